@@ -36,10 +36,14 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 25
+LIBPATCH = 31
 
 INVALID_EXTRA_USER_ROLE_BLOCKING_MESSAGE = "invalid role(s) for extra user roles"
 
+# Share of the huge pages that can be used by the shared buffers (the remaining is left to
+# the other shared memory structures, like the WAL buffers and the lock tables).
+HUGEPAGES_SHARED_BUFFERS_RATIO = 0.9
+
 REQUIRED_PLUGINS = {
     "address_standardizer": ["postgis"],
     "address_standardizer_data_us": ["postgis"],
@@ -55,6 +59,10 @@ for dependencies in REQUIRED_PLUGINS.values():
 logger = logging.getLogger(__name__)
 
 
+class PostgreSQLAuthQuerySetupError(Exception):
+    """Exception raised when setting up the auth query function fails."""
+
+
 class PostgreSQLCreateDatabaseError(Exception):
     """Exception raised when creating a database fails."""
 
@@ -83,10 +91,26 @@ class PostgreSQLGetPostgreSQLVersionError(Exception):
     """Exception raised when retrieving PostgreSQL version fails."""
 
 
+class PostgreSQLGetReplicationSlotsLagError(Exception):
+    """Exception raised when retrieving the replication slots lag fails."""
+
+
 class PostgreSQLListUsersError(Exception):
     """Exception raised when retrieving PostgreSQL users list fails."""
 
 
+class PostgreSQLLogicalReplicationRemoveError(Exception):
+    """Exception raised when removing a logical replication publication fails."""
+
+
+class PostgreSQLLogicalReplicationSetupError(Exception):
+    """Exception raised when setting up a logical replication publication fails."""
+
+
+class PostgreSQLUpdateUserLimitsError(Exception):
+    """Exception raised when updating the resource limits of a user fails."""
+
+
 class PostgreSQLUpdateUserPasswordError(Exception):
     """Exception raised when updating a user password fails."""
 
@@ -109,6 +133,9 @@ class PostgreSQL:
         self.password = password
         self.database = database
         self.system_users = system_users
+        # Catalog of the existing roles, loaded on first use and kept up to date
+        # with the roles created and deleted through this object.
+        self._roles: Optional[Set[str]] = None
 
     def _connect_to_database(
         self, database: str = None, connect_to_current_host: bool = False
@@ -241,6 +268,8 @@ class PostgreSQL:
                                 sql.Identifier(role), sql.Identifier(user)
                             )
                         )
+            if self._roles is not None:
+                self._roles.add(user)
         except psycopg2.Error as e:
             logger.error(f"Failed to create user: {e}")
             raise PostgreSQLCreateUserError()
@@ -278,6 +307,8 @@ class PostgreSQL:
             # Delete the user.
             with self._connect_to_database() as connection, connection.cursor() as cursor:
                 cursor.execute(sql.SQL("DROP ROLE {};").format(sql.Identifier(user)))
+            if self._roles is not None:
+                self._roles.discard(user)
         except psycopg2.Error as e:
             logger.error(f"Failed to delete user: {e}")
             raise PostgreSQLDeleteUserError()
@@ -460,17 +491,21 @@ WHERE lomowner = (SELECT oid FROM pg_roles WHERE rolname = '{}');""".format(user
     def list_valid_privileges_and_roles(self) -> Tuple[Set[str], Set[str]]:
         """Returns two sets with valid privileges and roles.
 
+        The roles are only queried the first time (later calls use the roles catalog).
+
         Returns:
             Tuple containing two sets: the first with valid privileges
                 and the second with valid roles.
         """
-        with self._connect_to_database() as connection, connection.cursor() as cursor:
-            cursor.execute("SELECT rolname FROM pg_roles;")
-            return {
-                "createdb",
-                "createrole",
-                "superuser",
-            }, {role[0] for role in cursor.fetchall() if role[0]}
+        if self._roles is None:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                cursor.execute("SELECT rolname FROM pg_roles;")
+                self._roles = {role[0] for role in cursor.fetchall() if role[0]}
+        return {
+            "createdb",
+            "createrole",
+            "superuser",
+        }, set(self._roles)
 
     def set_up_database(self) -> None:
         """Set up postgres database with the right permissions."""
@@ -498,6 +533,232 @@ WHERE lomowner = (SELECT oid FROM pg_roles WHERE rolname = '{}');""".format(user
             if connection is not None:
                 connection.close()
 
+    def set_up_auth_query(self, user: str) -> None:
+        """Create the function a connection pooler uses to look up the users passwords.
+
+        The function runs with the privileges of its owner, so the connection pooler user
+        only needs to execute it (and not to read pg_authid). Superusers are not returned.
+
+        Args:
+            user: the user the connection pooler authenticates with to run the auth query
+                (the function is created in a schema with the same name).
+
+        Raises:
+            PostgreSQLAuthQuerySetupError if the function couldn't be created.
+        """
+        connection = None
+        try:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                schema = sql.Identifier(user)
+                cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(schema))
+                cursor.execute(
+                    sql.SQL(
+                        "CREATE OR REPLACE FUNCTION {}.get_auth(username TEXT)"
+                        " RETURNS TABLE(usename TEXT, passwd TEXT)"
+                        " LANGUAGE sql SECURITY DEFINER SET search_path = pg_catalog AS"
+                        " $$ SELECT rolname::TEXT, rolpassword::TEXT FROM pg_authid"
+                        " WHERE rolname = username AND rolcanlogin AND NOT rolsuper; $$;"
+                    ).format(schema)
+                )
+                cursor.execute(
+                    sql.SQL("REVOKE ALL ON FUNCTION {}.get_auth(TEXT) FROM PUBLIC;").format(schema)
+                )
+                cursor.execute(
+                    sql.SQL("GRANT USAGE ON SCHEMA {} TO {};").format(schema, sql.Identifier(user))
+                )
+                cursor.execute(
+                    sql.SQL("GRANT EXECUTE ON FUNCTION {}.get_auth(TEXT) TO {};").format(
+                        schema, sql.Identifier(user)
+                    )
+                )
+        except psycopg2.Error as e:
+            logger.error(f"Failed to set up the auth query: {e}")
+            raise PostgreSQLAuthQuerySetupError()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def get_replication_slots_lag(self) -> Dict[str, int]:
+        """Returns how far behind the current WAL position each logical replication slot is.
+
+        Returns:
+            Dictionary with the lag (in bytes) of the logical replication slots.
+
+        Raises:
+            PostgreSQLGetReplicationSlotsLagError if the lag couldn't be retrieved.
+        """
+        connection = None
+        try:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT slot_name, pg_wal_lsn_diff(pg_current_wal_lsn(),"
+                    " COALESCE(confirmed_flush_lsn, restart_lsn))::BIGINT"
+                    " FROM pg_replication_slots WHERE slot_type = 'logical';"
+                )
+                return {slot: lag for slot, lag in cursor.fetchall() if lag is not None}
+        except psycopg2.Error as e:
+            logger.error(f"Failed to get the replication slots lag: {e}")
+            raise PostgreSQLGetReplicationSlotsLagError()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def set_up_logical_replication(
+        self, user: str, password: str, database: str, publication: str, tables: List[str]
+    ) -> None:
+        """Create (or update) a publication and a user that can subscribe to it.
+
+        The replication slot is not created here, as it needs to be managed by Patroni
+        to survive failovers.
+
+        Args:
+            user: the user to be created to stream the changes.
+            password: the password of the user.
+            database: the database where the tables are.
+            publication: the name of the publication.
+            tables: the tables to publish (optionally qualified with their schema).
+
+        Raises:
+            PostgreSQLLogicalReplicationSetupError if the publication couldn't be set up.
+        """
+        connection = None
+        try:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                cursor.execute("SELECT TRUE FROM pg_roles WHERE rolname = %s;", (user,))
+                user_definition = "ALTER ROLE {}" if cursor.fetchone() else "CREATE ROLE {}"
+                cursor.execute(
+                    sql.SQL(
+                        f"{user_definition} WITH LOGIN REPLICATION ENCRYPTED PASSWORD {{}};"
+                    ).format(sql.Identifier(user), sql.Literal(password))
+                )
+                cursor.execute(
+                    sql.SQL("GRANT CONNECT ON DATABASE {} TO {};").format(
+                        sql.Identifier(database), sql.Identifier(user)
+                    )
+                )
+            connection.close()
+            connection = None
+            if self._roles is not None:
+                self._roles.add(user)
+
+            tables_identifiers = sql.SQL(", ").join(
+                sql.Identifier(*table.split(".")) for table in tables
+            )
+            schemas = {table.split(".")[0] if "." in table else "public" for table in tables}
+            with self._connect_to_database(database) as connection, connection.cursor() as cursor:
+                for schema in sorted(schemas):
+                    cursor.execute(
+                        sql.SQL("GRANT USAGE ON SCHEMA {} TO {};").format(
+                            sql.Identifier(schema), sql.Identifier(user)
+                        )
+                    )
+                # The initial synchronisation of the subscriber copies the tables data.
+                cursor.execute(
+                    sql.SQL("GRANT SELECT ON TABLE {} TO {};").format(
+                        tables_identifiers, sql.Identifier(user)
+                    )
+                )
+                cursor.execute(
+                    "SELECT TRUE FROM pg_publication WHERE pubname = %s;", (publication,)
+                )
+                publication_definition = (
+                    "ALTER PUBLICATION {} SET TABLE {};"
+                    if cursor.fetchone()
+                    else "CREATE PUBLICATION {} FOR TABLE {};"
+                )
+                cursor.execute(
+                    sql.SQL(publication_definition).format(
+                        sql.Identifier(publication), tables_identifiers
+                    )
+                )
+        except psycopg2.Error as e:
+            logger.error(f"Failed to set up logical replication: {e}")
+            raise PostgreSQLLogicalReplicationSetupError()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def remove_logical_replication(self, database: str, publication: str, slot: str) -> None:
+        """Drop a publication and its replication slot.
+
+        The subscriber that is still streaming from the slot is disconnected first, as an
+        active slot can't be dropped.
+
+        Args:
+            database: the database where the publication is.
+            publication: the name of the publication.
+            slot: the name of the replication slot.
+
+        Raises:
+            PostgreSQLLogicalReplicationRemoveError if the publication couldn't be removed.
+        """
+        connection = None
+        try:
+            with self._connect_to_database(database) as connection, connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("DROP PUBLICATION IF EXISTS {};").format(sql.Identifier(publication))
+                )
+                # Wait up to 10 seconds for the walsender to exit.
+                cursor.execute(
+                    "SELECT pg_terminate_backend(active_pid, 10000) FROM pg_replication_slots"
+                    " WHERE slot_name = %s AND active_pid IS NOT NULL;",
+                    (slot,),
+                )
+                cursor.execute(
+                    "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots"
+                    " WHERE slot_name = %s;",
+                    (slot,),
+                )
+        except psycopg2.Error as e:
+            logger.error(f"Failed to remove logical replication: {e}")
+            raise PostgreSQLLogicalReplicationRemoveError()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def update_user_limits(
+        self, user: str, connection_limit: int = -1, settings: Dict[str, Optional[str]] = None
+    ) -> None:
+        """Bound the resources a user can use.
+
+        Args:
+            user: the user to update the limits.
+            connection_limit: maximum number of concurrent connections of the user
+                (-1 means no limit).
+            settings: role level settings (like statement_timeout or work_mem) to set
+                for the user. A None value resets the setting to the instance default.
+
+        Raises:
+            PostgreSQLUpdateUserLimitsError if the limits couldn't be updated.
+        """
+        connection = None
+        try:
+            with self._connect_to_database() as connection, connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("ALTER ROLE {} CONNECTION LIMIT {};").format(
+                        sql.Identifier(user), sql.Literal(connection_limit)
+                    )
+                )
+                for setting, value in (settings or {}).items():
+                    if value is None:
+                        cursor.execute(
+                            sql.SQL("ALTER ROLE {} RESET {};").format(
+                                sql.Identifier(user), sql.Identifier(setting)
+                            )
+                        )
+                    else:
+                        cursor.execute(
+                            sql.SQL("ALTER ROLE {} SET {} = {};").format(
+                                sql.Identifier(user), sql.Identifier(setting), sql.Literal(value)
+                            )
+                        )
+        except psycopg2.Error as e:
+            logger.error(f"Failed to update user limits: {e}")
+            raise PostgreSQLUpdateUserLimitsError()
+        finally:
+            if connection is not None:
+                connection.close()
+
     def update_user_password(self, username: str, password: str) -> None:
         """Update a user password.
 
@@ -542,7 +803,10 @@ WHERE lomowner = (SELECT oid FROM pg_roles WHERE rolname = '{}');""".format(user
 
     @staticmethod
     def build_postgresql_parameters(
-        config_options: Dict, available_memory: int, limit_memory: Optional[int] = None
+        config_options: Dict,
+        available_memory: int,
+        limit_memory: Optional[int] = None,
+        available_hugepages: Optional[int] = None,
     ) -> Optional[Dict]:
         """Builds the PostgreSQL parameters.
 
@@ -550,6 +814,8 @@ WHERE lomowner = (SELECT oid FROM pg_roles WHERE rolname = '{}');""".format(user
             config_options: charm config options containing profile and PostgreSQL parameters.
             available_memory: available memory to use in calculation in bytes.
             limit_memory: (optional) limit memory to use in calculation in bytes.
+            available_hugepages: (optional) huge pages memory available in bytes
+                (zero disables huge pages and None keeps the PostgreSQL default).
 
         Returns:
             Dictionary with the PostgreSQL parameters.
@@ -557,7 +823,9 @@ WHERE lomowner = (SELECT oid FROM pg_roles WHERE rolname = '{}');""".format(user
         if limit_memory:
             available_memory = min(available_memory, limit_memory)
         profile = config_options["profile"]
-        logger.debug(f"Building PostgreSQL parameters for {profile=} and {available_memory=}")
+        logger.debug(
+            f"Building PostgreSQL parameters for {profile=}, {available_memory=} and {available_hugepages=}"
+        )
         parameters = {}
         for config, value in config_options.items():
             # Filter config option not related to PostgreSQL parameters.
@@ -576,27 +844,82 @@ WHERE lomowner = (SELECT oid FROM pg_roles WHERE rolname = '{}');""".format(user
             if parameter in ["date_style", "time_zone"]:
                 parameter = "".join(x.capitalize() for x in parameter.split("_"))
             parameters[parameter] = value
+        shared_buffers = PostgreSQL._build_shared_buffers_parameters(
+            parameters, profile, available_memory, available_hugepages
+        )
+        if profile == "production":
+            effective_cache_size = int(available_memory - shared_buffers)
+            parameters.update({"effective_cache_size": f"{int(effective_cache_size / 10**6)}MB"})
+        return parameters
+
+    @staticmethod
+    def _build_shared_buffers_parameters(
+        parameters: Dict,
+        profile: str,
+        available_memory: int,
+        available_hugepages: Optional[int] = None,
+    ) -> int:
+        """Set the shared_buffers and huge_pages parameters.
+
+        Args:
+            parameters: the PostgreSQL parameters being built (updated in place).
+            profile: the charm profile.
+            available_memory: available memory to use in calculation in bytes.
+            available_hugepages: (optional) huge pages memory available in bytes
+                (zero disables huge pages and None keeps the PostgreSQL default).
+
+        Returns:
+            The size of the shared buffers in bytes.
+        """
         shared_buffers_max_value_in_mb = int(available_memory * 0.4 / 10**6)
         shared_buffers_max_value = int(shared_buffers_max_value_in_mb * 10**3 / 8)
         if parameters.get("shared_buffers", 0) > shared_buffers_max_value:
             raise Exception(
                 f"Shared buffers config option should be at most 40% of the available memory, which is {shared_buffers_max_value_in_mb}MB"
             )
-        if profile == "production":
-            if "shared_buffers" in parameters:
-                # Convert to bytes to use in the calculation.
-                shared_buffers = parameters["shared_buffers"] * 8 * 10**3
-            else:
-                # Use 25% of the available memory for shared_buffers.
-                # and the remaining as cache memory.
-                shared_buffers = int(available_memory * 0.25)
-            effective_cache_size = int(available_memory - shared_buffers)
-            parameters.setdefault("shared_buffers", f"{int(shared_buffers / 10**6)}MB")
-            parameters.update({"effective_cache_size": f"{int(effective_cache_size / 10**6)}MB"})
+        hugepages_max_shared_buffers = int(
+            (available_hugepages or 0) * HUGEPAGES_SHARED_BUFFERS_RATIO
+        )
+        if "shared_buffers" in parameters:
+            # Convert to bytes to use in the calculation.
+            shared_buffers = parameters["shared_buffers"] * 8 * 10**3
+        elif profile == "production":
+            # Use 25% of the available memory for shared_buffers
+            # and the remaining as cache memory.
+            shared_buffers = int(available_memory * 0.25)
+            # Keep the shared buffers inside the huge pages reserved for the container.
+            if hugepages_max_shared_buffers:
+                shared_buffers = min(shared_buffers, hugepages_max_shared_buffers)
+            parameters["shared_buffers"] = f"{int(shared_buffers / 10**6)}MB"
         else:
             # Return default
-            parameters.setdefault("shared_buffers", "128MB")
-        return parameters
+            shared_buffers = 128 * 10**6
+            parameters["shared_buffers"] = "128MB"
+        if available_hugepages is not None:
+            parameters["huge_pages"] = PostgreSQL._huge_pages_setting(
+                shared_buffers, hugepages_max_shared_buffers
+            )
+        return shared_buffers
+
+    @staticmethod
+    def _huge_pages_setting(shared_buffers: int, hugepages_max_shared_buffers: int) -> str:
+        """Choose the huge_pages value based on the shared buffers size.
+
+        Args:
+            shared_buffers: size of the shared buffers in bytes.
+            hugepages_max_shared_buffers: maximum size in bytes of the shared buffers
+                that fits in the available huge pages.
+
+        Returns:
+            "off" when there are no huge pages available, "on" when the shared buffers
+                fit in them or "try" (falling back to regular pages) when they don't.
+        """
+        if not hugepages_max_shared_buffers:
+            return "off"
+        if shared_buffers <= hugepages_max_shared_buffers:
+            return "on"
+        logger.warning("Shared buffers don't fit in the available huge pages")
+        return "try"
 
     def validate_date_style(self, date_style: str) -> bool:
         """Validate a date style against PostgreSQL.
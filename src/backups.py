@@ -3,17 +3,16 @@
 
 """Backups implementation."""
 
+import hashlib
 import json
 import logging
 import os
 import re
-import tempfile
-from datetime import datetime
-from typing import Dict, List, Optional, OrderedDict, Tuple
+from datetime import datetime, timezone
+from heapq import merge
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, OrderedDict, Tuple
 
-import boto3 as boto3
-import botocore
-from botocore.exceptions import ClientError
 from charms.data_platform_libs.v0.s3 import CredentialsChangedEvent, S3Requirer
 from jinja2 import Template
 from lightkube import ApiError, Client
@@ -21,11 +20,12 @@ from lightkube.resources.core_v1 import Endpoints
 from ops.charm import ActionEvent
 from ops.framework import Object
 from ops.jujuversion import JujuVersion
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
-from ops.pebble import ChangeError, ExecError
+from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, Unit
+from ops.pebble import ChangeError, ExecError, Layer, ServiceStatus
 from tenacity import RetryError, Retrying, stop_after_attempt, wait_fixed
 
 from constants import BACKUP_USER, WORKLOAD_OS_GROUP, WORKLOAD_OS_USER
+from utils import next_cron_run
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +41,79 @@ S3_BLOCK_MESSAGES = [
     FAILED_TO_INITIALIZE_STANZA_ERROR_MESSAGE,
 ]
 
+# Map of the backup types accepted by the create-backup action to the pgBackRest ones.
+BACKUP_TYPE_OVERRIDES = {"full": "full", "differential": "diff", "incremental": "incr"}
+# Map of the suffixes of the pgBackRest backup labels to the backup types.
+BACKUP_LABEL_SUFFIXES = {"F": "full", "D": "differential", "I": "incremental"}
+
+# Files where the background backup job stores the pgBackRest output and exit code.
+BACKUP_JOB_STDOUT_FILE = "/var/log/pgbackrest/backup-job.out"
+BACKUP_JOB_STDERR_FILE = "/var/log/pgbackrest/backup-job.err"
+BACKUP_JOB_EXIT_CODE_FILE = "/var/log/pgbackrest/backup-job.rc"
+# Lines logged by pgBackRest for each copied file, like
+# "P01 DETAIL: backup file /var/lib/postgresql/data/pgdata/base/1/1249 (440KB, 12.34%) checksum ...".
+BACKUP_FILE_PROGRESS_REGEX = re.compile(
+    r"DETAIL: (?:backup|match) file .*\((?:bundle [^,]+, )?([0-9.]+)(B|KB|MB|GB|TB), ([0-9.]+)%\)"
+)
+BACKUP_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+
+# Files where the background expire job stores the pgBackRest output and exit code.
+EXPIRE_JOB_STDOUT_FILE = "/var/log/pgbackrest/expire-job.out"
+EXPIRE_JOB_STDERR_FILE = "/var/log/pgbackrest/expire-job.err"
+EXPIRE_JOB_EXIT_CODE_FILE = "/var/log/pgbackrest/expire-job.rc"
+# Files where the background restore job (run in the replicas) stores the pgBackRest output.
+RESTORE_JOB_STDOUT_FILE = "/var/log/pgbackrest/restore-job.out"
+RESTORE_JOB_STDERR_FILE = "/var/log/pgbackrest/restore-job.err"
+RESTORE_JOB_EXIT_CODE_FILE = "/var/log/pgbackrest/restore-job.rc"
+# Log file of the restore run by Patroni when bootstrapping the cluster from a backup.
+RESTORE_LOG_FILE = "/var/log/pgbackrest/{stanza}-restore.log"
+# Lines logged by pgBackRest for each restored file, like
+# "2023-01-01 10:00:00.000 P01 DETAIL: restore file /var/lib/postgresql/data/pgdata/base/1/1249
+# (440KB, 12.34%) checksum ...".
+RESTORE_FILE_PROGRESS_REGEX = re.compile(
+    r"DETAIL: restore (?:zeroed )?file .*\((?:bundle [^,]+, )?([0-9.]+)(B|KB|MB|GB|TB), ([0-9.]+)%\)"
+)
+PGBACKREST_LOG_TIMESTAMP_REGEX = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) ")
+PGBACKREST_LOG_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# Lines logged by pgBackRest for the expired backups, like
+# "INFO: repo1: expire full backup set 20230101-090000F, 20230101-090000F_20230102-090000I".
+EXPIRED_BACKUP_REGEX = re.compile(r"expire (?:full|diff|incr) backup (?:set )?(.*)$")
+
+# Maximum number of backups whose S3 objects are counted in a list-backups call (the
+# objects of each backup are listed separately).
+MAX_COUNTED_BACKUPS = 50
+
+# File where the pgBackRest version is cached (outside the data volume, so it's discarded
+# when the workload container is restarted with a new image).
+PGBACKREST_VERSION_CACHE_FILE = "/tmp/pgbackrest-version"
+
+# File where the output of pgbackrest info is cached and how long it's valid (in seconds).
+REPOSITORY_INFO_CACHE_FILE = "/var/lib/postgresql/data/pgbackrest-info.json"
+REPOSITORY_INFO_CACHE_TTL = 300
+
+# Time (in seconds) a unit has to start a scheduled backup before it's abandoned.
+SCHEDULED_BACKUP_START_TIMEOUT = 3600
+
+# Time (in seconds) the other units have to get ready to restore a backup in parallel with
+# the leader, and to finish that restore after the leader started its own.
+CLUSTER_RESTORE_READY_TIMEOUT = 900
+CLUSTER_RESTORE_FINISH_TIMEOUT = 21600
+
+# Local queue used by the asynchronous WAL archiving (kept on the data volume).
+ARCHIVE_SPOOL_PATH = "/var/lib/postgresql/data/pgbackrest-spool"
+
+# pgBackRest versions from which the bundling of files and the block incremental are
+# supported (and no longer beta).
+PGBACKREST_BUNDLE_MIN_VERSION = (2, 45)
+PGBACKREST_BLOCK_INCREMENTAL_MIN_VERSION = (2, 52)
+
+# Keys of the pgBackRest repositories: the S3 bucket and the optional local repository
+# kept on the backups storage of the units.
+LOCAL_REPOSITORY = "local"
+REPOSITORY_KEYS = {"s3": 1, LOCAL_REPOSITORY: 2}
+BACKUPS_STORAGE = "backups"
+LOCAL_REPOSITORY_PATH = "/var/lib/postgresql/backups/pgbackrest"
+
 
 class PostgreSQLBackups(Object):
     """In this class, we manage PostgreSQL backups."""
@@ -51,6 +124,8 @@ class PostgreSQLBackups(Object):
         self.charm = charm
         self.relation_name = relation_name
         self.container = self.charm.unit.get_container("postgresql")
+        # S3 clients already built in this hook, indexed by the fingerprint of their parameters.
+        self._s3_clients = {}
 
         # s3 relation handles the config options for s3 backups
         self.s3_client = S3Requirer(self.charm, self.relation_name)
@@ -58,10 +133,36 @@ class PostgreSQLBackups(Object):
             self.s3_client.on.credentials_changed, self._on_s3_credential_changed
         )
         self.framework.observe(self.s3_client.on.credentials_gone, self._on_s3_credential_gone)
+        self.framework.observe(self.charm.on.config_changed, self._on_config_changed)
         self.framework.observe(self.charm.on.create_backup_action, self._on_create_backup_action)
+        self.framework.observe(
+            self.charm.on.get_backup_status_action, self._on_get_backup_status_action
+        )
+        self.framework.observe(
+            self.charm.on.get_backup_schedule_action, self._on_get_backup_schedule_action
+        )
+        self.framework.observe(
+            self.charm.on.get_restore_status_action, self._on_get_restore_status_action
+        )
         self.framework.observe(self.charm.on.list_backups_action, self._on_list_backups_action)
         self.framework.observe(self.charm.on.restore_action, self._on_restore_action)
 
+    @property
+    def is_local_repository_enabled(self) -> bool:
+        """Whether the local repository is enabled and the backups storage is attached.
+
+        The backups storage is optional, so the local repository is skipped when the
+        application was deployed without it.
+        """
+        if not self.charm.config.backup_local_repository:
+            return False
+        if not self.model.storages.get(BACKUPS_STORAGE):
+            logger.warning(
+                f"backup_local_repository is enabled, but the {BACKUPS_STORAGE} storage is not attached"
+            )
+            return False
+        return True
+
     @property
     def stanza_name(self) -> str:
         """Stanza name, composed by model and cluster name."""
@@ -81,13 +182,15 @@ class PostgreSQLBackups(Object):
 
         return True, None
 
-    def _can_unit_perform_backup(self) -> Tuple[bool, Optional[str]]:
-        """Validates whether this unit can perform a backup."""
+    def _can_unit_perform_backup(self, repository: str = "s3") -> Tuple[bool, Optional[str]]:
+        """Validates whether this unit can perform a backup.
+
+        Args:
+            repository: the repository where the backup is stored (s3 or local).
+        """
         if self.charm.is_blocked:
             return False, "Unit is in a blocking state"
 
-        tls_enabled = "tls" in self.charm.unit_peer_data
-
         # Check if this unit is the primary (if it was not possible to retrieve that information,
         # then show that the unit cannot perform a backup, because possibly the database is offline).
         try:
@@ -95,15 +198,8 @@ class PostgreSQLBackups(Object):
         except RetryError:
             return False, "Unit cannot perform backups as the database seems to be offline"
 
-        # Only enable backups on primary if there are replicas but TLS is not enabled.
-        if is_primary and self.charm.app.planned_units() > 1 and tls_enabled:
-            return False, "Unit cannot perform backups as it is the cluster primary"
-
-        # Can create backups on replicas only if TLS is enabled (it's needed to enable
-        # pgBackRest to communicate with the primary to request that missing WAL files
-        # are pushed to the S3 repo before the backup action is triggered).
-        if not is_primary and not tls_enabled:
-            return False, "Unit cannot perform backups as TLS is not enabled"
+        if (role_message := self._check_backup_unit_role(is_primary, repository)) is not None:
+            return False, role_message
 
         if not self.charm._patroni.member_started:
             return False, "Unit cannot perform backups as it's not in running state"
@@ -111,17 +207,49 @@ class PostgreSQLBackups(Object):
         if "stanza" not in self.charm.app_peer_data:
             return False, "Stanza was not initialised"
 
+        if self._backup_job is not None:
+            return False, "A backup is already in progress in this unit"
+
+        if self._expire_job is not None:
+            return False, "Old backups are being expired in this unit"
+
         return self._are_backup_settings_ok()
 
+    def _check_backup_unit_role(self, is_primary: bool, repository: str) -> Optional[str]:
+        """Check whether the role of this unit allows it to create a backup.
+
+        Returns:
+            the reason why the unit cannot create the backup or None if it can.
+        """
+        tls_enabled = "tls" in self.charm.unit_peer_data
+
+        # Local backups are created in the primary, as its repository has the WAL files.
+        if repository == LOCAL_REPOSITORY:
+            if not is_primary:
+                return "Unit cannot perform local backups as it is not the cluster primary"
+            return None
+
+        # Only enable backups on primary if there are replicas but TLS is not enabled.
+        if is_primary and self.charm.app.planned_units() > 1 and tls_enabled:
+            return "Unit cannot perform backups as it is the cluster primary"
+
+        # Can create backups on replicas only if TLS is enabled (it's needed to enable
+        # pgBackRest to communicate with the primary to request that missing WAL files
+        # are pushed to the S3 repo before the backup action is triggered).
+        if not is_primary and not tls_enabled:
+            return "Unit cannot perform backups as TLS is not enabled"
+
+        return None
+
     def can_use_s3_repository(self) -> Tuple[bool, Optional[str]]:
         """Returns whether the charm was configured to use another cluster repository."""
         # Prevent creating backups and storing in another cluster repository.
-        output, _ = self._execute_command(["pgbackrest", "info", "--output=json"], timeout=30)
-        if output is None:
+        repository_info = self._get_repository_info(timeout=30)
+        if repository_info is None:
             return False, FAILED_TO_INITIALIZE_STANZA_ERROR_MESSAGE
 
         if self.charm.unit.is_leader():
-            for stanza in json.loads(output):
+            for stanza in repository_info:
                 system_identifier_from_instance, error = self._execute_command([
                     f'/usr/lib/postgresql/{self.charm._patroni.rock_postgresql_version.split(".")[0]}/bin/pg_controldata',
                     "/var/lib/postgresql/data/pgdata",
@@ -151,6 +279,10 @@ class PostgreSQLBackups(Object):
 
         This is needed when the provided endpoint is from AWS, and it doesn't contain the region.
         """
+        # Imported here to not load the botocore data in the hooks that don't use S3.
+        import botocore.loaders
+        import botocore.regions
+
         # Use the provided endpoint if a region is not needed.
         endpoint = s3_parameters["endpoint"]
 
@@ -168,27 +300,71 @@ class PostgreSQLBackups(Object):
 
         return endpoint
 
+    @staticmethod
+    def _s3_parameters_fingerprint(s3_parameters: Dict, include_secret: bool = True) -> str:
+        """Fingerprint of the S3 parameters that identify the bucket and its credentials.
+
+        Args:
+            s3_parameters: the S3 parameters.
+            include_secret: whether to include the secret key (it must be left out of the
+                fingerprints stored in the relation databags).
+        """
+        keys = ["access-key", "endpoint", "region", "bucket"]
+        if include_secret:
+            keys.append("secret-key")
+        return hashlib.sha256(
+            json.dumps([s3_parameters.get(key) for key in keys]).encode("utf-8")
+        ).hexdigest()
+
+    def _get_s3_client(self, s3_parameters: Dict):
+        """Return a S3 client, reusing the one already built for the same S3 parameters.
+
+        Args:
+            s3_parameters: A dictionary containing the S3 parameters
+                The following are expected keys in the dictionary: bucket, region,
+                endpoint, access-key and secret-key
+
+        Returns:
+            a boto3 S3 client.
+        """
+        fingerprint = self._s3_parameters_fingerprint(s3_parameters)
+        if fingerprint not in self._s3_clients:
+            # Imported here to not load boto3 in the hooks that don't use S3.
+            import boto3
+
+            session = boto3.session.Session(
+                aws_access_key_id=s3_parameters["access-key"],
+                aws_secret_access_key=s3_parameters["secret-key"],
+                region_name=s3_parameters["region"],
+            )
+            self._s3_clients[fingerprint] = session.client(
+                "s3", endpoint_url=self._construct_endpoint(s3_parameters)
+            )
+        return self._s3_clients[fingerprint]
+
     def _create_bucket_if_not_exists(self) -> None:
+        from botocore.exceptions import ClientError
+
         s3_parameters, missing_parameters = self._retrieve_s3_parameters()
         if missing_parameters:
             return
 
+        # Skip the check if the bucket was already verified with the same parameters.
+        fingerprint = self._s3_parameters_fingerprint(s3_parameters, include_secret=False)
+        if self.charm.unit_peer_data.get("s3-bucket-verified") == fingerprint:
+            logger.debug("Bucket was already verified with the current S3 parameters")
+            return
+
         bucket_name = s3_parameters["bucket"]
         region = s3_parameters.get("region")
-        session = boto3.session.Session(
-            aws_access_key_id=s3_parameters["access-key"],
-            aws_secret_access_key=s3_parameters["secret-key"],
-            region_name=s3_parameters["region"],
-        )
 
         try:
-            s3 = session.resource("s3", endpoint_url=self._construct_endpoint(s3_parameters))
+            s3 = self._get_s3_client(s3_parameters)
         except ValueError as e:
             logger.exception("Failed to create a session '%s' in region=%s.", bucket_name, region)
             raise e
-        bucket = s3.Bucket(bucket_name)
         try:
-            bucket.meta.client.head_bucket(Bucket=bucket_name)
+            s3.head_bucket(Bucket=bucket_name)
             logger.info("Bucket %s exists.", bucket_name)
             exists = True
         except ClientError:
@@ -196,9 +372,11 @@ class PostgreSQLBackups(Object):
             exists = False
         if not exists:
             try:
-                bucket.create(CreateBucketConfiguration={"LocationConstraint": region})
+                s3.create_bucket(
+                    Bucket=bucket_name, CreateBucketConfiguration={"LocationConstraint": region}
+                )
 
-                bucket.wait_until_exists()
+                s3.get_waiter("bucket_exists").wait(Bucket=bucket_name)
                 logger.info("Created bucket '%s' in region=%s", bucket_name, region)
             except ClientError as error:
                 logger.exception(
@@ -206,6 +384,8 @@ class PostgreSQLBackups(Object):
                 )
                 raise error
 
+        self.charm.unit_peer_data.update({"s3-bucket-verified": fingerprint})
+
     def _empty_data_files(self) -> None:
         """Empty the PostgreSQL data directory in preparation of backup restore."""
         try:
@@ -216,6 +396,25 @@ class PostgreSQLBackups(Object):
             )
             raise
 
+    def _move_data_files_aside(self) -> None:
+        """Move the PostgreSQL data directory aside in preparation of a delta restore.
+
+        Patroni only bootstraps the cluster (restoring the backup) when the data directory
+        is empty, so the files are moved back by the bootstrap command before pgBackRest
+        runs the delta restore over them.
+        """
+        try:
+            self.container.exec([
+                "/bin/bash",
+                "-c",
+                "rm -rf /var/lib/postgresql/data/pgdata.delta && mv /var/lib/postgresql/data/pgdata /var/lib/postgresql/data/pgdata.delta",
+            ]).wait_output()
+        except ExecError as e:
+            logger.exception(
+                "Failed to move data directory aside in prep for backup restore", exc_info=e
+            )
+            raise
+
     def _change_connectivity_to_database(self, connectivity: bool) -> None:
         """Enable or disable the connectivity to the database."""
         self.charm.unit_peer_data.update({"connectivity": "on" if connectivity else "off"})
@@ -235,65 +434,367 @@ class PostgreSQLBackups(Object):
         except ChangeError:
             return None, None
 
+    def _count_backup_objects(self, labels: List[str]) -> Dict[str, int]:
+        """Count the objects stored in the S3 repository for some backups.
+
+        The count shows the effect of the bundling of files (each bundle is a single object,
+        while each file is its own object when the bundling is disabled). Only the objects
+        of the requested backups are listed, so listing a page of backups stays cheap.
+
+        Args:
+            labels: the pgBackRest labels of the backups.
+
+        Returns:
+            a dictionary with the number of objects of each backup (indexed by its label)
+            or an empty dictionary if the objects couldn't be listed.
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        s3_parameters, missing_parameters = self._retrieve_s3_parameters()
+        if missing_parameters:
+            return {}
+
+        prefix = "/".join(
+            filter(None, [s3_parameters["path"].strip("/"), "backup", self.stanza_name])
+        )
+        counts = {}
+        try:
+            paginator = self._get_s3_client(s3_parameters).get_paginator("list_objects_v2")
+            for label in labels:
+                # Keys are like "<path>/backup/<stanza>/<label>/pg_data/...".
+                counts[label] = sum(
+                    page.get("KeyCount", 0)
+                    for page in paginator.paginate(
+                        Bucket=s3_parameters["bucket"], Prefix=f"{prefix}/{label}/"
+                    )
+                )
+        except (BotoCoreError, ClientError, ValueError) as e:
+            logger.warning(f"Failed to count the objects of the backups: {e}")
+            return {}
+        return counts
+
     def _format_backup_list(self, backup_list) -> str:
         """Formats provided list of backups as a table."""
-        backups = ["{:<21s} | {:<12s} | {:s}".format("backup-id", "backup-type", "backup-status")]
-        backups.append("-" * len(backups[0]))
-        for backup_id, backup_type, backup_status in backup_list:
-            backups.append(
-                "{:<21s} | {:<12s} | {:s}".format(backup_id, backup_type, backup_status)
+        row = "{:<21s} | {:<12s} | {:<21s} | {:<10s} | {:<10s} | {:s}"
+        backups = [
+            row.format(
+                "backup-id",
+                "backup-type",
+                "reference-backup-id",
+                "repository",
+                "s3-objects",
+                "backup-status",
             )
+        ]
+        backups.append("-" * len(backups[0]))
+        for backup in backup_list:
+            backups.append(row.format(*backup))
         return "\n".join(backups)
 
-    def _generate_backup_list_output(self) -> str:
-        """Generates a list of backups in a formatted table.
+    def _iter_backups(self, filters: Dict) -> Iterator[Dict]:
+        """Yield the backups that match the filters, in order of ascending time.
+
+        The backups are converted and filtered one at a time, so only the requested page
+        of a repository with thousands of backups is kept in the action output.
+
+        Args:
+            filters: the backup-type, status (finished or failed) and time range
+                (since and until, as backup ids) to filter the backups.
+        """
+        # The local backups of the other units are only stored in their own backups storage.
+        for entry in merge(
+            self._iter_repository_backups(),
+            self._get_other_units_local_backups(),
+            key=lambda entry: entry["backup-id"],
+        ):
+            if self._backup_matches_filters(entry, filters):
+                yield entry
+
+    def _iter_repository_backups(self) -> Iterator[Dict]:
+        """Yield the backups from the repositories this unit can reach, in ascending time."""
+        repository_names = {key: name for name, key in REPOSITORY_KEYS.items()}
+        repository_info = next(iter(self._get_repository_info() or []), {})
+        for backup in repository_info.get("backup", []):
+            backup_id, backup_type = self._parse_backup_id(backup["label"])
+            repository_key = backup.get("database", {}).get("repo-key", 1)
+            yield {
+                "label": backup["label"],
+                "backup-id": backup_id,
+                "backup-type": backup_type,
+                # Differential and incremental backups depend on a prior backup.
+                "reference-backup-id": self._parse_backup_id(backup["prior"])[0]
+                if backup.get("prior")
+                else "",
+                "repository": repository_names.get(repository_key, str(repository_key)),
+                "backup-status": f"failed: {backup['error']}" if backup["error"] else "finished",
+            }
+
+    def can_create_replicas_from_repository(self) -> bool:
+        """Whether the new replicas are created from a backup instead of the primary's data.
+
+        Patroni falls back to basebackup (copying the data from the primary) when pgBackRest
+        has no backup to restore, so a stanza alone isn't enough.
+        """
+        if "stanza" not in self.charm.app_peer_data:
+            return False
+        return any(
+            backup["repository"] == "s3" and backup["backup-status"] == "finished"
+            for backup in self._iter_repository_backups()
+        )
+
+    def _get_other_units_local_backups(self) -> List[Dict]:
+        """Return the finished backups stored in the local repositories of the other units.
+
+        The repository column has the name of the unit that owns the backup, as only
+        that unit can restore it (when it's the leader).
+        """
+        if self.charm._peers is None:
+            return []
+        backups = []
+        for unit in self._peer_units:
+            local_backups = json.loads(self.charm._peers.data[unit].get("local-backups") or "{}")
+            for label, prior in local_backups.items():
+                backup_id, backup_type = self._parse_backup_id(label)
+                backups.append({
+                    "label": label,
+                    "backup-id": backup_id,
+                    "backup-type": backup_type,
+                    "reference-backup-id": self._parse_backup_id(prior)[0] if prior else "",
+                    "repository": f"{LOCAL_REPOSITORY} ({unit.name})",
+                    "backup-status": "finished",
+                    "unit": unit.name,
+                })
+        return sorted(backups, key=lambda backup: backup["backup-id"])
+
+    def publish_local_backups(self) -> None:
+        """Share the finished backups of the local repository of this unit with the others.
+
+        It's called from the update status hook, after the backup and expire jobs are
+        checked (which invalidate the repository info cache when they finish).
+        """
+        local_backups = {}
+        if self.is_local_repository_enabled:
+            repository_info = self._get_repository_info()
+            if repository_info is None:
+                return
+            local_backups = {
+                backup["label"]: backup.get("prior") or ""
+                for stanza in repository_info
+                for backup in stanza.get("backup", [])
+                if backup.get("database", {}).get("repo-key") == REPOSITORY_KEYS[LOCAL_REPOSITORY]
+                and not backup["error"]
+            }
+        value = json.dumps(local_backups) if local_backups else ""
+        if self.charm.unit_peer_data.get("local-backups", "") != value:
+            self.charm.unit_peer_data.update({"local-backups": value})
+
+    @staticmethod
+    def _backup_matches_filters(backup: Dict, filters: Dict) -> bool:
+        """Return whether a backup matches the filters of the list-backups action."""
+        if filters.get("backup-type") and backup["backup-type"] != filters["backup-type"]:
+            return False
+        if filters.get("status") and backup["backup-status"].split(":")[0] != filters["status"]:
+            return False
+        if filters.get("since") and backup["backup-id"] < filters["since"]:
+            return False
+        return not filters.get("until") or backup["backup-id"] <= filters["until"]
+
+    def _generate_backup_list_output(
+        self,
+        filters: Optional[Dict] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        output_format: str = "table",
+        count_objects: bool = False,
+    ) -> Tuple[str, bool]:
+        """Generates a page of the list of backups, as a formatted table or as JSON.
 
         List contains successful and failed backups in order of ascending time.
+
+        Args:
+            filters: the filters of the backups (see _iter_backups).
+            offset: number of matching backups to skip.
+            limit: maximum number of backups to list (all of them if None).
+            output_format: table or json.
+            count_objects: whether to count the S3 objects of the listed backups (which
+                lists the bucket, so it's only done when requested).
+
+        Returns:
+            a tuple with the list of backups and whether there are more backups after it.
         """
-        backup_list = []
-        output, _ = self._execute_command(["pgbackrest", "info", "--output=json"])
-        backups = json.loads(output)[0]["backup"]
-        for backup in backups:
-            backup_id = datetime.strftime(
-                datetime.strptime(backup["label"][:-1], "%Y%m%d-%H%M%S"), "%Y-%m-%dT%H:%M:%SZ"
+        stop = None if limit is None else offset + limit + 1
+        page = list(islice(self._iter_backups(filters or {}), offset, stop))
+        has_more = limit is not None and len(page) > limit
+        page = page[:limit]
+
+        object_counts = (
+            self._count_backup_objects([
+                backup["label"] for backup in page if backup["repository"] == "s3"
+            ])
+            if page and count_objects
+            else {}
+        )
+        for backup in page:
+            backup["s3-objects"] = object_counts.get(backup.pop("label"))
+
+        if output_format == "json":
+            return json.dumps(page), has_more
+        return self._format_backup_list(
+            (
+                backup["backup-id"],
+                backup["backup-type"],
+                backup["reference-backup-id"],
+                backup["repository"],
+                "" if backup["s3-objects"] is None else str(backup["s3-objects"]),
+                backup["backup-status"],
             )
-            error = backup["error"]
-            backup_status = "finished"
-            if error:
-                backup_status = f"failed: {error}"
-            backup_list.append((backup_id, "physical", backup_status))
-        return self._format_backup_list(backup_list)
+            for backup in page
+        ), has_more
+
+    def _get_repository_info(self, timeout: float = None) -> Optional[List[Dict]]:
+        """Retrieve the output of pgbackrest info, using the cached one while it's still valid.
+
+        Listing the repository is slow and costly on buckets with many backups and WAL files,
+        so the parsed output is cached in the workload container until it expires or it's
+        invalidated (by this or other units) after a backup, a restore or an S3 change.
+
+        Args:
+            timeout: timeout in seconds for the pgbackrest info command.
+
+        Returns:
+            the list of stanzas from the repository or None if pgBackRest couldn't be run.
+        """
+        can_connect = self.container.can_connect()
+        if can_connect and self.container.exists(REPOSITORY_INFO_CACHE_FILE):
+            cache = json.loads(self.container.pull(REPOSITORY_INFO_CACHE_FILE).read())
+            if (
+                cache["cached-at"] > self._repository_info_invalidated_at
+                and datetime.now().timestamp() - cache["cached-at"] < REPOSITORY_INFO_CACHE_TTL
+            ):
+                return cache["info"]
+
+        output, _ = self._execute_command(["pgbackrest", "info", "--output=json"], timeout=timeout)
+        if output is None:
+            return None
+        # pgBackRest renders the whole document before printing it and the command output is
+        # read at once, so it's parsed as a whole (the backups are then converted lazily).
+        repository_info = json.loads(output)
+
+        if can_connect:
+            self.container.push(
+                REPOSITORY_INFO_CACHE_FILE,
+                json.dumps({"cached-at": datetime.now().timestamp(), "info": repository_info}),
+                user=WORKLOAD_OS_USER,
+                group=WORKLOAD_OS_GROUP,
+            )
+        return repository_info
+
+    @property
+    def _repository_info_invalidated_at(self) -> float:
+        """Last time the repository info cache was invalidated by any of the units."""
+        relation = self.charm._peers
+        if relation is None:
+            return 0
+        return max(
+            float(relation.data[unit].get("repository-info-invalidated-at", 0))
+            for unit in {self.charm.unit, *relation.units}
+        )
+
+    def invalidate_repository_info_cache(self, local_only: bool = False) -> None:
+        """Invalidate the repository info cache.
+
+        Args:
+            local_only: whether to invalidate only the cache of this unit (used when all
+                the units are notified about the change, like when the S3 relation is removed).
+        """
+        if self.container.can_connect() and self.container.exists(REPOSITORY_INFO_CACHE_FILE):
+            self.container.remove_path(REPOSITORY_INFO_CACHE_FILE)
+        if local_only:
+            return
+        self.charm.unit_peer_data.update({
+            "repository-info-invalidated-at": str(datetime.now().timestamp())
+        })
 
-    def _list_backups(self, show_failed: bool) -> OrderedDict[str, str]:
+    def _list_backups(self, show_failed: bool, parse: bool = True) -> OrderedDict[str, str]:
         """Retrieve the list of backups.
 
         Args:
             show_failed: whether to also return the failed backups.
+            parse: whether to convert the pgBackRest labels into backup ids.
 
         Returns:
             a dict of previously created backups (id + stanza name) or an empty list
                 if there is no backups in the S3 bucket.
         """
-        output, _ = self._execute_command(["pgbackrest", "info", "--output=json"])
-        repository_info = next(iter(json.loads(output)), None)
+        repository_info = next(iter(self._get_repository_info() or []), None)
 
         # If there are no backups, returns an empty dict.
         if repository_info is None:
             return OrderedDict[str, str]()
 
-        backups = repository_info["backup"]
+        # Sort the backups by their ids, as the labels of differential and incremental
+        # backups are prefixed by the label of the full backup they depend on.
+        backups = sorted(
+            repository_info["backup"],
+            key=lambda backup: self._parse_backup_id(backup["label"])[0],
+        )
         stanza_name = repository_info["name"]
         return OrderedDict[str, str](
             (
-                datetime.strftime(
-                    datetime.strptime(backup["label"][:-1], "%Y%m%d-%H%M%S"), "%Y-%m-%dT%H:%M:%SZ"
-                ),
+                self._parse_backup_id(backup["label"])[0] if parse else backup["label"],
                 stanza_name,
             )
             for backup in backups
             if show_failed or not backup["error"]
         )
 
+    def _get_backup_chain(self, backup_id: str) -> Tuple[Optional[str], List[str]]:
+        """Retrieve the label of a backup and check the backups it depends on.
+
+        Args:
+            backup_id: id of the backup (format = %Y-%m-%dT%H:%M:%SZ).
+
+        Returns:
+            a tuple with the pgBackRest label of the backup (or None if it doesn't exist)
+                and the list of labels of the backups it depends on that are not available.
+        """
+        repository_info = next(iter(self._get_repository_info() or []), None)
+        if repository_info is None:
+            return None, []
+
+        available_labels = {
+            backup["label"]: backup for backup in repository_info["backup"] if not backup["error"]
+        }
+        for label, backup in available_labels.items():
+            if self._parse_backup_id(label)[0] == backup_id:
+                # Differential and incremental backups need all the referenced backups
+                # (the full one and, for incremental ones, the intermediate ones).
+                missing_references = [
+                    reference
+                    for reference in backup.get("reference") or []
+                    if reference not in available_labels
+                ]
+                return label, missing_references
+        return None, []
+
+    @staticmethod
+    def _parse_backup_id(label: str) -> Tuple[str, str]:
+        """Parse a pgBackRest backup label.
+
+        Args:
+            label: the backup label (like 20230101-090000F or 20230101-090000F_20230102-090000D
+                for differential and incremental backups).
+
+        Returns:
+            a tuple with the backup id (format = %Y-%m-%dT%H:%M:%SZ) and the backup type.
+        """
+        # Differential and incremental labels are suffixed with their own timestamp.
+        backup_label = label.split("_")[-1]
+        backup_id = datetime.strftime(
+            datetime.strptime(backup_label[:-1], "%Y%m%d-%H%M%S"), "%Y-%m-%dT%H:%M:%SZ"
+        )
+        return backup_id, BACKUP_LABEL_SUFFIXES.get(backup_label[-1], "full")
+
     def _initialise_stanza(self) -> None:
         """Initialize the stanza.
 
@@ -324,6 +825,7 @@ class PostgreSQLBackups(Object):
             self.charm.unit.status = BlockedStatus(FAILED_TO_INITIALIZE_STANZA_ERROR_MESSAGE)
             return
 
+        self.invalidate_repository_info_cache(local_only=True)
         self.start_stop_pgbackrest_service()
 
         # Store the stanza name to be used in configurations updates.
@@ -427,6 +929,8 @@ class PostgreSQLBackups(Object):
 
     def _on_s3_credential_changed(self, event: CredentialsChangedEvent):
         """Call the stanza initialization when the credentials or the connection info change."""
+        from botocore.exceptions import ClientError
+
         if "cluster_initialised" not in self.charm.app_peer_data:
             logger.debug("Cannot set pgBackRest configurations, PostgreSQL has not yet started.")
             event.defer()
@@ -436,6 +940,9 @@ class PostgreSQLBackups(Object):
             logger.debug("Cannot set pgBackRest configurations, missing configurations.")
             return
 
+        # The credentials may point to another repository.
+        self.invalidate_repository_info_cache(local_only=True)
+
         # Verify the s3 relation only on the primary.
         if not self.charm.is_primary:
             return
@@ -453,21 +960,95 @@ class PostgreSQLBackups(Object):
 
         self._initialise_stanza()
 
+    def _build_backup_command(self, backup_type: str, repository: str = "s3") -> List[str]:
+        """Build the pgBackRest command to create a backup.
+
+        Args:
+            backup_type: the type of the backup (full, differential or incremental).
+            repository: the repository where the backup is stored (s3 or local).
+
+        Returns:
+            the command to run in the workload container.
+        """
+        command = [
+            "pgbackrest",
+            f"--stanza={self.stanza_name}",
+            "--log-level-console=debug",
+            f"--type={BACKUP_TYPE_OVERRIDES[backup_type]}",
+            "backup",
+        ]
+        if repository == LOCAL_REPOSITORY:
+            command.append(f"--repo={REPOSITORY_KEYS[LOCAL_REPOSITORY]}")
+        if self.charm.is_primary:
+            # Force the backup to run in the primary if it's not possible to run it
+            # on the replicas (that happens when TLS is not enabled).
+            command.append("--no-backup-standby")
+        return command
+
+    def _on_config_changed(self, _) -> None:
+        """Render the pgBackRest configuration file again to apply the backup config options."""
+        if self.model.get_relation(self.relation_name) is None or not self.container.can_connect():
+            return
+
+        if self._render_pgbackrest_conf_file() and self.is_local_repository_enabled:
+            self._maintain_local_repository()
+
     def _on_create_backup_action(self, event) -> None:
-        """Request that pgBackRest creates a backup."""
-        can_unit_perform_backup, validation_message = self._can_unit_perform_backup()
-        if not can_unit_perform_backup:
-            logger.error(f"Backup failed: {validation_message}")
-            event.fail(validation_message)
+        """Request that pgBackRest creates a backup in a background job."""
+        backup_type = event.params.get("type", "full")
+        if backup_type not in BACKUP_TYPE_OVERRIDES:
+            error_message = f"Invalid backup type: {backup_type}. Possible values: {', '.join(BACKUP_TYPE_OVERRIDES.keys())}."
+            logger.error(f"Backup failed: {error_message}")
+            event.fail(error_message)
+            return
+
+        repository = event.params.get("repository", "s3")
+        if repository not in REPOSITORY_KEYS:
+            error_message = f"Invalid repository: {repository}. Possible values: {', '.join(REPOSITORY_KEYS.keys())}."
+            logger.error(f"Backup failed: {error_message}")
+            event.fail(error_message)
+            return
+        if repository == LOCAL_REPOSITORY and not self.is_local_repository_enabled:
+            error_message = f"The local repository is not enabled (backup_local_repository config option and {BACKUPS_STORAGE} storage)"
+            logger.error(f"Backup failed: {error_message}")
+            event.fail(error_message)
+            return
+
+        job_id = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        error_message = self._create_backup(backup_type, job_id, repository)
+        if error_message is not None:
+            logger.error(f"Backup failed: {error_message}")
+            event.fail(error_message)
             return
 
+        event.set_results({"backup-status": "backup started", "job-id": job_id})
+
+    def _create_backup(
+        self, backup_type: str, job_id: str, repository: str = "s3"
+    ) -> Optional[str]:
+        """Start a backup job in this unit.
+
+        Args:
+            backup_type: the type of the backup (full, differential or incremental).
+            job_id: id of the backup job (the time the backup was requested).
+            repository: the repository where the backup is stored (s3 or local).
+
+        Returns:
+            an error message if the backup job couldn't be started or None otherwise.
+        """
+        can_unit_perform_backup, validation_message = self._can_unit_perform_backup(repository)
+        if not can_unit_perform_backup:
+            return validation_message
+
+        if repository == LOCAL_REPOSITORY and not self._ensure_local_stanza():
+            return "Failed to initialise the stanza in the local repository"
+
         # Retrieve the S3 Parameters to use when uploading the backup logs to S3.
         s3_parameters, _ = self._retrieve_s3_parameters()
 
         # Test uploading metadata to S3 to test credentials before backup.
-        datetime_backup_requested = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
         juju_version = JujuVersion.from_environ()
-        metadata = f"""Date Backup Requested: {datetime_backup_requested}
+        metadata = f"""Date Backup Requested: {job_id}
 Model Name: {self.model.name}
 Application Name: {self.model.app.name}
 Unit Name: {self.charm.unit.name}
@@ -481,12 +1062,10 @@ Juju Version: {str(juju_version)}
             ),
             s3_parameters,
         ):
-            error_message = "Failed to upload metadata to provided S3"
-            logger.error(f"Backup failed: {error_message}")
-            event.fail(error_message)
-            return
+            return "Failed to upload metadata to provided S3"
 
-        if not self.charm.is_primary:
+        is_primary = self.charm.is_primary
+        if not is_primary:
             # Create a rule to mark the cluster as in a creating backup state and update
             # the Patroni configuration.
             self._change_connectivity_to_database(connectivity=False)
@@ -497,25 +1076,130 @@ Juju Version: {str(juju_version)}
         self.charm.update_config(is_creating_backup=True)
 
         try:
-            command = [
-                "pgbackrest",
-                f"--stanza={self.stanza_name}",
-                "--log-level-console=debug",
-                "--type=full",
-                "backup",
-            ]
-            if self.charm.is_primary:
-                # Force the backup to run in the primary if it's not possible to run it
-                # on the replicas (that happens when TLS is not enabled).
-                command.append("--no-backup-standby")
-            stdout, stderr = self._execute_command(command)
-            backup_id = list(self._list_backups(show_failed=True).keys())[-1]
-        except ExecError as e:
+            self._start_backup_job(backup_type, repository)
+        except ChangeError as e:
             logger.exception(e)
+            self._release_backup_resources(changed_connectivity=not is_primary)
+            return f"Failed to start the backup job with error: {str(e)}"
+
+        # Keep track of the job to report its progress and finish it when pgBackRest exits.
+        self.invalidate_repository_info_cache()
+        self.charm.unit_peer_data.update({
+            "backup-job": json.dumps({
+                "id": job_id,
+                "type": backup_type,
+                "repository": repository,
+                "started": datetime.now().timestamp(),
+                "changed-connectivity": not is_primary,
+            }),
+        })
+        logger.info(f"Backup job {job_id} started")
+        return None
+
+    @property
+    def _backup_job(self) -> Optional[Dict]:
+        """The background backup job started in this unit that has not been finished yet."""
+        backup_job = self.charm.unit_peer_data.get("backup-job")
+        return json.loads(backup_job) if backup_job else None
+
+    def _start_backup_job(self, backup_type: str, repository: str = "s3") -> None:
+        """Start pgBackRest as a Pebble service to create the backup in the background.
+
+        The output and the exit code of pgBackRest are stored in files, so they can be
+        checked (and uploaded to S3) by the following hooks.
+
+        Args:
+            backup_type: the type of the backup (full, differential or incremental).
+            repository: the repository where the backup is stored (s3 or local).
+        """
+        self._start_pgbackrest_job(
+            self.charm.pgbackrest_backup_service,
+            "backup",
+            self._build_backup_command(backup_type, repository),
+            (BACKUP_JOB_STDOUT_FILE, BACKUP_JOB_STDERR_FILE, BACKUP_JOB_EXIT_CODE_FILE),
+        )
+
+    def _start_pgbackrest_job(
+        self, service: str, job: str, command: List[str], files: Tuple[str, str, str]
+    ) -> None:
+        """Start a pgBackRest command as a Pebble service that is not restarted when it exits.
+
+        Args:
+            service: name of the Pebble service (also used as the layer label).
+            job: short description of the job (like backup or expire).
+            command: the pgBackRest command to run.
+            files: the files where the stdout, the stderr and the exit code are stored.
+        """
+        for path in files:
+            if self.container.exists(path):
+                self.container.remove_path(path)
+
+        stdout_file, stderr_file, exit_code_file = files
+        layer = Layer({
+            "summary": f"pgBackRest {job} job layer",
+            "description": f"pebble config layer for the pgBackRest {job} job",
+            "services": {
+                service: {
+                    "override": "replace",
+                    "summary": f"pgBackRest {job} job",
+                    "command": f"/bin/bash -c '{' '.join(command)} > {stdout_file} 2> {stderr_file}; echo $? > {exit_code_file}'",
+                    "startup": "disabled",
+                    "user": WORKLOAD_OS_USER,
+                    "group": WORKLOAD_OS_GROUP,
+                    "on-success": "ignore",
+                    "on-failure": "ignore",
+                }
+            },
+        })
+        self.container.add_layer(service, layer, combine=True)
+        self.container.restart(service)
+
+    def _read_backup_job_file(self, path: str) -> Optional[str]:
+        """Read one of the files written by the backup job (or None if it doesn't exist)."""
+        if not self.container.exists(path):
+            return None
+        return self.container.pull(path).read()
+
+    def _is_backup_job_running(self) -> bool:
+        """Returns whether the pgBackRest backup job is still running."""
+        return self._is_job_running(
+            self.charm.pgbackrest_backup_service, BACKUP_JOB_EXIT_CODE_FILE
+        )
+
+    def _is_job_running(self, service: str, exit_code_file: str) -> bool:
+        """Returns whether a pgBackRest job is still running."""
+        if self._read_backup_job_file(exit_code_file) is not None:
+            return False
+        services = self.container.pebble.get_services(names=[service])
+        return len(services) > 0 and services[0].current == ServiceStatus.ACTIVE
+
+    def check_backup_job(self) -> None:
+        """Finish the backup job if pgBackRest has already exited.
+
+        The backup logs are uploaded to S3 and the connectivity to the database and the
+        is_creating_backup Patroni tag are released.
+        """
+        backup_job = self._backup_job
+        if backup_job is None or not self.container.can_connect():
+            return
+
+        if self._is_backup_job_running():
+            logger.debug(f"Backup job {backup_job['id']} is still running")
+            return
 
+        self.invalidate_repository_info_cache()
+        exit_code = self._read_backup_job_file(BACKUP_JOB_EXIT_CODE_FILE)
+        stdout = self._read_backup_job_file(BACKUP_JOB_STDOUT_FILE) or ""
+        stderr = self._read_backup_job_file(BACKUP_JOB_STDERR_FILE) or ""
+        if exit_code is not None and exit_code.strip() == "0":
+            backup_id = list(self._list_backups(show_failed=True).keys())[-1]
+            backup_status = "finished"
+        else:
             # Recover the backup id from the logs.
             backup_label_stdout_line = re.findall(
-                r"(new backup label = )([0-9]{8}[-][0-9]{6}[F])$", e.stdout, re.MULTILINE
+                r"(new backup label = )([0-9]{8}[-][0-9]{6}[F](_[0-9]{8}[-][0-9]{6}[DI])?)$",
+                stdout,
+                re.MULTILINE,
             )
             if len(backup_label_stdout_line) > 0:
                 backup_id = backup_label_stdout_line[0][1]
@@ -523,15 +1207,20 @@ Juju Version: {str(juju_version)}
                 # Generate a backup id from the current date and time if the backup failed before
                 # generating the backup label (our backup id).
                 backup_id = datetime.strftime(datetime.now(), "%Y%m%d-%H%M%SF")
+            backup_status = (
+                f"failed: pgBackRest exited with code {(exit_code or 'unknown').strip()}"
+            )
 
-            # Upload the logs to S3.
-            logs = f"""Stdout:
-{e.stdout}
+        # Upload the logs to S3.
+        logs = f"""Stdout:
+{stdout}
 
 Stderr:
-{e.stderr}
+{stderr}
 """
-            self._upload_content_to_s3(
+        s3_parameters, _ = self._retrieve_s3_parameters()
+        if (
+            not self._upload_content_to_s3(
                 logs,
                 os.path.join(
                     s3_parameters["path"],
@@ -539,33 +1228,386 @@ Stderr:
                 ),
                 s3_parameters,
             )
-            error_message = f"Failed to backup PostgreSQL with error: {str(e)}"
-            logger.error(f"Backup failed: {error_message}")
-            event.fail(error_message)
+            and backup_status == "finished"
+        ):
+            backup_status = "failed: error uploading logs to S3"
+
+        if backup_status == "finished":
+            logger.info(
+                f"Backup succeeded: backup job {backup_job['id']} with backup-id {backup_id}"
+            )
         else:
-            # Upload the logs to S3 and fail the action if it doesn't succeed.
-            logs = f"""Stdout:
-{stdout}
+            logger.error(f"Backup failed: backup job {backup_job['id']} {backup_status}")
 
-Stderr:
-{stderr}
-"""
-            if not self._upload_content_to_s3(
-                logs,
-                os.path.join(
-                    s3_parameters["path"],
-                    f"backup/{self.stanza_name}/{backup_id}/backup.log",
-                ),
-                s3_parameters,
+        backup_job.update({
+            "backup-id": backup_id,
+            "status": backup_status,
+            "finished": datetime.now().timestamp(),
+        })
+        self.charm.unit_peer_data.update({
+            "backup-job": "",
+            "last-backup-job": json.dumps(backup_job),
+        })
+        self._release_backup_resources(backup_job["changed-connectivity"])
+
+        if backup_status == "finished":
+            # Expire the old backups only after the new one succeeded, outside the backup job.
+            self._start_expire_job()
+
+    @property
+    def _expire_job(self) -> Optional[Dict]:
+        """The background expire job started in this unit that has not been finished yet."""
+        expire_job = self.charm.unit_peer_data.get("expire-job")
+        return json.loads(expire_job) if expire_job else None
+
+    def _get_repository_size(self) -> int:
+        """Returns the size (in bytes) of the backups stored in the repository."""
+        repository_info = next(iter(self._get_repository_info() or []), None)
+        if repository_info is None:
+            return 0
+        return sum(
+            backup.get("info", {}).get("repository", {}).get("delta", 0)
+            for backup in repository_info["backup"]
+        )
+
+    def _start_expire_job(self) -> None:
+        """Start pgBackRest expire in the background to apply the retention policy."""
+        repository_size = self._get_repository_size()
+        try:
+            self._start_pgbackrest_job(
+                self.charm.pgbackrest_expire_service,
+                "expire",
+                [
+                    "pgbackrest",
+                    f"--stanza={self.stanza_name}",
+                    "--log-level-console=info",
+                    "expire",
+                ],
+                (EXPIRE_JOB_STDOUT_FILE, EXPIRE_JOB_STDERR_FILE, EXPIRE_JOB_EXIT_CODE_FILE),
+            )
+        except ChangeError as e:
+            logger.exception("Failed to start the expire job", exc_info=e)
+            return
+
+        self.charm.unit_peer_data.update({
+            "expire-job": json.dumps({
+                "started": datetime.now().timestamp(),
+                "repository-size": repository_size,
+            }),
+        })
+        logger.info("Expire job started")
+
+    def check_expire_job(self) -> None:
+        """Finish the expire job if pgBackRest has already exited, recording the reclaimed backups space."""
+        expire_job = self._expire_job
+        if expire_job is None or not self.container.can_connect():
+            return
+
+        if self._is_job_running(self.charm.pgbackrest_expire_service, EXPIRE_JOB_EXIT_CODE_FILE):
+            logger.debug("Expire job is still running")
+            return
+
+        self.invalidate_repository_info_cache()
+        exit_code = (self._read_backup_job_file(EXPIRE_JOB_EXIT_CODE_FILE) or "unknown").strip()
+        expired_backups = [
+            label.strip()
+            for line in (self._read_backup_job_file(EXPIRE_JOB_STDOUT_FILE) or "").splitlines()
+            if (match := EXPIRED_BACKUP_REGEX.search(line))
+            for label in match.group(1).split(",")
+        ]
+        if exit_code == "0":
+            logger.info(f"Expire succeeded: {len(expired_backups)} backups expired")
+        else:
+            logger.error(f"Expire failed: pgBackRest exited with code {exit_code}")
+
+        expire_job.update({
+            "finished": datetime.now().timestamp(),
+            "status": "finished" if exit_code == "0" else f"failed: exit code {exit_code}",
+            "expired-backups": len(expired_backups),
+            # pgBackRest info doesn't report the size of the WAL files, so only the
+            # space of the expired backups is accounted.
+            "reclaimed-backup-bytes": max(
+                expire_job["repository-size"] - self._get_repository_size(), 0
+            ),
+        })
+        self.charm.unit_peer_data.update({
+            "expire-job": "",
+            "last-expire-job": json.dumps(expire_job),
+        })
+
+    @property
+    def _scheduled_backup(self) -> Optional[Dict]:
+        """The scheduled backup assigned by the leader to one of the units."""
+        scheduled_backup = self.charm.app_peer_data.get("scheduled-backup")
+        return json.loads(scheduled_backup) if scheduled_backup else None
+
+    def run_backup_schedule(self) -> None:
+        """Create the backups scheduled through the backup_schedule_* config options.
+
+        The leader checks which scheduled backups are due and assigns each run to one
+        of the units, which starts the backup job in its next update-status hook.
+        """
+        if self.model.get_relation(self.relation_name) is None:
+            return
+
+        if self.charm.unit.is_leader() and "stanza" in self.charm.app_peer_data:
+            self._coordinate_scheduled_backups()
+
+        scheduled_backup = self._scheduled_backup
+        if (
+            scheduled_backup is None
+            or scheduled_backup["unit"] != self.charm.unit.name
+            or self.charm.unit_peer_data.get("scheduled-backup-id") == scheduled_backup["id"]
+        ):
+            return
+
+        self.charm.unit_peer_data.update({"scheduled-backup-id": scheduled_backup["id"]})
+        # The local schedule creates full backups in the local repository.
+        if scheduled_backup["type"] == LOCAL_REPOSITORY:
+            backup_type, repository = "full", LOCAL_REPOSITORY
+        else:
+            backup_type, repository = scheduled_backup["type"], "s3"
+        error_message = self._create_backup(backup_type, scheduled_backup["id"], repository)
+        if error_message is not None:
+            logger.error(f"Scheduled backup {scheduled_backup['id']} failed: {error_message}")
+
+    def _maintain_local_repository(self) -> None:
+        """Create the stanza in the local repository of the primary when it's enabled.
+
+        After a failover, Patroni creates it in the new primary when promoting it.
+        """
+        try:
+            is_primary = self.charm.is_primary
+        except RetryError:
+            return
+        if is_primary:
+            self._ensure_local_stanza()
+
+    def _ensure_local_stanza(self) -> bool:
+        """Create the stanza in the local repository of this unit if it doesn't exist yet.
+
+        The primary pushes the WAL files to all the repositories, so the stanza must also
+        exist in its local repository.
+
+        Returns:
+            whether the stanza exists in the local repository.
+        """
+        stanza = self.charm.app_peer_data.get("stanza")
+        if not stanza:
+            return False
+        if self.charm.unit_peer_data.get("local-stanza") == stanza:
+            return True
+
+        try:
+            output, _ = self._execute_command([
+                "pgbackrest",
+                f"--stanza={stanza}",
+                f"--repo={REPOSITORY_KEYS[LOCAL_REPOSITORY]}",
+                "stanza-create",
+            ])
+        except ExecError as e:
+            logger.exception("Failed to create the stanza in the local repository", exc_info=e)
+            return False
+        if output is None:
+            return False
+        self.charm.unit_peer_data.update({"local-stanza": stanza})
+        return True
+
+    def _coordinate_scheduled_backups(self) -> None:
+        """Assign the due scheduled backups to units, skipping the runs that would overlap."""
+        now = datetime.now(timezone.utc)
+        schedule = json.loads(self.charm.app_peer_data.get("backup-schedule", "{}"))
+        scheduled_backup = self._scheduled_backup
+        if scheduled_backup is not None and self._finish_scheduled_backup(
+            scheduled_backup, schedule
+        ):
+            scheduled_backup = None
+
+        # Only one of the due backups is created (the most complete one).
+        due_backup_types = self._update_backup_schedule(schedule, now)
+        if due_backup_types:
+            unit = None
+            if scheduled_backup is None and not self._is_any_backup_job_running:
+                unit = self._pick_scheduled_backup_unit(due_backup_types[0])
+            if unit is None:
+                logger.warning(
+                    f"Skipping scheduled {', '.join(due_backup_types)} backup: a backup is already running or no unit can create it"
+                )
+                for backup_type in due_backup_types:
+                    schedule[backup_type]["skipped-runs"] = (
+                        schedule[backup_type].get("skipped-runs", 0) + 1
+                    )
+            else:
+                backup_type = due_backup_types[0]
+                scheduled_backup = {
+                    "id": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "type": backup_type,
+                    "unit": unit,
+                    "assigned": now.timestamp(),
+                }
+                schedule[backup_type]["last-run"] = scheduled_backup["id"]
+                logger.info(f"Scheduled {backup_type} backup assigned to {unit}")
+
+        self.charm.app_peer_data.update({
+            "backup-schedule": json.dumps(schedule),
+            "scheduled-backup": json.dumps(scheduled_backup) if scheduled_backup else "",
+        })
+
+    def _update_backup_schedule(self, schedule: Dict, now: datetime) -> List[str]:
+        """Compute the next runs from the backup_schedule_* config options.
+
+        Args:
+            schedule: the runs of each backup type, which are updated in place.
+            now: the current time.
+
+        Returns:
+            the list of backup types that are due.
+        """
+        due_backup_types = []
+        for backup_type in [*BACKUP_TYPE_OVERRIDES, LOCAL_REPOSITORY]:
+            expression = getattr(self.charm.config, f"backup_schedule_{backup_type}")
+            if backup_type == LOCAL_REPOSITORY and not self.is_local_repository_enabled:
+                expression = None
+            if expression is None:
+                schedule.pop(backup_type, None)
+                continue
+
+            runs = schedule.setdefault(backup_type, {})
+            if runs.get("expression") != expression:
+                runs.update({
+                    "expression": expression,
+                    "next-run": next_cron_run(expression, now).timestamp(),
+                })
+            elif runs["next-run"] <= now.timestamp():
+                due_backup_types.append(backup_type)
+                runs["next-run"] = next_cron_run(expression, now).timestamp()
+        return due_backup_types
+
+    def _finish_scheduled_backup(self, scheduled_backup: Dict, schedule: Dict) -> bool:
+        """Record the result of a scheduled backup if it already finished.
+
+        Args:
+            scheduled_backup: the scheduled backup assigned to one of the units.
+            schedule: the runs of each backup type, which are updated in place.
+
+        Returns:
+            whether the scheduled backup finished (or was abandoned).
+        """
+        relation = self.charm._peers
+        unit = next(
+            (
+                unit
+                for unit in {self.charm.unit, *relation.units}
+                if unit.name == scheduled_backup["unit"]
+            ),
+            None,
+        )
+        unit_data = relation.data[unit] if unit is not None else {}
+        if unit is not None and unit_data.get("scheduled-backup-id") != scheduled_backup["id"]:
+            # The unit didn't start the backup yet.
+            if (
+                datetime.now().timestamp() - scheduled_backup["assigned"]
+                < SCHEDULED_BACKUP_START_TIMEOUT
             ):
-                error_message = "Error uploading logs to S3"
-                logger.error(f"Backup failed: {error_message}")
-                event.fail(error_message)
+                return False
+            status = "failed: the backup was not started in time"
+        elif "backup-job" in unit_data:
+            return False
+        else:
+            last_backup_job = json.loads(unit_data.get("last-backup-job", "{}"))
+            if last_backup_job.get("id") == scheduled_backup["id"]:
+                status = last_backup_job["status"]
+                schedule.get(scheduled_backup["type"], {})["last-duration"] = (
+                    f"{int(last_backup_job['finished'] - last_backup_job['started'])}s"
+                )
             else:
-                logger.info(f"Backup succeeded: with backup-id {datetime_backup_requested}")
-                event.set_results({"backup-status": "backup created"})
+                status = "failed: the backup job could not be started"
 
-        if not self.charm.is_primary:
+        schedule.get(scheduled_backup["type"], {}).update({
+            "last-status": status,
+            "last-unit": scheduled_backup["unit"],
+        })
+        logger.info(f"Scheduled backup {scheduled_backup['id']} {status}")
+        return True
+
+    @property
+    def _is_any_backup_job_running(self) -> bool:
+        """Whether any of the units is creating a backup or expiring old ones."""
+        relation = self.charm._peers
+        return any(
+            "backup-job" in relation.data[unit] or "expire-job" in relation.data[unit]
+            for unit in {self.charm.unit, *relation.units}
+        )
+
+    def _pick_scheduled_backup_unit(self, backup_type: str = "full") -> Optional[str]:
+        """Pick the unit to create a scheduled backup.
+
+        Backups are created preferably on the replica with the lowest replication lag,
+        to avoid loading the primary (which is used only when there are no replicas or
+        when TLS is not enabled, as pgBackRest needs it to backup from the replicas).
+        Local backups are always created on the primary.
+
+        Args:
+            backup_type: the scheduled backup type (or local for the local backups).
+
+        Returns:
+            the name of the unit or None if no unit can create the backup.
+        """
+        try:
+            primary = self.charm._patroni.get_primary(unit_name_pattern=True)
+            replicas_lag = self.charm._patroni.get_replicas_lag()
+        except RetryError as e:
+            logger.warning(f"Failed to retrieve the cluster members: {e}")
+            return None
+
+        relation = self.charm._peers
+        units = {unit.name: unit for unit in {self.charm.unit, *relation.units}}
+        if backup_type == LOCAL_REPOSITORY:
+            return primary if primary in units else None
+        replicas = sorted(
+            (lag, name)
+            for name, lag in replicas_lag.items()
+            if name in units and "tls" in relation.data[units[name]]
+        )
+        if replicas:
+            return replicas[0][1]
+        if primary in units and (
+            "tls" not in relation.data[units[primary]] or self.charm.app.planned_units() == 1
+        ):
+            return primary
+        return None
+
+    def _on_get_backup_schedule_action(self, event) -> None:
+        """Report the last and next runs of the scheduled backups."""
+        schedule = json.loads(self.charm.app_peer_data.get("backup-schedule", "{}"))
+        if not schedule:
+            event.fail("No backups are scheduled")
+            return
+
+        results = {}
+        for backup_type, runs in schedule.items():
+            results[backup_type] = {
+                "schedule": runs["expression"],
+                "next-run": datetime.fromtimestamp(runs["next-run"], tz=timezone.utc).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                ),
+                **{
+                    key: str(runs[key])
+                    for key in [
+                        "last-run",
+                        "last-duration",
+                        "last-status",
+                        "last-unit",
+                        "skipped-runs",
+                    ]
+                    if key in runs
+                },
+            }
+        event.set_results(results)
+
+    def _release_backup_resources(self, changed_connectivity: bool) -> None:
+        """Restore the connectivity to the database and remove the creating backup tag."""
+        if changed_connectivity:
             # Remove the rule the marks the cluster as in a creating backup state
             # and update the Patroni configuration.
             self._change_connectivity_to_database(connectivity=True)
@@ -573,13 +1615,228 @@ Stderr:
         self.charm.update_config(is_creating_backup=False)
         self.charm.unit.status = ActiveStatus()
 
+    def _on_get_backup_status_action(self, event) -> None:
+        """Report the progress of the backup job running in this unit.
+
+        The action only reads the state of the job, which is finished by the
+        update status hook once pgBackRest exits.
+        """
+        if (backup_job := self._backup_job) is not None:
+            stdout = self._read_backup_job_file(BACKUP_JOB_STDOUT_FILE) or ""
+            phase, bytes_transferred, progress = self._parse_backup_progress(stdout)
+            if self._read_backup_job_file(BACKUP_JOB_EXIT_CODE_FILE) is not None:
+                phase = "finishing"
+            elapsed_time = max(datetime.now().timestamp() - backup_job["started"], 1)
+            rate = bytes_transferred / elapsed_time
+            results = {
+                "job-id": backup_job["id"],
+                "backup-type": backup_job["type"],
+                "phase": phase,
+                "bytes-transferred": str(bytes_transferred),
+                "progress": f"{progress:.2f}%",
+                "rate": f"{rate / 10**6:.2f}MB/s",
+                "elapsed-time": f"{int(elapsed_time)}s",
+            }
+            if progress > 0:
+                results["eta"] = f"{int(elapsed_time * (100 - progress) / progress)}s"
+            event.set_results(results)
+            return
+
+        if (last_backup_job := self.charm.unit_peer_data.get("last-backup-job")) is not None:
+            backup_job = json.loads(last_backup_job)
+            event.set_results({
+                "job-id": backup_job["id"],
+                "backup-type": backup_job["type"],
+                "phase": "finished" if backup_job["status"] == "finished" else "failed",
+                "backup-id": backup_job["backup-id"],
+                "backup-status": backup_job["status"],
+            })
+            return
+
+        event.fail("No backup was created in this unit")
+
+    @staticmethod
+    def _parse_backup_progress(output: str) -> Tuple[str, int, float]:
+        """Parse the progress of a backup from the pgBackRest output.
+
+        Args:
+            output: the console output of pgBackRest (with at least the detail log level).
+
+        Returns:
+            a tuple with the current phase, the number of bytes already copied
+                and the percentage of the backup that was already completed.
+        """
+        bytes_transferred = 0
+        progress = 0.0
+        phase = "starting"
+        for line in output.splitlines():
+            if match := BACKUP_FILE_PROGRESS_REGEX.search(line):
+                size, unit, percentage = match.groups()
+                bytes_transferred += int(float(size) * BACKUP_SIZE_UNITS[unit])
+                progress = float(percentage)
+                phase = "copying files"
+            elif "backup stop archive" in line:
+                phase = "archiving WAL"
+            elif "new backup label" in line:
+                phase = "finishing"
+        return phase, bytes_transferred, progress
+
+    def _on_get_restore_status_action(self, event) -> None:
+        """Report the progress of the backup restore running in this unit."""
+        if not self.container.can_connect():
+            event.fail("Workload container not ready yet!")
+            return
+
+        if (status := self.get_restore_status()) is None:
+            event.fail("No backup is being restored in this unit")
+            return
+        event.set_results(status)
+
+    def get_restore_status(self) -> Optional[Dict[str, str]]:
+        """Report the progress of the backup restore running in this unit.
+
+        Returns:
+            the phase, the restored bytes, the progress, the rate and the ETA of the restore
+                (and the WAL replay position and lag after the files were restored) or None
+                if this unit isn't restoring a backup.
+        """
+        state = json.loads(self.charm.unit_peer_data.get("cluster-restore") or "null")
+        if state is not None:
+            # This replica restores the backup as a standby in a Pebble job.
+            if state["phase"] == "ready":
+                return {"phase": "waiting for the leader"}
+            if state["phase"] == "restoring":
+                return self._get_restore_progress(
+                    self._read_backup_job_file(RESTORE_JOB_STDOUT_FILE) or ""
+                )
+            return {
+                "phase": "catching up",
+                "replication-lag": self.charm._patroni.member_replication_lag,
+            }
+
+        if "restoring-backup" not in self.charm.app_peer_data:
+            restore_request = self._restore_request
+            if self.charm.unit.is_leader() and restore_request is not None:
+                return {"phase": "waiting for the other units"}
+            return None
+
+        # Patroni restores the backup when bootstrapping the cluster and PostgreSQL then
+        # replays the WAL until the backup is consistent.
+        stanza = self.charm.app_peer_data.get("restore-stanza")
+        status = self._get_restore_progress(
+            self._read_backup_job_file(RESTORE_LOG_FILE.format(stanza=stanza)) or ""
+        )
+        if status["phase"] == "restored":
+            status["phase"] = "replaying WAL"
+            status.update(self._get_wal_replay_status())
+        return status
+
+    def get_restore_status_message(self) -> str:
+        """Unit status message with the progress of the backup restore running in this unit."""
+        status = self.get_restore_status() or {}
+        message = "restoring backup"
+        if status.get("phase") == "restoring files":
+            message += f": {status['progress']}"
+            if "rate" in status:
+                message += f" at {status['rate']}"
+        elif status.get("phase") == "replaying WAL":
+            message += ": replaying WAL"
+            if "replay-lag" in status:
+                message += f" (lag {status['replay-lag']})"
+        return message
+
+    def _get_restore_progress(self, output: str) -> Dict[str, str]:
+        """Summarise the progress of a restore from the pgBackRest output."""
+        phase, bytes_restored, progress, started, finished = self._parse_restore_progress(output)
+        status = {
+            "phase": phase,
+            "bytes-restored": str(bytes_restored),
+            "progress": f"{progress:.2f}%",
+        }
+        if started is not None:
+            elapsed_time = max(((finished or datetime.now()) - started).total_seconds(), 1)
+            status["rate"] = f"{bytes_restored / elapsed_time / 10**6:.2f}MB/s"
+            status["elapsed-time"] = f"{int(elapsed_time)}s"
+            if 0 < progress < 100 and finished is None:
+                status["eta"] = f"{int(elapsed_time * (100 - progress) / progress)}s"
+        return status
+
+    @staticmethod
+    def _parse_restore_progress(
+        output: str,
+    ) -> Tuple[str, int, float, Optional[datetime], Optional[datetime]]:
+        """Parse the progress of a restore from the pgBackRest output.
+
+        Args:
+            output: the output or log of pgBackRest (with at least the detail log level).
+
+        Returns:
+            a tuple with the current phase, the number of bytes already restored, the
+                percentage of the restore that was already completed and the times when the
+                restore started and finished (if logged).
+        """
+        # The log file also keeps the output of the previous restores.
+        output = output.rsplit("PROCESS START", 1)[-1]
+        bytes_restored = 0
+        progress = 0.0
+        phase = "starting"
+        started = finished = None
+        for line in output.splitlines():
+            timestamp = None
+            if match := PGBACKREST_LOG_TIMESTAMP_REGEX.match(line):
+                timestamp = datetime.strptime(match.group(1), PGBACKREST_LOG_TIMESTAMP_FORMAT)
+                started = started or timestamp
+            if match := RESTORE_FILE_PROGRESS_REGEX.search(line):
+                size, unit, percentage = match.groups()
+                bytes_restored += int(float(size) * BACKUP_SIZE_UNITS[unit])
+                progress = float(percentage)
+                phase = "restoring files"
+            elif "restore global/pg_control" in line:
+                phase = "finishing"
+            elif "restore command end" in line:
+                phase = "restored" if "completed successfully" in line else "failed"
+                finished = timestamp
+        return phase, bytes_restored, progress, started, finished
+
+    def _get_wal_replay_status(self) -> Dict[str, str]:
+        """WAL replay position and lag of the database recovering from the restored backup.
+
+        The lag is the time since the last replayed transaction was committed.
+        """
+        xlog = self.charm._patroni.member_wal_replay_status
+        status = {}
+        if (location := xlog.get("replayed_location")) is not None:
+            status["replayed-lsn"] = f"{location >> 32:X}/{location & 0xFFFFFFFF:X}"
+        if timestamp := xlog.get("replayed_timestamp"):
+            try:
+                lag = datetime.now(timezone.utc) - datetime.fromisoformat(timestamp)
+                status["replay-lag"] = f"{max(int(lag.total_seconds()), 0)}s"
+            except ValueError:
+                logger.debug(f"Unexpected replayed timestamp format: {timestamp}")
+        return status
+
     def _on_s3_credential_gone(self, _) -> None:
+        self.invalidate_repository_info_cache(local_only=True)
+        self.charm.unit_peer_data.update({"s3-bucket-verified": ""})
         if self.charm.unit.is_leader():
             self.charm.app_peer_data.update({"stanza": "", "init-pgbackrest": ""})
         self.charm.unit_peer_data.update({"stanza": "", "init-pgbackrest": ""})
         if self.charm.is_blocked and self.charm.unit.status.message in S3_BLOCK_MESSAGES:
             self.charm.unit.status = ActiveStatus()
 
+    @property
+    def _last_expire_job(self) -> Optional[Dict]:
+        """The most recent expire job finished by any of the units."""
+        relation = self.charm._peers
+        if relation is None:
+            return None
+        expire_jobs = [
+            json.loads(relation.data[unit]["last-expire-job"])
+            for unit in {self.charm.unit, *relation.units}
+            if "last-expire-job" in relation.data[unit]
+        ]
+        return max(expire_jobs, key=lambda job: job["finished"], default=None)
+
     def _on_list_backups_action(self, event) -> None:
         """List the previously created backups."""
         are_backup_settings_ok, validation_message = self._are_backup_settings_ok()
@@ -588,13 +1845,68 @@ Stderr:
             event.fail(validation_message)
             return
 
+        filters, error_message = self._parse_list_backups_filters(event.params)
+        if error_message is not None:
+            event.fail(error_message)
+            return
+        offset = event.params.get("offset", 0)
+        limit = event.params.get("limit") or None
+        count_objects = bool(event.params.get("count-objects", False))
+        if count_objects and (limit is None or limit > MAX_COUNTED_BACKUPS):
+            event.fail(f"count-objects requires a limit of at most {MAX_COUNTED_BACKUPS} backups")
+            return
+
         try:
-            formatted_list = self._generate_backup_list_output()
-            event.set_results({"backups": formatted_list})
+            formatted_list, has_more = self._generate_backup_list_output(
+                filters, offset, limit, event.params.get("format", "table"), count_objects
+            )
+            results = {"backups": formatted_list}
+            if has_more:
+                results["next-offset"] = offset + limit
+            if (last_expire_job := self._last_expire_job) is not None:
+                finished = datetime.fromtimestamp(last_expire_job["finished"], tz=timezone.utc)
+                results["last-expiry"] = (
+                    f"{finished.strftime('%Y-%m-%dT%H:%M:%SZ')}: "
+                    f"{last_expire_job['status']}, {last_expire_job['expired-backups']} backups expired, "
+                    f"{last_expire_job['reclaimed-backup-bytes'] / 1024** 2:.2f}MB of backups reclaimed"
+                )
+            event.set_results(results)
         except ExecError as e:
             logger.exception(e)
             event.fail(f"Failed to list PostgreSQL backups with error: {str(e)}")
 
+    @staticmethod
+    def _parse_list_backups_filters(params: Dict) -> Tuple[Dict, Optional[str]]:
+        """Validate the filters of the list-backups action.
+
+        Returns:
+            a tuple with the filters and an error message (None if they are valid).
+        """
+        filters = {
+            key: params[key]
+            for key in ["backup-type", "status", "since", "until"]
+            if params.get(key)
+        }
+        if filters.get("backup-type", "full") not in BACKUP_TYPE_OVERRIDES:
+            return (
+                filters,
+                f"Invalid backup-type: {filters['backup-type']}. Possible values: {', '.join(BACKUP_TYPE_OVERRIDES.keys())}.",
+            )
+        if filters.get("status", "finished") not in ["finished", "failed"]:
+            return (
+                filters,
+                f"Invalid status: {filters['status']}. Possible values: finished, failed.",
+            )
+        for key in ["since", "until"]:
+            try:
+                if key in filters:
+                    datetime.strptime(filters[key], "%Y-%m-%dT%H:%M:%SZ")
+            except ValueError:
+                return filters, f"Invalid {key}: {filters[key]} (format = %Y-%m-%dT%H:%M:%SZ)."
+        if params.get("format", "table") not in ["table", "json"]:
+            return filters, f"Invalid format: {params['format']}. Possible values: table, json."
+        return filters, None
+
     def _on_restore_action(self, event):
         """Request that pgBackRest restores a backup."""
         if not self._pre_restore_checks(event):
@@ -608,21 +1920,86 @@ Stderr:
         backups = self._list_backups(show_failed=False)
         if backup_id not in backups.keys():
             error_message = f"Invalid backup-id: {backup_id}"
+            owner = next(
+                (
+                    backup["unit"]
+                    for backup in self._get_other_units_local_backups()
+                    if backup["backup-id"] == backup_id
+                ),
+                None,
+            )
+            if owner is not None:
+                error_message = (
+                    f"Backup {backup_id} is only stored in the local repository of {owner},"
+                    " which is not the leader unit"
+                )
+            logger.error(f"Restore failed: {error_message}")
+            event.fail(error_message)
+            return
+
+        # Differential and incremental backups can only be restored when all the backups
+        # they depend on are still available in the repository.
+        backup_label, missing_references = self._get_backup_chain(backup_id)
+        if backup_label is None:
+            error_message = f"Invalid backup-id: {backup_id}"
+            logger.error(f"Restore failed: {error_message}")
+            event.fail(error_message)
+            return
+        if missing_references:
+            error_message = (
+                f"Backup {backup_id} depends on missing backups: {', '.join(missing_references)}"
+            )
             logger.error(f"Restore failed: {error_message}")
             event.fail(error_message)
             return
 
         self.charm.unit.status = MaintenanceStatus("restoring backup")
 
+        # A delta restore keeps the data files, so pgBackRest only fetches the changed ones.
+        restore_delta = bool(event.params.get("delta", False))
+        if self._peer_units:
+            # The other units stop their database and restore the same backup in parallel
+            # (the restore in this unit is started when all of them are ready).
+            logger.info("Requesting the other units to take part in the restore")
+            self.charm.app_peer_data.update({
+                "restore-request": json.dumps({
+                    "id": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "label": backup_label,
+                    "stanza": backups[backup_id],
+                    "delta": restore_delta,
+                    "requested": datetime.now().timestamp(),
+                }),
+            })
+            event.set_results({"restore-status": "restore started"})
+            return
+
+        error_message = self._start_restore(backup_label, backups[backup_id], restore_delta)
+        if error_message is not None:
+            logger.error(f"Restore failed: {error_message}")
+            event.fail(error_message)
+            return
+
+        event.set_results({"restore-status": "restore started"})
+
+    def _start_restore(
+        self, backup_label: str, restore_stanza: str, restore_delta: bool
+    ) -> Optional[str]:
+        """Configure Patroni to bootstrap the cluster from a backup and start it.
+
+        Args:
+            backup_label: the pgBackRest label of the backup to restore.
+            restore_stanza: name of the stanza the backup belongs to.
+            restore_delta: whether to restore the backup over the existing data files.
+
+        Returns:
+            an error message if the restore couldn't be started or None otherwise.
+        """
         # Stop the database service before performing the restore.
         logger.info("Stopping database service")
         try:
             self.container.stop(self.charm._postgresql_service)
         except ChangeError as e:
-            error_message = f"Failed to stop database service with error: {str(e)}"
-            logger.error(f"Restore failed: {error_message}")
-            event.fail(error_message)
-            return
+            return f"Failed to stop database service with error: {str(e)}"
 
         # Delete the K8S endpoints that tracks the cluster information, including its id.
         # This is the same as "patronictl remove patroni-postgresql-k8s", but the latter doesn't
@@ -641,38 +2018,263 @@ Stderr:
                 namespace=self.charm._namespace,
             )
         except ApiError as e:
-            error_message = f"Failed to remove previous cluster information with error: {str(e)}"
-            logger.error(f"Restore failed: {error_message}")
-            event.fail(error_message)
             self._restart_database()
-            return
+            return f"Failed to remove previous cluster information with error: {str(e)}"
 
-        logger.info("Removing the contents of the data directory")
         try:
-            self._empty_data_files()
+            if restore_delta:
+                logger.info("Moving the data directory aside to run a delta restore")
+                self._move_data_files_aside()
+            else:
+                logger.info("Removing the contents of the data directory")
+                self._empty_data_files()
         except ExecError as e:
-            error_message = f"Failed to remove contents of the data directory with error: {str(e)}"
-            logger.error(f"Restore failed: {error_message}")
-            event.fail(error_message)
             self._restart_database()
-            return
+            return f"Failed to prepare the data directory with error: {str(e)}"
 
         logger.info("Creating PostgreSQL data directory")
         self.charm._create_pgdata(self.container)
 
+        # Restore straight from the local repository when the backup is there (which is
+        # much faster than fetching it from S3).
+        restore_repository = self._get_backup_repository_key(backup_label)
+        if restore_repository != str(REPOSITORY_KEYS[LOCAL_REPOSITORY]):
+            restore_repository = ""
+
         # Mark the cluster as in a restoring backup state and update the Patroni configuration.
         logger.info("Configuring Patroni to restore the backup")
         self.charm.app_peer_data.update({
-            "restoring-backup": f'{datetime.strftime(datetime.strptime(backup_id, "%Y-%m-%dT%H:%M:%SZ"), "%Y%m%d-%H%M%S")}F',
-            "restore-stanza": backups[backup_id],
+            "restoring-backup": backup_label,
+            "restore-stanza": restore_stanza,
+            "restore-delta": "True" if restore_delta else "",
+            "restore-repository": restore_repository,
         })
+        self.invalidate_repository_info_cache()
         self.charm.update_config()
 
         # Start the database to start the restore process.
         logger.info("Configuring Patroni to restore the backup")
         self.container.start(self.charm._postgresql_service)
+        return None
 
-        event.set_results({"restore-status": "restore started"})
+    def _get_backup_repository_key(self, backup_label: str) -> Optional[str]:
+        """Return the key of the repository where a backup is stored (or None if not found)."""
+        for stanza in self._get_repository_info() or []:
+            for backup in stanza.get("backup", []):
+                if backup["label"] == backup_label:
+                    return str(backup.get("database", {}).get("repo-key", 1))
+        return None
+
+    @property
+    def _peer_units(self) -> List[Unit]:
+        """The other units of the application."""
+        return [unit for unit in self.charm._peers.units if unit != self.charm.unit]
+
+    @property
+    def _restore_request(self) -> Optional[Dict]:
+        """The restore of the whole cluster requested in the leader unit."""
+        restore_request = self.charm.app_peer_data.get("restore-request")
+        return json.loads(restore_request) if restore_request else None
+
+    def _coordinate_cluster_restore(self) -> None:
+        """Start the restore in the leader when all the units are ready to restore in parallel.
+
+        The restore request is removed after the restore finishes in the leader and all the
+        other units have already restored the backup. It's also removed (aborting the restore
+        if the leader didn't start it yet) when the other units don't get ready or don't
+        finish in time, so it doesn't block later restores.
+        """
+        restore_request = self._restore_request
+        if restore_request is None:
+            return
+
+        states = [
+            json.loads(self.charm._peers.data[unit].get("cluster-restore") or "null")
+            for unit in self._peer_units
+        ]
+        elapsed_time = datetime.now().timestamp() - restore_request.get("requested", 0)
+        if not restore_request.get("restoring"):
+            if not all(
+                state is not None and state["id"] == restore_request["id"] for state in states
+            ):
+                if elapsed_time < CLUSTER_RESTORE_READY_TIMEOUT:
+                    logger.debug("Waiting for the other units to stop their database")
+                    return
+                logger.error("Restore aborted: the other units didn't get ready in time")
+                self.charm.app_peer_data.update({"restore-request": ""})
+                self.charm._set_primary_status_message()
+                return
+
+            error_message = self._start_restore(
+                restore_request["label"], restore_request["stanza"], restore_request["delta"]
+            )
+            if error_message is not None:
+                logger.error(f"Restore failed: {error_message}")
+                self.charm.app_peer_data.update({"restore-request": ""})
+                self.charm.unit.status = BlockedStatus("Failed to restore backup")
+                return
+
+            # Signal the other units to restore the backup too (only now they remove their
+            # data, as the restore could still fail to start in the leader).
+            restore_request.update({"restoring": True, "requested": datetime.now().timestamp()})
+            self.charm.app_peer_data.update({"restore-request": json.dumps(restore_request)})
+            return
+
+        if "restoring-backup" in self.charm.app_peer_data:
+            return
+        if all(
+            state is None
+            or state["id"] != restore_request["id"]
+            or state["phase"] == "catching-up"
+            for state in states
+        ):
+            logger.info("Restore finished in all the units")
+            self.charm.app_peer_data.update({"restore-request": ""})
+        elif elapsed_time >= CLUSTER_RESTORE_FINISH_TIMEOUT:
+            logger.warning("Restore finished in the leader, but not in time in the other units")
+            self.charm.app_peer_data.update({"restore-request": ""})
+
+    def handle_cluster_restore(self) -> bool:
+        """Restore, in a replica, the same backup being restored in the leader.
+
+        In the leader, this starts its own restore when all the replicas are ready.
+
+        The database is stopped first. Then, when the leader starts its restore, the data
+        directory is prepared and pgBackRest restores the backup as a standby in a Pebble
+        job and the database is started when the leader has finished, following its new
+        timeline (or creating the replica again if pgBackRest failed). If the restore is
+        aborted before the leader starts it, the database is started with the same data.
+
+        Returns:
+            whether this unit is still restoring the backup (so the database shouldn't be
+                touched by the other handlers).
+        """
+        if self.charm.unit.is_leader():
+            self._coordinate_cluster_restore()
+            return False
+
+        if not self.container.can_connect():
+            return False
+
+        restore_request = self._restore_request
+        state = json.loads(self.charm.unit_peer_data.get("cluster-restore") or "null")
+        if state is None or (restore_request is not None and state["id"] != restore_request["id"]):
+            if restore_request is None or restore_request.get("restoring"):
+                return False
+            return self._prepare_cluster_restore(restore_request)
+
+        if state["phase"] == "ready":
+            if restore_request is None:
+                # The restore failed to start in the leader or was aborted (the data
+                # files weren't touched yet, so the database is just started again).
+                self._finish_cluster_restore(state, restored=True)
+            elif restore_request.get("restoring"):
+                self._start_cluster_restore(state, restore_request)
+            return True
+
+        if state["phase"] == "restoring":
+            self.charm.unit.status = MaintenanceStatus(self.get_restore_status_message())
+            self._check_restore_job(state)
+            return True
+
+        # Wait for the replica to catch up with the new timeline.
+        if not self.charm._patroni.member_streaming:
+            return True
+        self.charm.unit_peer_data.update({"cluster-restore": ""})
+        self.charm.unit.status = ActiveStatus()
+        return False
+
+    def _check_restore_job(self, state: Dict) -> None:
+        """Start the database when both the restore job and the restore in the leader finished."""
+        if (
+            self._is_job_running(self.charm.pgbackrest_restore_service, RESTORE_JOB_EXIT_CODE_FILE)
+            or "restoring-backup" in self.charm.app_peer_data
+        ):
+            return
+        exit_code = (self._read_backup_job_file(RESTORE_JOB_EXIT_CODE_FILE) or "").strip()
+        self._finish_cluster_restore(state, restored=exit_code == "0")
+
+    def _prepare_cluster_restore(self, restore_request: Dict) -> bool:
+        """Stop the database to restore a backup after the leader starts its own restore."""
+        logger.info(f"Preparing restore of backup {restore_request['label']}")
+        self.charm.unit.status = MaintenanceStatus("restoring backup")
+        try:
+            self.container.stop(self.charm._postgresql_service)
+        except ChangeError as e:
+            logger.exception("Failed to prepare the restore", exc_info=e)
+            return False
+        self.charm.unit_peer_data.update({
+            "cluster-restore": json.dumps({"id": restore_request["id"], "phase": "ready"})
+        })
+        return True
+
+    def _start_cluster_restore(self, state: Dict, restore_request: Dict) -> None:
+        """Prepare the data directory and restore the backup that the leader is restoring."""
+        try:
+            # A delta restore is done directly over the existing data files.
+            if not restore_request["delta"]:
+                self._empty_data_files()
+        except ExecError as e:
+            logger.exception("Failed to prepare the restore", exc_info=e)
+            return
+        self.charm._create_pgdata(self.container)
+        self._start_restore_job(restore_request)
+        self.charm.unit_peer_data.update({
+            "cluster-restore": json.dumps({**state, "phase": "restoring"})
+        })
+
+    def _build_restore_command(self, restore_request: Dict) -> List[str]:
+        """Build the pgBackRest command to restore the backup as a standby.
+
+        Args:
+            restore_request: the restore request set by the leader.
+
+        Returns:
+            the command to run in the workload container.
+        """
+        command = [
+            "pgbackrest",
+            f"--stanza={restore_request['stanza']}",
+            f"--pg1-path={self.charm._storage_path}/pgdata",
+            f"--set={restore_request['label']}",
+            "--type=standby",
+            "--target-timeline=latest",
+            "--log-level-console=detail",
+        ]
+        if restore_request["delta"]:
+            command.append("--delta")
+        command.append("restore")
+        return command
+
+    def _start_restore_job(self, restore_request: Dict) -> None:
+        """Start pgBackRest in a Pebble service to restore the backup as a standby."""
+        self._start_pgbackrest_job(
+            self.charm.pgbackrest_restore_service,
+            "restore",
+            self._build_restore_command(restore_request),
+            (RESTORE_JOB_STDOUT_FILE, RESTORE_JOB_STDERR_FILE, RESTORE_JOB_EXIT_CODE_FILE),
+        )
+
+    def _finish_cluster_restore(self, state: Dict, restored: bool) -> None:
+        """Start the database again after the restore.
+
+        Args:
+            state: the state of the restore in this unit.
+            restored: whether the backup was restored (otherwise the data directory is
+                emptied, so Patroni creates the replica from the new primary).
+        """
+        if not restored:
+            logger.error("Restore failed in this unit: creating the replica again")
+            try:
+                self._empty_data_files()
+            except ExecError as e:
+                logger.exception("Failed to remove the contents of the data directory", exc_info=e)
+            self.charm._create_pgdata(self.container)
+        self.charm.update_config()
+        self.container.start(self.charm._postgresql_service)
+        self.charm.unit_peer_data.update({
+            "cluster-restore": json.dumps({**state, "phase": "catching-up"})
+        })
 
     def _pre_restore_checks(self, event: ActionEvent) -> bool:
         """Run some checks before starting the restore.
@@ -708,11 +2310,8 @@ Stderr:
             event.fail(error_message)
             return False
 
-        logger.info("Checking that the cluster does not have more than one unit")
-        if self.charm.app.planned_units() > 1:
-            error_message = (
-                "Unit cannot restore backup as there are more than one unit in the cluster"
-            )
+        if self._restore_request is not None:
+            error_message = "A restore is already in progress"
             logger.error(f"Restore failed: {error_message}")
             event.fail(error_message)
             return False
@@ -735,6 +2334,9 @@ Stderr:
             )
             return False
 
+        bundle, block_incremental = self._get_bundle_settings()
+        local_repository = self.is_local_repository_enabled
+
         # Open the template pgbackrest.conf file.
         with open("templates/pgbackrest.conf.j2", "r") as file:
             template = Template(file.read())
@@ -752,7 +2354,37 @@ Stderr:
             stanza=self.stanza_name,
             storage_path=self.charm._storage_path,
             user=BACKUP_USER,
+            compress_type=self.charm.config.backup_compress_type,
+            compress_level=self.charm.config.backup_compress_level,
+            process_max=self.charm.config.backup_process_max or self._calculate_process_max(),
+            # pgBackRest requires a full backups retention, so 0 (keep all) is a huge number.
+            retention_full=self.charm.config.backup_retention_full or 9999999,
+            retention_diff=self.charm.config.backup_retention_diff,
+            retention_archive=self.charm.config.backup_retention_archive,
+            archive_async=self.charm.config.backup_archive_async,
+            archive_get_queue_max=self.charm.config.backup_archive_get_queue_max,
+            archive_process_max=self.charm.config.backup_archive_process_max,
+            spool_path=ARCHIVE_SPOOL_PATH,
+            bundle=bundle,
+            bundle_limit=self.charm.config.backup_bundle_limit,
+            bundle_size=self.charm.config.backup_bundle_size,
+            block_incremental=block_incremental,
+            local_repository=local_repository,
+            local_repository_path=LOCAL_REPOSITORY_PATH,
+            local_retention_full=self.charm.config.backup_local_retention_full,
         )
+        for enabled, path in [
+            (self.charm.config.backup_archive_async, ARCHIVE_SPOOL_PATH),
+            (local_repository, LOCAL_REPOSITORY_PATH),
+        ]:
+            if enabled and not self.container.exists(path):
+                self.container.make_dir(
+                    path,
+                    make_parents=True,
+                    permissions=0o750,
+                    user=WORKLOAD_OS_USER,
+                    group=WORKLOAD_OS_GROUP,
+                )
         # Delete the original file and render the one with the right info.
         filename = "/etc/pgbackrest.conf"
         self.container.push(
@@ -764,9 +2396,76 @@ Stderr:
 
         return True
 
+    def _get_pgbackrest_version(self) -> Optional[Tuple[int, int]]:
+        """Return the version (major, minor) of pgBackRest installed in the workload container.
+
+        The version is cached in the workload container, as it's checked each time the
+        pgBackRest configuration file is rendered.
+        """
+        can_connect = self.container.can_connect()
+        if can_connect and self.container.exists(PGBACKREST_VERSION_CACHE_FILE):
+            output = self.container.pull(PGBACKREST_VERSION_CACHE_FILE).read()
+        else:
+            try:
+                output, _ = self._execute_command(["pgbackrest", "version"])
+            except ExecError as e:
+                logger.warning(f"Failed to retrieve the pgBackRest version: {e}")
+                return None
+        # The output is like "pgBackRest 2.48".
+        match = re.search(r"(\d+)\.(\d+)", output or "")
+        if match is None:
+            return None
+        if can_connect:
+            self.container.push(
+                PGBACKREST_VERSION_CACHE_FILE,
+                match.group(0),
+                user=WORKLOAD_OS_USER,
+                group=WORKLOAD_OS_GROUP,
+            )
+        return int(match.group(1)), int(match.group(2))
+
+    def _get_bundle_settings(self) -> Tuple[bool, bool]:
+        """Return whether the bundling of files and the block incremental can be enabled.
+
+        Both are enabled only if requested in the config and supported by pgBackRest.
+        """
+        if not self.charm.config.backup_bundle:
+            return False, False
+
+        version = self._get_pgbackrest_version()
+        if version is None:
+            logger.warning("Unknown pgBackRest version: not enabling the bundling of files")
+            return False, False
+        if version < PGBACKREST_BUNDLE_MIN_VERSION:
+            logger.warning(f"Bundling of files is not supported by pgBackRest {version}")
+            return False, False
+
+        block_incremental = self.charm.config.backup_block_incremental
+        if block_incremental and version < PGBACKREST_BLOCK_INCREMENTAL_MIN_VERSION:
+            logger.warning(f"Block incremental is not supported by pgBackRest {version}")
+            block_incremental = False
+        return True, block_incremental
+
+    def _calculate_process_max(self) -> int:
+        """Calculate the number of processes pgBackRest can use to transfer files.
+
+        A quarter of the CPU cores available to the container (at least one) is kept
+        as a reserve for PostgreSQL, so backups don't starve the database workload.
+        """
+        try:
+            cpu_cores, _ = self.charm.get_available_resources()
+        except ApiError as e:
+            logger.warning(f"Failed to retrieve the available CPU cores: {e}")
+            return 1
+        return max(1, cpu_cores - max(1, cpu_cores // 4))
+
     def _restart_database(self) -> None:
         """Removes the restoring backup flag and restart the database."""
-        self.charm.app_peer_data.update({"restoring-backup": ""})
+        self.charm.app_peer_data.update({
+            "restoring-backup": "",
+            "restore-delta": "",
+            "restore-repository": "",
+        })
         self.charm.update_config()
         self.container.start(self.charm._postgresql_service)
 
@@ -856,22 +2555,11 @@ Stderr:
         """
         bucket_name = s3_parameters["bucket"]
         s3_path = os.path.join(s3_parameters["path"], s3_path).lstrip("/")
-        logger.info(f"Uploading content to bucket={s3_parameters['bucket']}, path={s3_path}")
+        logger.info(f"Uploading content to bucket={bucket_name}, path={s3_path}")
         try:
-            logger.info(f"Uploading content to bucket={bucket_name}, path={s3_path}")
-            session = boto3.session.Session(
-                aws_access_key_id=s3_parameters["access-key"],
-                aws_secret_access_key=s3_parameters["secret-key"],
-                region_name=s3_parameters["region"],
+            self._get_s3_client(s3_parameters).put_object(
+                Bucket=bucket_name, Key=s3_path, Body=content.encode("utf-8")
             )
-
-            s3 = session.resource("s3", endpoint_url=self._construct_endpoint(s3_parameters))
-            bucket = s3.Bucket(bucket_name)
-
-            with tempfile.NamedTemporaryFile() as temp_file:
-                temp_file.write(content.encode("utf-8"))
-                temp_file.flush()
-                bucket.upload_file(temp_file.name, s3_path)
         except Exception as e:
             logger.exception(
                 f"Failed to upload content to S3 bucket={bucket_name}, path={s3_path}", exc_info=e
@@ -7,7 +7,7 @@
 import itertools
 import json
 import logging
-from typing import Dict, List, Literal, Optional, Tuple, get_args
+from typing import Dict, List, Literal, Optional, Set, Tuple, get_args
 
 import psycopg2
 from charms.data_platform_libs.v0.data_interfaces import DataPeer, DataPeerUnit
@@ -19,11 +19,14 @@ from charms.postgresql_k8s.v0.postgresql import (
     REQUIRED_PLUGINS,
     PostgreSQL,
     PostgreSQLEnableDisableExtensionError,
+    PostgreSQLListUsersError,
+    PostgreSQLUpdateUserLimitsError,
     PostgreSQLUpdateUserPasswordError,
 )
 from charms.postgresql_k8s.v0.postgresql_tls import PostgreSQLTLS
 from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
 from charms.rolling_ops.v0.rollingops import RollingOpsManager, RunWithLock
+from jinja2 import Template
 from lightkube import ApiError, Client
 from lightkube.models.core_v1 import ServicePort, ServiceSpec
 from lightkube.models.meta_v1 import ObjectMeta
@@ -52,21 +55,31 @@ from requests import ConnectionError
 from tenacity import RetryError, Retrying, stop_after_attempt, wait_fixed
 
 from backups import PostgreSQLBackups
-from config import CharmConfig
+from config import RELATION_USER_LIMIT_VALIDATORS, CharmConfig
 from constants import (
     APP_SCOPE,
     BACKUP_USER,
+    DATABASE_PORT,
+    HUGEPAGES_RESOURCE,
     METRICS_PORT,
     MONITORING_PASSWORD_KEY,
     MONITORING_USER,
     PEER,
+    PGBOUNCER_EXECUTABLE,
+    PGBOUNCER_PASSWORD_KEY,
+    PGBOUNCER_PORT,
+    PGBOUNCER_USER,
     POSTGRES_LOG_FILES,
+    RELATION_USER_LIMITS,
+    REPLICA_READY_LABEL,
     REPLICATION_PASSWORD_KEY,
     REPLICATION_USER,
     REWIND_PASSWORD_KEY,
     SECRET_DELETED_LABEL,
     SECRET_INTERNAL_LABEL,
     SECRET_KEY_OVERRIDES,
+    SYNC_STANDBY_LABEL,
+    SYNCHRONOUS_COMMIT_LEVELS,
     SYSTEM_USERS,
     TLS_CA_FILE,
     TLS_CERT_FILE,
@@ -79,6 +92,7 @@ from constants import (
 )
 from patroni import NotReadyError, Patroni
 from relations.db import EXTENSIONS_BLOCKING_MESSAGE, DbProvides
+from relations.logical_replication import PostgreSQLLogicalReplication
 from relations.postgresql_provider import PostgreSQLProvider
 from upgrade import PostgreSQLUpgrade, get_postgresql_k8s_dependencies_model
 from utils import any_cpu_to_cores, any_memory_to_bytes, new_password
@@ -128,9 +142,15 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             deleted_label=SECRET_DELETED_LABEL,
         )
 
+        # Reused during the hook, so the roles catalog is only loaded once.
+        self._postgresql: Optional[PostgreSQL] = None
         self._postgresql_service = "postgresql"
         self.pgbackrest_server_service = "pgbackrest server"
+        self.pgbackrest_backup_service = "pgbackrest backup"
+        self.pgbackrest_expire_service = "pgbackrest expire"
+        self.pgbackrest_restore_service = "pgbackrest restore"
         self._metrics_service = "metrics_server"
+        self._pgbouncer_service = "pgbouncer"
         self._unit = self.model.unit.name
         self._name = self.model.app.name
         self._namespace = self.model.name
@@ -149,6 +169,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         self.framework.observe(self.on.get_password_action, self._on_get_password)
         self.framework.observe(self.on.set_password_action, self._on_set_password)
         self.framework.observe(self.on.get_primary_action, self._on_get_primary)
+        self.framework.observe(self.on.get_huge_pages_action, self._on_get_huge_pages)
         self.framework.observe(self.on.update_status, self._on_update_status)
         self._storage_path = self.meta.storages["pgdata"].location
 
@@ -161,8 +182,13 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         self.postgresql_client_relation = PostgreSQLProvider(self)
         self.legacy_db_relation = DbProvides(self, admin=False)
         self.legacy_db_admin_relation = DbProvides(self, admin=True)
+        self.logical_replication = PostgreSQLLogicalReplication(self)
         self.backup = PostgreSQLBackups(self, "s3-parameters")
-        self.tls = PostgreSQLTLS(self, PEER, [self.primary_endpoint, self.replicas_endpoint])
+        self.tls = PostgreSQLTLS(
+            self,
+            PEER,
+            [self.primary_endpoint, self.replicas_endpoint, self.sync_standbys_endpoint],
+        )
         self.restart_manager = RollingOpsManager(
             charm=self, relation="restart", callback=self._restart
         )
@@ -181,7 +207,14 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
         postgresql_db_port = ServicePort(5432, name="database")
         patroni_api_port = ServicePort(8008, name="api")
-        self.service_patcher = KubernetesServicePatch(self, [postgresql_db_port, patroni_api_port])
+        ports = [postgresql_db_port, patroni_api_port]
+        # The raw config is used, as an invalid value of another option
+        # would otherwise fail every hook.
+        if self.model.config.get("connection_pooler"):
+            ports.append(ServicePort(int(PGBOUNCER_PORT), name="pgbouncer"))
+        self.service_patcher = KubernetesServicePatch(
+            self, ports, refresh_event=self.on.config_changed
+        )
 
     def _generate_metrics_jobs(self, enable_tls: bool) -> Dict:
         """Generate spec for Prometheus scraping."""
@@ -290,14 +323,17 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
     @property
     def postgresql(self) -> PostgreSQL:
         """Returns an instance of the object used to interact with the database."""
-        return PostgreSQL(
-            primary_host=self.primary_endpoint,
-            current_host=self.endpoint,
-            user=USER,
-            password=self.get_secret(APP_SCOPE, f"{USER}-password"),
-            database="postgres",
-            system_users=SYSTEM_USERS,
-        )
+        password = self.get_secret(APP_SCOPE, f"{USER}-password")
+        if self._postgresql is None or self._postgresql.password != password:
+            self._postgresql = PostgreSQL(
+                primary_host=self.primary_endpoint,
+                current_host=self.endpoint,
+                user=USER,
+                password=password,
+                database="postgres",
+                system_users=SYSTEM_USERS,
+            )
+        return self._postgresql
 
     @property
     def endpoint(self) -> str:
@@ -314,6 +350,11 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         """Returns the endpoint of the replicas instances' service."""
         return self._build_service_name("replicas")
 
+    @property
+    def sync_standbys_endpoint(self) -> str:
+        """Returns the endpoint of the synchronous standby instances' service."""
+        return self._build_service_name("sync-standbys")
+
     def _build_service_name(self, service: str) -> str:
         """Build a full k8s service name based on the service name."""
         return f"{self._name}-{service}.{self._namespace}.svc.cluster.local"
@@ -352,6 +393,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
         endpoints_to_remove = self._get_endpoints_to_remove()
         self.postgresql_client_relation.update_read_only_endpoint()
+        self.postgresql_client_relation.update_pooler_endpoints()
         self._remove_from_endpoints(endpoints_to_remove)
 
     def _on_peer_relation_changed(self, event: HookEvent) -> None:
@@ -365,6 +407,11 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             event.defer()
             return
 
+        # Take part in the restore of a backup requested in the leader.
+        if self.backup.handle_cluster_restore():
+            logger.debug("Early exit on_peer_relation_changed: restoring backup")
+            return
+
         # If the leader is the one receiving the event, it adds the new members,
         # one at a time.
         if self.unit.is_leader():
@@ -375,18 +422,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             return
 
         # Update the list of the cluster members in the replicas to make them know each other.
-        # Update the cluster members in this unit (updating patroni configuration).
-        container = self.unit.get_container("postgresql")
-        if not container.can_connect():
-            logger.debug(
-                "Early exit on_peer_relation_changed: Waiting for container to become available"
-            )
-            return
-        try:
-            self.update_config()
-        except ValueError as e:
-            self.unit.status = BlockedStatus("Configuration Error. Please check the logs")
-            logger.error("Invalid configuration: %s", str(e))
+        if not self._update_cluster_members():
             return
 
         # Validate the status of the member before setting an ActiveStatus.
@@ -396,25 +432,31 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             event.defer()
             return
 
-        # Restart the workload if it's stuck on the starting state after a timeline divergence
-        # due to a backup that was restored.
-        if not self.is_primary and (
-            self._patroni.member_replication_lag == "unknown"
-            or int(self._patroni.member_replication_lag) > 1000
-        ):
-            self._patroni.reinitialize_postgresql()
+        if self._reinitialise_diverged_replica():
             logger.debug("Deferring on_peer_relation_changed: reinitialising replica")
-            self.unit.status = MaintenanceStatus("reinitialising replica")
             event.defer()
             return
 
         self.postgresql_client_relation.update_read_only_endpoint()
+        self.postgresql_client_relation.update_pooler_endpoints()
+        self._update_replicas_readiness()
 
         self.backup.coordinate_stanza_fields()
 
         self.backup.check_stanza()
 
-        # Start or stop the pgBackRest TLS server service when TLS certificate change.
+        if not self._start_stop_pgbackrest_service(event):
+            return
+
+        if not self.is_blocked:
+            self.unit.status = ActiveStatus()
+
+    def _start_stop_pgbackrest_service(self, event: HookEvent) -> bool:
+        """Start or stop the pgBackRest TLS server service when TLS certificate change.
+
+        Returns:
+            a bool indicating whether the service is in the expected state.
+        """
         if not self.backup.start_stop_pgbackrest_service():
             # Ping primary to start its TLS server.
             self.unit_peer_data.update({"start-tls-server": "True"})
@@ -422,12 +464,10 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                 "Deferring on_peer_relation_changed: awaiting for TLS server service to start on primary"
             )
             event.defer()
-            return
-        else:
-            self.unit_peer_data.pop("start-tls-server", None)
+            return False
 
-        if not self.is_blocked:
-            self.unit.status = ActiveStatus()
+        self.unit_peer_data.pop("start-tls-server", None)
+        return True
 
     def _on_config_changed(self, event) -> None:
         """Handle configuration changes, like enabling plugins."""
@@ -460,6 +500,9 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         if not self.unit.is_leader():
             return
 
+        self._update_connection_pooler_clients()
+        self._update_client_relations_user_limits()
+
         # Enable and/or disable the extensions.
         self.enable_disable_extensions()
 
@@ -527,6 +570,44 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                     )
         return skip
 
+    def _update_cluster_members(self) -> bool:
+        """Update the cluster members in this unit (updating patroni configuration).
+
+        Returns:
+            a bool indicating whether the configuration was updated.
+        """
+        container = self.unit.get_container("postgresql")
+        if not container.can_connect():
+            logger.debug(
+                "Early exit on_peer_relation_changed: Waiting for container to become available"
+            )
+            return False
+        try:
+            self.update_config()
+        except ValueError as e:
+            self.unit.status = BlockedStatus("Configuration Error. Please check the logs")
+            logger.error("Invalid configuration: %s", str(e))
+            return False
+        return True
+
+    def _reinitialise_diverged_replica(self) -> bool:
+        """Restart the workload if it's stuck on the starting state after a timeline divergence.
+
+        That happens due to a backup that was restored.
+
+        Returns:
+            a bool indicating whether the replica is being reinitialised.
+        """
+        if self.is_primary or (
+            self._patroni.member_replication_lag != "unknown"
+            and int(self._patroni.member_replication_lag) <= 1000
+        ):
+            return False
+
+        self._patroni.reinitialize_postgresql()
+        self.unit.status = MaintenanceStatus("reinitialising replica")
+        return True
+
     def _add_members(self, event) -> None:
         """Add new cluster members.
 
@@ -535,6 +616,8 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         one of the current units is copying data from the primary, to avoid
         multiple units copying data at the same time, which can cause slow
         transfer rates in these processes and overload the primary instance.
+        When the backup repository has a backup, the new members are restored from
+        it, so they are added without waiting for each other.
         """
         # Only the leader can reconfigure.
         if not self.unit.is_leader():
@@ -568,7 +651,10 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         """
         hostname = self._get_hostname_from_unit(member)
 
-        if not self._patroni.are_all_members_ready():
+        # Replicas created from the backup repository don't load the primary.
+        if not self._patroni.are_all_members_ready(
+            creating_replicas_allowed=self.backup.can_create_replicas_from_repository()
+        ):
             logger.info("not all members are ready")
             raise NotReadyError("not all members are ready")
 
@@ -612,17 +698,15 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
     def _on_leader_elected(self, event: LeaderElectedEvent) -> None:
         """Handle the leader-elected event."""
-        if self.get_secret(APP_SCOPE, USER_PASSWORD_KEY) is None:
-            self.set_secret(APP_SCOPE, USER_PASSWORD_KEY, new_password())
-
-        if self.get_secret(APP_SCOPE, REPLICATION_PASSWORD_KEY) is None:
-            self.set_secret(APP_SCOPE, REPLICATION_PASSWORD_KEY, new_password())
-
-        if self.get_secret(APP_SCOPE, REWIND_PASSWORD_KEY) is None:
-            self.set_secret(APP_SCOPE, REWIND_PASSWORD_KEY, new_password())
-
-        if self.get_secret(APP_SCOPE, MONITORING_PASSWORD_KEY) is None:
-            self.set_secret(APP_SCOPE, MONITORING_PASSWORD_KEY, new_password())
+        for password_key in [
+            USER_PASSWORD_KEY,
+            REPLICATION_PASSWORD_KEY,
+            REWIND_PASSWORD_KEY,
+            MONITORING_PASSWORD_KEY,
+            PGBOUNCER_PASSWORD_KEY,
+        ]:
+            if self.get_secret(APP_SCOPE, password_key) is None:
+                self.set_secret(APP_SCOPE, password_key, new_password())
 
         self._cleanup_old_cluster_resources()
         client = Client()
@@ -723,6 +807,9 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         # was fully initialised.
         self.enable_disable_extensions()
 
+        # A recreated pod loses the readiness labels set by the leader.
+        self._update_replicas_readiness(own_pod_only=True)
+
         # All is well, set an ActiveStatus.
         self.unit.status = ActiveStatus()
 
@@ -763,6 +850,8 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                 self.get_secret(APP_SCOPE, MONITORING_PASSWORD_KEY),
                 extra_user_roles="pg_monitor",
             )
+        # Create the user PgBouncer authenticates the clients with.
+        self._set_up_connection_pooler_auth(pg_users)
 
         self.postgresql.set_up_database()
 
@@ -777,6 +866,9 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         return isinstance(self.unit.status, BlockedStatus)
 
     def _on_upgrade_charm(self, _) -> None:
+        # Label the replicas before the services select them by their readiness.
+        self._update_replicas_readiness()
+
         # Recreate k8s resources and add labels required for replication
         # when the pod loses them (like when it's deleted).
         try:
@@ -793,6 +885,9 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             self.unit.status = BlockedStatus(f"failed to patch pod with error {e}")
             return
 
+        # A recreated pod loses the readiness labels set by the leader.
+        self._update_replicas_readiness(own_pod_only=True)
+
     def _patch_pod_labels(self, member: str) -> None:
         """Add labels required for replication to the current pod.
 
@@ -823,10 +918,27 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             namespace=self.model.name,
         )
 
+        # The replicas service only selects the replicas that can serve read-only traffic
+        # (when a maximum lag is set), while the sync-standbys one only selects the
+        # synchronous standbys (read-your-writes).
         services = {
-            "primary": "master",
-            "replicas": "replica",
+            "primary": {"role": "master"},
+            "replicas": {"role": "replica"},
+            "sync-standbys": {"role": "replica", SYNC_STANDBY_LABEL: "true"},
         }
+        if self.config.replicas_max_lag:
+            services["replicas"][REPLICA_READY_LABEL] = "true"
+        pooler_ports = (
+            [
+                ServicePort(
+                    name="pgbouncer",
+                    port=int(PGBOUNCER_PORT),
+                    targetPort=int(PGBOUNCER_PORT),
+                )
+            ]
+            if self.config.connection_pooler
+            else []
+        )
         for service_name_suffix, role_selector in services.items():
             service = Service(
                 metadata=ObjectMeta(
@@ -849,11 +961,12 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                             port=5432,
                             targetPort=5432,
                         ),
+                        *pooler_ports,
                     ],
                     selector={
                         "app.kubernetes.io/name": self.app.name,
                         "cluster-name": f"patroni-{self.app.name}",
-                        "role": role_selector,
+                        **role_selector,
                     },
                 ),
             )
@@ -865,6 +978,68 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                 field_manager=self.model.app.name,
             )
 
+    def _update_replicas_readiness(self, own_pod_only: bool = False) -> None:
+        """Label the replicas that can be selected by the replicas and sync-standbys services.
+
+        Only the replicas that are running and whose replication lag is below the
+        replicas_max_lag config option (if set) serve read-only traffic. The synchronous
+        standbys are also selected by the sync-standbys service.
+
+        Args:
+            own_pod_only: whether to label only the pod of this unit (used when the unit
+                starts, so a recreated pod doesn't wait for the leader to label it).
+        """
+        if not own_pod_only and not self.unit.is_leader():
+            return
+
+        try:
+            replicas_lag = self._patroni.get_replicas_lag()
+            sync_standbys = self._patroni.get_sync_standby_names()
+        except RetryError:
+            logger.debug(
+                "Early exit _update_replicas_readiness: failed to get the replicas status"
+            )
+            return
+
+        client = Client()
+        try:
+            # Read the current labels of all the pods at once, so only
+            # the pods whose readiness changed are patched.
+            current_labels = {
+                pod.metadata.name: pod.metadata.labels or {}
+                for pod in client.list(
+                    Pod,
+                    namespace=self._namespace,
+                    labels={"app.kubernetes.io/name": self.app.name},
+                )
+            }
+        except ApiError as e:
+            logger.warning(f"Failed to get the readiness labels of the pods: {e}")
+            return
+
+        max_lag = self.config.replicas_max_lag * 10**6
+        units = [self.unit] if own_pod_only or not self._peers else [self.unit, *self._peers.units]
+        for unit in units:
+            lag = replicas_lag.get(unit.name)
+            ready = lag is not None and (not max_lag or lag <= max_lag)
+            sync_standby = lag is not None and unit.name in sync_standbys
+            labels = {
+                REPLICA_READY_LABEL: str(ready).lower(),
+                SYNC_STANDBY_LABEL: str(sync_standby).lower(),
+            }
+            pod_name = self._unit_name_to_pod_name(unit.name)
+            if labels.items() <= current_labels.get(pod_name, {}).items():
+                continue
+            try:
+                client.patch(
+                    Pod,
+                    name=pod_name,
+                    namespace=self._namespace,
+                    obj={"metadata": {"labels": labels}},
+                )
+            except ApiError as e:
+                logger.warning(f"Failed to update the readiness label of {unit.name}: {e}")
+
     def _cleanup_old_cluster_resources(self) -> None:
         """Delete kubernetes services and endpoints from previous deployment."""
         if self.is_cluster_initialised:
@@ -969,6 +1144,28 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         except RetryError as e:
             logger.error(f"failed to get primary with error {e}")
 
+    def _on_get_huge_pages(self, event: ActionEvent) -> None:
+        """Report the huge pages and shared buffers settings chosen for this unit."""
+        try:
+            container_limits = self.get_resources_limits(container_name="postgresql")
+            _, available_memory = self.get_available_resources(container_limits)
+            hugepages = self.get_available_hugepages(container_limits)
+            parameters = self._build_postgresql_parameters(available_memory, hugepages)
+        except ApiError as e:
+            logger.exception(e)
+            event.fail(f"Failed to retrieve the available resources: {e}")
+            return
+        except Exception as e:
+            # Raised when the shared_buffers config option doesn't fit in the memory.
+            logger.exception(e)
+            event.fail(f"Failed to build the PostgreSQL parameters: {e}")
+            return
+        event.set_results({
+            "huge-pages": parameters["huge_pages"],
+            "shared-buffers": str(parameters["shared_buffers"]),
+            "hugepages-limit": f"{int(hugepages / 10**6)}MB",
+        })
+
     def _on_stop(self, _):
         # Remove data from the drive when scaling down to zero to prevent
         # the cluster from getting stuck when scaling back up.
@@ -1047,6 +1244,21 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             logger.debug("on_update_status early exit: Cannot connect to container")
             return
 
+        # Finish the backup job if pgBackRest has already exited.
+        self.backup.check_backup_job()
+        self.backup.check_expire_job()
+        self.backup.publish_local_backups()
+        self.backup.run_backup_schedule()
+
+        # Take part in the restore of a backup requested in the leader.
+        if self.backup.handle_cluster_restore():
+            logger.debug("on_update_status early exit: restoring backup")
+            return
+
+        # Take the lagging or unhealthy replicas out of the replicas service.
+        self._update_replicas_readiness()
+        self.logical_replication.update_replication_slots_lag()
+
         if self._has_blocked_status or self._has_waiting_status:
             logger.debug("on_update_status early exit: Unit is in Blocked/Waiting status")
             return
@@ -1057,31 +1269,54 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             logger.debug("on_update_status early exit: Service has not been added nor started yet")
             return
 
-        if "restoring-backup" in self.app_peer_data:
-            if services[0].current != ServiceStatus.ACTIVE:
-                logger.error("Restore failed: database service failed to start")
-                self.unit.status = BlockedStatus("Failed to restore backup")
-                return
-
-            if not self._patroni.member_started:
-                logger.debug("on_update_status early exit: Patroni has not started yet")
-                return
-
-            # Remove the restoring backup flag and the restore stanza name.
-            self.app_peer_data.update({"restoring-backup": "", "restore-stanza": ""})
-            self.update_config()
-            logger.info("Restore succeeded")
-
-            can_use_s3_repository, validation_message = self.backup.can_use_s3_repository()
-            if not can_use_s3_repository:
-                self.unit.status = BlockedStatus(validation_message)
-                return
+        if "restoring-backup" in self.app_peer_data and not self._handle_restore_completion(
+            services[0]
+        ):
+            return
 
         if self._handle_processes_failures():
             return
 
         self._set_primary_status_message()
 
+    def _handle_restore_completion(self, service) -> bool:
+        """Finish the restore of a backup when the database has started.
+
+        Args:
+            service: the database Pebble service info.
+
+        Returns:
+            a bool indicating whether the restore succeeded.
+        """
+        if service.current != ServiceStatus.ACTIVE:
+            logger.error("Restore failed: database service failed to start")
+            self.unit.status = BlockedStatus("Failed to restore backup")
+            return False
+
+        if not self._patroni.member_started:
+            logger.debug("on_update_status early exit: Patroni has not started yet")
+            self.unit.status = MaintenanceStatus(self.backup.get_restore_status_message())
+            return False
+
+        # Remove the restoring backup flag and the restore stanza name.
+        self.app_peer_data.update({
+            "restoring-backup": "",
+            "restore-stanza": "",
+            "restore-delta": "",
+            "restore-repository": "",
+        })
+        self.update_config()
+        logger.info("Restore succeeded")
+
+        # The restore started a new timeline in the repository.
+        self.backup.invalidate_repository_info_cache()
+
+        can_use_s3_repository, validation_message = self.backup.can_use_s3_repository()
+        if not can_use_s3_repository:
+            self.unit.status = BlockedStatus(validation_message)
+            return False
+        return True
+
     def _handle_processes_failures(self) -> bool:
         """Handle Patroni and PostgreSQL OS processes failures.
 
@@ -1268,6 +1503,17 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                     "group": WORKLOAD_OS_GROUP,
                 },
                 self._metrics_service: self._generate_metrics_service(),
+                self._pgbouncer_service: {
+                    "override": "replace",
+                    "summary": "pgbouncer connection pooler",
+                    "command": f"{PGBOUNCER_EXECUTABLE} {self._storage_path}/pgbouncer/pgbouncer.ini",
+                    "startup": "enabled"
+                    if self.config.connection_pooler and self._is_pgbouncer_available
+                    else "disabled",
+                    "after": [self._postgresql_service],
+                    "user": WORKLOAD_OS_USER,
+                    "group": WORKLOAD_OS_GROUP,
+                },
             },
             "checks": {
                 self._postgresql_service: {
@@ -1372,9 +1618,18 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
         return services[0].current == ServiceStatus.ACTIVE
 
-    def update_config(self, is_creating_backup: bool = False) -> bool:
-        """Updates Patroni config file based on the existence of the TLS files."""
-        # Retrieve PostgreSQL parameters.
+    def _build_postgresql_parameters(
+        self, available_memory: int, available_hugepages: int = 0
+    ) -> Optional[Dict]:
+        """Build the PostgreSQL parameters from the charm config and the available resources.
+
+        Args:
+            available_memory: available memory for the container in bytes.
+            available_hugepages: huge pages memory available for the container in bytes.
+
+        Returns:
+            Dictionary with the PostgreSQL parameters.
+        """
         if (
             self.model.config.get("profile-limit-memory") is not None
             and self.model.config.get("profile_limit_memory") is not None
@@ -1386,24 +1641,42 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             limit_memory = self.config.profile_limit_memory * 10**6
         else:
             limit_memory = None
-        available_cpu_cores, available_memory = self.get_available_resources()
-        postgresql_parameters = self.postgresql.build_postgresql_parameters(
-            self.model.config, available_memory, limit_memory
+        return self.postgresql.build_postgresql_parameters(
+            self.model.config,
+            available_memory,
+            limit_memory,
+            available_hugepages=available_hugepages,
+        )
+
+    def update_config(self, is_creating_backup: bool = False) -> bool:
+        """Updates Patroni config file based on the existence of the TLS files."""
+        # Retrieve PostgreSQL parameters.
+        container_limits = self.get_resources_limits(container_name="postgresql")
+        available_cpu_cores, available_memory = self.get_available_resources(container_limits)
+        postgresql_parameters = self._build_postgresql_parameters(
+            available_memory, self.get_available_hugepages(container_limits)
         )
+        max_connections = max(4 * available_cpu_cores, 100)
 
         logger.info("Updating Patroni config file")
         # Update and reload configuration based on TLS files availability.
         self._patroni.render_patroni_yml_file(
             connectivity=self.unit_peer_data.get("connectivity", "on") == "on",
-            is_creating_backup=is_creating_backup,
+            # Keep the tag while a backup job is running in the background.
+            is_creating_backup=is_creating_backup or bool(self.unit_peer_data.get("backup-job")),
             enable_tls=self.is_tls_enabled,
             is_no_sync_member=self.upgrade.is_no_sync_member,
             backup_id=self.app_peer_data.get("restoring-backup"),
+            restore_delta=self.app_peer_data.get("restore-delta") == "True",
+            restore_repository=self.app_peer_data.get("restore-repository") or None,
+            local_repository=self.backup.is_local_repository_enabled,
             stanza=self.app_peer_data.get("stanza"),
             restore_stanza=self.app_peer_data.get("restore-stanza"),
             parameters=postgresql_parameters,
         )
 
+        self._update_connection_pooler(max_connections)
+
         if not self._is_workload_running:
             # If Patroni/PostgreSQL has not started yet and TLS relations was initialised,
             # then mark TLS as enabled. This commonly happens when the charm is deployed
@@ -1418,7 +1691,7 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
             return False
 
         self._patroni.bulk_update_parameters_controller_by_patroni({
-            "max_connections": max(4 * available_cpu_cores, 100),
+            "max_connections": max_connections,
             "max_prepared_transactions": self.config.memory_max_prepared_transactions,
         })
 
@@ -1440,6 +1713,135 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
         return True
 
+    def _set_up_connection_pooler_auth(self, pg_users: Optional[Set[str]] = None) -> None:
+        """Create the PgBouncer user and the function it uses to look up the users passwords.
+
+        Args:
+            pg_users: the existing PostgreSQL users (retrieved if not provided).
+        """
+        if self.get_secret(APP_SCOPE, PGBOUNCER_PASSWORD_KEY) is None:
+            self.set_secret(APP_SCOPE, PGBOUNCER_PASSWORD_KEY, new_password())
+        if pg_users is None:
+            pg_users = self.postgresql.list_users()
+        if PGBOUNCER_USER not in pg_users:
+            self.postgresql.create_user(
+                PGBOUNCER_USER, self.get_secret(APP_SCOPE, PGBOUNCER_PASSWORD_KEY)
+            )
+        self.postgresql.set_up_auth_query(PGBOUNCER_USER)
+
+    def _update_connection_pooler_clients(self) -> None:
+        """Create the PgBouncer user (if needed) and publish or remove the pooled endpoints."""
+        # Clusters created before the connection pooler was added don't have the user yet.
+        if self.config.connection_pooler:
+            self._set_up_connection_pooler_auth()
+        # Expose the PgBouncer port only while the connection pooler is enabled.
+        try:
+            self._create_services()
+        except ApiError:
+            logger.exception("failed to update k8s services")
+        self.postgresql_client_relation.update_pooler_endpoints()
+
+    @staticmethod
+    def _build_pgbouncer_pool_sizes(max_connections: int) -> Dict[str, int]:
+        """Calculate the PgBouncer pool sizes from the PostgreSQL max_connections.
+
+        Args:
+            max_connections: the max_connections set in PostgreSQL.
+
+        Returns:
+            Dictionary with the PgBouncer pool settings.
+        """
+        # Keep some connections for the charm, Patroni, the replication and the monitoring.
+        max_db_connections = max(max_connections - 15, 10)
+        default_pool_size = max(max_db_connections // 4, 1)
+        return {
+            "max_client_conn": 100 * max_connections,
+            "max_db_connections": max_db_connections,
+            "default_pool_size": default_pool_size,
+            "reserve_pool_size": max(default_pool_size // 4, 1),
+        }
+
+    def _render_pgbouncer_files(self, container: Container, max_connections: int) -> bool:
+        """Render the PgBouncer configuration and auth files.
+
+        Returns:
+            whether any of the files changed.
+        """
+        with open("templates/pgbouncer.ini.j2", "r") as file:
+            template = Template(file.read())
+        auth_file = f"{self._storage_path}/pgbouncer/userlist.txt"
+        files = {
+            f"{self._storage_path}/pgbouncer/pgbouncer.ini": template.render(
+                database_port=DATABASE_PORT,
+                listen_port=PGBOUNCER_PORT,
+                auth_file=auth_file,
+                auth_user=PGBOUNCER_USER,
+                pool_mode=self.config.connection_pooler_mode,
+                enable_tls=self.is_tls_enabled,
+                storage_path=self._storage_path,
+                **self._build_pgbouncer_pool_sizes(max_connections),
+            ),
+            auth_file: (
+                f'"{PGBOUNCER_USER}" "{self.get_secret(APP_SCOPE, PGBOUNCER_PASSWORD_KEY)}"\n'
+            ),
+        }
+        changed = False
+        for path, content in files.items():
+            if container.exists(path) and container.pull(path).read() == content:
+                continue
+            container.push(
+                path,
+                content,
+                make_dirs=True,
+                permissions=0o600,
+                user=WORKLOAD_OS_USER,
+                group=WORKLOAD_OS_GROUP,
+            )
+            changed = True
+        return changed
+
+    @property
+    def _is_pgbouncer_available(self) -> bool:
+        """Whether the workload image has the PgBouncer executable."""
+        container = self.unit.get_container("postgresql")
+        return container.can_connect() and container.exists(PGBOUNCER_EXECUTABLE)
+
+    def _update_connection_pooler(self, max_connections: int) -> None:
+        """Render the PgBouncer configuration and start, reload or stop its service.
+
+        PgBouncer is stopped while the connectivity to the database is disabled.
+
+        Args:
+            max_connections: the max_connections set in PostgreSQL.
+        """
+        container = self.unit.get_container("postgresql")
+        if not container.can_connect():
+            return
+        services = container.pebble.get_services(names=[self._pgbouncer_service])
+        if len(services) == 0:
+            # The service is added to the plan with the PostgreSQL layer.
+            return
+        running = services[0].current == ServiceStatus.ACTIVE
+
+        if (
+            not self.config.connection_pooler
+            or not self._is_pgbouncer_available
+            or self.get_secret(APP_SCOPE, PGBOUNCER_PASSWORD_KEY) is None
+            or self.unit_peer_data.get("connectivity", "on") != "on"
+        ):
+            if running:
+                logger.info("Stopping PgBouncer")
+                container.stop(self._pgbouncer_service)
+            return
+
+        changed = self._render_pgbouncer_files(container, max_connections)
+        if not running:
+            logger.info("Starting PgBouncer")
+            container.start(self._pgbouncer_service)
+        elif changed:
+            # Reload the configuration without dropping the client connections.
+            container.send_signal("SIGHUP", self._pgbouncer_service)
+
     def _validate_config_options(self) -> None:
         """Validates specific config options that need access to the database or to the TLS status."""
         if (
@@ -1456,6 +1858,11 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         if self.config.request_time_zone not in self.postgresql.get_postgresql_timezones():
             raise ValueError("request_time_zone config option has an invalid value")
 
+        if self.config.connection_pooler and not self._is_pgbouncer_available:
+            raise ValueError(
+                f"connection_pooler needs {PGBOUNCER_EXECUTABLE}, which the workload image doesn't have"
+            )
+
         container = self.unit.get_container("postgresql")
         output, _ = container.exec(["locale", "-a"]).wait_output()
         locales = list(output.splitlines())
@@ -1503,8 +1910,14 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         # Create a new config layer.
         new_layer = self._postgresql_layer()
 
-        # Check if there are any changes to layer services.
-        if current_layer.services != new_layer.services:
+        # Check if there are any changes to layer services (ignoring the services from
+        # other layers, like the pgBackRest backup job).
+        current_services = {
+            name: service
+            for name, service in current_layer.services.items()
+            if name in new_layer.services
+        }
+        if current_services != new_layer.services:
             # Changes were made, add the new layer.
             container.add_layer(self._postgresql_service, new_layer, combine=True)
             logging.info("Added updated layer 'postgresql' to Pebble plan")
@@ -1550,11 +1963,15 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
                 return container.resources.limits or {}
         return {}
 
-    def get_node_allocable_memory(self) -> int:
-        """Return the allocable memory in bytes for the current K8S node."""
+    def get_node_allocable_memory(self, resource: str = "memory") -> int:
+        """Return the allocable memory in bytes for the current K8S node.
+
+        Args:
+            resource: the memory resource to check (regular memory or a huge pages size).
+        """
         client = Client()
         node = client.get(Node, name=self._get_node_name_for_pod(), namespace=self._namespace)
-        return any_memory_to_bytes(node.status.allocatable["memory"])
+        return any_memory_to_bytes(node.status.allocatable.get(resource, "0"))
 
     def get_node_cpu_cores(self) -> int:
         """Return the number of CPU cores for the current K8S node."""
@@ -1562,11 +1979,16 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
         node = client.get(Node, name=self._get_node_name_for_pod(), namespace=self._namespace)
         return any_cpu_to_cores(node.status.allocatable["cpu"])
 
-    def get_available_resources(self) -> Tuple[int, int]:
-        """Get available CPU cores and memory (in bytes) for the container."""
+    def get_available_resources(self, container_limits: Optional[Dict] = None) -> Tuple[int, int]:
+        """Get available CPU cores and memory (in bytes) for the container.
+
+        Args:
+            container_limits: resources limits of the container (retrieved when not provided).
+        """
         cpu_cores = self.get_node_cpu_cores()
         allocable_memory = self.get_node_allocable_memory()
-        container_limits = self.get_resources_limits(container_name="postgresql")
+        if container_limits is None:
+            container_limits = self.get_resources_limits(container_name="postgresql")
         if "cpu" in container_limits:
             cpu_str = container_limits["cpu"]
             constrained_cpu = int(cpu_str)
@@ -1582,6 +2004,129 @@ class PostgresqlOperatorCharm(TypedCharmBase[CharmConfig]):
 
         return cpu_cores, allocable_memory
 
+    def get_available_hugepages(self, container_limits: Optional[Dict] = None) -> int:
+        """Get the huge pages memory (in bytes) available for the container.
+
+        Kubernetes only gives huge pages to containers that request them explicitly,
+        so zero is returned when the container has no limit or the node doesn't expose them.
+
+        Args:
+            container_limits: resources limits of the container (retrieved when not provided).
+        """
+        if container_limits is None:
+            container_limits = self.get_resources_limits(container_name="postgresql")
+        if HUGEPAGES_RESOURCE not in container_limits:
+            return 0
+        allocable_hugepages = self.get_node_allocable_memory(resource=HUGEPAGES_RESOURCE)
+        if not allocable_hugepages:
+            return 0
+        hugepages = min(
+            allocable_hugepages, any_memory_to_bytes(container_limits[HUGEPAGES_RESOURCE])
+        )
+        logger.debug(f"Huge pages available for the container: {hugepages} bytes")
+        return hugepages
+
+    def get_relation_user_limits(self, relation: Relation) -> Tuple[int, Dict[str, Optional[str]]]:
+        """Get the resource limits and durability level of the user of a client relation.
+
+        The limits requested by the related application (in its application databag) are
+        only honoured when they are stricter than the ones set through the config options.
+        The requested synchronous_commit level is raised to relation_min_synchronous_commit
+        (or to durability_synchronous_commit when it's not set).
+
+        Args:
+            relation: the client relation.
+
+        Returns:
+            The connection limit (-1 means no limit) and the role settings (None means
+                that the instance default is used).
+        """
+        requested_limits = relation.data[relation.app] if relation.app else {}
+        limits = {}
+        for limit, unlimited in RELATION_USER_LIMITS.items():
+            values = [
+                self.config[f"relation_{limit}"],
+                self._get_requested_user_limit(relation, limit, unlimited),
+            ]
+            values = [value for value in values if value > unlimited]
+            limits[limit] = min(values) if values else None
+        connection_limit = limits.pop("connection_limit")
+        settings = {
+            setting: None if value is None else str(value) for setting, value in limits.items()
+        }
+        settings["synchronous_commit"] = self._get_relation_synchronous_commit(
+            relation, requested_limits.get("synchronous-commit")
+        )
+        return -1 if connection_limit is None else connection_limit, settings
+
+    def _get_requested_user_limit(self, relation: Relation, limit: str, unlimited: int) -> int:
+        """Get a resource limit requested by the application of a client relation.
+
+        The requested value is checked against the same range as the matching
+        relation_* config option, so PostgreSQL doesn't refuse it later.
+
+        Args:
+            relation: the client relation.
+            limit: the name of the resource limit.
+            unlimited: the value that means no limit.
+
+        Returns:
+            The requested limit, or the unlimited value when no valid limit was requested.
+        """
+        if not relation.app:
+            return unlimited
+        requested_limit = relation.data[relation.app].get(limit.replace("_", "-"))
+        if requested_limit is None:
+            return unlimited
+        try:
+            value = int(requested_limit)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {limit} requested by {relation.app.name}")
+            return unlimited
+        try:
+            return RELATION_USER_LIMIT_VALIDATORS[limit](value)
+        except ValueError as e:
+            logger.warning(f"Ignoring out of range {limit} requested by {relation.app.name}: {e}")
+            return unlimited
+
+    def _get_relation_synchronous_commit(
+        self, relation: Relation, requested_level: Optional[str]
+    ) -> Optional[str]:
+        """Get the synchronous_commit level of the user of a client relation.
+
+        Args:
+            relation: the client relation.
+            requested_level: the level requested by the related application (if any).
+
+        Returns:
+            The requested level raised to the lowest allowed one, or None when no valid
+                level was requested (so the durability_synchronous_commit level is used).
+        """
+        if requested_level is None:
+            return None
+        if requested_level not in SYNCHRONOUS_COMMIT_LEVELS:
+            logger.warning(f"Ignoring invalid synchronous-commit requested by {relation.app.name}")
+            return None
+        return max(
+            requested_level,
+            self.config.relation_min_synchronous_commit
+            or self.config.durability_synchronous_commit,
+            key=SYNCHRONOUS_COMMIT_LEVELS.index,
+        )
+
+    def _update_client_relations_user_limits(self) -> None:
+        """Apply the resource limits to the users of all the client relations."""
+        try:
+            users = self.postgresql.list_users()
+            for relation in self.client_relations:
+                user = f"relation_id_{relation.id}"
+                if user not in users:
+                    continue
+                connection_limit, settings = self.get_relation_user_limits(relation)
+                self.postgresql.update_user_limits(user, connection_limit, settings)
+        except (PostgreSQLListUsersError, PostgreSQLUpdateUserLimitsError):
+            logger.exception("Failed to update the client relations users limits")
+
     @property
     def client_relations(self) -> List[Relation]:
         """Return the list of established client relations."""
@@ -5,17 +5,45 @@
 """Structured configuration for the PostgreSQL charm."""
 
 import logging
-from typing import Optional
+from datetime import datetime
+from typing import Dict, Optional
 
 from charms.data_platform_libs.v0.data_models import BaseConfigModel
-from pydantic import validator
+from pydantic import root_validator, validator
+
+from constants import SYNCHRONOUS_COMMIT_LEVELS
+from utils import next_cron_run
 
 logger = logging.getLogger(__name__)
 
+# Compression levels accepted by pgBackRest for each compression type.
+BACKUP_COMPRESS_LEVELS = {"bz2": (1, 9), "gz": (0, 9), "lz4": (-5, 12), "zst": (-7, 22)}
+
 
 class CharmConfig(BaseConfigModel):
     """Manager for the structured configuration."""
 
+    backup_archive_async: bool
+    backup_archive_get_queue_max: int
+    backup_archive_process_max: int
+    backup_block_incremental: bool
+    backup_bundle: bool
+    backup_bundle_limit: int
+    backup_bundle_size: int
+    backup_compress_level: Optional[int]
+    backup_compress_type: str
+    backup_local_repository: bool
+    backup_local_retention_full: int
+    backup_process_max: int
+    backup_retention_archive: Optional[int]
+    backup_retention_diff: Optional[int]
+    backup_retention_full: int
+    backup_schedule_differential: Optional[str]
+    backup_schedule_full: Optional[str]
+    backup_schedule_incremental: Optional[str]
+    backup_schedule_local: Optional[str]
+    connection_pooler: bool
+    connection_pooler_mode: str
     durability_synchronous_commit: Optional[str]
     instance_default_text_search_config: Optional[str]
     instance_password_encryption: Optional[str]
@@ -84,6 +112,13 @@ class CharmConfig(BaseConfigModel):
     plugin_postgis_topology_enable: bool
     plugin_postgis_raster_enable: bool
     plugin_vector_enable: bool
+    relation_connection_limit: int
+    relation_idle_in_transaction_session_timeout: int
+    relation_min_synchronous_commit: Optional[str]
+    relation_statement_timeout: int
+    relation_temp_file_limit: int
+    relation_work_mem: int
+    replicas_max_lag: int
     request_date_style: Optional[str]
     request_standard_conforming_strings: Optional[bool]
     request_time_zone: Optional[str]
@@ -108,6 +143,119 @@ class CharmConfig(BaseConfigModel):
         """Return plugin config names in a iterable."""
         return filter(lambda x: x.startswith("plugin_"), cls.keys())
 
+    @validator("backup_archive_get_queue_max")
+    @classmethod
+    def backup_archive_get_queue_max_values(cls, value: int) -> Optional[int]:
+        """Check backup_archive_get_queue_max config option is between 0 and 4194304."""
+        if value < 0 or value > 4194304:
+            raise ValueError("Value is not between 0 and 4194304")
+
+        return value
+
+    @validator("backup_archive_process_max")
+    @classmethod
+    def backup_archive_process_max_values(cls, value: int) -> Optional[int]:
+        """Check backup_archive_process_max config option is between 1 and 999."""
+        if value < 1 or value > 999:
+            raise ValueError("Value is not between 1 and 999")
+
+        return value
+
+    @validator("backup_bundle_limit", "backup_bundle_size")
+    @classmethod
+    def backup_bundle_values(cls, value: int) -> Optional[int]:
+        """Check backup_bundle_limit and backup_bundle_size config options are between 1 and 1024."""
+        if value < 1 or value > 1024:
+            raise ValueError("Value is not between 1 and 1024")
+
+        return value
+
+    @root_validator(skip_on_failure=True)
+    @classmethod
+    def backup_compress_level_values(cls, values: Dict) -> Dict:
+        """Check backup_compress_level config option is valid for backup_compress_type."""
+        level = values.get("backup_compress_level")
+        compress_type = values.get("backup_compress_type")
+        # The level isn't used when the backups aren't compressed.
+        if level is None or compress_type not in BACKUP_COMPRESS_LEVELS:
+            return values
+
+        min_level, max_level = BACKUP_COMPRESS_LEVELS[compress_type]
+        if level < min_level or level > max_level:
+            raise ValueError(
+                f"backup_compress_level is not between {min_level} and {max_level}"
+                f" for the {compress_type} backup_compress_type"
+            )
+
+        return values
+
+    @validator("backup_compress_type")
+    @classmethod
+    def backup_compress_type_values(cls, value: str) -> Optional[str]:
+        """Check backup_compress_type config option is one of `none`, `bz2`, `gz`, `lz4` or `zst`."""
+        if value not in ["none", "bz2", "gz", "lz4", "zst"]:
+            raise ValueError("Value not one of 'none', 'bz2', 'gz', 'lz4' or 'zst'")
+
+        return value
+
+    @validator("backup_local_retention_full")
+    @classmethod
+    def backup_local_retention_full_values(cls, value: int) -> Optional[int]:
+        """Check backup_local_retention_full config option is between 1 and 9999999."""
+        if value < 1 or value > 9999999:
+            raise ValueError("Value is not between 1 and 9999999")
+
+        return value
+
+    @validator("backup_process_max")
+    @classmethod
+    def backup_process_max_values(cls, value: int) -> Optional[int]:
+        """Check backup_process_max config option is between 0 and 999."""
+        if value < 0 or value > 999:
+            raise ValueError("Value is not between 0 and 999")
+
+        return value
+
+    @validator("backup_retention_archive", "backup_retention_diff")
+    @classmethod
+    def backup_retention_values(cls, value: int) -> Optional[int]:
+        """Check backup_retention_archive and backup_retention_diff are between 1 and 9999999."""
+        if value < 1 or value > 9999999:
+            raise ValueError("Value is not between 1 and 9999999")
+
+        return value
+
+    @validator("backup_retention_full")
+    @classmethod
+    def backup_retention_full_values(cls, value: int) -> Optional[int]:
+        """Check backup_retention_full config option is between 0 and 9999999."""
+        if value < 0 or value > 9999999:
+            raise ValueError("Value is not between 0 and 9999999")
+
+        return value
+
+    @validator(
+        "backup_schedule_differential",
+        "backup_schedule_full",
+        "backup_schedule_incremental",
+        "backup_schedule_local",
+    )
+    @classmethod
+    def backup_schedule_values(cls, value: str) -> Optional[str]:
+        """Check the backup_schedule_* config options are valid cron expressions."""
+        next_cron_run(value, datetime.now())
+
+        return value
+
+    @validator("connection_pooler_mode")
+    @classmethod
+    def connection_pooler_mode_values(cls, value: str) -> Optional[str]:
+        """Check connection_pooler_mode config option is one of `session` or `transaction`."""
+        if value not in ["session", "transaction"]:
+            raise ValueError("Value not one of 'session' or 'transaction'")
+
+        return value
+
     @validator("durability_synchronous_commit")
     @classmethod
     def durability_synchronous_commit_values(cls, value: str) -> Optional[str]:
@@ -227,6 +375,53 @@ class CharmConfig(BaseConfigModel):
 
         return value
 
+    @validator("relation_connection_limit", "relation_temp_file_limit")
+    @classmethod
+    def relation_limit_values(cls, value: int) -> Optional[int]:
+        """Check relation_connection_limit and relation_temp_file_limit are between -1 and 2147483647."""
+        if value < -1 or value > 2147483647:
+            raise ValueError("Value is not between -1 and 2147483647")
+
+        return value
+
+    @validator("relation_min_synchronous_commit")
+    @classmethod
+    def relation_min_synchronous_commit_values(cls, value: str) -> Optional[str]:
+        """Check relation_min_synchronous_commit config option is a synchronous_commit level."""
+        if value not in SYNCHRONOUS_COMMIT_LEVELS:
+            raise ValueError(
+                "Value not one of 'off', 'local', 'remote_write', 'on' or 'remote_apply'"
+            )
+
+        return value
+
+    @validator("relation_idle_in_transaction_session_timeout", "relation_statement_timeout")
+    @classmethod
+    def relation_timeout_values(cls, value: int) -> Optional[int]:
+        """Check the relation timeout config options are between 0 and 2147483647."""
+        if value < 0 or value > 2147483647:
+            raise ValueError("Value is not between 0 and 2147483647")
+
+        return value
+
+    @validator("relation_work_mem")
+    @classmethod
+    def relation_work_mem_values(cls, value: int) -> Optional[int]:
+        """Check relation_work_mem config option is 0 or between 64 and 2147483647."""
+        if value != 0 and (value < 64 or value > 2147483647):
+            raise ValueError("Value is not 0 or between 64 and 2147483647")
+
+        return value
+
+    @validator("replicas_max_lag")
+    @classmethod
+    def replicas_max_lag_values(cls, value: int) -> Optional[int]:
+        """Check replicas_max_lag config option is between 0 and 2147483647."""
+        if value < 0 or value > 2147483647:
+            raise ValueError("Value is not between 0 and 2147483647")
+
+        return value
+
     @validator("response_bytea_output")
     @classmethod
     def response_bytea_output_values(cls, value: str) -> Optional[str]:
@@ -280,3 +475,14 @@ class CharmConfig(BaseConfigModel):
             raise ValueError("Value is not between 0 and 2000000000")
 
         return value
+
+
+# The checks of the relation_* config options, also used for the limits requested by the
+# applications of the client relations.
+RELATION_USER_LIMIT_VALIDATORS = {
+    "connection_limit": CharmConfig.relation_limit_values,
+    "idle_in_transaction_session_timeout": CharmConfig.relation_timeout_values,
+    "statement_timeout": CharmConfig.relation_timeout_values,
+    "temp_file_limit": CharmConfig.relation_limit_values,
+    "work_mem": CharmConfig.relation_work_mem_values,
+}
@@ -20,13 +20,40 @@ USER_PASSWORD_KEY = "operator-password"
 WORKLOAD_OS_GROUP = "postgres"
 WORKLOAD_OS_USER = "postgres"
 METRICS_PORT = "9187"
+PGBOUNCER_PORT = "6432"
+# Pod label set on the replicas that are healthy and fresh enough to serve read-only traffic.
+REPLICA_READY_LABEL = "replica-ready"
+# Pod label set on the synchronous standbys, which serve read-your-writes traffic.
+SYNC_STANDBY_LABEL = "sync-standby"
+# Resource limits of the client relations users, with the value that means no limit.
+RELATION_USER_LIMITS = {
+    "connection_limit": -1,
+    "idle_in_transaction_session_timeout": 0,
+    "statement_timeout": 0,
+    "temp_file_limit": -1,
+    "work_mem": 0,
+}
+# synchronous_commit levels, from the least to the most durable.
+SYNCHRONOUS_COMMIT_LEVELS = ["off", "local", "remote_write", "on", "remote_apply"]
+PGBOUNCER_USER = "pgbouncer"
+PGBOUNCER_PASSWORD_KEY = "pgbouncer-password"
+# PgBouncer isn't shipped in the workload image, so the pooler needs an image that has it.
+PGBOUNCER_EXECUTABLE = "/usr/sbin/pgbouncer"
+HUGEPAGES_RESOURCE = "hugepages-2Mi"
 POSTGRES_LOG_FILES = [
     "/var/log/pgbackrest/*",
     "/var/log/postgresql/patroni.log",
     "/var/log/postgresql/postgresql*.log",
 ]
 # List of system usernames needed for correct work of the charm/workload.
-SYSTEM_USERS = [BACKUP_USER, REPLICATION_USER, REWIND_USER, USER, MONITORING_USER]
+SYSTEM_USERS = [
+    BACKUP_USER,
+    REPLICATION_USER,
+    REWIND_USER,
+    USER,
+    MONITORING_USER,
+    PGBOUNCER_USER,
+]
 
 SECRET_LABEL = "secret"
 SECRET_CACHE_LABEL = "cache"
@@ -140,6 +140,21 @@ class Patroni:
                         sync_standbys.append("/".join(member["name"].rsplit("-", 1)))
         return sync_standbys
 
+    def get_replicas_lag(self) -> Dict[str, int]:
+        """Get the replication lag (in bytes) of the running replicas, keyed by unit name."""
+        # Request info from cluster endpoint (which returns all members of the cluster).
+        for attempt in Retrying(stop=stop_after_attempt(len(self._endpoints) + 1)):
+            with attempt:
+                url = self._get_alternative_patroni_url(attempt)
+                r = requests.get(f"{url}/cluster", verify=self._verify)
+        return {
+            "/".join(member["name"].rsplit("-", 1)): member["lag"]
+            for member in r.json()["members"]
+            if member["role"] != "leader"
+            and member["state"] in RUNNING_STATES
+            and isinstance(member.get("lag"), int)
+        }
+
     @property
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
     def cluster_members(self) -> set:
@@ -148,9 +163,14 @@ class Patroni:
         r = requests.get(f"{self._patroni_url}/cluster", verify=self._verify)
         return {member["name"] for member in r.json()["members"]}
 
-    def are_all_members_ready(self) -> bool:
+    def are_all_members_ready(self, creating_replicas_allowed: bool = False) -> bool:
         """Check if all members are correctly running Patroni and PostgreSQL.
 
+        Args:
+            creating_replicas_allowed: whether to also consider ready the members that are
+                still creating their replica (used when they are restored from the backup
+                repository, so they don't copy data from the primary).
+
         Returns:
             True if all members are ready False otherwise. Retries over a period of 10 seconds
             3 times to allow server time to start up.
@@ -164,7 +184,8 @@ class Patroni:
         except RetryError:
             return False
 
-        return all(member["state"] in RUNNING_STATES for member in r.json()["members"])
+        ready_states = RUNNING_STATES + (["creating replica"] if creating_replicas_allowed else [])
+        return all(member["state"] in ready_states for member in r.json()["members"])
 
     @property
     def is_creating_backup(self) -> bool:
@@ -285,6 +306,21 @@ class Patroni:
 
         return r.json().get("replication_state") == "streaming"
 
+    @property
+    def member_wal_replay_status(self) -> Dict[str, Any]:
+        """WAL replay position of the member (while PostgreSQL is still in recovery).
+
+        Returns:
+            the xlog section of the Patroni member status (with the replayed location and the
+                timestamp of the last replayed transaction) or an empty dict if the member
+                isn't replaying WAL or the Patroni API isn't reachable.
+        """
+        try:
+            r = requests.get(f"{self._patroni_url}/patroni", verify=self._verify, timeout=5)
+            return r.json().get("xlog", {})
+        except (requests.exceptions.RequestException, ValueError):
+            return {}
+
     @property
     def is_database_running(self) -> bool:
         """Returns whether the PostgreSQL database process is running (and isn't frozen)."""
@@ -310,6 +346,23 @@ class Patroni:
             json={"postgresql": {"parameters": parameters}},
         )
 
+    def update_permanent_slots(self, slots: Dict[str, Optional[Dict[str, str]]]) -> None:
+        """Add or remove (with a None value) replication slots kept by Patroni on every member.
+
+        Patroni creates the permanent slots on the primary and keeps them on the replicas,
+        so they survive failovers.
+
+        Args:
+            slots: the slots definitions keyed by the slots names.
+        """
+        r = requests.patch(
+            f"{self._patroni_url}/config",
+            verify=self._verify,
+            json={"slots": slots},
+            timeout=5,
+        )
+        r.raise_for_status()
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
     def reinitialize_postgresql(self) -> None:
         """Reinitialize PostgreSQL."""
@@ -346,6 +399,9 @@ class Patroni:
         stanza: str = None,
         restore_stanza: Optional[str] = None,
         backup_id: Optional[str] = None,
+        restore_delta: bool = False,
+        restore_repository: Optional[str] = None,
+        local_repository: bool = False,
         parameters: Optional[dict[str, str]] = None,
     ) -> None:
         """Render the Patroni configuration file.
@@ -359,6 +415,12 @@ class Patroni:
             stanza: name of the stanza created by pgBackRest.
             restore_stanza: name of the stanza used when restoring a backup.
             backup_id: id of the backup that is being restored.
+            restore_delta: whether to restore the backup over the existing data files
+                (which were moved aside to let Patroni bootstrap the cluster).
+            restore_repository: key of the pgBackRest repository to restore the backup from
+                (otherwise pgBackRest looks for it in all the repositories).
+            local_repository: whether the local pgBackRest repository is enabled (so its
+                stanza is created when this member is promoted).
             parameters: PostgreSQL parameters to be added to the postgresql.conf file.
         """
         # Open the template patroni.yml file.
@@ -381,6 +443,9 @@ class Patroni:
             enable_pgbackrest=stanza is not None,
             restoring_backup=backup_id is not None,
             backup_id=backup_id,
+            restore_delta=restore_delta,
+            restore_repository=restore_repository,
+            local_repository=local_repository,
             stanza=stanza,
             restore_stanza=restore_stanza,
             minority_count=self._members_count // 2,
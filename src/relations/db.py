@@ -3,14 +3,17 @@
 
 """Postgres db and db-admin relation hooks & helpers."""
 
+import hashlib
+import json
 import logging
-from typing import Iterable, List, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from charms.postgresql_k8s.v0.postgresql import (
     PostgreSQLCreateDatabaseError,
     PostgreSQLCreateUserError,
     PostgreSQLDeleteUserError,
     PostgreSQLGetPostgreSQLVersionError,
+    PostgreSQLUpdateUserLimitsError,
 )
 from ops.charm import (
     CharmBase,
@@ -146,20 +149,32 @@ class DbProvides(Object):
             logger.warning("Early exit on_relation_changed: No database name provided")
             return False
 
-        try:
-            unit_relation_databag = relation.data[self.charm.unit]
-            application_relation_databag = relation.data[self.charm.app]
+        unit_relation_databag = relation.data[self.charm.unit]
+        application_relation_databag = relation.data[self.charm.app]
+        user = f"relation_id_{relation.id}"
+        password = unit_relation_databag.get("password", new_password())
+        plugins = [
+            "_".join(plugin.split("_")[1:-1])
+            for plugin in self.charm.config.plugin_keys()
+            if self.charm.config[plugin]
+        ]
+        user_limits = self.charm.get_relation_user_limits(relation)
+
+        # Skip the setup if nothing changed since the last time it was done, so the
+        # application doesn't receive relation changed events for the same data.
+        fingerprint = self._get_fingerprint(
+            relation, database, password, required_extensions, plugins, user_limits
+        )
+        if self._is_set_up(relation, fingerprint):
+            logger.debug("Early exit set_up_relation: relation already set up")
+            self._update_unit_status(relation)
+            return True
 
+        try:
             # Creates the user and the database for this specific relation if it was not already
             # created in a previous relation changed event.
-            user = f"relation_id_{relation.id}"
-            password = unit_relation_databag.get("password", new_password())
             self.charm.postgresql.create_user(user, password, self.admin)
-            plugins = [
-                "_".join(plugin.split("_")[1:-1])
-                for plugin in self.charm.config.plugin_keys()
-                if self.charm.config[plugin]
-            ]
+            self.charm.postgresql.update_user_limits(user, *user_limits)
 
             self.charm.postgresql.create_database(
                 database, user, plugins=plugins, client_relations=self.charm.client_relations
@@ -189,12 +204,25 @@ class DbProvides(Object):
                 )
             )
 
+            # Build the synchronous standbys' connection string (for the
+            # applications that need read-your-writes consistency).
+            sync_standbys = str(
+                ConnectionString(
+                    host=self.charm.sync_standbys_endpoint,
+                    dbname=database,
+                    port=DATABASE_PORT,
+                    user=user,
+                    password=password,
+                    fallback_application_name=relation.app.name,
+                )
+            )
+
             # Set the data in both application and unit data bag.
-            # It's needed to run this logic on every relation changed event
-            # setting the data again in the databag, otherwise the application charm that
-            # is connecting to this database will receive a "database gone" event from the
-            # old PostgreSQL library (ops-lib-pgsql) and the connection between the
-            # application and this charm will not work.
+            # The old PostgreSQL library (ops-lib-pgsql) reports the database as gone when
+            # the data is missing or doesn't match what its unit requested (the database or
+            # the allowed units), so the data is written again whenever any of those inputs
+            # changes (see the fingerprint) or it's missing from the databags (like in the
+            # unit databag of a new leader). Values that didn't change stay in the databags.
             for databag in [application_relation_databag, unit_relation_databag]:
                 updates = {
                     "allowed-subnets": self._get_allowed_subnets(relation),
@@ -203,6 +231,7 @@ class DbProvides(Object):
                     "master": primary,
                     "port": DATABASE_PORT,
                     "standbys": standbys,
+                    "sync-standbys": sync_standbys,
                     "version": self.charm.postgresql.get_postgresql_version(),
                     "user": user,
                     "password": password,
@@ -210,10 +239,12 @@ class DbProvides(Object):
                     "extensions": ",".join(required_extensions),
                 }
                 databag.update(updates)
+            self.charm._peers.data[self.charm.app][self._fingerprint_key(relation)] = fingerprint
         except (
             PostgreSQLCreateDatabaseError,
             PostgreSQLCreateUserError,
             PostgreSQLGetPostgreSQLVersionError,
+            PostgreSQLUpdateUserLimitsError,
         ):
             self.charm.unit.status = BlockedStatus(
                 f"Failed to initialize {self.relation_name} relation"
@@ -224,6 +255,68 @@ class DbProvides(Object):
 
         return True
 
+    def _is_set_up(self, relation: Relation, fingerprint: str) -> bool:
+        """Whether the relation was set up with the same inputs and its data is still published.
+
+        Args:
+            relation: the legacy db/db-admin relation.
+            fingerprint: the fingerprint of the current relation setup inputs.
+        """
+        if self.charm._peers.data[self.charm.app].get(self._fingerprint_key(relation)) != (
+            fingerprint
+        ):
+            return False
+        return all(
+            relation.data[entity].get("master") for entity in [self.charm.app, self.charm.unit]
+        )
+
+    def _fingerprint_key(self, relation: Relation) -> str:
+        """Key of the peer relation app databag where the relation setup fingerprint is kept."""
+        return f"{self.relation_name}-{relation.id}-fingerprint"
+
+    def _get_fingerprint(
+        self,
+        relation: Relation,
+        database: str,
+        password: str,
+        extensions: List[str],
+        plugins: List[str],
+        user_limits: Tuple[int, Dict[str, Optional[str]]],
+    ) -> str:
+        """Hash everything the relation setup depends on.
+
+        Args:
+            relation: the legacy db/db-admin relation.
+            database: the requested database.
+            password: the password of the relation user.
+            extensions: the extensions requested by the application.
+            plugins: the enabled plugins.
+            user_limits: the resource limits of the relation user.
+
+        Returns:
+            The fingerprint of the relation setup inputs.
+        """
+        inputs = {
+            "allowed-subnets": self._get_allowed_subnets(relation),
+            "allowed-units": self._get_allowed_units(relation),
+            "client-relations": sorted(
+                client_relation.id for client_relation in self.charm.client_relations
+            ),
+            "database": database,
+            "endpoints": [
+                self.charm.endpoint,
+                self.charm.primary_endpoint,
+                self.charm.replicas_endpoint,
+                self.charm.sync_standbys_endpoint,
+            ],
+            "extensions": extensions,
+            "password": password,
+            "plugins": plugins,
+            "user-limits": user_limits,
+            "version": self.charm._patroni.rock_postgresql_version,
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
     def _check_for_blocking_relations(self, relation_id: int) -> bool:
         """Checks if there are relations with extensions or roles.
 
@@ -300,6 +393,8 @@ class DbProvides(Object):
         if not self.charm.unit.is_leader():
             return
 
+        self.charm._peers.data[self.charm.app].pop(self._fingerprint_key(event.relation), None)
+
         # Delete the user.
         user = f"relation_id_{event.relation.id}"
         try:
@@ -0,0 +1,228 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Logical replication (change data capture) relation hooks & helpers."""
+
+import logging
+import re
+from typing import List, Optional
+
+from charms.postgresql_k8s.v0.postgresql import (
+    PostgreSQLDeleteUserError,
+    PostgreSQLGetPostgreSQLVersionError,
+    PostgreSQLGetReplicationSlotsLagError,
+    PostgreSQLLogicalReplicationRemoveError,
+    PostgreSQLLogicalReplicationSetupError,
+)
+from ops.charm import (
+    CharmBase,
+    RelationBrokenEvent,
+    RelationChangedEvent,
+    RelationDepartedEvent,
+)
+from ops.framework import Object
+from ops.model import BlockedStatus, Relation
+from requests import RequestException
+
+from constants import DATABASE_PORT
+from utils import new_password
+
+logger = logging.getLogger(__name__)
+
+LOGICAL_REPLICATION_PLUGIN = "pgoutput"
+
+# Tables can be qualified with their schema (otherwise the public schema is used).
+TABLE_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$")
+
+
+class PostgreSQLLogicalReplication(Object):
+    """Defines functionality for the 'provides' side of the 'logical-replication' relation.
+
+    The related application requests the database and the tables it wants to receive the
+    changes from. A publication, a replication slot (managed by Patroni) and a user that can
+    stream the changes are created for it.
+
+    Hook events observed:
+        - relation-changed
+        - relation-departed
+        - relation-broken
+    """
+
+    def __init__(self, charm: CharmBase, relation_name: str = "logical-replication") -> None:
+        """Constructor for PostgreSQLLogicalReplication object.
+
+        Args:
+            charm: the charm for which this relation is provided
+            relation_name: the name of the relation
+        """
+        self.relation_name = relation_name
+
+        super().__init__(charm, self.relation_name)
+        self.framework.observe(
+            charm.on[self.relation_name].relation_changed, self._on_relation_changed
+        )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_departed, self._on_relation_departed
+        )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_broken, self._on_relation_broken
+        )
+
+        self.charm = charm
+
+    @staticmethod
+    def _get_name(relation: Relation) -> str:
+        """Returns the name of the user, publication and replication slot of the relation."""
+        return f"relation_id_{relation.id}"
+
+    def _get_tables(self, relation: Relation) -> Optional[List[str]]:
+        """Returns the tables requested by the application (or None if they are invalid)."""
+        tables = [
+            table.strip()
+            for table in relation.data[relation.app].get("tables", "").split(",")
+            if table.strip()
+        ]
+        invalid_tables = [table for table in tables if not TABLE_NAME_PATTERN.match(table)]
+        if invalid_tables:
+            logger.error(f"Invalid tables requested through relation: {', '.join(invalid_tables)}")
+            return None
+        return tables
+
+    def _on_relation_changed(self, event: RelationChangedEvent) -> None:
+        """Set up the publication requested by the related application."""
+        # Check for some conditions before trying to access the PostgreSQL instance.
+        if not self.charm.is_cluster_initialised or not self.charm._patroni.member_started:
+            logger.debug(
+                "Deferring on_relation_changed: Cluster not initialized or patroni not running"
+            )
+            event.defer()
+            return
+
+        if not self.charm.unit.is_leader():
+            return
+
+        self.set_up_relation(event.relation)
+
+    def set_up_relation(self, relation: Relation) -> bool:
+        """Set up the publication, replication slot and user of the relation.
+
+        Args:
+            relation: the logical replication relation.
+
+        Returns:
+            Whether the relation was set up.
+        """
+        database = relation.data[relation.app].get("database")
+        tables = self._get_tables(relation)
+        if not database or not tables:
+            logger.warning("Early exit set_up_relation: No valid database or tables requested")
+            return False
+
+        application_relation_databag = relation.data[self.charm.app]
+        name = self._get_name(relation)
+        password = application_relation_databag.get("password", new_password())
+        try:
+            self.charm.postgresql.set_up_logical_replication(
+                name, password, database, name, tables
+            )
+            # Patroni keeps the slot on every member, so it survives failovers.
+            self.charm._patroni.update_permanent_slots({
+                name: {
+                    "type": "logical",
+                    "database": database,
+                    "plugin": LOGICAL_REPLICATION_PLUGIN,
+                }
+            })
+            application_relation_databag.update({
+                "endpoints": f"{self.charm.primary_endpoint}:{DATABASE_PORT}",
+                "database": database,
+                "username": name,
+                "password": password,
+                "publication": name,
+                "replication-slot": name,
+                "plugin": LOGICAL_REPLICATION_PLUGIN,
+                "version": self.charm.postgresql.get_postgresql_version(),
+            })
+        except (
+            PostgreSQLGetPostgreSQLVersionError,
+            PostgreSQLLogicalReplicationSetupError,
+            RequestException,
+        ):
+            logger.exception(f"Failed to set up {self.relation_name} relation")
+            self.charm.unit.status = BlockedStatus(
+                f"Failed to initialize {self.relation_name} relation"
+            )
+            return False
+
+        return True
+
+    def _on_relation_departed(self, event: RelationDepartedEvent) -> None:
+        """Set a flag to avoid removing the publication when not wanted."""
+        # Set a flag to avoid deleting the publication, slot and user when this unit
+        # is removed and receives relation broken events from related applications.
+        # This is needed because of https://bugs.launchpad.net/juju/+bug/1979811.
+        if event.departing_unit == self.charm.unit:
+            self.charm._peers.data[self.charm.unit].update({"departing": "True"})
+
+    def _on_relation_broken(self, event: RelationBrokenEvent) -> None:
+        """Remove the publication, replication slot and user of the relation."""
+        # Check for some conditions before trying to access the PostgreSQL instance.
+        if not self.charm.is_cluster_initialised or not self.charm._patroni.member_started:
+            logger.debug(
+                "Deferring on_relation_broken: Cluster not initialized or patroni not running"
+            )
+            event.defer()
+            return
+
+        if "departing" in self.charm._peers.data[self.charm.unit]:
+            logger.debug("Early exit on_relation_broken: Skipping departing unit")
+            return
+
+        if not self.charm.unit.is_leader():
+            return
+
+        database = event.relation.data[self.charm.app].get("database")
+        if not database:
+            logger.debug("Early exit on_relation_broken: relation was not set up")
+            return
+
+        name = self._get_name(event.relation)
+        try:
+            # Patroni would create the slot again if it was dropped before.
+            self.charm._patroni.update_permanent_slots({name: None})
+            self.charm.postgresql.remove_logical_replication(database, name, name)
+            self.charm.postgresql.delete_user(name)
+        except PostgreSQLLogicalReplicationRemoveError:
+            # The subscriber may still be using the slot (like when it reconnected
+            # before the slot was dropped), so the removal is retried later.
+            logger.exception(f"Failed to remove the {self.relation_name} replication slot")
+            event.defer()
+        except (PostgreSQLDeleteUserError, RequestException):
+            logger.exception(f"Failed to remove {self.relation_name} relation")
+            self.charm.unit.status = BlockedStatus(
+                f"Failed to remove {self.relation_name} relation"
+            )
+
+    def update_replication_slots_lag(self) -> None:
+        """Share with the related applications how far behind their replication slots are.
+
+        The lag is rounded down to MiB, so the related applications aren't notified
+        while they keep up with the changes.
+        """
+        relations = self.model.relations.get(self.relation_name, [])
+        if not self.charm.unit.is_leader() or not relations:
+            return
+
+        try:
+            slots_lag = self.charm.postgresql.get_replication_slots_lag()
+        except PostgreSQLGetReplicationSlotsLagError:
+            logger.debug("Early exit update_replication_slots_lag: failed to get the slots lag")
+            return
+
+        for relation in relations:
+            lag = slots_lag.get(self._get_name(relation))
+            if lag is None:
+                continue
+            lag_mib = str(lag // 1024**2)
+            if relation.data[self.charm.app].get("replication-slot-lag-mib") != lag_mib:
+                relation.data[self.charm.app]["replication-slot-lag-mib"] = lag_mib
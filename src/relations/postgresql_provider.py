@@ -15,12 +15,18 @@ from charms.postgresql_k8s.v0.postgresql import (
     PostgreSQLCreateUserError,
     PostgreSQLDeleteUserError,
     PostgreSQLGetPostgreSQLVersionError,
+    PostgreSQLUpdateUserLimitsError,
+)
+from ops.charm import (
+    CharmBase,
+    RelationBrokenEvent,
+    RelationChangedEvent,
+    RelationDepartedEvent,
 )
-from ops.charm import CharmBase, RelationBrokenEvent, RelationDepartedEvent
 from ops.framework import Object
 from ops.model import ActiveStatus, BlockedStatus, Relation
 
-from constants import DATABASE_PORT
+from constants import DATABASE_PORT, PGBOUNCER_PORT
 from utils import new_password
 
 logger = logging.getLogger(__name__)
@@ -31,6 +37,7 @@ class PostgreSQLProvider(Object):
 
     Hook events observed:
         - database-requested
+        - relation-changed
         - relation-broken
     """
 
@@ -44,6 +51,9 @@ class PostgreSQLProvider(Object):
         self.relation_name = relation_name
 
         super().__init__(charm, self.relation_name)
+        self.framework.observe(
+            charm.on[self.relation_name].relation_changed, self._on_relation_changed
+        )
         self.framework.observe(
             charm.on[self.relation_name].relation_departed, self._on_relation_departed
         )
@@ -87,6 +97,9 @@ class PostgreSQLProvider(Object):
             user = f"relation_id_{event.relation.id}"
             password = new_password()
             self.charm.postgresql.create_user(user, password, extra_user_roles=extra_user_roles)
+            self.charm.postgresql.update_user_limits(
+                user, *self.charm.get_relation_user_limits(event.relation)
+            )
             plugins = [
                 "_".join(plugin.split("_")[1:-1])
                 for plugin in self.charm.config.plugin_keys()
@@ -109,6 +122,9 @@ class PostgreSQLProvider(Object):
             # Update the read-only endpoint.
             self.update_read_only_endpoint(event)
 
+            # Set the PgBouncer endpoints (if the connection pooler is enabled).
+            self.update_pooler_endpoints(event)
+
             # Set the database version.
             self.database_provides.set_version(
                 event.relation.id, self.charm.postgresql.get_postgresql_version()
@@ -122,6 +138,7 @@ class PostgreSQLProvider(Object):
             PostgreSQLCreateDatabaseError,
             PostgreSQLCreateUserError,
             PostgreSQLGetPostgreSQLVersionError,
+            PostgreSQLUpdateUserLimitsError,
         ) as e:
             logger.exception(e)
             self.charm.unit.status = BlockedStatus(
@@ -130,6 +147,42 @@ class PostgreSQLProvider(Object):
                 else f"Failed to initialize {self.relation_name} relation"
             )
 
+    def _on_relation_changed(self, event: RelationChangedEvent) -> None:
+        """Apply again the resource limits, as the application may have requested new ones.
+
+        The database requested event is only emitted once, so the limits requested
+        after the database was created are applied here.
+        """
+        # Skip the relations whose database wasn't created yet (the limits
+        # are applied when it's requested).
+        if not self.charm.unit.is_leader() or not event.relation.data[self.charm.app].get(
+            "database"
+        ):
+            return
+
+        # Check for some conditions before trying to access the PostgreSQL instance.
+        if (
+            "cluster_initialised" not in self.charm._peers.data[self.charm.app]
+            or not self.charm._patroni.member_started
+        ):
+            logger.debug(
+                "Deferring on_relation_changed: Cluster must be initialized before the user limits can be updated"
+            )
+            event.defer()
+            return
+
+        try:
+            self.charm.postgresql.update_user_limits(
+                f"relation_id_{event.relation.id}",
+                *self.charm.get_relation_user_limits(event.relation),
+            )
+        except PostgreSQLUpdateUserLimitsError as e:
+            # The failure is usually transient (like a switchover), so it's retried
+            # instead of blocking the unit.
+            logger.exception(e)
+            logger.debug("Deferring on_relation_changed: failed to update the user limits")
+            event.defer()
+
     def _on_relation_departed(self, event: RelationDepartedEvent) -> None:
         """Set a flag to avoid deleting database users when not wanted."""
         # Set a flag to avoid deleting database users when this unit
@@ -172,16 +225,20 @@ class PostgreSQLProvider(Object):
             )
 
     def update_read_only_endpoint(self, event: DatabaseRequestedEvent = None) -> None:
-        """Set the read-only endpoint only if there are replicas."""
+        """Set the read-only endpoints only if there are replicas.
+
+        The sync-standbys endpoint is published in its own field for the clients
+        that need read-your-writes consistency.
+        """
         if not self.charm.unit.is_leader():
             return
 
-        # If there are no replicas, remove the read-only endpoint.
-        endpoints = (
-            f"{self.charm.replicas_endpoint}:{DATABASE_PORT}"
-            if len(self.charm._peers.units) > 0
-            else ""
-        )
+        # If there are no replicas, remove the read-only endpoints.
+        endpoints = ""
+        sync_standby_endpoints = ""
+        if len(self.charm._peers.units) > 0:
+            endpoints = f"{self.charm.replicas_endpoint}:{DATABASE_PORT}"
+            sync_standby_endpoints = f"{self.charm.sync_standbys_endpoint}:{DATABASE_PORT}"
 
         # Get the current relation or all the relations
         # if this is triggered by another type of event.
@@ -192,6 +249,36 @@ class PostgreSQLProvider(Object):
                 relation.id,
                 endpoints,
             )
+            self.database_provides.update_relation_data(
+                relation.id,
+                {"sync-standby-endpoints": sync_standby_endpoints},
+            )
+
+    def update_pooler_endpoints(self, event: DatabaseRequestedEvent = None) -> None:
+        """Set the PgBouncer endpoints only if the connection pooler is enabled."""
+        if not self.charm.unit.is_leader():
+            return
+
+        endpoints = ""
+        read_only_endpoints = ""
+        if self.charm.config.connection_pooler:
+            endpoints = f"{self.charm.primary_endpoint}:{PGBOUNCER_PORT}"
+            # Each replica pools the connections to its own database.
+            if len(self.charm._peers.units) > 0:
+                read_only_endpoints = f"{self.charm.replicas_endpoint}:{PGBOUNCER_PORT}"
+
+        # Get the current relation or all the relations
+        # if this is triggered by another type of event.
+        relations = [event.relation] if event else self.model.relations[self.relation_name]
+
+        for relation in relations:
+            self.database_provides.update_relation_data(
+                relation.id,
+                {
+                    "pooler-endpoints": endpoints,
+                    "pooler-read-only-endpoints": read_only_endpoints,
+                },
+            )
 
     def _update_unit_status(self, relation: Relation) -> None:
         """# Clean up Blocked status if it's due to extensions request."""
@@ -6,6 +6,12 @@
 import re
 import secrets
 import string
+from datetime import datetime, timedelta
+from typing import List, Set
+
+# Allowed values of each field of a cron expression
+# (minute, hour, day of month, month and day of week).
+CRON_FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
 
 
 def new_password() -> str:
@@ -71,3 +77,86 @@ def any_cpu_to_cores(cpu_str) -> int:
         # convert millis to cores, undercommited
         return int(cpu_str[:-1]) // 1000
     return int(cpu_str)
+
+
+def parse_cron_expression(expression: str) -> List[Set[int]]:
+    """Parse a cron expression into the sets of values allowed in each of its fields.
+
+    Args:
+        expression: a cron expression with five fields (minute, hour, day of month, month
+            and day of week), each one being a "*" or a list of values, ranges and steps,
+            e.g. "0 2 * * 0" or "*/30 8-18 * * 1-5".
+
+    Raises:
+        ValueError: if the expression is not valid.
+    """
+    fields = expression.split()
+    if len(fields) != len(CRON_FIELD_RANGES):
+        raise ValueError(f"Invalid cron expression '{expression}': expected 5 fields")
+
+    parsed_fields = []
+    for field, (minimum, maximum) in zip(fields, CRON_FIELD_RANGES):
+        values = set()
+        for item in field.split(","):
+            match = re.match(r"^(\*|(\d+)(?:-(\d+))?)(?:/(\d+))?$", item)
+            if not match:
+                raise ValueError(f"Invalid cron expression '{expression}': bad field '{field}'")
+            start, end = minimum, maximum
+            if match.group(2) is not None:
+                start = int(match.group(2))
+                end = int(match.group(3)) if match.group(3) is not None else start
+                if match.group(4) is not None and match.group(3) is None:
+                    end = maximum
+            step = int(match.group(4) or 1)
+            if start < minimum or end > maximum or start > end or step == 0:
+                raise ValueError(f"Invalid cron expression '{expression}': bad field '{field}'")
+            values.update(range(start, end + 1, step))
+        parsed_fields.append(values)
+
+    # Sunday can be either 0 or 7 in the day of week field.
+    if 7 in parsed_fields[4]:
+        parsed_fields[4] = (parsed_fields[4] - {7}) | {0}
+    return parsed_fields
+
+
+def next_cron_run(expression: str, after: datetime) -> datetime:
+    """Compute the next time (after the given one) that matches a cron expression.
+
+    As in cron, when both the day of month and the day of week are restricted,
+    the days that match either of them are considered.
+
+    Args:
+        expression: a cron expression (see parse_cron_expression).
+        after: the time after which the next run should happen.
+
+    Raises:
+        ValueError: if the expression is not valid or never matches (e.g. "0 0 30 2 *").
+    """
+    minutes, hours, days, months, weekdays = parse_cron_expression(expression)
+    fields = expression.split()
+    any_day, any_weekday = fields[2] == "*", fields[4] == "*"
+
+    def day_matches(time: datetime) -> bool:
+        day_match = time.day in days
+        # Python weekdays start on Monday (0), while cron ones start on Sunday (0).
+        weekday_match = (time.weekday() + 1) % 7 in weekdays
+        if any_day or any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    current = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = after + timedelta(days=366 * 5)
+    while current <= limit:
+        if current.month not in months:
+            current = (current.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(
+                day=1
+            )
+        elif not day_matches(current):
+            current = current.replace(hour=0, minute=0) + timedelta(days=1)
+        elif current.hour not in hours:
+            current = current.replace(minute=0) + timedelta(hours=1)
+        elif current.minute not in minutes:
+            current += timedelta(minutes=1)
+        else:
+            return current
+    raise ValueError(f"Cron expression '{expression}' never matches")
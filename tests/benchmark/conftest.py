@@ -0,0 +1,236 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+import json
+import os
+import shutil
+import subprocess
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+ACCESS_KEY = "benchmark-access-key"
+SECRET_KEY = "benchmark-secret-key"
+BUCKET = "benchmark"
+REGION = "us-east-1"
+
+# Approximate number of rows of the benchmark table per MiB of data.
+ROWS_PER_MIB = 14000
+
+RESULTS: List[Dict] = []
+
+
+class RequestCountingMiddleware:
+    """WSGI middleware that counts the requests received by the S3 stand-in."""
+
+    def __init__(self, app):
+        self.app = app
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.counts[environ["REQUEST_METHOD"]] += 1
+        return self.app(environ, start_response)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counts, "total": sum(self.counts.values())}
+
+
+@dataclass
+class S3Server:
+    host: str
+    port: int
+    requests: RequestCountingMiddleware
+    bucket: str = BUCKET
+    access_key: str = ACCESS_KEY
+    secret_key: str = SECRET_KEY
+    region: str = REGION
+
+    @property
+    def endpoint(self) -> str:
+        return f"https://{self.host}:{self.port}"
+
+
+@dataclass
+class PostgreSQLCluster:
+    bin_dir: Path
+    base_dir: Path
+    port: int
+
+    @property
+    def data_dir(self) -> Path:
+        return self.base_dir / "pgdata"
+
+    @property
+    def socket_dir(self) -> Path:
+        return self.base_dir / "run"
+
+    def pg_ctl(self, *args: str) -> None:
+        subprocess.run(
+            [
+                str(self.bin_dir / "pg_ctl"),
+                "--pgdata",
+                str(self.data_dir),
+                "--log",
+                str(self.base_dir / "postgresql.log"),
+                "--wait",
+                *args,
+            ],
+            check=True,
+            capture_output=True,
+        )
+
+    def psql(self, query: str) -> str:
+        return subprocess.run(
+            [
+                str(self.bin_dir / "psql"),
+                "--host",
+                str(self.socket_dir),
+                "--port",
+                str(self.port),
+                "--dbname",
+                "postgres",
+                "--tuples-only",
+                "--no-align",
+                "--command",
+                query,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+
+
+def _find_postgresql_bin_dir() -> Path:
+    """Return the directory with the PostgreSQL server binaries."""
+    if bin_dir := os.environ.get("BENCHMARK_PG_BIN_DIR"):
+        return Path(bin_dir)
+    if initdb := shutil.which("initdb"):
+        return Path(initdb).parent
+    for bin_dir in sorted(Path("/usr/lib/postgresql").glob("*/bin"), reverse=True):
+        if (bin_dir / "initdb").exists():
+            return bin_dir
+    pytest.skip("PostgreSQL server binaries not found (set BENCHMARK_PG_BIN_DIR)")
+
+
+def _free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def s3_server():
+    """Start a local S3-compatible server (moto) that counts the requests it receives."""
+    moto_server = pytest.importorskip("moto.server")
+    from werkzeug.serving import make_server
+
+    requests = RequestCountingMiddleware(
+        moto_server.DomainDispatcherApplication(moto_server.create_backend_app)
+    )
+    # pgBackRest only talks to S3 over TLS, so serve it with a self-signed certificate.
+    server = make_server("127.0.0.1", 0, requests, threaded=True, ssl_context="adhoc")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    import boto3
+
+    s3_server = S3Server(host="127.0.0.1", port=server.port, requests=requests)
+    boto3.session.Session(
+        aws_access_key_id=ACCESS_KEY, aws_secret_access_key=SECRET_KEY, region_name=REGION
+    ).client("s3", endpoint_url=s3_server.endpoint, verify=False).create_bucket(Bucket=BUCKET)
+    yield s3_server
+    server.shutdown()
+    thread.join()
+
+
+@pytest.fixture(scope="session")
+def dataset_size_mib() -> int:
+    """Size of the generated dataset (BENCHMARK_DATASET_MIB, 256 MiB by default)."""
+    return int(os.environ.get("BENCHMARK_DATASET_MIB", "256"))
+
+
+@pytest.fixture(scope="session")
+def postgresql_cluster(tmp_path_factory, dataset_size_mib):
+    """Initialise a local PostgreSQL cluster with a generated dataset."""
+    if shutil.which("pgbackrest") is None:
+        pytest.skip("pgbackrest not found")
+    cluster = PostgreSQLCluster(
+        bin_dir=_find_postgresql_bin_dir(),
+        base_dir=tmp_path_factory.mktemp("postgresql"),
+        port=_free_port(),
+    )
+    cluster.socket_dir.mkdir()
+    subprocess.run(
+        [
+            str(cluster.bin_dir / "initdb"),
+            "--pgdata",
+            str(cluster.data_dir),
+            "--auth",
+            "trust",
+            "--username",
+            "postgres",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    # The archive command is set by the benchmark once the pgBackRest options are known.
+    with open(cluster.data_dir / "postgresql.conf", "a") as file:
+        file.write(
+            f"port = {cluster.port}\n"
+            f"unix_socket_directories = '{cluster.socket_dir}'\n"
+            "listen_addresses = ''\n"
+            "archive_mode = on\n"
+            "archive_command = '/bin/true'\n"
+            "wal_level = replica\n"
+            "max_wal_senders = 3\n"
+        )
+    cluster.pg_ctl("start")
+    cluster.psql(
+        "CREATE TABLE benchmark AS SELECT id, md5(id::text) AS payload, now() AS created_at"
+        f" FROM generate_series(1, {dataset_size_mib * ROWS_PER_MIB}) AS id;"
+    )
+    cluster.psql("CHECKPOINT;")
+    yield cluster
+    cluster.pg_ctl("stop", "--mode", "immediate")
+
+
+@pytest.fixture(scope="session")
+def benchmark_results() -> List[Dict]:
+    return RESULTS
+
+
+def pytest_terminal_summary(terminalreporter):
+    """Print the benchmark results and write them to BENCHMARK_REPORT (if set)."""
+    if not RESULTS:
+        return
+    terminalreporter.section("backup and restore benchmark")
+    header = "{:<24s} | {:<8s} | {:>10s} | {:>10s} | {:>12s}".format(
+        "scenario", "phase", "seconds", "MiB/s", "s3-requests"
+    )
+    terminalreporter.write_line(header)
+    terminalreporter.write_line("-" * len(header))
+    for result in RESULTS:
+        terminalreporter.write_line(
+            "{:<24s} | {:<8s} | {:>10.2f} | {:>10.2f} | {:>12d}".format(
+                result["scenario"],
+                result["phase"],
+                result["seconds"],
+                result["throughput-mib-s"],
+                result["s3-requests"]["total"],
+            )
+        )
+    if report := os.environ.get("BENCHMARK_REPORT"):
+        with open(report, "w") as file:
+            json.dump(RESULTS, file, indent=2)
@@ -0,0 +1,184 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Backup and restore throughput of pgBackRest with the configuration rendered by the charm.
+
+The charm code builds the pgBackRest configuration and commands, which are run locally
+against a PostgreSQL cluster and a local S3-compatible server, so the duration, throughput
+and number of S3 requests of different backup settings can be compared.
+"""
+
+import os
+import subprocess
+import time
+from typing import Dict
+from unittest.mock import PropertyMock, patch
+
+import pytest
+from ops.testing import ExecResult, Harness
+
+from backups import REPOSITORY_INFO_CACHE_FILE
+from charm import PostgresqlOperatorCharm
+from constants import PEER
+
+CONTAINER = "postgresql"
+MIB = 1024 * 1024
+
+# Backup settings compared by the benchmark (the config options of the charm).
+SCENARIOS = {
+    "lz4": {"backup_compress_type": "lz4"},
+    "zst": {"backup_compress_type": "zst"},
+    "gz": {"backup_compress_type": "gz"},
+    "none": {"backup_compress_type": "none"},
+    "lz4-process-max-4": {"backup_compress_type": "lz4", "backup_process_max": 4},
+    "lz4-archive-sync": {"backup_compress_type": "lz4", "backup_archive_async": False},
+    "lz4-no-bundle": {"backup_compress_type": "lz4", "backup_bundle": False},
+    "lz4-block-incremental": {"backup_compress_type": "lz4", "backup_block_incremental": True},
+}
+
+
+class PgBackRestRunner:
+    """Run the pgBackRest commands from the charm locally instead of in the workload container.
+
+    The paths of the workload container are mapped to the local cluster and the options
+    that only make sense inside Kubernetes (endpoint, user, sockets) are overridden through
+    environment variables (which take precedence over the configuration file and, unlike
+    command line options, are ignored by the commands that don't use them).
+    """
+
+    def __init__(self, harness: Harness, cluster, s3_server):
+        self.storage_path = harness.charm._storage_path
+        self.data_dir = cluster.data_dir
+        for directory in ("spool", "lock", "log"):
+            (cluster.base_dir / directory).mkdir(exist_ok=True)
+        self.environment = {
+            "PGBACKREST_CONFIG": str(
+                harness.get_filesystem_root(CONTAINER) / "etc" / "pgbackrest.conf"
+            ),
+            "PGBACKREST_LOCK_PATH": str(cluster.base_dir / "lock"),
+            "PGBACKREST_LOG_PATH": str(cluster.base_dir / "log"),
+            "PGBACKREST_SPOOL_PATH": str(cluster.base_dir / "spool"),
+            "PGBACKREST_PG1_PATH": str(cluster.data_dir),
+            "PGBACKREST_PG1_PORT": str(cluster.port),
+            "PGBACKREST_PG1_SOCKET_PATH": str(cluster.socket_dir),
+            "PGBACKREST_PG1_USER": "postgres",
+            "PGBACKREST_REPO1_S3_ENDPOINT": s3_server.host,
+            "PGBACKREST_REPO1_STORAGE_PORT": str(s3_server.port),
+            "PGBACKREST_REPO1_STORAGE_VERIFY_TLS": "n",
+        }
+
+    def handler(self, args) -> ExecResult:
+        command = [
+            argument.replace(f"{self.storage_path}/pgdata", str(self.data_dir))
+            for argument in args.command
+        ]
+        process = subprocess.run(
+            command, capture_output=True, text=True, env={**os.environ, **self.environment}
+        )
+        return ExecResult(
+            exit_code=process.returncode, stdout=process.stdout, stderr=process.stderr
+        )
+
+    def archive_command(self, stanza: str) -> str:
+        variables = [f"{name}={value}" for name, value in self.environment.items()]
+        return " ".join([
+            "env",
+            *variables,
+            "pgbackrest",
+            f"--stanza={stanza}",
+            "archive-push",
+            "%p",
+        ])
+
+
+@pytest.fixture
+def harness(s3_server):
+    with patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None), patch(
+        "lightkube.core.client.GenericSyncClient"
+    ):
+        harness = Harness(PostgresqlOperatorCharm)
+        harness.add_relation(PEER, "postgresql-k8s")
+        harness.add_relation(
+            "s3-parameters",
+            "s3-integrator",
+            app_data={
+                "bucket": s3_server.bucket,
+                "access-key": s3_server.access_key,
+                "secret-key": s3_server.secret_key,
+                "endpoint": s3_server.endpoint,
+                "region": s3_server.region,
+                "path": "/benchmark",
+                "s3-uri-style": "path",
+            },
+        )
+        yield harness
+        harness.cleanup()
+
+
+def _measure(phase: str, scenario: str, s3_server, function, size: int = 0) -> Dict:
+    s3_server.requests.reset()
+    start = time.monotonic()
+    function()
+    seconds = time.monotonic() - start
+    return {
+        "scenario": scenario,
+        "phase": phase,
+        "seconds": seconds,
+        "throughput-mib-s": size / MIB / seconds if size else 0.0,
+        "s3-requests": s3_server.requests.snapshot(),
+    }
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_backup_and_restore(
+    scenario, harness, s3_server, postgresql_cluster, benchmark_results, tmp_path
+):
+    harness.update_config({"backup_process_max": 2, **SCENARIOS[scenario]})
+    harness.begin()
+    harness.set_can_connect(CONTAINER, True)
+    backup = harness.charm.backup
+    runner = PgBackRestRunner(harness, postgresql_cluster, s3_server)
+    harness.handle_exec(CONTAINER, ["pgbackrest"], handler=runner.handler)
+    assert backup._render_pgbackrest_conf_file()
+
+    # Create the stanza and send the WAL files to it.
+    postgresql_cluster.psql(
+        f"ALTER SYSTEM SET archive_command = '{runner.archive_command(backup.stanza_name)}';"
+    )
+    postgresql_cluster.psql("SELECT pg_reload_conf();")
+    backup._execute_command(["pgbackrest", f"--stanza={backup.stanza_name}", "stanza-create"])
+
+    with patch(
+        "charm.PostgresqlOperatorCharm.is_primary", new_callable=PropertyMock, return_value=True
+    ):
+        command = backup._build_backup_command("full")
+    result = _measure("backup", scenario, s3_server, lambda: backup._execute_command(command))
+
+    # Measure the listing from the repository, not from the cache.
+    container = harness.model.unit.get_container(CONTAINER)
+    if container.exists(REPOSITORY_INFO_CACHE_FILE):
+        container.remove_path(REPOSITORY_INFO_CACHE_FILE)
+    listing = _measure("list", scenario, s3_server, backup._generate_backup_list_output)
+
+    last_backup = backup._get_repository_info()[0]["backup"][-1]
+    size = last_backup["info"]["size"]
+    result["throughput-mib-s"] = size / MIB / result["seconds"]
+    result["repository-size"] = last_backup["info"]["repository"]["delta"]
+    result["dataset-size"] = size
+
+    # Restore the backup to a new data directory.
+    runner.data_dir = tmp_path / "restore"
+    restore_command = backup._build_restore_command({
+        "stanza": backup.stanza_name,
+        "label": last_backup["label"],
+        "delta": False,
+    })
+    restore = _measure(
+        "restore",
+        scenario,
+        s3_server,
+        lambda: backup._execute_command(restore_command),
+        size=size,
+    )
+    assert (runner.data_dir / "PG_VERSION").exists()
+
+    benchmark_results.extend([result, listing, restore])
@@ -1,16 +1,18 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 import datetime
+import json
 import unittest
 from typing import OrderedDict
-from unittest.mock import MagicMock, PropertyMock, call, mock_open, patch
+from unittest.mock import ANY, MagicMock, PropertyMock, call, mock_open, patch
 
 from boto3.exceptions import S3UploadFailedError
 from botocore.exceptions import ClientError
 from jinja2 import Template
 from ops import ActiveStatus, BlockedStatus, MaintenanceStatus, Unit
-from ops.pebble import Change, ChangeError, ChangeID, ExecError
+from ops.pebble import Change, ChangeError, ChangeID, ExecError, ServiceStatus
 from ops.testing import Harness
+from pydantic import ValidationError
 from tenacity import RetryError, wait_fixed
 
 from charm import PostgresqlOperatorCharm
@@ -26,7 +28,7 @@ S3_PARAMETERS_RELATION = "s3-parameters"
 
 
 class TestPostgreSQLBackups(unittest.TestCase):
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     def setUp(self):
         # Mock generic sync client to avoid search to ~/.kube/config.
         self.patcher = patch("lightkube.core.client.GenericSyncClient")
@@ -38,6 +40,7 @@ class TestPostgreSQLBackups(unittest.TestCase):
         # Set up the initial relation and hooks.
         self.peer_rel_id = self.harness.add_relation(PEER, "postgresql-k8s")
         self.harness.add_relation_unit(self.peer_rel_id, "postgresql-k8s/0")
+        self.harness.add_storage("backups", attach=True)
         self.harness.begin()
         self.charm = self.harness.charm
 
@@ -53,6 +56,21 @@ class TestPostgreSQLBackups(unittest.TestCase):
             self.charm.backup.stanza_name, f"{self.charm.model.name}.{self.charm.cluster_name}"
         )
 
+    def test_is_local_repository_enabled(self):
+        # Test when the local repository is disabled.
+        self.assertFalse(self.charm.backup.is_local_repository_enabled)
+
+        # Test when it's enabled and the backups storage is attached.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_local_repository": True})
+        self.assertTrue(self.charm.backup.is_local_repository_enabled)
+
+        # Test when the application was deployed without the backups storage.
+        with patch(
+            "ops.model.Model.storages", new_callable=PropertyMock(return_value={"backups": []})
+        ):
+            self.assertFalse(self.charm.backup.is_local_repository_enabled)
+
     def test_are_backup_settings_ok(self):
         # Test without S3 relation.
         self.assertEqual(
@@ -112,6 +130,17 @@ class TestPostgreSQLBackups(unittest.TestCase):
             (False, "Unit cannot perform backups as it is the cluster primary"),
         )
 
+        # Test that local backups can be created only in the primary.
+        self.assertEqual(
+            self.charm.backup._can_unit_perform_backup("local"),
+            (False, "Stanza was not initialised"),
+        )
+        _is_primary.return_value = False
+        self.assertEqual(
+            self.charm.backup._can_unit_perform_backup("local"),
+            (False, "Unit cannot perform local backups as it is not the cluster primary"),
+        )
+
         # Test when running the check in a replica and TLS is disabled.
         _is_primary.return_value = False
         with self.harness.hooks_disabled():
@@ -140,13 +169,30 @@ class TestPostgreSQLBackups(unittest.TestCase):
             (False, "Stanza was not initialised"),
         )
 
-        # Test when S3 parameters are not ok.
+        # Test when a backup is already in progress.
         with self.harness.hooks_disabled():
             self.harness.update_relation_data(
                 self.peer_rel_id,
                 self.charm.app.name,
                 {"stanza": self.charm.backup.stanza_name},
             )
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"backup-job": '{"id": "2023-01-01T09:00:00Z"}'},
+            )
+        self.assertEqual(
+            self.charm.backup._can_unit_perform_backup(),
+            (False, "A backup is already in progress in this unit"),
+        )
+
+        # Test when S3 parameters are not ok.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"backup-job": ""},
+            )
         _are_backup_settings_ok.return_value = (False, "fake error message")
         self.assertEqual(
             self.charm.backup._can_unit_perform_backup(),
@@ -356,63 +402,120 @@ class TestPostgreSQLBackups(unittest.TestCase):
             self.charm.backup._construct_endpoint(s3_parameters), "https://storage.googleapis.com"
         )
 
-    @patch("boto3.session.Session.resource")
+    @patch("boto3.session.Session.client")
+    def test_get_s3_client(self, _client):
+        s3_parameters = {
+            "bucket": "test-bucket",
+            "access-key": "test-access-key",
+            "secret-key": "test-secret-key",
+            "endpoint": "https://storage.googleapis.com",
+            "region": "us-east-1",
+        }
+
+        # Test that the client is built with the provided parameters.
+        client = self.charm.backup._get_s3_client(s3_parameters)
+        self.assertEqual(client, _client.return_value)
+        _client.assert_called_once_with("s3", endpoint_url="https://storage.googleapis.com")
+
+        # Test that the client is reused for the same parameters.
+        _client.reset_mock()
+        self.assertEqual(self.charm.backup._get_s3_client(dict(s3_parameters)), client)
+        _client.assert_not_called()
+
+        # Test that a new client is built when the credentials change.
+        s3_parameters["secret-key"] = "other-secret-key"
+        self.charm.backup._get_s3_client(s3_parameters)
+        _client.assert_called_once()
+
+    @patch("charm.PostgreSQLBackups._get_s3_client")
     @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
-    def test_create_bucket_if_not_exists(self, _retrieve_s3_parameters, _resource):
+    def test_create_bucket_if_not_exists(self, _retrieve_s3_parameters, _get_s3_client):
         # Test when there are missing S3 parameters.
         _retrieve_s3_parameters.return_value = ([], ["bucket", "access-key", "secret-key"])
         self.charm.backup._create_bucket_if_not_exists()
-        _resource.assert_not_called()
+        _get_s3_client.assert_not_called()
 
         # Test when the charm fails to create a boto3 session.
-        _retrieve_s3_parameters.return_value = (
-            {
-                "bucket": "test-bucket",
-                "access-key": "test-access-key",
-                "secret-key": "test-secret-key",
-                "endpoint": "test-endpoint",
-                "region": "test-region",
-            },
-            [],
-        )
-        _resource.side_effect = ValueError
+        s3_parameters = {
+            "bucket": "test-bucket",
+            "access-key": "test-access-key",
+            "secret-key": "test-secret-key",
+            "endpoint": "test-endpoint",
+            "region": "test-region",
+        }
+        _retrieve_s3_parameters.return_value = (s3_parameters, [])
+        _get_s3_client.side_effect = ValueError
         with self.assertRaises(ValueError):
             self.charm.backup._create_bucket_if_not_exists()
+        self.assertNotIn("s3-bucket-verified", self.charm.unit_peer_data)
 
         # Test when the bucket already exists.
-        _resource.side_effect = None
-        head_bucket = _resource.return_value.Bucket.return_value.meta.client.head_bucket
-        create = _resource.return_value.Bucket.return_value.create
-        wait_until_exists = _resource.return_value.Bucket.return_value.wait_until_exists
+        _get_s3_client.side_effect = None
+        head_bucket = _get_s3_client.return_value.head_bucket
+        create_bucket = _get_s3_client.return_value.create_bucket
+        wait = _get_s3_client.return_value.get_waiter.return_value.wait
         self.charm.backup._create_bucket_if_not_exists()
-        head_bucket.assert_called_once()
-        create.assert_not_called()
-        wait_until_exists.assert_not_called()
+        head_bucket.assert_called_once_with(Bucket="test-bucket")
+        create_bucket.assert_not_called()
+        wait.assert_not_called()
+        self.assertEqual(
+            self.charm.unit_peer_data["s3-bucket-verified"],
+            self.charm.backup._s3_parameters_fingerprint(s3_parameters, include_secret=False),
+        )
 
-        # Test when the bucket doesn't exist.
+        # Test that the secret key isn't part of the stored fingerprint.
+        self.assertNotEqual(
+            self.charm.unit_peer_data["s3-bucket-verified"],
+            self.charm.backup._s3_parameters_fingerprint(s3_parameters),
+        )
+
+        # Test that the bucket is not verified again with the same S3 parameters.
+        head_bucket.reset_mock()
+        self.charm.backup._create_bucket_if_not_exists()
+        head_bucket.assert_not_called()
+
+        # Test that the bucket is verified again when the bucket changes.
+        _retrieve_s3_parameters.return_value = ({**s3_parameters, "bucket": "other-bucket"}, [])
+        self.charm.backup._create_bucket_if_not_exists()
+        head_bucket.assert_called_once_with(Bucket="other-bucket")
         head_bucket.reset_mock()
+        _retrieve_s3_parameters.return_value = (s3_parameters, [])
+
+        # Test when the bucket doesn't exist.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"s3-bucket-verified": ""}
+            )
         head_bucket.side_effect = ClientError(
             error_response={"Error": {"Code": 1, "message": "fake error"}},
             operation_name="fake operation name",
         )
         self.charm.backup._create_bucket_if_not_exists()
         head_bucket.assert_called_once()
-        create.assert_called_once()
-        wait_until_exists.assert_called_once()
+        create_bucket.assert_called_once_with(
+            Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "test-region"}
+        )
+        _get_s3_client.return_value.get_waiter.assert_called_once_with("bucket_exists")
+        wait.assert_called_once_with(Bucket="test-bucket")
 
         # Test when the bucket creation fails.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"s3-bucket-verified": ""}
+            )
         head_bucket.reset_mock()
-        create.reset_mock()
-        wait_until_exists.reset_mock()
-        create.side_effect = ClientError(
+        create_bucket.reset_mock()
+        wait.reset_mock()
+        create_bucket.side_effect = ClientError(
             error_response={"Error": {"Code": 1, "message": "fake error"}},
             operation_name="fake operation name",
         )
         with self.assertRaises(ClientError):
             self.charm.backup._create_bucket_if_not_exists()
         head_bucket.assert_called_once()
-        create.assert_called_once()
-        wait_until_exists.assert_not_called()
+        create_bucket.assert_called_once()
+        wait.assert_not_called()
+        self.assertNotIn("s3-bucket-verified", self.charm.unit_peer_data)
 
     @patch("ops.model.Container.exec")
     def test_empty_data_files(self, _exec):
@@ -429,6 +532,26 @@ class TestPostgreSQLBackups(unittest.TestCase):
         self.charm.backup._empty_data_files()
         _exec.assert_called_once_with(command)
 
+    @patch("ops.model.Container.exec")
+    def test_move_data_files_aside(self, _exec):
+        command = [
+            "/bin/bash",
+            "-c",
+            "rm -rf /var/lib/postgresql/data/pgdata.delta && mv /var/lib/postgresql/data/pgdata /var/lib/postgresql/data/pgdata.delta",
+        ]
+
+        # Test when the data directory cannot be moved.
+        _exec.side_effect = ExecError(command=command, exit_code=1, stdout="", stderr="fake error")
+        with self.assertRaises(ExecError):
+            self.charm.backup._move_data_files_aside()
+        _exec.assert_called_once_with(command)
+
+        # Test when the data directory is successfully moved.
+        _exec.reset_mock()
+        _exec.side_effect = None
+        self.charm.backup._move_data_files_aside()
+        _exec.assert_called_once_with(command)
+
     @patch("charm.PostgresqlOperatorCharm.update_config")
     def test_change_connectivity_to_database(self, _update_config):
         # Ensure that there is no connectivity info in the unit relation databag.
@@ -490,45 +613,129 @@ class TestPostgreSQLBackups(unittest.TestCase):
         # Test when there are no backups.
         self.assertEqual(
             self.charm.backup._format_backup_list([]),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------""",
+            """backup-id             | backup-type  | reference-backup-id   | repository | s3-objects | backup-status
+------------------------------------------------------------------------------------------------------""",
         )
 
         # Test when there are backups.
         backup_list = [
-            ("2023-01-01T09:00:00Z", "physical", "failed: fake error"),
-            ("2023-01-01T10:00:00Z", "physical", "finished"),
+            ("2023-01-01T09:00:00Z", "full", "", "s3", "", "failed: fake error"),
+            ("2023-01-01T10:00:00Z", "full", "", "s3", "1532", "finished"),
+            (
+                "2023-01-01T11:00:00Z",
+                "differential",
+                "2023-01-01T10:00:00Z",
+                "local",
+                "",
+                "finished",
+            ),
         ]
         self.assertEqual(
             self.charm.backup._format_backup_list(backup_list),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------
-2023-01-01T09:00:00Z  | physical     | failed: fake error
-2023-01-01T10:00:00Z  | physical     | finished""",
+            """backup-id             | backup-type  | reference-backup-id   | repository | s3-objects | backup-status
+------------------------------------------------------------------------------------------------------
+2023-01-01T09:00:00Z  | full         |                       | s3         |            | failed: fake error
+2023-01-01T10:00:00Z  | full         |                       | s3         | 1532       | finished
+2023-01-01T11:00:00Z  | differential | 2023-01-01T10:00:00Z  | local      |            | finished""",
         )
 
+    @patch("charm.PostgreSQLBackups._count_backup_objects")
     @patch("charm.PostgreSQLBackups._execute_command")
-    def test_generate_backup_list_output(self, _execute_command):
+    def test_generate_backup_list_output(self, _execute_command, _count_backup_objects):
         # Test when no backups are returned.
         _execute_command.return_value = ('[{"backup":[]}]', None)
         self.assertEqual(
-            self.charm.backup._generate_backup_list_output(),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------""",
+            self.charm.backup._generate_backup_list_output()[0],
+            """backup-id             | backup-type  | reference-backup-id   | repository | s3-objects | backup-status
+------------------------------------------------------------------------------------------------------""",
         )
+        _count_backup_objects.assert_not_called()
 
         # Test when backups are returned.
         _execute_command.return_value = (
-            '[{"backup":[{"label":"20230101-090000F","error":"fake error"},{"label":"20230101-100000F","error":null}]}]',
+            '[{"backup":[{"label":"20230101-090000F","error":"fake error","prior":null},{"label":"20230101-100000F","error":null,"prior":null},{"label":"20230101-100000F_20230101-110000D","error":null,"prior":"20230101-100000F"},{"label":"20230101-100000F_20230101-120000I","error":null,"prior":"20230101-100000F_20230101-110000D","database":{"repo-key":2}}]}]',
             None,
         )
+        _count_backup_objects.return_value = {
+            "20230101-100000F": 1532,
+            "20230101-100000F_20230101-110000D": 12,
+        }
         self.assertEqual(
-            self.charm.backup._generate_backup_list_output(),
-            """backup-id             | backup-type  | backup-status
-----------------------------------------------------
-2023-01-01T09:00:00Z  | physical     | failed: fake error
-2023-01-01T10:00:00Z  | physical     | finished""",
+            self.charm.backup._generate_backup_list_output()[0],
+            """backup-id             | backup-type  | reference-backup-id   | repository | s3-objects | backup-status
+------------------------------------------------------------------------------------------------------
+2023-01-01T09:00:00Z  | full         |                       | s3         |            | failed: fake error
+2023-01-01T10:00:00Z  | full         |                       | s3         |            | finished
+2023-01-01T11:00:00Z  | differential | 2023-01-01T10:00:00Z  | s3         |            | finished
+2023-01-01T12:00:00Z  | incremental  | 2023-01-01T11:00:00Z  | local      |            | finished""",
+        )
+        _count_backup_objects.assert_not_called()
+
+        # Test when the S3 objects of the backups are counted.
+        self.assertEqual(
+            self.charm.backup._generate_backup_list_output(count_objects=True)[0],
+            """backup-id             | backup-type  | reference-backup-id   | repository | s3-objects | backup-status
+------------------------------------------------------------------------------------------------------
+2023-01-01T09:00:00Z  | full         |                       | s3         |            | failed: fake error
+2023-01-01T10:00:00Z  | full         |                       | s3         | 1532       | finished
+2023-01-01T11:00:00Z  | differential | 2023-01-01T10:00:00Z  | s3         | 12         | finished
+2023-01-01T12:00:00Z  | incremental  | 2023-01-01T11:00:00Z  | local      |            | finished""",
+        )
+
+        # Test when other units have backups in their local repositories.
+        with self.harness.hooks_disabled():
+            self.harness.add_relation_unit(self.peer_rel_id, "postgresql-k8s/1")
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                "postgresql-k8s/1",
+                {"local-backups": json.dumps({"20230101-093000F": ""})},
+            )
+        self.assertEqual(
+            self.charm.backup._generate_backup_list_output(
+                filters={"status": "finished"}, count_objects=True
+            )[0],
+            """backup-id             | backup-type  | reference-backup-id   | repository | s3-objects | backup-status
+------------------------------------------------------------------------------------------------------
+2023-01-01T09:30:00Z  | full         |                       | local (postgresql-k8s/1) |            | finished
+2023-01-01T10:00:00Z  | full         |                       | s3         | 1532       | finished
+2023-01-01T11:00:00Z  | differential | 2023-01-01T10:00:00Z  | s3         | 12         | finished
+2023-01-01T12:00:00Z  | incremental  | 2023-01-01T11:00:00Z  | local      |            | finished""",
+        )
+
+    @patch("charm.PostgreSQLBackups._get_s3_client")
+    @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
+    def test_count_backup_objects(self, _retrieve_s3_parameters, _get_s3_client):
+        # Test when there are missing S3 parameters.
+        _retrieve_s3_parameters.return_value = {}, ["bucket"]
+        self.assertEqual(self.charm.backup._count_backup_objects(["20230101-100000F"]), {})
+        _get_s3_client.assert_not_called()
+
+        # Test when the objects are listed (only the ones of the requested backups).
+        _retrieve_s3_parameters.return_value = {"bucket": "test-bucket", "path": "/test-path"}, []
+        prefix = f"test-path/backup/{self.charm.backup.stanza_name}"
+        paginate = _get_s3_client.return_value.get_paginator.return_value.paginate
+        paginate.side_effect = [
+            [{"KeyCount": 1000}, {"KeyCount": 532}],
+            [{"KeyCount": 12}],
+        ]
+        self.assertEqual(
+            self.charm.backup._count_backup_objects([
+                "20230101-100000F",
+                "20230101-100000F_20230101-110000D",
+            ]),
+            {"20230101-100000F": 1532, "20230101-100000F_20230101-110000D": 12},
+        )
+        _get_s3_client.return_value.get_paginator.assert_called_once_with("list_objects_v2")
+        paginate.assert_has_calls([
+            call(Bucket="test-bucket", Prefix=f"{prefix}/20230101-100000F/"),
+            call(Bucket="test-bucket", Prefix=f"{prefix}/20230101-100000F_20230101-110000D/"),
+        ])
+
+        # Test when the objects couldn't be listed.
+        paginate.side_effect = ClientError(
+            error_response={"Error": {"Code": "AccessDenied"}}, operation_name="ListObjectsV2"
         )
+        self.assertEqual(self.charm.backup._count_backup_objects(["20230101-100000F"]), {})
 
     @patch("charm.PostgreSQLBackups._execute_command")
     def test_list_backups(self, _execute_command):
@@ -557,6 +764,243 @@ class TestPostgreSQLBackups(unittest.TestCase):
             OrderedDict[str, str]([("2023-01-01T10:00:00Z", "test-stanza")]),
         )
 
+        # Test when there are differential and incremental backups (they should be sorted
+        # by their ids and the labels should be returned when it's not desired to parse them).
+        _execute_command.return_value = (
+            '[{"backup":[{"label":"20230101-090000F","error":null},{"label":"20230101-090000F_20230101-110000D","error":null},{"label":"20230101-100000F","error":null}],"name":"test-stanza"}]',
+            None,
+        )
+        self.assertEqual(
+            self.charm.backup._list_backups(show_failed=False),
+            OrderedDict[str, str]([
+                ("2023-01-01T09:00:00Z", "test-stanza"),
+                ("2023-01-01T10:00:00Z", "test-stanza"),
+                ("2023-01-01T11:00:00Z", "test-stanza"),
+            ]),
+        )
+        self.assertEqual(
+            list(self.charm.backup._list_backups(show_failed=False, parse=False).keys()),
+            ["20230101-090000F", "20230101-100000F", "20230101-090000F_20230101-110000D"],
+        )
+
+    @patch("backups.datetime")
+    @patch("charm.PostgreSQLBackups._execute_command")
+    def test_get_repository_info(self, _execute_command, _datetime):
+        # Test when the workload container is not reachable (nothing is cached).
+        _execute_command.return_value = ('[{"backup":[],"name":"test-stanza"}]', None)
+        _datetime.now.return_value.timestamp.return_value = 1000.0
+        self.assertEqual(
+            self.charm.backup._get_repository_info(timeout=30),
+            [{"backup": [], "name": "test-stanza"}],
+        )
+        _execute_command.assert_called_once_with(
+            ["pgbackrest", "info", "--output=json"], timeout=30
+        )
+
+        # Test when pgBackRest cannot be run.
+        _execute_command.reset_mock()
+        _execute_command.return_value = (None, None)
+        self.assertIsNone(self.charm.backup._get_repository_info())
+
+        # Test that the info is cached.
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        container.make_dir("/var/lib/postgresql/data", make_parents=True)
+        _execute_command.return_value = ('[{"backup":[],"name":"test-stanza"}]', None)
+        self.charm.backup._get_repository_info()
+        self.assertEqual(
+            json.loads(container.pull("/var/lib/postgresql/data/pgbackrest-info.json").read()),
+            {"cached-at": 1000.0, "info": [{"backup": [], "name": "test-stanza"}]},
+        )
+
+        # Test that the cached info is used while it's valid.
+        _execute_command.reset_mock()
+        _datetime.now.return_value.timestamp.return_value = 1100.0
+        self.assertEqual(
+            self.charm.backup._get_repository_info(), [{"backup": [], "name": "test-stanza"}]
+        )
+        _execute_command.assert_not_called()
+
+        # Test when the cached info was invalidated by another unit.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, "postgresql-k8s/0", {"repository-info-invalidated-at": "1050.0"}
+            )
+        _execute_command.return_value = ('[{"backup":[],"name":"other-stanza"}]', None)
+        self.assertEqual(
+            self.charm.backup._get_repository_info(), [{"backup": [], "name": "other-stanza"}]
+        )
+        _execute_command.assert_called_once()
+
+        # Test when the cached info has expired.
+        _execute_command.reset_mock()
+        _datetime.now.return_value.timestamp.return_value = 1500.0
+        self.charm.backup._get_repository_info()
+        _execute_command.assert_called_once()
+
+    @patch("charm.PostgreSQLBackups._get_repository_info")
+    def test_can_create_replicas_from_repository(self, _get_repository_info):
+        # Test when there is no stanza.
+        self.assertFalse(self.charm.backup.can_create_replicas_from_repository())
+        _get_repository_info.assert_not_called()
+
+        # Test when the repository can't be listed.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"stanza": "test-stanza"}
+            )
+        _get_repository_info.return_value = None
+        self.assertFalse(self.charm.backup.can_create_replicas_from_repository())
+
+        # Test when there are only failed and local backups.
+        _get_repository_info.return_value = [
+            {
+                "backup": [
+                    {
+                        "label": "20230101-090000F",
+                        "error": True,
+                        "database": {"repo-key": 1},
+                    },
+                    {
+                        "label": "20230101-100000F",
+                        "error": False,
+                        "database": {"repo-key": 2},
+                    },
+                ]
+            }
+        ]
+        self.assertFalse(self.charm.backup.can_create_replicas_from_repository())
+
+        # Test when there is a finished backup in the S3 repository.
+        _get_repository_info.return_value[0]["backup"].append({
+            "label": "20230101-110000F",
+            "error": False,
+            "database": {"repo-key": 1},
+        })
+        self.assertTrue(self.charm.backup.can_create_replicas_from_repository())
+
+    @patch("charm.PostgreSQLBackups._get_repository_info")
+    def test_publish_local_backups(self, _get_repository_info):
+        _get_repository_info.return_value = [
+            {
+                "backup": [
+                    {"label": "20230101-090000F", "error": None},
+                    {
+                        "label": "20230101-100000F",
+                        "error": None,
+                        "database": {"repo-key": 2},
+                    },
+                    {
+                        "label": "20230101-100000F_20230101-110000D",
+                        "error": None,
+                        "prior": "20230101-100000F",
+                        "database": {"repo-key": 2},
+                    },
+                    {
+                        "label": "20230101-120000F",
+                        "error": "fake error",
+                        "database": {"repo-key": 2},
+                    },
+                ]
+            }
+        ]
+
+        # Test when the local repository is not enabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_local_repository": False})
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"local-backups": "{}"}
+            )
+        self.charm.backup.publish_local_backups()
+        _get_repository_info.assert_not_called()
+        self.assertNotIn("local-backups", self.charm.unit_peer_data)
+
+        # Test that only the finished backups of the local repository are published.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_local_repository": True})
+        self.charm.backup.publish_local_backups()
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["local-backups"]),
+            {
+                "20230101-100000F": "",
+                "20230101-100000F_20230101-110000D": "20230101-100000F",
+            },
+        )
+
+        # Test that the published backups are kept when pgBackRest cannot be run.
+        _get_repository_info.return_value = None
+        self.charm.backup.publish_local_backups()
+        self.assertIn("local-backups", self.charm.unit_peer_data)
+
+        # Test when there are no local backups anymore.
+        _get_repository_info.return_value = [{"backup": []}]
+        self.charm.backup.publish_local_backups()
+        self.assertNotIn("local-backups", self.charm.unit_peer_data)
+
+    @patch("backups.datetime")
+    def test_invalidate_repository_info_cache(self, _datetime):
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        _datetime.now.return_value.timestamp.return_value = 1000.0
+
+        # Test when only the cache of this unit is invalidated.
+        container.push("/var/lib/postgresql/data/pgbackrest-info.json", "{}", make_dirs=True)
+        self.charm.backup.invalidate_repository_info_cache(local_only=True)
+        self.assertFalse(container.exists("/var/lib/postgresql/data/pgbackrest-info.json"))
+        self.assertNotIn("repository-info-invalidated-at", self.charm.unit_peer_data)
+
+        # Test when the other units are also notified.
+        container.push("/var/lib/postgresql/data/pgbackrest-info.json", "{}")
+        self.charm.backup.invalidate_repository_info_cache()
+        self.assertFalse(container.exists("/var/lib/postgresql/data/pgbackrest-info.json"))
+        self.assertEqual(self.charm.unit_peer_data["repository-info-invalidated-at"], "1000.0")
+
+    @patch("charm.PostgreSQLBackups._execute_command")
+    def test_get_backup_chain(self, _execute_command):
+        # Test when there are no backups.
+        _execute_command.return_value = ("[]", None)
+        self.assertEqual(self.charm.backup._get_backup_chain("2023-01-01T09:00:00Z"), (None, []))
+
+        _execute_command.return_value = (
+            '[{"backup":[{"label":"20230101-090000F","error":"fake error","reference":null},{"label":"20230101-100000F","error":null,"reference":null},{"label":"20230101-100000F_20230101-110000I","error":null,"reference":["20230101-100000F"]},{"label":"20230101-090000F_20230101-120000I","error":null,"reference":["20230101-090000F"]}],"name":"test-stanza"}]',
+            None,
+        )
+
+        # Test when the backup doesn't exist or has failed.
+        self.assertEqual(self.charm.backup._get_backup_chain("2023-01-01T08:00:00Z"), (None, []))
+        self.assertEqual(self.charm.backup._get_backup_chain("2023-01-01T09:00:00Z"), (None, []))
+
+        # Test a full backup.
+        self.assertEqual(
+            self.charm.backup._get_backup_chain("2023-01-01T10:00:00Z"), ("20230101-100000F", [])
+        )
+
+        # Test an incremental backup with all the referenced backups available.
+        self.assertEqual(
+            self.charm.backup._get_backup_chain("2023-01-01T11:00:00Z"),
+            ("20230101-100000F_20230101-110000I", []),
+        )
+
+        # Test an incremental backup that depends on a failed backup.
+        self.assertEqual(
+            self.charm.backup._get_backup_chain("2023-01-01T12:00:00Z"),
+            ("20230101-090000F_20230101-120000I", ["20230101-090000F"]),
+        )
+
+    def test_parse_backup_id(self):
+        self.assertEqual(
+            self.charm.backup._parse_backup_id("20230101-090000F"),
+            ("2023-01-01T09:00:00Z", "full"),
+        )
+        self.assertEqual(
+            self.charm.backup._parse_backup_id("20230101-090000F_20230102-090000D"),
+            ("2023-01-02T09:00:00Z", "differential"),
+        )
+        self.assertEqual(
+            self.charm.backup._parse_backup_id("20230101-090000F_20230103-090000I"),
+            ("2023-01-03T09:00:00Z", "incremental"),
+        )
+
     @patch("charm.Patroni.reload_patroni_configuration")
     @patch("charm.Patroni.member_started", new_callable=PropertyMock)
     @patch("backups.wait_fixed", return_value=wait_fixed(0))
@@ -1042,8 +1486,7 @@ class TestPostgreSQLBackups(unittest.TestCase):
 
     @patch("charm.PostgresqlOperatorCharm.update_config")
     @patch("charm.PostgreSQLBackups._change_connectivity_to_database")
-    @patch("charm.PostgreSQLBackups._list_backups")
-    @patch("charm.PostgreSQLBackups._execute_command")
+    @patch("charm.PostgreSQLBackups._start_backup_job")
     @patch("charm.PostgresqlOperatorCharm.is_primary", new_callable=PropertyMock)
     @patch("charm.PostgreSQLBackups._upload_content_to_s3")
     @patch("backups.datetime")
@@ -1058,13 +1501,21 @@ class TestPostgreSQLBackups(unittest.TestCase):
         _datetime,
         _upload_content_to_s3,
         _is_primary,
-        _execute_command,
-        _list_backups,
+        _start_backup_job,
         _change_connectivity_to_database,
         _update_config,
     ):
-        # Test when the unit cannot perform a backup.
+        # Test when the backup type is invalid.
         mock_event = MagicMock()
+        mock_event.params = {"type": "snapshot"}
+        self.charm.backup._on_create_backup_action(mock_event)
+        mock_event.fail.assert_called_once()
+        _can_unit_perform_backup.assert_not_called()
+        mock_event.set_results.assert_not_called()
+
+        # Test when the unit cannot perform a backup.
+        mock_event.reset_mock()
+        mock_event.params = {}
         _can_unit_perform_backup.return_value = (False, "fake validation message")
         self.charm.backup._on_create_backup_action(mock_event)
         mock_event.fail.assert_called_once()
@@ -1086,6 +1537,7 @@ class TestPostgreSQLBackups(unittest.TestCase):
             [],
         )
         _datetime.now.return_value.strftime.return_value = "2023-01-01T09:00:00Z"
+        _datetime.now.return_value.timestamp.return_value = 1672563600.0
         _from_environ.return_value = "test-juju-version"
         _upload_content_to_s3.return_value = False
         expected_metadata = f"""Date Backup Requested: 2023-01-01T09:00:00Z
@@ -1100,270 +1552,1750 @@ Juju Version: test-juju-version
             f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/latest",
             mock_s3_parameters,
         )
+        _start_backup_job.assert_not_called()
         mock_event.fail.assert_called_once()
         mock_event.set_results.assert_not_called()
 
-        # Test when the backup fails.
+        # Test when the backup job fails to start.
         mock_event.reset_mock()
         _upload_content_to_s3.return_value = True
         _is_primary.return_value = True
-        _execute_command.side_effect = ExecError(
-            command="fake command".split(), exit_code=1, stdout="", stderr="fake error"
+        _start_backup_job.side_effect = ChangeError(
+            err="fake error",
+            change=Change(
+                ChangeID("1"),
+                "fake kind",
+                "fake summary",
+                "fake status",
+                [],
+                True,
+                "fake error",
+                datetime.datetime.now(),
+                datetime.datetime.now(),
+            ),
         )
         self.charm.backup._on_create_backup_action(mock_event)
+        _start_backup_job.assert_called_once_with("full", "s3")
         update_config_calls = [
             call(is_creating_backup=True),
             call(is_creating_backup=False),
         ]
         _update_config.assert_has_calls(update_config_calls)
+        _change_connectivity_to_database.assert_not_called()
         mock_event.fail.assert_called_once()
         mock_event.set_results.assert_not_called()
+        self.assertNotIn("backup-job", self.charm.unit_peer_data)
 
-        # Test when the backup succeeds but the charm fails to upload the backup logs.
+        # Test when the backup job starts in the primary.
         mock_event.reset_mock()
-        _upload_content_to_s3.reset_mock()
-        _upload_content_to_s3.side_effect = [True, False]
-        _execute_command.side_effect = None
-        _execute_command.return_value = "fake stdout", "fake stderr"
-        _list_backups.return_value = {"2023-01-01T09:00:00Z": self.charm.backup.stanza_name}
+        _start_backup_job.reset_mock()
+        _start_backup_job.side_effect = None
         _update_config.reset_mock()
         self.charm.backup._on_create_backup_action(mock_event)
-        _upload_content_to_s3.assert_has_calls([
-            call(
-                expected_metadata,
-                f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/latest",
-                mock_s3_parameters,
-            ),
-            call(
-                "Stdout:\nfake stdout\n\nStderr:\nfake stderr\n",
-                f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/2023-01-01T09:00:00Z/backup.log",
-                mock_s3_parameters,
-            ),
-        ])
-        _update_config.assert_has_calls(update_config_calls)
-        mock_event.fail.assert_called_once()
-        mock_event.set_results.assert_not_called()
+        _start_backup_job.assert_called_once_with("full", "s3")
+        _update_config.assert_called_once_with(is_creating_backup=True)
+        _change_connectivity_to_database.assert_not_called()
+        mock_event.fail.assert_not_called()
+        mock_event.set_results.assert_called_once_with({
+            "backup-status": "backup started",
+            "job-id": "2023-01-01T09:00:00Z",
+        })
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["backup-job"]),
+            {
+                "id": "2023-01-01T09:00:00Z",
+                "type": "full",
+                "repository": "s3",
+                "started": 1672563600.0,
+                "changed-connectivity": False,
+            },
+        )
+        self.assertIsInstance(self.charm.unit.status, MaintenanceStatus)
 
-        # Test when the backup succeeds (including the upload of the backup logs).
+        # Test when a differential backup is requested in a replica (the connectivity
+        # to the database should be changed).
         mock_event.reset_mock()
-        _upload_content_to_s3.reset_mock()
-        _upload_content_to_s3.side_effect = None
-        _upload_content_to_s3.return_value = True
-        _update_config.reset_mock()
+        _start_backup_job.reset_mock()
+        mock_event.params = {"type": "differential"}
+        _is_primary.return_value = False
         self.charm.backup._on_create_backup_action(mock_event)
-        _upload_content_to_s3.assert_has_calls([
-            call(
-                expected_metadata,
-                f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/latest",
-                mock_s3_parameters,
-            ),
-            call(
-                "Stdout:\nfake stdout\n\nStderr:\nfake stderr\n",
-                f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/2023-01-01T09:00:00Z/backup.log",
-                mock_s3_parameters,
-            ),
-        ])
-        _change_connectivity_to_database.assert_not_called()
-        _update_config.assert_has_calls(update_config_calls)
+        _start_backup_job.assert_called_once_with("differential", "s3")
+        _change_connectivity_to_database.assert_called_once_with(connectivity=False)
         mock_event.fail.assert_not_called()
         mock_event.set_results.assert_called_once()
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["backup-job"])["changed-connectivity"], True
+        )
+
+        # Test when the repository is invalid or the local repository is not enabled.
+        for repository in ["nfs", "local"]:
+            mock_event.reset_mock()
+            _start_backup_job.reset_mock()
+            mock_event.params = {"repository": repository}
+            self.charm.backup._on_create_backup_action(mock_event)
+            mock_event.fail.assert_called_once()
+            _start_backup_job.assert_not_called()
 
-        # Test when this unit is a replica (the connectivity to the database should be changed).
+        # Test when a backup is requested in the local repository.
         mock_event.reset_mock()
+        _is_primary.return_value = True
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_local_repository": True})
+        with patch("charm.PostgreSQLBackups._ensure_local_stanza") as _ensure_local_stanza:
+            _ensure_local_stanza.return_value = False
+            self.charm.backup._on_create_backup_action(mock_event)
+            mock_event.fail.assert_called_once_with(
+                "Failed to initialise the stanza in the local repository"
+            )
+            _start_backup_job.assert_not_called()
+
+            mock_event.reset_mock()
+            _ensure_local_stanza.return_value = True
+            self.charm.backup._on_create_backup_action(mock_event)
+        _can_unit_perform_backup.assert_called_with("local")
+        _start_backup_job.assert_called_once_with("full", "local")
+        mock_event.fail.assert_not_called()
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["backup-job"])["repository"], "local"
+        )
+
+    @patch("ops.model.Container.restart")
+    @patch("ops.model.Container.add_layer")
+    @patch("charm.PostgresqlOperatorCharm.is_primary", new_callable=PropertyMock)
+    def test_start_backup_job(self, _is_primary, _add_layer, _restart):
+        # Test that the files from a previous job are removed and the job is started.
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        container.push("/var/log/pgbackrest/backup-job.rc", "0", make_dirs=True)
+        _is_primary.return_value = True
+        self.charm.backup._start_backup_job("incremental")
+        self.assertFalse(container.exists("/var/log/pgbackrest/backup-job.rc"))
+        layer = _add_layer.call_args[0][1].to_dict()
+        _add_layer.assert_called_once_with("pgbackrest backup", ANY, combine=True)
+        self.assertEqual(
+            layer["services"]["pgbackrest backup"]["command"],
+            f"/bin/bash -c 'pgbackrest --stanza={self.charm.backup.stanza_name} --log-level-console=debug --type=incr backup --no-backup-standby > /var/log/pgbackrest/backup-job.out 2> /var/log/pgbackrest/backup-job.err; echo $? > /var/log/pgbackrest/backup-job.rc'",
+        )
+        self.assertEqual(layer["services"]["pgbackrest backup"]["on-success"], "ignore")
+        self.assertEqual(layer["services"]["pgbackrest backup"]["on-failure"], "ignore")
+        _restart.assert_called_once_with("pgbackrest backup")
+
+        # Test a backup in the local repository.
+        self.charm.backup._start_backup_job("full", "local")
+        self.assertIn(
+            "--type=full backup --repo=2 --no-backup-standby",
+            _add_layer.call_args[0][1].to_dict()["services"]["pgbackrest backup"]["command"],
+        )
+
+    @patch("charm.PostgreSQLBackups._start_expire_job")
+    @patch("charm.PostgreSQLBackups._release_backup_resources")
+    @patch("charm.PostgreSQLBackups._list_backups")
+    @patch("charm.PostgreSQLBackups._upload_content_to_s3")
+    @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
+    @patch("charm.PostgreSQLBackups._is_backup_job_running")
+    def test_check_backup_job(
+        self,
+        _is_backup_job_running,
+        _retrieve_s3_parameters,
+        _upload_content_to_s3,
+        _list_backups,
+        _release_backup_resources,
+        _start_expire_job,
+    ):
+        # Test when there is no backup job.
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        self.charm.backup.check_backup_job()
+        _is_backup_job_running.assert_not_called()
+
+        # Test when the backup job is still running.
+        backup_job = {
+            "id": "2023-01-01T09:00:00Z",
+            "type": "full",
+            "started": 1672563600.0,
+            "changed-connectivity": True,
+        }
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"backup-job": json.dumps(backup_job)}
+            )
+        _is_backup_job_running.return_value = True
+        self.charm.backup.check_backup_job()
+        _upload_content_to_s3.assert_not_called()
+        _release_backup_resources.assert_not_called()
+
+        # Test when the backup job succeeded.
+        _is_backup_job_running.return_value = False
+        _retrieve_s3_parameters.return_value = ({"path": "test-path"}, [])
+        _upload_content_to_s3.return_value = True
+        _list_backups.return_value = {"2023-01-01T09:00:01Z": self.charm.backup.stanza_name}
+        container.push("/var/log/pgbackrest/backup-job.out", "fake stdout", make_dirs=True)
+        container.push("/var/log/pgbackrest/backup-job.err", "fake stderr")
+        container.push("/var/log/pgbackrest/backup-job.rc", "0\n")
+        self.charm.backup.check_backup_job()
+        _upload_content_to_s3.assert_called_once_with(
+            "Stdout:\nfake stdout\n\nStderr:\nfake stderr\n",
+            f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/2023-01-01T09:00:01Z/backup.log",
+            {"path": "test-path"},
+        )
+        _release_backup_resources.assert_called_once_with(True)
+        self.assertNotIn("backup-job", self.charm.unit_peer_data)
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["last-backup-job"]),
+            {
+                **backup_job,
+                "backup-id": "2023-01-01T09:00:01Z",
+                "status": "finished",
+                "finished": ANY,
+            },
+        )
+        _start_expire_job.assert_called_once()
+
+        # Test when the backup job failed after generating the backup label.
         _upload_content_to_s3.reset_mock()
+        _release_backup_resources.reset_mock()
+        _start_expire_job.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"backup-job": json.dumps(backup_job)}
+            )
+        container.push(
+            "/var/log/pgbackrest/backup-job.out",
+            "P00   INFO: new backup label = 20230101-090000F_20230101-090001I\nfake stdout",
+        )
+        container.push("/var/log/pgbackrest/backup-job.rc", "1\n")
+        self.charm.backup.check_backup_job()
+        self.assertEqual(
+            _upload_content_to_s3.call_args[0][1],
+            f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/20230101-090000F_20230101-090001I/backup.log",
+        )
+        _release_backup_resources.assert_called_once_with(True)
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["last-backup-job"])["status"],
+            "failed: pgBackRest exited with code 1",
+        )
+        _start_expire_job.assert_not_called()
+
+        # Test when the backup logs cannot be uploaded to S3.
+        _release_backup_resources.reset_mock()
+        _upload_content_to_s3.return_value = False
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"backup-job": json.dumps(backup_job)}
+            )
+        container.push("/var/log/pgbackrest/backup-job.rc", "0\n")
+        self.charm.backup.check_backup_job()
+        _release_backup_resources.assert_called_once_with(True)
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["last-backup-job"])["status"],
+            "failed: error uploading logs to S3",
+        )
+
+    @patch("ops.model.Container.restart")
+    @patch("charm.PostgreSQLBackups._get_repository_size", return_value=1000)
+    def test_start_expire_job(self, _get_repository_size, _restart):
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+
+        # Test when the job cannot be started.
+        _restart.side_effect = ChangeError(err="fake error", change=MagicMock())
+        self.charm.backup._start_expire_job()
+        self.assertNotIn("expire-job", self.charm.unit_peer_data)
+
+        # Test when the job is started (removing the files from a previous run).
+        _restart.side_effect = None
+        container.push("/var/log/pgbackrest/expire-job.rc", "0\n", make_dirs=True)
+        self.charm.backup._start_expire_job()
+        self.assertFalse(container.exists("/var/log/pgbackrest/expire-job.rc"))
+        layer = container.get_plan().to_dict()
+        self.assertEqual(
+            layer["services"]["pgbackrest expire"]["command"],
+            f"/bin/bash -c 'pgbackrest --stanza={self.charm.backup.stanza_name} --log-level-console=info expire > /var/log/pgbackrest/expire-job.out 2> /var/log/pgbackrest/expire-job.err; echo $? > /var/log/pgbackrest/expire-job.rc'",
+        )
+        _restart.assert_called_with("pgbackrest expire")
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["expire-job"])["repository-size"], 1000
+        )
+
+    @patch("charm.PostgreSQLBackups.invalidate_repository_info_cache")
+    @patch("charm.PostgreSQLBackups._get_repository_size", return_value=400)
+    @patch("charm.PostgreSQLBackups._is_job_running")
+    def test_check_expire_job(
+        self, _is_job_running, _get_repository_size, _invalidate_repository_info_cache
+    ):
+        # Test when there is no expire job.
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        self.charm.backup.check_expire_job()
+        _is_job_running.assert_not_called()
+
+        # Test when the expire job is still running.
+        expire_job = {"started": 1672563600.0, "repository-size": 1000}
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"expire-job": json.dumps(expire_job)}
+            )
+        _is_job_running.return_value = True
+        self.charm.backup.check_expire_job()
+        _invalidate_repository_info_cache.assert_not_called()
+        self.assertIn("expire-job", self.charm.unit_peer_data)
+
+        # Test when the expire job finished.
+        _is_job_running.return_value = False
+        container.push(
+            "/var/log/pgbackrest/expire-job.out",
+            "P00   INFO: repo1: expire full backup set 20230101-090000F, 20230101-090000F_20230102-090000I\n"
+            "P00   INFO: repo1: expire diff backup 20230101-090000F_20230103-090000D\n",
+            make_dirs=True,
+        )
+        container.push("/var/log/pgbackrest/expire-job.rc", "0\n")
+        self.charm.backup.check_expire_job()
+        _invalidate_repository_info_cache.assert_called_once()
+        self.assertNotIn("expire-job", self.charm.unit_peer_data)
+        last_expire_job = json.loads(self.charm.unit_peer_data["last-expire-job"])
+        self.assertEqual(last_expire_job["status"], "finished")
+        self.assertEqual(last_expire_job["expired-backups"], 3)
+        self.assertEqual(last_expire_job["reclaimed-backup-bytes"], 600)
+
+    @patch("ops.model.Container.pebble")
+    def test_is_backup_job_running(self, _pebble):
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+
+        # Test when the job service is running.
+        _pebble.get_services.return_value = [MagicMock(current=ServiceStatus.ACTIVE)]
+        self.assertTrue(self.charm.backup._is_backup_job_running())
+
+        # Test when the job service stopped without storing the exit code
+        # (e.g. the container was restarted).
+        _pebble.get_services.return_value = [MagicMock(current=ServiceStatus.INACTIVE)]
+        self.assertFalse(self.charm.backup._is_backup_job_running())
+
+        # Test when pgBackRest has already exited.
+        _pebble.get_services.return_value = [MagicMock(current=ServiceStatus.ACTIVE)]
+        container.push("/var/log/pgbackrest/backup-job.rc", "0\n", make_dirs=True)
+        self.assertFalse(self.charm.backup._is_backup_job_running())
+
+    @patch("charm.PostgreSQLBackups._create_backup")
+    @patch("charm.PostgreSQLBackups._coordinate_scheduled_backups")
+    def test_run_backup_schedule(self, _coordinate_scheduled_backups, _create_backup):
+        # Test when the S3 relation is not established.
+        self.charm.backup.run_backup_schedule()
+        _coordinate_scheduled_backups.assert_not_called()
+        _create_backup.assert_not_called()
+
+        # Test when no backup is assigned to the unit (and the unit is not the leader).
+        self.relate_to_s3_integrator()
+        self.charm.backup.run_backup_schedule()
+        _coordinate_scheduled_backups.assert_not_called()
+        _create_backup.assert_not_called()
+
+        # Test when the leader coordinates the scheduled backups.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"stanza": "test-stanza"}
+            )
+        self.charm.backup.run_backup_schedule()
+        _coordinate_scheduled_backups.assert_called_once()
+        _create_backup.assert_not_called()
+
+        # Test when a backup is assigned to another unit.
+        scheduled_backup = {
+            "id": "2023-01-01T09:00:00Z",
+            "type": "differential",
+            "unit": "postgresql-k8s/1",
+            "assigned": 1672563600.0,
+        }
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"scheduled-backup": json.dumps(scheduled_backup)},
+            )
+        self.charm.backup.run_backup_schedule()
+        _create_backup.assert_not_called()
+
+        # Test when a backup is assigned to this unit.
+        scheduled_backup["unit"] = self.charm.unit.name
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"scheduled-backup": json.dumps(scheduled_backup)},
+            )
+        _create_backup.return_value = None
+        self.charm.backup.run_backup_schedule()
+        _create_backup.assert_called_once_with("differential", "2023-01-01T09:00:00Z", "s3")
+        self.assertEqual(self.charm.unit_peer_data["scheduled-backup-id"], "2023-01-01T09:00:00Z")
+
+        # Test that the backup is not started twice.
+        _create_backup.reset_mock()
+        self.charm.backup.run_backup_schedule()
+        _create_backup.assert_not_called()
+
+        # Test when a local backup is assigned to this unit (a full backup is created
+        # in the local repository).
+        scheduled_backup.update({"id": "2023-01-01T10:00:00Z", "type": "local"})
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_local_repository": True})
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"scheduled-backup": json.dumps(scheduled_backup)},
+            )
+        self.charm.backup.run_backup_schedule()
+        _create_backup.assert_called_once_with("full", "2023-01-01T10:00:00Z", "local")
+
+    @patch("charm.PostgreSQLBackups._ensure_local_stanza")
+    @patch("charm.PostgresqlOperatorCharm.is_primary", new_callable=PropertyMock)
+    def test_maintain_local_repository(self, _is_primary, _ensure_local_stanza):
+        # Test when the primary cannot be retrieved or the unit is a replica.
+        _is_primary.side_effect = RetryError(last_attempt=1)
+        self.charm.backup._maintain_local_repository()
+        _is_primary.side_effect = None
         _is_primary.return_value = False
-        self.charm.backup._on_create_backup_action(mock_event)
-        _upload_content_to_s3.assert_has_calls([
-            call(
-                expected_metadata,
-                f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/latest",
-                mock_s3_parameters,
-            ),
-            call(
-                "Stdout:\nfake stdout\n\nStderr:\nfake stderr\n",
-                f"test-path/backup/{self.charm.model.name}.{self.charm.cluster_name}/2023-01-01T09:00:00Z/backup.log",
-                mock_s3_parameters,
-            ),
+        self.charm.backup._maintain_local_repository()
+        _ensure_local_stanza.assert_not_called()
+
+        # Test when the unit is the primary.
+        _is_primary.return_value = True
+        self.charm.backup._maintain_local_repository()
+        _ensure_local_stanza.assert_called_once()
+
+    @patch("charm.PostgreSQLBackups._execute_command")
+    def test_ensure_local_stanza(self, _execute_command):
+        # Test when the stanza was not initialised yet.
+        self.assertFalse(self.charm.backup._ensure_local_stanza())
+        _execute_command.assert_not_called()
+
+        # Test when the stanza creation fails.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"stanza": "test-stanza"}
+            )
+        _execute_command.side_effect = ExecError(
+            command=["pgbackrest"], exit_code=1, stdout="", stderr="fake error"
+        )
+        self.assertFalse(self.charm.backup._ensure_local_stanza())
+        _execute_command.assert_called_once_with([
+            "pgbackrest",
+            "--stanza=test-stanza",
+            "--repo=2",
+            "stanza-create",
         ])
-        self.assertEqual(_change_connectivity_to_database.call_count, 2)
-        mock_event.fail.assert_not_called()
-        mock_event.set_results.assert_called_once_with({"backup-status": "backup created"})
+        self.assertNotIn("local-stanza", self.charm.unit_peer_data)
 
-    @patch("charm.PostgreSQLBackups._generate_backup_list_output")
-    @patch("charm.PostgreSQLBackups._are_backup_settings_ok")
-    def test_on_list_backups_action(self, _are_backup_settings_ok, _generate_backup_list_output):
-        # Test when not all backup settings are ok.
+        # Test when the stanza is created (and it's not created again).
+        _execute_command.side_effect = None
+        _execute_command.return_value = ("", "")
+        self.assertTrue(self.charm.backup._ensure_local_stanza())
+        self.assertEqual(self.charm.unit_peer_data["local-stanza"], "test-stanza")
+        _execute_command.reset_mock()
+        self.assertTrue(self.charm.backup._ensure_local_stanza())
+        _execute_command.assert_not_called()
+
+    @patch("charm.PostgreSQLBackups._get_repository_info")
+    def test_get_backup_repository_key(self, _get_repository_info):
+        _get_repository_info.return_value = [
+            {
+                "backup": [
+                    {"label": "20230101-090000F"},
+                    {"label": "20230101-100000F", "database": {"repo-key": 2}},
+                ]
+            }
+        ]
+        self.assertEqual(self.charm.backup._get_backup_repository_key("20230101-090000F"), "1")
+        self.assertEqual(self.charm.backup._get_backup_repository_key("20230101-100000F"), "2")
+        self.assertIsNone(self.charm.backup._get_backup_repository_key("20230101-110000F"))
+
+        # Test when the repository info couldn't be retrieved.
+        _get_repository_info.return_value = None
+        self.assertIsNone(self.charm.backup._get_backup_repository_key("20230101-090000F"))
+
+    @patch("charm.PostgreSQLBackups._pick_scheduled_backup_unit")
+    @patch("charm.PostgreSQLBackups._finish_scheduled_backup")
+    @patch("charm.PostgreSQLBackups._update_backup_schedule")
+    def test_coordinate_scheduled_backups(
+        self, _update_backup_schedule, _finish_scheduled_backup, _pick_scheduled_backup_unit
+    ):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+
+        # Test when no backup is due.
+        _update_backup_schedule.return_value = []
+        self.charm.backup._coordinate_scheduled_backups()
+        _finish_scheduled_backup.assert_not_called()
+        _pick_scheduled_backup_unit.assert_not_called()
+        self.assertNotIn("scheduled-backup", self.charm.app_peer_data)
+
+        # Test when backups are due (only the most complete one is created).
+        def update_backup_schedule(schedule, _):
+            schedule.update({"full": {}, "incremental": {}})
+            return ["full", "incremental"]
+
+        _update_backup_schedule.side_effect = update_backup_schedule
+        _pick_scheduled_backup_unit.return_value = "postgresql-k8s/1"
+        self.charm.backup._coordinate_scheduled_backups()
+        scheduled_backup = json.loads(self.charm.app_peer_data["scheduled-backup"])
+        self.assertEqual(scheduled_backup["type"], "full")
+        self.assertEqual(scheduled_backup["unit"], "postgresql-k8s/1")
+        schedule = json.loads(self.charm.app_peer_data["backup-schedule"])
+        self.assertEqual(schedule["full"]["last-run"], scheduled_backup["id"])
+
+        # Test when the previous scheduled backup is still running (the runs are skipped).
+        _finish_scheduled_backup.return_value = False
+        _pick_scheduled_backup_unit.reset_mock()
+        self.charm.backup._coordinate_scheduled_backups()
+        _finish_scheduled_backup.assert_called_once()
+        _pick_scheduled_backup_unit.assert_not_called()
+        schedule = json.loads(self.charm.app_peer_data["backup-schedule"])
+        self.assertEqual(schedule["full"]["skipped-runs"], 1)
+        self.assertEqual(schedule["incremental"]["skipped-runs"], 1)
+        self.assertEqual(
+            json.loads(self.charm.app_peer_data["scheduled-backup"]), scheduled_backup
+        )
+
+        # Test when the previous scheduled backup finished.
+        _finish_scheduled_backup.return_value = True
+        _update_backup_schedule.side_effect = None
+        _update_backup_schedule.return_value = []
+        self.charm.backup._coordinate_scheduled_backups()
+        self.assertNotIn("scheduled-backup", self.charm.app_peer_data)
+
+    @patch("backups.datetime")
+    def test_update_backup_schedule(self, _datetime):
+        now = datetime.datetime(2024, 1, 1, 1, 0, tzinfo=datetime.timezone.utc)
+        _datetime.now.return_value = now
+
+        # Test when no backup is scheduled.
+        schedule = {"full": {"expression": "0 2 * * 0"}}
+        self.assertEqual(self.charm.backup._update_backup_schedule(schedule, now), [])
+        self.assertEqual(schedule, {})
+
+        # Test when the schedule is set (the next run is computed).
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "backup_schedule_full": "0 2 * * 0",
+                "backup_schedule_incremental": "0 * * * *",
+            })
+        self.assertEqual(self.charm.backup._update_backup_schedule(schedule, now), [])
+        self.assertEqual(
+            schedule["full"],
+            {
+                "expression": "0 2 * * 0",
+                "next-run": datetime.datetime(
+                    2024, 1, 7, 2, tzinfo=datetime.timezone.utc
+                ).timestamp(),
+            },
+        )
+        self.assertEqual(
+            schedule["incremental"]["next-run"],
+            datetime.datetime(2024, 1, 1, 2, tzinfo=datetime.timezone.utc).timestamp(),
+        )
+
+        # Test when one of the backups is due.
+        now = datetime.datetime(2024, 1, 1, 2, 0, 30, tzinfo=datetime.timezone.utc)
+        self.assertEqual(self.charm.backup._update_backup_schedule(schedule, now), ["incremental"])
+        self.assertEqual(
+            schedule["incremental"]["next-run"],
+            datetime.datetime(2024, 1, 1, 3, tzinfo=datetime.timezone.utc).timestamp(),
+        )
+
+        # Test that the local backups are scheduled only when the local repository is enabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_schedule_local": "*/15 * * * *"})
+        self.charm.backup._update_backup_schedule(schedule, now)
+        self.assertNotIn("local", schedule)
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_local_repository": True})
+        self.charm.backup._update_backup_schedule(schedule, now)
+        self.assertEqual(
+            schedule["local"]["next-run"],
+            datetime.datetime(2024, 1, 1, 2, 15, tzinfo=datetime.timezone.utc).timestamp(),
+        )
+
+    def test_finish_scheduled_backup(self):
+        scheduled_backup = {
+            "id": "2023-01-01T09:00:00Z",
+            "type": "full",
+            "unit": self.charm.unit.name,
+            "assigned": datetime.datetime.now().timestamp(),
+        }
+        schedule = {"full": {}}
+
+        # Test when the unit didn't start the backup yet.
+        self.assertFalse(self.charm.backup._finish_scheduled_backup(scheduled_backup, schedule))
+
+        # Test when the backup is still running.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"scheduled-backup-id": "2023-01-01T09:00:00Z", "backup-job": "{}"},
+            )
+        self.assertFalse(self.charm.backup._finish_scheduled_backup(scheduled_backup, schedule))
+
+        # Test when the backup finished.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {
+                    "backup-job": "",
+                    "last-backup-job": json.dumps({
+                        "id": "2023-01-01T09:00:00Z",
+                        "status": "finished",
+                        "started": 1672563600.0,
+                        "finished": 1672563660.5,
+                    }),
+                },
+            )
+        self.assertTrue(self.charm.backup._finish_scheduled_backup(scheduled_backup, schedule))
+        self.assertEqual(
+            schedule["full"],
+            {
+                "last-duration": "60s",
+                "last-status": "finished",
+                "last-unit": self.charm.unit.name,
+            },
+        )
+
+        # Test when the backup job could not be started.
+        scheduled_backup["id"] = "2023-01-02T09:00:00Z"
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"scheduled-backup-id": "2023-01-02T09:00:00Z"},
+            )
+        self.assertTrue(self.charm.backup._finish_scheduled_backup(scheduled_backup, schedule))
+        self.assertEqual(
+            schedule["full"]["last-status"], "failed: the backup job could not be started"
+        )
+
+        # Test when the unit didn't start the backup in time.
+        scheduled_backup.update({"id": "2023-01-03T09:00:00Z", "assigned": 1672563600.0})
+        self.assertTrue(self.charm.backup._finish_scheduled_backup(scheduled_backup, schedule))
+        self.assertEqual(
+            schedule["full"]["last-status"], "failed: the backup was not started in time"
+        )
+
+    @patch("ops.model.Application.planned_units", return_value=3)
+    @patch("charm.Patroni.get_replicas_lag")
+    @patch("charm.Patroni.get_primary")
+    def test_pick_scheduled_backup_unit(self, _get_primary, _get_replicas_lag, _planned_units):
+        with self.harness.hooks_disabled():
+            for unit_id in [1, 2]:
+                self.harness.add_relation_unit(self.peer_rel_id, f"postgresql-k8s/{unit_id}")
+        _get_primary.return_value = "postgresql-k8s/0"
+        _get_replicas_lag.return_value = {"postgresql-k8s/1": 1024, "postgresql-k8s/2": 0}
+
+        # Test when TLS is not enabled (backups can be created only on the primary).
+        self.assertEqual(self.charm.backup._pick_scheduled_backup_unit(), "postgresql-k8s/0")
+
+        # Test when TLS is enabled (the replica with the lowest lag is picked).
+        with self.harness.hooks_disabled():
+            for unit_id in [0, 1, 2]:
+                self.harness.update_relation_data(
+                    self.peer_rel_id, f"postgresql-k8s/{unit_id}", {"tls": "enabled"}
+                )
+        self.assertEqual(self.charm.backup._pick_scheduled_backup_unit(), "postgresql-k8s/2")
+
+        # Test when there are no running replicas.
+        _get_replicas_lag.return_value = {}
+        self.assertIsNone(self.charm.backup._pick_scheduled_backup_unit())
+
+        # Test that local backups are created on the primary.
+        self.assertEqual(
+            self.charm.backup._pick_scheduled_backup_unit("local"), "postgresql-k8s/0"
+        )
+
+        # Test when the cluster members cannot be retrieved.
+        _get_primary.side_effect = RetryError(last_attempt=1)
+        self.assertIsNone(self.charm.backup._pick_scheduled_backup_unit())
+
+    def test_on_get_backup_schedule_action(self):
+        # Test when no backups are scheduled.
         mock_event = MagicMock()
-        _are_backup_settings_ok.return_value = (False, "fake validation message")
-        self.charm.backup._on_list_backups_action(mock_event)
+        self.charm.backup._on_get_backup_schedule_action(mock_event)
         mock_event.fail.assert_called_once()
-        _generate_backup_list_output.assert_not_called()
         mock_event.set_results.assert_not_called()
 
-        # Test when the charm fails to generate the backup list output.
+        # Test when backups are scheduled.
         mock_event.reset_mock()
-        _are_backup_settings_ok.return_value = (True, None)
-        _generate_backup_list_output.side_effect = ExecError(
-            command="fake command".split(), exit_code=1, stdout="", stderr="fake error"
-        )
-        self.charm.backup._on_list_backups_action(mock_event)
-        _generate_backup_list_output.assert_called_once()
+        next_run = datetime.datetime(2024, 1, 7, 2, tzinfo=datetime.timezone.utc)
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {
+                    "backup-schedule": json.dumps({
+                        "full": {
+                            "expression": "0 2 * * 0",
+                            "next-run": next_run.timestamp(),
+                            "last-run": "2023-12-31T02:00:00Z",
+                            "last-duration": "60s",
+                            "skipped-runs": 1,
+                        }
+                    })
+                },
+            )
+        self.charm.backup._on_get_backup_schedule_action(mock_event)
+        mock_event.fail.assert_not_called()
+        mock_event.set_results.assert_called_once_with({
+            "full": {
+                "schedule": "0 2 * * 0",
+                "next-run": "2024-01-07T02:00:00Z",
+                "last-run": "2023-12-31T02:00:00Z",
+                "last-duration": "60s",
+                "skipped-runs": "1",
+            }
+        })
+
+    @patch("charm.PostgresqlOperatorCharm.update_config")
+    @patch("charm.PostgreSQLBackups._change_connectivity_to_database")
+    def test_release_backup_resources(self, _change_connectivity_to_database, _update_config):
+        # Test when the connectivity to the database wasn't changed.
+        self.charm.unit.status = MaintenanceStatus("creating backup")
+        self.charm.backup._release_backup_resources(False)
+        _change_connectivity_to_database.assert_not_called()
+        _update_config.assert_called_once_with(is_creating_backup=False)
+        self.assertIsInstance(self.charm.unit.status, ActiveStatus)
+
+        # Test when the connectivity to the database was changed.
+        self.charm.backup._release_backup_resources(True)
+        _change_connectivity_to_database.assert_called_once_with(connectivity=True)
+
+    @patch("backups.datetime")
+    @patch("charm.PostgreSQLBackups.check_backup_job")
+    def test_on_get_backup_status_action(self, _check_backup_job, _datetime):
+        # Test when no backup was created in the unit.
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        mock_event = MagicMock()
+        self.charm.backup._on_get_backup_status_action(mock_event)
         mock_event.fail.assert_called_once()
         mock_event.set_results.assert_not_called()
 
-        # Test when the charm succeeds on generating the backup list output.
-        mock_event.reset_mock()
-        _generate_backup_list_output.reset_mock()
-        _are_backup_settings_ok.return_value = (True, None)
-        _generate_backup_list_output.side_effect = None
-        _generate_backup_list_output.return_value = """backup-id             | backup-type  | backup-status
-----------------------------------------------------
-2023-01-01T09:00:00Z  | physical     | failed: fake error
-2023-01-01T10:00:00Z  | physical     | finished"""
-        self.charm.backup._on_list_backups_action(mock_event)
-        _generate_backup_list_output.assert_called_once()
-        mock_event.set_results.assert_called_once_with({
-            "backups": """backup-id             | backup-type  | backup-status
-----------------------------------------------------
-2023-01-01T09:00:00Z  | physical     | failed: fake error
-2023-01-01T10:00:00Z  | physical     | finished"""
-        })
-        mock_event.fail.assert_not_called()
+        # Test when the backup job is running.
+        mock_event.reset_mock()
+        _datetime.now.return_value.timestamp.return_value = 1672563700.0
+        container.push(
+            "/var/log/pgbackrest/backup-job.out",
+            """P00   INFO: execute non-exclusive backup start
+P01 DETAIL: backup file /var/lib/postgresql/data/pgdata/base/1/1249 (100MB, 20.00%) checksum 1
+P02 DETAIL: backup file /var/lib/postgresql/data/pgdata/base/1/1259 (100MB, 40.00%) checksum 2""",
+            make_dirs=True,
+        )
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {
+                    "backup-job": json.dumps({
+                        "id": "2023-01-01T09:00:00Z",
+                        "type": "full",
+                        "started": 1672563600.0,
+                        "changed-connectivity": False,
+                    })
+                },
+            )
+        self.charm.backup._on_get_backup_status_action(mock_event)
+        mock_event.set_results.assert_called_once_with({
+            "job-id": "2023-01-01T09:00:00Z",
+            "backup-type": "full",
+            "phase": "copying files",
+            "bytes-transferred": "209715200",
+            "progress": "40.00%",
+            "rate": "2.10MB/s",
+            "elapsed-time": "100s",
+            "eta": "150s",
+        })
+        mock_event.fail.assert_not_called()
+
+        # Test when pgBackRest has exited, but the job wasn't finished by the charm yet.
+        mock_event.reset_mock()
+        container.push("/var/log/pgbackrest/backup-job.rc", "0")
+        self.charm.backup._on_get_backup_status_action(mock_event)
+        self.assertEqual(mock_event.set_results.call_args.args[0]["phase"], "finishing")
+        self.assertIn("backup-job", self.charm.unit_peer_data)
+
+        # Test when the backup job has already finished.
+        mock_event.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {
+                    "backup-job": "",
+                    "last-backup-job": json.dumps({
+                        "id": "2023-01-01T09:00:00Z",
+                        "type": "full",
+                        "started": 1672563600.0,
+                        "changed-connectivity": False,
+                        "backup-id": "2023-01-01T09:00:01Z",
+                        "status": "finished",
+                    }),
+                },
+            )
+        self.charm.backup._on_get_backup_status_action(mock_event)
+        mock_event.set_results.assert_called_once_with({
+            "job-id": "2023-01-01T09:00:00Z",
+            "backup-type": "full",
+            "phase": "finished",
+            "backup-id": "2023-01-01T09:00:01Z",
+            "backup-status": "finished",
+        })
+        mock_event.fail.assert_not_called()
+
+        # Test that the action never finishes the backup job itself.
+        _check_backup_job.assert_not_called()
+
+    def test_parse_backup_progress(self):
+        # Test when pgBackRest hasn't copied any file yet.
+        self.assertEqual(
+            self.charm.backup._parse_backup_progress(
+                "P00   INFO: execute non-exclusive backup start"
+            ),
+            ("starting", 0, 0.0),
+        )
+
+        # Test when some files were copied or matched (including bundled files).
+        output = """P00   INFO: execute non-exclusive backup start
+P01 DETAIL: backup file /var/lib/postgresql/data/pgdata/base/1/1249 (1.5MB, 10.00%) checksum 1
+P02 DETAIL: match file from prior backup /var/lib/postgresql/data/pgdata/base/1/1255 (512KB, 15.00%) checksum 2
+P01 DETAIL: backup file /var/lib/postgresql/data/pgdata/base/1/1259 (bundle 1/0, 8KB, 15.05%) checksum 3"""
+        self.assertEqual(
+            self.charm.backup._parse_backup_progress(output),
+            ("copying files", 1572864 + 524288 + 8192, 15.05),
+        )
+
+        # Test when pgBackRest is waiting for the WAL to be archived.
+        output += "\nP00   INFO: backup stop archive = 000000010000000000000005, lsn = 0/5000100"
+        self.assertEqual(self.charm.backup._parse_backup_progress(output)[0], "archiving WAL")
+
+        # Test when the backup label was already generated.
+        output += "\nP00   INFO: new backup label = 20230101-090000F"
+        self.assertEqual(self.charm.backup._parse_backup_progress(output)[0], "finishing")
+
+    @patch("charm.PostgreSQLBackups.get_restore_status")
+    def test_on_get_restore_status_action(self, _get_restore_status):
+        # Test when the workload container isn't accessible yet.
+        mock_event = MagicMock()
+        self.charm.backup._on_get_restore_status_action(mock_event)
+        mock_event.fail.assert_called_once()
+        _get_restore_status.assert_not_called()
+
+        # Test when no backup is being restored in the unit.
+        mock_event.reset_mock()
+        self.harness.set_can_connect("postgresql", True)
+        _get_restore_status.return_value = None
+        self.charm.backup._on_get_restore_status_action(mock_event)
+        mock_event.fail.assert_called_once()
+        mock_event.set_results.assert_not_called()
+
+        # Test when a backup is being restored.
+        mock_event.reset_mock()
+        _get_restore_status.return_value = {"phase": "restoring files", "progress": "40.00%"}
+        self.charm.backup._on_get_restore_status_action(mock_event)
+        mock_event.set_results.assert_called_once_with({
+            "phase": "restoring files",
+            "progress": "40.00%",
+        })
+        mock_event.fail.assert_not_called()
+
+    @patch("charm.Patroni.member_replication_lag", new_callable=PropertyMock)
+    @patch("charm.PostgreSQLBackups._get_wal_replay_status")
+    @patch("backups.datetime")
+    def test_get_restore_status(self, _datetime, _get_wal_replay_status, _member_replication_lag):
+        _datetime.now.return_value = datetime.datetime(2023, 1, 1, 10, 1, 40)
+        _datetime.strptime.side_effect = datetime.datetime.strptime
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+
+        # Test when no backup is being restored.
+        self.assertIsNone(self.charm.backup.get_restore_status())
+
+        # Test when the leader waits for the other units to take part in the restore.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps({"id": "1", "label": "20230101-090000F"})},
+            )
+        self.assertEqual(
+            self.charm.backup.get_restore_status(), {"phase": "waiting for the other units"}
+        )
+
+        # Test when Patroni is restoring the backup.
+        log_file = f"/var/log/pgbackrest/{self.charm.backup.stanza_name}-restore.log"
+        log = """2023-01-01 09:50:00.000 P00   INFO: restore command end: completed successfully
+-------------------PROCESS START-------------------
+2023-01-01 10:00:00.000 P00   INFO: restore command begin 2.50
+2023-01-01 10:00:10.000 P01 DETAIL: restore file /var/lib/postgresql/data/pgdata/base/1/1249 (100MB, 20.00%) checksum 1
+2023-01-01 10:00:20.000 P02 DETAIL: restore file /var/lib/postgresql/data/pgdata/base/1/1259 (100MB, 40.00%) checksum 2"""
+        container.push(log_file, log, make_dirs=True)
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {
+                    "restoring-backup": "20230101-090000F",
+                    "restore-stanza": self.charm.backup.stanza_name,
+                },
+            )
+        self.assertEqual(
+            self.charm.backup.get_restore_status(),
+            {
+                "phase": "restoring files",
+                "bytes-restored": "209715200",
+                "progress": "40.00%",
+                "rate": "2.10MB/s",
+                "elapsed-time": "100s",
+                "eta": "150s",
+            },
+        )
+        _get_wal_replay_status.assert_not_called()
+
+        # Test when the files were restored and PostgreSQL is replaying the WAL.
+        _get_wal_replay_status.return_value = {"replayed-lsn": "0/5000100", "replay-lag": "30s"}
+        container.push(
+            log_file,
+            log
+            + "\n2023-01-01 10:00:50.000 P00   INFO: restore command end: completed successfully",
+        )
+        self.assertEqual(
+            self.charm.backup.get_restore_status(),
+            {
+                "phase": "replaying WAL",
+                "bytes-restored": "209715200",
+                "progress": "40.00%",
+                "rate": "4.19MB/s",
+                "elapsed-time": "50s",
+                "replayed-lsn": "0/5000100",
+                "replay-lag": "30s",
+            },
+        )
+
+        # Test when this replica is restoring the backup as a standby.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"cluster-restore": json.dumps({"id": "1", "phase": "ready"})},
+            )
+        self.assertEqual(
+            self.charm.backup.get_restore_status(), {"phase": "waiting for the leader"}
+        )
+
+        container.push(
+            "/var/log/pgbackrest/restore-job.out",
+            "P01 DETAIL: restore file /var/lib/postgresql/data/pgdata/base/1/1249 (8KB, 1.00%)",
+            make_dirs=True,
+        )
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"cluster-restore": json.dumps({"id": "1", "phase": "restoring"})},
+            )
+        self.assertEqual(
+            self.charm.backup.get_restore_status(),
+            {"phase": "restoring files", "bytes-restored": "8192", "progress": "1.00%"},
+        )
+
+        _member_replication_lag.return_value = "1024"
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"cluster-restore": json.dumps({"id": "1", "phase": "catching-up"})},
+            )
+        self.assertEqual(
+            self.charm.backup.get_restore_status(),
+            {"phase": "catching up", "replication-lag": "1024"},
+        )
+
+    @patch("charm.PostgreSQLBackups.get_restore_status")
+    def test_get_restore_status_message(self, _get_restore_status):
+        for status, message in [
+            (None, "restoring backup"),
+            ({"phase": "starting"}, "restoring backup"),
+            ({"phase": "restoring files", "progress": "40.00%"}, "restoring backup: 40.00%"),
+            (
+                {"phase": "restoring files", "progress": "40.00%", "rate": "2.10MB/s"},
+                "restoring backup: 40.00% at 2.10MB/s",
+            ),
+            ({"phase": "replaying WAL"}, "restoring backup: replaying WAL"),
+            (
+                {"phase": "replaying WAL", "replay-lag": "30s"},
+                "restoring backup: replaying WAL (lag 30s)",
+            ),
+        ]:
+            _get_restore_status.return_value = status
+            self.assertEqual(self.charm.backup.get_restore_status_message(), message)
+
+    def test_parse_restore_progress(self):
+        # Test when pgBackRest hasn't restored any file yet.
+        self.assertEqual(
+            self.charm.backup._parse_restore_progress("P00   INFO: restore command begin 2.50"),
+            ("starting", 0, 0.0, None, None),
+        )
+
+        # Test when some files were restored (including bundled and zeroed files).
+        output = """2023-01-01 10:00:00.000 P00   INFO: restore command begin 2.50
+2023-01-01 10:00:01.000 P01 DETAIL: restore file /var/lib/postgresql/data/pgdata/base/1/1249 (1.5MB, 10.00%) checksum 1
+2023-01-01 10:00:02.000 P02 DETAIL: restore file /var/lib/postgresql/data/pgdata/base/1/1255 (bundle 1/0, 512KB, 15.00%) checksum 2
+2023-01-01 10:00:03.000 P01 DETAIL: restore zeroed file /var/lib/postgresql/data/pgdata/base/5/1259 (8KB, 15.05%)"""
+        started = datetime.datetime(2023, 1, 1, 10, 0, 0)
+        self.assertEqual(
+            self.charm.backup._parse_restore_progress(output),
+            ("restoring files", 1572864 + 524288 + 8192, 15.05, started, None),
+        )
+
+        # Test when pgControl is being restored.
+        output += "\n2023-01-01 10:00:04.000 P00   INFO: restore global/pg_control"
+        self.assertEqual(self.charm.backup._parse_restore_progress(output)[0], "finishing")
+
+        # Test when the restore finished.
+        finished_output = (
+            output
+            + "\n2023-01-01 10:00:05.000 P00   INFO: restore command end: completed successfully"
+        )
+        self.assertEqual(
+            self.charm.backup._parse_restore_progress(finished_output)[::4],
+            ("restored", datetime.datetime(2023, 1, 1, 10, 0, 5)),
+        )
+
+        # Test when the restore failed.
+        self.assertEqual(
+            self.charm.backup._parse_restore_progress(
+                output + "\n2023-01-01 10:00:05.000 P00   INFO: restore command end: aborted"
+            )[0],
+            "failed",
+        )
+
+        # Test that only the last restore in the log file is considered.
+        self.assertEqual(
+            self.charm.backup._parse_restore_progress(
+                finished_output
+                + "\n-------------------PROCESS START-------------------\n"
+                + "2023-01-01 11:00:00.000 P00   INFO: restore command begin 2.50"
+            ),
+            ("starting", 0, 0.0, datetime.datetime(2023, 1, 1, 11, 0, 0), None),
+        )
+
+    @patch("charm.Patroni.member_wal_replay_status", new_callable=PropertyMock)
+    @patch("backups.datetime")
+    def test_get_wal_replay_status(self, _datetime, _member_wal_replay_status):
+        _datetime.now.return_value = datetime.datetime(
+            2023, 1, 1, 10, 0, 30, tzinfo=datetime.timezone.utc
+        )
+        _datetime.fromisoformat.side_effect = datetime.datetime.fromisoformat
+
+        # Test when PostgreSQL isn't replaying WAL yet.
+        _member_wal_replay_status.return_value = {}
+        self.assertEqual(self.charm.backup._get_wal_replay_status(), {})
+
+        # Test when PostgreSQL is replaying WAL.
+        _member_wal_replay_status.return_value = {
+            "received_location": 83886336,
+            "replayed_location": 83886336,
+            "replayed_timestamp": "2023-01-01 10:00:00.000000+00:00",
+            "paused": False,
+        }
+        self.assertEqual(
+            self.charm.backup._get_wal_replay_status(),
+            {"replayed-lsn": "0/5000100", "replay-lag": "30s"},
+        )
+
+        # Test when no transaction was replayed yet.
+        _member_wal_replay_status.return_value["replayed_timestamp"] = None
+        self.assertEqual(self.charm.backup._get_wal_replay_status(), {"replayed-lsn": "0/5000100"})
+
+    @patch("charm.PostgreSQLBackups._generate_backup_list_output")
+    @patch("charm.PostgreSQLBackups._are_backup_settings_ok")
+    def test_on_list_backups_action(self, _are_backup_settings_ok, _generate_backup_list_output):
+        # Test when not all backup settings are ok.
+        mock_event = MagicMock()
+        mock_event.params = {}
+        _are_backup_settings_ok.return_value = (False, "fake validation message")
+        self.charm.backup._on_list_backups_action(mock_event)
+        mock_event.fail.assert_called_once()
+        _generate_backup_list_output.assert_not_called()
+        mock_event.set_results.assert_not_called()
+
+        # Test when the charm fails to generate the backup list output.
+        mock_event.reset_mock()
+        _are_backup_settings_ok.return_value = (True, None)
+        _generate_backup_list_output.side_effect = ExecError(
+            command="fake command".split(), exit_code=1, stdout="", stderr="fake error"
+        )
+        self.charm.backup._on_list_backups_action(mock_event)
+        _generate_backup_list_output.assert_called_once()
+        mock_event.fail.assert_called_once()
+        mock_event.set_results.assert_not_called()
+
+        # Test when the charm succeeds on generating the backup list output.
+        mock_event.reset_mock()
+        _generate_backup_list_output.reset_mock()
+        _are_backup_settings_ok.return_value = (True, None)
+        _generate_backup_list_output.side_effect = None
+        _generate_backup_list_output.return_value = (
+            """backup-id             | backup-type  | backup-status
+----------------------------------------------------
+2023-01-01T09:00:00Z  | physical     | failed: fake error
+2023-01-01T10:00:00Z  | physical     | finished""",
+            False,
+        )
+        self.charm.backup._on_list_backups_action(mock_event)
+        _generate_backup_list_output.assert_called_once_with({}, 0, None, "table", False)
+        mock_event.set_results.assert_called_once_with({
+            "backups": """backup-id             | backup-type  | backup-status
+----------------------------------------------------
+2023-01-01T09:00:00Z  | physical     | failed: fake error
+2023-01-01T10:00:00Z  | physical     | finished"""
+        })
+        mock_event.fail.assert_not_called()
+
+        # Test when old backups were already expired by one of the units.
+        mock_event.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {
+                    "last-expire-job": json.dumps({
+                        "finished": 1672563600.0,
+                        "status": "finished",
+                        "expired-backups": 2,
+                        "reclaimed-backup-bytes": 3 * 1024**2,
+                    })
+                },
+            )
+        self.charm.backup._on_list_backups_action(mock_event)
+        self.assertEqual(
+            mock_event.set_results.call_args[0][0]["last-expiry"],
+            "2023-01-01T09:00:00Z: finished, 2 backups expired, 3.00MB of backups reclaimed",
+        )
+
+        # Test when the filters are invalid.
+        for params in [
+            {"backup-type": "snapshot"},
+            {"status": "running"},
+            {"since": "yesterday"},
+            {"format": "yaml"},
+        ]:
+            mock_event.reset_mock()
+            _generate_backup_list_output.reset_mock()
+            mock_event.params = params
+            self.charm.backup._on_list_backups_action(mock_event)
+            mock_event.fail.assert_called_once()
+            _generate_backup_list_output.assert_not_called()
+
+        # Test when the S3 objects are requested to be counted for too many backups.
+        for params in [{"count-objects": True}, {"count-objects": True, "limit": 51}]:
+            mock_event.reset_mock()
+            _generate_backup_list_output.reset_mock()
+            mock_event.params = params
+            self.charm.backup._on_list_backups_action(mock_event)
+            mock_event.fail.assert_called_once_with(
+                "count-objects requires a limit of at most 50 backups"
+            )
+            _generate_backup_list_output.assert_not_called()
+
+        # Test when a page of filtered backups is listed (and there are more backups).
+        mock_event.reset_mock()
+        mock_event.params = {
+            "backup-type": "full",
+            "status": "finished",
+            "since": "2023-01-01T00:00:00Z",
+            "offset": 10,
+            "limit": 5,
+            "format": "json",
+            "count-objects": True,
+        }
+        _generate_backup_list_output.return_value = ("[]", True)
+        self.charm.backup._on_list_backups_action(mock_event)
+        _generate_backup_list_output.assert_called_once_with(
+            {"backup-type": "full", "status": "finished", "since": "2023-01-01T00:00:00Z"},
+            10,
+            5,
+            "json",
+            True,
+        )
+        self.assertEqual(mock_event.set_results.call_args[0][0]["next-offset"], 15)
+
+    @patch("charm.PostgreSQLBackups._get_backup_repository_key", return_value="1")
+    @patch("ops.model.Container.start")
+    @patch("charm.PostgresqlOperatorCharm.update_config")
+    @patch("charm.PostgresqlOperatorCharm._create_pgdata")
+    @patch("charm.PostgreSQLBackups._empty_data_files")
+    @patch("charm.PostgreSQLBackups._restart_database")
+    @patch("lightkube.Client.delete")
+    @patch("ops.model.Container.stop")
+    @patch("charm.PostgreSQLBackups._get_backup_chain")
+    @patch("charm.PostgreSQLBackups._list_backups")
+    @patch("charm.PostgreSQLBackups._pre_restore_checks")
+    def test_on_restore_action(
+        self,
+        _pre_restore_checks,
+        _list_backups,
+        _get_backup_chain,
+        _stop,
+        _delete,
+        _restart_database,
+        _empty_data_files,
+        _create_pgdata,
+        _update_config,
+        _start,
+        _get_backup_repository_key,
+    ):
+        # Test when pre restore checks fail.
+        mock_event = MagicMock()
+        _pre_restore_checks.return_value = False
+        self.charm.unit.status = ActiveStatus()
+        self.charm.backup._on_restore_action(mock_event)
+        _list_backups.assert_not_called()
+        _stop.assert_not_called()
+        _delete.assert_not_called()
+        _restart_database.assert_not_called()
+        _empty_data_files.assert_not_called()
+        _create_pgdata.assert_not_called()
+        _update_config.assert_not_called()
+        _start.assert_not_called()
+        mock_event.fail.assert_not_called()
+        mock_event.set_results.assert_not_called()
+        self.assertNotIsInstance(self.charm.unit.status, MaintenanceStatus)
+
+        # Test when the user provides an invalid backup id.
+        mock_event.params = {"backup-id": "2023-01-01T10:00:00Z"}
+        _pre_restore_checks.return_value = True
+        _list_backups.return_value = {"2023-01-01T09:00:00Z": self.charm.backup.stanza_name}
+        self.charm.unit.status = ActiveStatus()
+        self.charm.backup._on_restore_action(mock_event)
+        _list_backups.assert_called_once_with(show_failed=False)
+        mock_event.fail.assert_called_once()
+        _stop.assert_not_called()
+        _delete.assert_not_called()
+        _restart_database.assert_not_called()
+        _empty_data_files.assert_not_called()
+        _create_pgdata.assert_not_called()
+        _update_config.assert_not_called()
+        _start.assert_not_called()
+        mock_event.set_results.assert_not_called()
+        self.assertNotIsInstance(self.charm.unit.status, MaintenanceStatus)
+
+        # Test when the backup is only stored in the local repository of another unit.
+        mock_event.reset_mock()
+        with patch(
+            "charm.PostgreSQLBackups._get_other_units_local_backups",
+            return_value=[{"backup-id": "2023-01-01T10:00:00Z", "unit": "postgresql-k8s/1"}],
+        ):
+            self.charm.backup._on_restore_action(mock_event)
+        mock_event.fail.assert_called_once_with(
+            "Backup 2023-01-01T10:00:00Z is only stored in the local repository of"
+            " postgresql-k8s/1, which is not the leader unit"
+        )
+        _stop.assert_not_called()
+
+        # Test when the backup depends on backups that are not available anymore.
+        mock_event.reset_mock()
+        mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
+        _get_backup_chain.return_value = (
+            "20221231-090000F_20230101-090000I",
+            ["20221231-090000F"],
+        )
+        self.charm.backup._on_restore_action(mock_event)
+        _get_backup_chain.assert_called_once_with("2023-01-01T09:00:00Z")
+        mock_event.fail.assert_called_once()
+        _stop.assert_not_called()
+        mock_event.set_results.assert_not_called()
+        self.assertNotIsInstance(self.charm.unit.status, MaintenanceStatus)
+
+        # Test when the charm fails to stop the workload.
+        mock_event.reset_mock()
+        mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
+        _get_backup_chain.return_value = ("20230101-090000F", [])
+        _stop.side_effect = ChangeError(
+            err="fake error",
+            change=Change(
+                ChangeID("1"),
+                "fake kind",
+                "fake summary",
+                "fake status",
+                [],
+                True,
+                "fake error",
+                datetime.datetime.now(),
+                datetime.datetime.now(),
+            ),
+        )
+        self.charm.backup._on_restore_action(mock_event)
+        _stop.assert_called_once_with("postgresql")
+        mock_event.fail.assert_called_once()
+        _delete.assert_not_called()
+        _restart_database.assert_not_called()
+        _empty_data_files.assert_not_called()
+        _create_pgdata.assert_not_called()
+        _update_config.assert_not_called()
+        _start.assert_not_called()
+        mock_event.set_results.assert_not_called()
+
+        # Test when the charm fails to remove the previous cluster information.
+        mock_event.reset_mock()
+        mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
+        _stop.side_effect = None
+        _delete.side_effect = [None, _FakeApiError]
+        self.charm.backup._on_restore_action(mock_event)
+        self.assertEqual(_delete.call_count, 2)
+        mock_event.fail.assert_called_once()
+        _restart_database.assert_called_once()
+        _empty_data_files.assert_not_called()
+        _create_pgdata.assert_not_called()
+        _update_config.assert_not_called()
+        _start.assert_not_called()
+        mock_event.set_results.assert_not_called()
+
+        # Test when the charm fails to remove the files from the data directory.
+        mock_event.reset_mock()
+        _restart_database.reset_mock()
+        _delete.side_effect = None
+        _empty_data_files.side_effect = ExecError(
+            command="fake command".split(), exit_code=1, stdout="", stderr="fake error"
+        )
+        self.charm.backup._on_restore_action(mock_event)
+        _empty_data_files.assert_called_once()
+        mock_event.fail.assert_called_once()
+        _restart_database.assert_called_once()
+        _create_pgdata.assert_not_called()
+        _update_config.assert_not_called()
+        _start.assert_not_called()
+        mock_event.set_results.assert_not_called()
+
+        # Test a successful start of the restore process.
+        mock_event.reset_mock()
+        _restart_database.reset_mock()
+        _empty_data_files.side_effect = None
+        self.assertEqual(self.harness.get_relation_data(self.peer_rel_id, self.charm.app), {})
+        self.charm.backup._on_restore_action(mock_event)
+        _restart_database.assert_not_called()
+        self.assertEqual(
+            self.harness.get_relation_data(self.peer_rel_id, self.charm.app),
+            {
+                "restoring-backup": "20230101-090000F",
+                "restore-stanza": f"{self.charm.model.name}.{self.charm.cluster_name}",
+            },
+        )
+        _create_pgdata.assert_called_once()
+        _update_config.assert_called_once()
+        _start.assert_called_once_with("postgresql")
+        mock_event.fail.assert_not_called()
+        mock_event.set_results.assert_called_once_with({"restore-status": "restore started"})
+
+        # Test a successful start of a delta restore, which keeps the data files.
+        mock_event.reset_mock()
+        _empty_data_files.reset_mock()
+        _create_pgdata.reset_mock()
+        mock_event.params["delta"] = True
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restoring-backup": ""}
+            )
+        with patch("charm.PostgreSQLBackups._move_data_files_aside") as _move_data_files_aside:
+            self.charm.backup._on_restore_action(mock_event)
+            _move_data_files_aside.assert_called_once()
+        _empty_data_files.assert_not_called()
+        self.assertEqual(
+            self.harness.get_relation_data(self.peer_rel_id, self.charm.app)["restore-delta"],
+            "True",
+        )
+        _create_pgdata.assert_called_once()
+        mock_event.fail.assert_not_called()
+        mock_event.set_results.assert_called_once_with({"restore-status": "restore started"})
+
+        # Test when the backup is stored in the local repository.
+        mock_event.reset_mock()
+        mock_event.params["delta"] = False
+        _get_backup_repository_key.return_value = "2"
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restoring-backup": ""}
+            )
+        self.charm.backup._on_restore_action(mock_event)
+        _get_backup_repository_key.assert_called_with("20230101-090000F")
+        self.assertEqual(
+            self.harness.get_relation_data(self.peer_rel_id, self.charm.app)["restore-repository"],
+            "2",
+        )
+        mock_event.fail.assert_not_called()
+
+        # Test when there are other units (which are requested to restore the backup too).
+        mock_event.reset_mock()
+        _stop.reset_mock()
+        mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restoring-backup": ""}
+            )
+            self.harness.add_relation_unit(self.peer_rel_id, "postgresql-k8s/1")
+        self.charm.backup._on_restore_action(mock_event)
+        _stop.assert_not_called()
+        restore_request = json.loads(
+            self.harness.get_relation_data(self.peer_rel_id, self.charm.app)["restore-request"]
+        )
+        self.assertEqual(
+            restore_request,
+            {
+                "id": ANY,
+                "label": "20230101-090000F",
+                "stanza": f"{self.charm.model.name}.{self.charm.cluster_name}",
+                "delta": False,
+                "requested": ANY,
+            },
+        )
+        mock_event.fail.assert_not_called()
+        mock_event.set_results.assert_called_once_with({"restore-status": "restore started"})
+
+    @patch("charm.PostgresqlOperatorCharm._set_primary_status_message")
+    @patch("charm.PostgreSQLBackups._start_restore")
+    def test_coordinate_cluster_restore(self, _start_restore, _set_primary_status_message):
+        restore_request = {
+            "id": "2023-01-01T09:00:00Z",
+            "label": "20230101-090000F",
+            "stanza": "test-stanza",
+            "delta": False,
+            "requested": datetime.datetime.now().timestamp(),
+        }
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.add_relation_unit(self.peer_rel_id, "postgresql-k8s/1")
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps(restore_request)},
+            )
+
+        # Test when the other units are not ready yet.
+        self.charm.backup._coordinate_cluster_restore()
+        _start_restore.assert_not_called()
+        self.assertIn("restore-request", self.charm.app_peer_data)
+
+        # Test when the other units don't get ready in time (the restore is aborted).
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps({**restore_request, "requested": 0})},
+            )
+        self.charm.backup._coordinate_cluster_restore()
+        _start_restore.assert_not_called()
+        self.assertNotIn("restore-request", self.charm.app_peer_data)
+        _set_primary_status_message.assert_called_once()
+
+        # Test when the restore fails to start.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                "postgresql-k8s/1",
+                {"cluster-restore": json.dumps({"id": restore_request["id"], "phase": "ready"})},
+            )
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps(restore_request)},
+            )
+        _start_restore.return_value = "fake error"
+        self.charm.backup._coordinate_cluster_restore()
+        _start_restore.assert_called_once_with("20230101-090000F", "test-stanza", False)
+        self.assertNotIn("restore-request", self.charm.app_peer_data)
+        self.assertIsInstance(self.charm.unit.status, BlockedStatus)
+
+        # Test when the restore starts.
+        _start_restore.reset_mock()
+        _start_restore.return_value = None
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps(restore_request), "restoring-backup": "label"},
+            )
+        self.charm.backup._coordinate_cluster_restore()
+        _start_restore.assert_called_once()
+        self.assertTrue(json.loads(self.charm.app_peer_data["restore-request"])["restoring"])
+
+        # Test when the restore didn't finish in the other units yet.
+        _start_restore.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restoring-backup": ""}
+            )
+        self.charm.backup._coordinate_cluster_restore()
+        _start_restore.assert_not_called()
+        self.assertIn("restore-request", self.charm.app_peer_data)
+
+        # Test when the restore didn't finish in time in the other units.
+        started_request = json.loads(self.charm.app_peer_data["restore-request"])
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps({**started_request, "requested": 0})},
+            )
+        self.charm.backup._coordinate_cluster_restore()
+        self.assertNotIn("restore-request", self.charm.app_peer_data)
+
+        # Test when the restore finished in all the units.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps(started_request)},
+            )
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                "postgresql-k8s/1",
+                {
+                    "cluster-restore": json.dumps({
+                        "id": restore_request["id"],
+                        "phase": "catching-up",
+                    })
+                },
+            )
+        self.charm.backup._coordinate_cluster_restore()
+        self.assertNotIn("restore-request", self.charm.app_peer_data)
+
+    @patch("charm.Patroni.member_streaming", new_callable=PropertyMock)
+    @patch("charm.PostgreSQLBackups._check_restore_job")
+    @patch("charm.PostgreSQLBackups._finish_cluster_restore")
+    @patch("charm.PostgreSQLBackups._start_cluster_restore")
+    @patch("charm.PostgreSQLBackups._prepare_cluster_restore", return_value=True)
+    @patch("charm.PostgreSQLBackups._coordinate_cluster_restore")
+    def test_handle_cluster_restore(
+        self,
+        _coordinate_cluster_restore,
+        _prepare_cluster_restore,
+        _start_cluster_restore,
+        _finish_cluster_restore,
+        _check_restore_job,
+        _member_streaming,
+    ):
+        # Test in the leader.
+        self.harness.set_can_connect("postgresql", True)
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        self.assertFalse(self.charm.backup.handle_cluster_restore())
+        _coordinate_cluster_restore.assert_called_once()
+
+        # Test when no restore was requested.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader(False)
+        self.assertFalse(self.charm.backup.handle_cluster_restore())
+        _prepare_cluster_restore.assert_not_called()
+
+        # Test when a restore is requested.
+        restore_request = {"id": "2023-01-01T09:00:00Z", "label": "label", "delta": False}
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps(restore_request)},
+            )
+        self.assertTrue(self.charm.backup.handle_cluster_restore())
+        _prepare_cluster_restore.assert_called_once_with(restore_request)
+
+        # Test when the unit is ready, but the restore didn't start in the leader yet.
+        state = {"id": "2023-01-01T09:00:00Z", "phase": "ready"}
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"cluster-restore": json.dumps(state)}
+            )
+        self.assertTrue(self.charm.backup.handle_cluster_restore())
+        _start_cluster_restore.assert_not_called()
+
+        # Test when the restore started in the leader.
+        restore_request["restoring"] = True
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": json.dumps(restore_request)},
+            )
+        self.assertTrue(self.charm.backup.handle_cluster_restore())
+        _start_cluster_restore.assert_called_once_with(state, restore_request)
+
+        # Test when the backup is being restored.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"cluster-restore": json.dumps({**state, "phase": "restoring"})},
+            )
+        self.assertTrue(self.charm.backup.handle_cluster_restore())
+        _check_restore_job.assert_called_once()
+
+        # Test when the restore failed to start in the leader or was aborted.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.app.name,
+                {"restore-request": ""},
+            )
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.unit.name, {"cluster-restore": json.dumps(state)}
+            )
+        self.assertTrue(self.charm.backup.handle_cluster_restore())
+        _finish_cluster_restore.assert_called_once_with(state, restored=True)
+
+        # Test when the replica is catching up with the new timeline.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id,
+                self.charm.unit.name,
+                {"cluster-restore": json.dumps({**state, "phase": "catching-up"})},
+            )
+        _member_streaming.return_value = False
+        self.assertTrue(self.charm.backup.handle_cluster_restore())
+
+        # Test when the replica is already streaming from the new primary.
+        _member_streaming.return_value = True
+        self.assertFalse(self.charm.backup.handle_cluster_restore())
+        self.assertNotIn("cluster-restore", self.charm.unit_peer_data)
+        self.assertIsInstance(self.charm.unit.status, ActiveStatus)
 
-    @patch("ops.model.Container.start")
-    @patch("charm.PostgresqlOperatorCharm.update_config")
-    @patch("charm.PostgresqlOperatorCharm._create_pgdata")
     @patch("charm.PostgreSQLBackups._empty_data_files")
-    @patch("charm.PostgreSQLBackups._restart_database")
-    @patch("lightkube.Client.delete")
     @patch("ops.model.Container.stop")
-    @patch("charm.PostgreSQLBackups._list_backups")
-    @patch("charm.PostgreSQLBackups._pre_restore_checks")
-    def test_on_restore_action(
-        self,
-        _pre_restore_checks,
-        _list_backups,
-        _stop,
-        _delete,
-        _restart_database,
-        _empty_data_files,
-        _create_pgdata,
-        _update_config,
-        _start,
-    ):
-        # Test when pre restore checks fail.
-        mock_event = MagicMock()
-        _pre_restore_checks.return_value = False
-        self.charm.unit.status = ActiveStatus()
-        self.charm.backup._on_restore_action(mock_event)
-        _list_backups.assert_not_called()
-        _stop.assert_not_called()
-        _delete.assert_not_called()
-        _restart_database.assert_not_called()
-        _empty_data_files.assert_not_called()
-        _create_pgdata.assert_not_called()
-        _update_config.assert_not_called()
-        _start.assert_not_called()
-        mock_event.fail.assert_not_called()
-        mock_event.set_results.assert_not_called()
-        self.assertNotIsInstance(self.charm.unit.status, MaintenanceStatus)
-
-        # Test when the user provides an invalid backup id.
-        mock_event.params = {"backup-id": "2023-01-01T10:00:00Z"}
-        _pre_restore_checks.return_value = True
-        _list_backups.return_value = {"2023-01-01T09:00:00Z": self.charm.backup.stanza_name}
-        self.charm.unit.status = ActiveStatus()
-        self.charm.backup._on_restore_action(mock_event)
-        _list_backups.assert_called_once_with(show_failed=False)
-        mock_event.fail.assert_called_once()
-        _stop.assert_not_called()
-        _delete.assert_not_called()
-        _restart_database.assert_not_called()
-        _empty_data_files.assert_not_called()
-        _create_pgdata.assert_not_called()
-        _update_config.assert_not_called()
-        _start.assert_not_called()
-        mock_event.set_results.assert_not_called()
-        self.assertNotIsInstance(self.charm.unit.status, MaintenanceStatus)
+    def test_prepare_cluster_restore(self, _stop, _empty_data_files):
+        restore_request = {"id": "2023-01-01T09:00:00Z", "label": "label", "delta": False}
 
-        # Test when the charm fails to stop the workload.
-        mock_event.reset_mock()
-        mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
-        _stop.side_effect = ChangeError(
-            err="fake error",
-            change=Change(
-                ChangeID("1"),
-                "fake kind",
-                "fake summary",
-                "fake status",
-                [],
-                True,
-                "fake error",
-                datetime.datetime.now(),
-                datetime.datetime.now(),
-            ),
-        )
-        self.charm.backup._on_restore_action(mock_event)
-        _stop.assert_called_once_with("postgresql")
-        mock_event.fail.assert_called_once()
-        _delete.assert_not_called()
-        _restart_database.assert_not_called()
-        _empty_data_files.assert_not_called()
-        _create_pgdata.assert_not_called()
-        _update_config.assert_not_called()
-        _start.assert_not_called()
-        mock_event.set_results.assert_not_called()
+        # Test when the database cannot be stopped.
+        _stop.side_effect = ChangeError(err="fake error", change=MagicMock())
+        self.assertFalse(self.charm.backup._prepare_cluster_restore(restore_request))
+        self.assertNotIn("cluster-restore", self.charm.unit_peer_data)
 
-        # Test when the charm fails to remove the previous cluster information.
-        mock_event.reset_mock()
-        mock_event.params = {"backup-id": "2023-01-01T09:00:00Z"}
+        # Test when the database is stopped (the data files are kept until the leader
+        # starts its restore).
         _stop.side_effect = None
-        _delete.side_effect = [None, _FakeApiError]
-        self.charm.backup._on_restore_action(mock_event)
-        self.assertEqual(_delete.call_count, 2)
-        mock_event.fail.assert_called_once()
-        _restart_database.assert_called_once()
+        self.assertTrue(self.charm.backup._prepare_cluster_restore(restore_request))
+        _stop.assert_called_with("postgresql")
         _empty_data_files.assert_not_called()
-        _create_pgdata.assert_not_called()
-        _update_config.assert_not_called()
-        _start.assert_not_called()
-        mock_event.set_results.assert_not_called()
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["cluster-restore"]),
+            {"id": "2023-01-01T09:00:00Z", "phase": "ready"},
+        )
 
-        # Test when the charm fails to remove the files from the data directory.
-        mock_event.reset_mock()
-        _restart_database.reset_mock()
-        _delete.side_effect = None
+    @patch("charm.PostgreSQLBackups._start_restore_job")
+    @patch("charm.PostgresqlOperatorCharm._create_pgdata")
+    @patch("charm.PostgreSQLBackups._empty_data_files")
+    def test_start_cluster_restore(self, _empty_data_files, _create_pgdata, _start_restore_job):
+        restore_request = {"id": "2023-01-01T09:00:00Z", "label": "label", "delta": False}
+        state = {"id": "2023-01-01T09:00:00Z", "phase": "ready"}
+
+        # Test when the data directory cannot be emptied.
         _empty_data_files.side_effect = ExecError(
-            command="fake command".split(), exit_code=1, stdout="", stderr="fake error"
+            command=["rm"], exit_code=1, stdout="", stderr="fake error"
         )
-        self.charm.backup._on_restore_action(mock_event)
-        _empty_data_files.assert_called_once()
-        mock_event.fail.assert_called_once()
-        _restart_database.assert_called_once()
+        self.charm.backup._start_cluster_restore(state, restore_request)
         _create_pgdata.assert_not_called()
-        _update_config.assert_not_called()
-        _start.assert_not_called()
-        mock_event.set_results.assert_not_called()
+        _start_restore_job.assert_not_called()
+        self.assertNotIn("cluster-restore", self.charm.unit_peer_data)
 
-        # Test a successful start of the restore process.
-        mock_event.reset_mock()
-        _restart_database.reset_mock()
+        # Test when the restore starts.
         _empty_data_files.side_effect = None
-        self.assertEqual(self.harness.get_relation_data(self.peer_rel_id, self.charm.app), {})
-        self.charm.backup._on_restore_action(mock_event)
-        _restart_database.assert_not_called()
+        self.charm.backup._start_cluster_restore(state, restore_request)
+        _create_pgdata.assert_called_once()
+        _start_restore_job.assert_called_once_with(restore_request)
         self.assertEqual(
-            self.harness.get_relation_data(self.peer_rel_id, self.charm.app),
-            {
-                "restoring-backup": "20230101-090000F",
-                "restore-stanza": f"{self.charm.model.name}.{self.charm.cluster_name}",
-            },
+            json.loads(self.charm.unit_peer_data["cluster-restore"])["phase"], "restoring"
         )
-        _create_pgdata.assert_called_once()
+
+        # Test a delta restore (which keeps the data files).
+        _empty_data_files.reset_mock()
+        restore_request["delta"] = True
+        self.charm.backup._start_cluster_restore(state, restore_request)
+        _empty_data_files.assert_not_called()
+
+    @patch("charm.PostgreSQLBackups._start_pgbackrest_job")
+    def test_start_restore_job(self, _start_pgbackrest_job):
+        restore_request = {"id": "id", "label": "label", "stanza": "test-stanza", "delta": True}
+        self.charm.backup._start_restore_job(restore_request)
+        _start_pgbackrest_job.assert_called_once_with(
+            "pgbackrest restore",
+            "restore",
+            [
+                "pgbackrest",
+                "--stanza=test-stanza",
+                "--pg1-path=/var/lib/postgresql/data/pgdata",
+                "--set=label",
+                "--type=standby",
+                "--target-timeline=latest",
+                "--log-level-console=detail",
+                "--delta",
+                "restore",
+            ],
+            (
+                "/var/log/pgbackrest/restore-job.out",
+                "/var/log/pgbackrest/restore-job.err",
+                "/var/log/pgbackrest/restore-job.rc",
+            ),
+        )
+
+    @patch("charm.PostgreSQLBackups._finish_cluster_restore")
+    @patch("charm.PostgreSQLBackups._is_job_running")
+    def test_check_restore_job(self, _is_job_running, _finish_cluster_restore):
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        state = {"id": "2023-01-01T09:00:00Z", "phase": "restoring"}
+
+        # Test when the restore job is still running.
+        _is_job_running.return_value = True
+        self.charm.backup._check_restore_job(state)
+        _finish_cluster_restore.assert_not_called()
+
+        # Test when the restore is still running in the leader.
+        _is_job_running.return_value = False
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restoring-backup": "label"}
+            )
+        self.charm.backup._check_restore_job(state)
+        _finish_cluster_restore.assert_not_called()
+
+        # Test when the restore finished in both units.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restoring-backup": ""}
+            )
+        container.push("/var/log/pgbackrest/restore-job.rc", "0\n", make_dirs=True)
+        self.charm.backup._check_restore_job(state)
+        _finish_cluster_restore.assert_called_once_with(state, restored=True)
+
+    @patch("ops.model.Container.start")
+    @patch("charm.PostgresqlOperatorCharm.update_config")
+    @patch("charm.PostgresqlOperatorCharm._create_pgdata")
+    @patch("charm.PostgreSQLBackups._empty_data_files")
+    def test_finish_cluster_restore(
+        self, _empty_data_files, _create_pgdata, _update_config, _start
+    ):
+        state = {"id": "2023-01-01T09:00:00Z", "phase": "restoring"}
+
+        # Test when the backup was restored.
+        self.charm.backup._finish_cluster_restore(state, restored=True)
+        _empty_data_files.assert_not_called()
         _update_config.assert_called_once()
         _start.assert_called_once_with("postgresql")
-        mock_event.fail.assert_not_called()
-        mock_event.set_results.assert_called_once_with({"restore-status": "restore started"})
+        self.assertEqual(
+            json.loads(self.charm.unit_peer_data["cluster-restore"])["phase"], "catching-up"
+        )
+
+        # Test when the backup couldn't be restored (the replica is created again).
+        self.charm.backup._finish_cluster_restore(state, restored=False)
+        _empty_data_files.assert_called_once()
+        _create_pgdata.assert_called_once()
 
     @patch("ops.model.Application.planned_units")
     @patch("charm.PostgreSQLBackups._are_backup_settings_ok")
@@ -1395,29 +3327,42 @@ Juju Version: test-juju-version
         mock_event.fail.assert_called_once()
 
         # Test when the unit is in a blocked state that is recoverable by changing S3 parameters,
-        # but the cluster has more than one unit.
+        # but a restore is already in progress.
         mock_event.reset_mock()
         self.charm.unit.status = BlockedStatus(ANOTHER_CLUSTER_REPOSITORY_ERROR_MESSAGE)
-        _planned_units.return_value = 2
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restore-request": "{}"}
+            )
         self.assertEqual(self.charm.backup._pre_restore_checks(mock_event), False)
         mock_event.fail.assert_called_once()
 
-        # Test when the cluster has only one unit, but it's not the leader yet.
+        # Test when the unit is not the leader yet.
         mock_event.reset_mock()
-        _planned_units.return_value = 1
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.peer_rel_id, self.charm.app.name, {"restore-request": ""}
+            )
+            self.harness.set_leader(False)
         self.assertEqual(self.charm.backup._pre_restore_checks(mock_event), False)
         mock_event.fail.assert_called_once()
 
-        # Test when everything is ok to run a restore.
+        # Test when everything is ok to run a restore (also in a cluster with more than one unit).
         mock_event.reset_mock()
+        _planned_units.return_value = 2
         with self.harness.hooks_disabled():
             self.harness.set_leader()
         self.assertEqual(self.charm.backup._pre_restore_checks(mock_event), True)
         mock_event.fail.assert_not_called()
 
+    @patch("charm.PostgreSQLBackups._get_bundle_settings", return_value=(False, False))
+    @patch("charm.PostgresqlOperatorCharm.get_available_resources", return_value=(8, 1000000000))
     @patch("ops.model.Container.push")
     @patch("charm.PostgreSQLBackups._retrieve_s3_parameters")
-    def test_render_pgbackrest_conf_file(self, _retrieve_s3_parameters, _push):
+    def test_render_pgbackrest_conf_file(
+        self, _retrieve_s3_parameters, _push, _, _get_bundle_settings
+    ):
         # Set up a mock for the `open` method, set returned data to postgresql.conf template.
         with open("templates/pgbackrest.conf.j2", "r") as f:
             mock = mock_open(read_data=f.read())
@@ -1434,6 +3379,7 @@ Juju Version: test-juju-version
         _push.assert_not_called()
 
         # Test when all parameters are provided.
+        self.harness.set_can_connect("postgresql", True)
         _retrieve_s3_parameters.return_value = (
             {
                 "bucket": "test-bucket",
@@ -1463,6 +3409,23 @@ Juju Version: test-juju-version
             stanza=self.charm.backup.stanza_name,
             storage_path=self.charm._storage_path,
             user="backup",
+            compress_type="lz4",
+            compress_level=None,
+            process_max=6,
+            retention_full=9999999,
+            retention_diff=None,
+            retention_archive=None,
+            archive_async=True,
+            archive_get_queue_max=128,
+            archive_process_max=2,
+            spool_path="/var/lib/postgresql/data/pgbackrest-spool",
+            bundle=False,
+            bundle_limit=2,
+            bundle_size=20,
+            block_incremental=False,
+            local_repository=False,
+            local_repository_path="/var/lib/postgresql/backups/pgbackrest",
+            local_retention_full=2,
         )
 
         # Patch the `open` method with our mock.
@@ -1480,6 +3443,194 @@ Juju Version: test-juju-version
             user="postgres",
             group="postgres",
         )
+        self.assertIn(
+            "compress-type=lz4\nexpire-auto=n\nprocess-max=6\nrepo1-retention-full=9999999\n",
+            expected_content,
+        )
+        self.assertIn(
+            "[global:archive-get]\narchive-get-queue-max=128MiB\nprocess-max=2\n",
+            expected_content,
+        )
+        self.assertIn("spool-path=/var/lib/postgresql/data/pgbackrest-spool\n", expected_content)
+        self.assertTrue(
+            self.charm.unit.get_container("postgresql").exists(
+                "/var/lib/postgresql/data/pgbackrest-spool"
+            )
+        )
+
+        # Test when the compression and the number of processes are set through config options.
+        _push.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "backup_compress_type": "zst",
+                "backup_compress_level": 6,
+                "backup_process_max": 2,
+            })
+        with patch("builtins.open", mock, create=True):
+            self.charm.backup._render_pgbackrest_conf_file()
+        self.assertIn(
+            "compress-type=zst\ncompress-level=6\nexpire-auto=n\nprocess-max=2\n",
+            _push.call_args[0][1],
+        )
+
+        # Test that the compression level is checked against the compression type.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_compress_type": "gz", "backup_compress_level": 15})
+        with self.assertRaises(ValidationError):
+            self.charm.config
+
+        # Test that the compression level isn't used when the backups aren't compressed.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_compress_type": "none"})
+        with patch("builtins.open", mock, create=True):
+            self.charm.backup._render_pgbackrest_conf_file()
+        self.assertIn("compress-type=none\nexpire-auto=n\nprocess-max=2\n", _push.call_args[0][1])
+
+        # Test when the retention is set through config options.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "backup_retention_full": 2,
+                "backup_retention_diff": 4,
+                "backup_retention_archive": 3,
+            })
+        with patch("builtins.open", mock, create=True):
+            self.charm.backup._render_pgbackrest_conf_file()
+        self.assertIn(
+            "repo1-retention-archive=3\nrepo1-retention-archive-type=diff\n"
+            "repo1-retention-diff=4\nrepo1-retention-full=2\n",
+            _push.call_args[0][1],
+        )
+
+        # Test when the asynchronous archiving is disabled.
+        _push.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_archive_async": False})
+        with patch("builtins.open", mock, create=True):
+            self.charm.backup._render_pgbackrest_conf_file()
+        self.assertNotIn("archive-async", _push.call_args[0][1])
+        self.assertNotIn("[global:archive-push]", _push.call_args[0][1])
+
+        # Test when the bundling of files and the block incremental are enabled.
+        _get_bundle_settings.return_value = (True, True)
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_bundle_limit": 4, "backup_bundle_size": 64})
+        with patch("builtins.open", mock, create=True):
+            self.charm.backup._render_pgbackrest_conf_file()
+        self.assertIn(
+            "repo1-block=y\nrepo1-bundle=y\nrepo1-bundle-limit=4MiB\nrepo1-bundle-size=64MiB\n",
+            _push.call_args[0][1],
+        )
+
+        # Test when the local repository is enabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "backup_local_repository": True,
+                "backup_local_retention_full": 3,
+            })
+        with patch("builtins.open", mock, create=True):
+            self.charm.backup._render_pgbackrest_conf_file()
+        self.assertIn(
+            "repo2-path=/var/lib/postgresql/backups/pgbackrest\nrepo2-retention-full=3\n"
+            "repo2-type=posix\n",
+            _push.call_args[0][1],
+        )
+        self.assertTrue(
+            self.charm.unit.get_container("postgresql").exists(
+                "/var/lib/postgresql/backups/pgbackrest"
+            )
+        )
+
+    @patch("charm.PostgreSQLBackups._execute_command")
+    def test_get_pgbackrest_version(self, _execute_command):
+        _execute_command.return_value = ("pgBackRest 2.48\n", "")
+        self.assertEqual(self.charm.backup._get_pgbackrest_version(), (2, 48))
+        _execute_command.assert_called_once_with(["pgbackrest", "version"])
+
+        # Test that the version is cached in the workload container.
+        self.harness.set_can_connect("postgresql", True)
+        container = self.charm.unit.get_container("postgresql")
+        container.make_dir("/tmp", make_parents=True)
+        _execute_command.reset_mock()
+        self.assertEqual(self.charm.backup._get_pgbackrest_version(), (2, 48))
+        self.assertEqual(container.pull("/tmp/pgbackrest-version").read(), "2.48")
+        _execute_command.reset_mock()
+        self.assertEqual(self.charm.backup._get_pgbackrest_version(), (2, 48))
+        _execute_command.assert_not_called()
+        container.remove_path("/tmp/pgbackrest-version")
+
+        # Test when the version couldn't be retrieved.
+        _execute_command.return_value = (None, None)
+        self.assertIsNone(self.charm.backup._get_pgbackrest_version())
+        _execute_command.side_effect = ExecError(
+            command=["pgbackrest", "version"], exit_code=1, stdout="", stderr="fake error"
+        )
+        self.assertIsNone(self.charm.backup._get_pgbackrest_version())
+
+    @patch("charm.PostgreSQLBackups._get_pgbackrest_version")
+    def test_get_bundle_settings(self, _get_pgbackrest_version):
+        # Test when the bundling of files is disabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_bundle": False})
+        self.assertEqual(self.charm.backup._get_bundle_settings(), (False, False))
+        _get_pgbackrest_version.assert_not_called()
+
+        # Test when pgBackRest doesn't support the bundling of files.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_bundle": True, "backup_block_incremental": True})
+        for version in [None, (2, 38)]:
+            _get_pgbackrest_version.return_value = version
+            self.assertEqual(self.charm.backup._get_bundle_settings(), (False, False))
+
+        # Test when pgBackRest supports only the bundling of files.
+        _get_pgbackrest_version.return_value = (2, 48)
+        self.assertEqual(self.charm.backup._get_bundle_settings(), (True, False))
+
+        # Test when pgBackRest supports both.
+        _get_pgbackrest_version.return_value = (2, 52)
+        self.assertEqual(self.charm.backup._get_bundle_settings(), (True, True))
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"backup_block_incremental": False})
+        self.assertEqual(self.charm.backup._get_bundle_settings(), (True, False))
+
+    @patch("charm.PostgresqlOperatorCharm.get_available_resources")
+    def test_calculate_process_max(self, _get_available_resources):
+        # Test when the resources cannot be retrieved.
+        _get_available_resources.side_effect = _FakeApiError
+        self.assertEqual(self.charm.backup._calculate_process_max(), 1)
+
+        # Test that at least one CPU core is kept as a reserve for PostgreSQL
+        # (but pgBackRest can always use at least one process).
+        _get_available_resources.side_effect = None
+        for cpu_cores, expected_process_max in [(1, 1), (2, 1), (4, 3), (8, 6), (16, 12)]:
+            _get_available_resources.return_value = (cpu_cores, 1000000000)
+            self.assertEqual(self.charm.backup._calculate_process_max(), expected_process_max)
+
+    @patch("charm.PostgreSQLBackups._render_pgbackrest_conf_file")
+    def test_on_config_changed(self, _render_pgbackrest_conf_file):
+        # Test when the unit is not related to the S3 integrator.
+        self.charm.backup._on_config_changed(None)
+        _render_pgbackrest_conf_file.assert_not_called()
+
+        # Test when the workload container is not ready yet.
+        self.relate_to_s3_integrator()
+        self.harness.set_can_connect("postgresql", False)
+        self.charm.backup._on_config_changed(None)
+        _render_pgbackrest_conf_file.assert_not_called()
+
+        # Test when the pgBackRest configuration can be rendered again.
+        self.harness.set_can_connect("postgresql", True)
+        with patch(
+            "charm.PostgreSQLBackups._maintain_local_repository"
+        ) as _maintain_local_repository:
+            self.charm.backup._on_config_changed(None)
+            _render_pgbackrest_conf_file.assert_called_once()
+            _maintain_local_repository.assert_not_called()
+
+            # Test when the local repository is enabled (its stanza is created in the primary).
+            with self.harness.hooks_disabled():
+                self.harness.update_config({"backup_local_repository": True})
+            self.charm.backup._on_config_changed(None)
+            _maintain_local_repository.assert_called_once()
 
     @patch("ops.model.Container.start")
     @patch("charm.PostgresqlOperatorCharm.update_config")
@@ -1648,10 +3799,9 @@ Juju Version: test-juju-version
         _stop.assert_not_called()
         _restart.assert_called_once()
 
-    @patch("tempfile.NamedTemporaryFile")
     @patch("charm.PostgreSQLBackups._construct_endpoint")
-    @patch("boto3.session.Session.resource")
-    def test_upload_content_to_s3(self, _resource, _construct_endpoint, _named_temporary_file):
+    @patch("boto3.session.Session.client")
+    def test_upload_content_to_s3(self, _client, _construct_endpoint):
         # Set some parameters.
         content = "test-content"
         s3_path = "test-file."
@@ -1665,38 +3815,37 @@ Juju Version: test-juju-version
         }
 
         # Test when any exception happens.
-        upload_file = _resource.return_value.Bucket.return_value.upload_file
-        _resource.side_effect = ValueError
+        put_object = _client.return_value.put_object
+        _client.side_effect = ValueError
         _construct_endpoint.return_value = "https://s3.us-east-1.amazonaws.com"
-        _named_temporary_file.return_value.__enter__.return_value.name = "/tmp/test-file"
         self.assertEqual(
             self.charm.backup._upload_content_to_s3(content, s3_path, s3_parameters),
             False,
         )
-        _resource.assert_called_once_with("s3", endpoint_url="https://s3.us-east-1.amazonaws.com")
-        _named_temporary_file.assert_not_called()
-        upload_file.assert_not_called()
+        _client.assert_called_once_with("s3", endpoint_url="https://s3.us-east-1.amazonaws.com")
+        put_object.assert_not_called()
 
-        _resource.reset_mock()
-        _resource.side_effect = None
-        upload_file.side_effect = S3UploadFailedError
+        _client.reset_mock()
+        _client.side_effect = None
+        put_object.side_effect = S3UploadFailedError
         self.assertEqual(
             self.charm.backup._upload_content_to_s3(content, s3_path, s3_parameters),
             False,
         )
-        _resource.assert_called_once_with("s3", endpoint_url="https://s3.us-east-1.amazonaws.com")
-        _named_temporary_file.assert_called_once()
-        upload_file.assert_called_once_with("/tmp/test-file", "test-path/test-file.")
+        _client.assert_called_once_with("s3", endpoint_url="https://s3.us-east-1.amazonaws.com")
+        put_object.assert_called_once_with(
+            Bucket="test-bucket", Key="test-path/test-file.", Body=b"test-content"
+        )
 
-        # Test when the upload succeeds
-        _resource.reset_mock()
-        _named_temporary_file.reset_mock()
-        upload_file.reset_mock()
-        upload_file.side_effect = None
+        # Test when the upload succeeds (reusing the same client).
+        _client.reset_mock()
+        put_object.reset_mock()
+        put_object.side_effect = None
         self.assertEqual(
             self.charm.backup._upload_content_to_s3(content, s3_path, s3_parameters),
             True,
         )
-        _resource.assert_called_once_with("s3", endpoint_url="https://s3.us-east-1.amazonaws.com")
-        _named_temporary_file.assert_called_once()
-        upload_file.assert_called_once_with("/tmp/test-file", "test-path/test-file.")
+        _client.assert_not_called()
+        put_object.assert_called_once_with(
+            Bucket="test-bucket", Key="test-path/test-file.", Body=b"test-content"
+        )
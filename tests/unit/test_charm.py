@@ -5,10 +5,16 @@ import json
 import logging
 import unittest
 from datetime import datetime
-from unittest.mock import MagicMock, Mock, PropertyMock, patch
+from typing import Dict
+from unittest.mock import ANY, MagicMock, Mock, PropertyMock, call, patch
 
 import pytest
-from charms.postgresql_k8s.v0.postgresql import PostgreSQLUpdateUserPasswordError
+from charms.postgresql_k8s.v0.postgresql import (
+    PostgreSQLUpdateUserLimitsError,
+    PostgreSQLUpdateUserPasswordError,
+)
+from jinja2 import Template
+from lightkube.models.meta_v1 import ObjectMeta
 from lightkube.resources.core_v1 import Endpoints, Pod, Service
 from ops.model import (
     ActiveStatus,
@@ -29,7 +35,7 @@ from tests.unit.helpers import _FakeApiError
 
 
 class TestCharm(unittest.TestCase):
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     @patch_network_get(private_address="1.1.1.1")
     def setUp(self):
         self._peer_relation = PEER
@@ -78,11 +84,12 @@ class TestCharm(unittest.TestCase):
             [MagicMock(metadata=MagicMock(name="fakeName2", namespace="fakeNamespace"))],
         ]
         self.harness.set_leader()
-        assert _set_secret.call_count == 4
+        assert _set_secret.call_count == 5
         _set_secret.assert_any_call("app", "operator-password", "sekr1t")
         _set_secret.assert_any_call("app", "replication-password", "sekr1t")
         _set_secret.assert_any_call("app", "rewind-password", "sekr1t")
         _set_secret.assert_any_call("app", "monitoring-password", "sekr1t")
+        _set_secret.assert_any_call("app", "pgbouncer-password", "sekr1t")
         _client.return_value.get.assert_called_once_with(
             Endpoints, name=self._cluster_name, namespace=self.charm.model.name
         )
@@ -133,6 +140,7 @@ class TestCharm(unittest.TestCase):
     )
     @patch_network_get(private_address="1.1.1.1")
     @patch("charm.Patroni.member_started")
+    @patch("charm.PostgresqlOperatorCharm._update_replicas_readiness")
     @patch("charm.PostgresqlOperatorCharm.push_tls_files_to_workload")
     @patch("charm.PostgresqlOperatorCharm._patch_pod_labels")
     @patch("charm.PostgresqlOperatorCharm._on_leader_elected")
@@ -143,6 +151,7 @@ class TestCharm(unittest.TestCase):
         _,
         __,
         _push_tls_files_to_workload,
+        _update_replicas_readiness,
         _member_started,
         _create_services,
         _postgresql,
@@ -187,6 +196,7 @@ class TestCharm(unittest.TestCase):
         container = self.harness.model.unit.get_container(self._postgresql_container)
         self.assertEqual(container.get_service(self._postgresql_service).is_running(), True)
         _push_tls_files_to_workload.assert_called_once()
+        _update_replicas_readiness.assert_called_once_with(own_pod_only=True)
 
     @patch("charm.Patroni.rock_postgresql_version", new_callable=PropertyMock)
     @patch("charm.PostgresqlOperatorCharm._create_pgdata")
@@ -319,6 +329,82 @@ class TestCharm(unittest.TestCase):
         _get_primary.assert_called_once()
         mock_event.set_results.assert_not_called()
 
+    @patch("charm.PostgresqlOperatorCharm.get_resources_limits", return_value={})
+    @patch("charm.PostgresqlOperatorCharm.get_available_hugepages")
+    @patch("charm.PostgresqlOperatorCharm.get_available_resources")
+    def test_on_get_huge_pages(
+        self, _get_available_resources, _get_available_hugepages, _get_resources_limits
+    ):
+        mock_event = Mock()
+        _get_available_resources.return_value = (4, 8000000000)
+        _get_available_hugepages.return_value = 1000000000
+
+        # Test when the shared buffers fit in the huge pages.
+        self.harness.update_config({"profile": "production"})
+        self.charm._on_get_huge_pages(mock_event)
+        mock_event.set_results.assert_called_once_with({
+            "huge-pages": "on",
+            "shared-buffers": "900MB",
+            "hugepages-limit": "1000MB",
+        })
+        mock_event.fail.assert_not_called()
+        _get_resources_limits.assert_called_once_with(container_name="postgresql")
+        _get_available_hugepages.assert_called_once_with({})
+
+        # Test when there are no huge pages available.
+        mock_event.reset_mock()
+        _get_available_hugepages.return_value = 0
+        self.charm._on_get_huge_pages(mock_event)
+        mock_event.set_results.assert_called_once_with({
+            "huge-pages": "off",
+            "shared-buffers": "2000MB",
+            "hugepages-limit": "0MB",
+        })
+
+        # Test when the resources cannot be retrieved.
+        mock_event.reset_mock()
+        _get_available_resources.side_effect = _FakeApiError
+        self.charm._on_get_huge_pages(mock_event)
+        mock_event.set_results.assert_not_called()
+        mock_event.fail.assert_called_once()
+
+        # Test when the shared buffers don't fit in the available memory.
+        mock_event.reset_mock()
+        _get_available_resources.side_effect = None
+        self.harness.update_config({"memory_shared_buffers": 10000000})
+        self.charm._on_get_huge_pages(mock_event)
+        mock_event.set_results.assert_not_called()
+        mock_event.fail.assert_called_once()
+
+    @patch("charm.PostgresqlOperatorCharm.get_resources_limits")
+    @patch("charm.PostgresqlOperatorCharm.get_node_allocable_memory")
+    def test_get_available_hugepages(self, _get_node_allocable_memory, _get_resources_limits):
+        # Test when the container has no huge pages limit (the node is not queried).
+        _get_resources_limits.return_value = {"memory": "4Gi"}
+        self.assertEqual(self.charm.get_available_hugepages(), 0)
+        _get_resources_limits.assert_called_once_with(container_name="postgresql")
+        _get_node_allocable_memory.assert_not_called()
+
+        # Test when the node doesn't expose huge pages.
+        _get_node_allocable_memory.return_value = 0
+        _get_resources_limits.return_value = {"hugepages-2Mi": "1Gi"}
+        self.assertEqual(self.charm.get_available_hugepages(), 0)
+        _get_node_allocable_memory.assert_called_once_with(resource="hugepages-2Mi")
+
+        # Test when the container limits are provided (they are not retrieved again).
+        _get_resources_limits.reset_mock()
+        _get_node_allocable_memory.return_value = 2147483648
+        self.assertEqual(self.charm.get_available_hugepages({"hugepages-2Mi": "1Gi"}), 1073741824)
+        _get_resources_limits.assert_not_called()
+
+        # Test when the container limit is lower than the node allocatable huge pages.
+        _get_resources_limits.return_value = {"hugepages-2Mi": "1Gi"}
+        self.assertEqual(self.charm.get_available_hugepages(), 1073741824)
+
+        # Test when the node allocatable huge pages are lower than the container limit.
+        _get_resources_limits.return_value = {"hugepages-2Mi": "4Gi"}
+        self.assertEqual(self.charm.get_available_hugepages(), 2147483648)
+
     @patch_network_get(private_address="1.1.1.1")
     @patch("charm.PostgresqlOperatorCharm._handle_processes_failures")
     @patch("charm.Patroni.member_started")
@@ -439,7 +525,7 @@ class TestCharm(unittest.TestCase):
         _update_config.assert_not_called()
         _handle_processes_failures.assert_not_called()
         _set_primary_status_message.assert_not_called()
-        self.assertIsInstance(self.charm.unit.status, ActiveStatus)
+        self.assertEqual(self.charm.unit.status, MaintenanceStatus("restoring backup"))
 
         # Assert that the backup id is still in the application relation databag.
         self.assertEqual(
@@ -448,6 +534,7 @@ class TestCharm(unittest.TestCase):
         )
 
         # Test when the restore operation finished successfully.
+        self.charm.unit.status = ActiveStatus()
         _member_started.return_value = True
         _can_use_s3_repository.return_value = (True, None)
         _handle_processes_failures.return_value = False
@@ -482,17 +569,31 @@ class TestCharm(unittest.TestCase):
         self.assertEqual(self.harness.get_relation_data(self.rel_id, self.charm.app), {})
 
     @patch("charms.data_platform_libs.v0.upgrade.DataUpgrade._upgrade_supported_check")
+    @patch("charm.PostgresqlOperatorCharm._update_replicas_readiness")
     @patch("charm.PostgresqlOperatorCharm._patch_pod_labels", side_effect=[_FakeApiError, None])
     @patch(
         "charm.PostgresqlOperatorCharm._create_services", side_effect=[_FakeApiError, None, None]
     )
-    def test_on_upgrade_charm(self, _create_services, _patch_pod_labels, _upgrade_supported_check):
+    def test_on_upgrade_charm(
+        self,
+        _create_services,
+        _patch_pod_labels,
+        _update_replicas_readiness,
+        _upgrade_supported_check,
+    ):
         # Test with a problem happening when trying to create the k8s resources.
+        manager = MagicMock()
+        manager.attach_mock(_update_replicas_readiness, "update_replicas_readiness")
+        manager.attach_mock(_create_services, "create_services")
         self.charm.unit.status = ActiveStatus()
         self.charm.on.upgrade_charm.emit()
         _create_services.assert_called_once()
         _patch_pod_labels.assert_not_called()
         self.assertTrue(isinstance(self.charm.unit.status, BlockedStatus))
+        # The replicas are labelled before the services select them.
+        self.assertEqual(
+            manager.mock_calls, [call.update_replicas_readiness(), call.create_services()]
+        )
 
         # Test a successful k8s resources creation, but unsuccessful pod patch operation.
         _create_services.reset_mock()
@@ -509,6 +610,7 @@ class TestCharm(unittest.TestCase):
         self.charm.on.upgrade_charm.emit()
         _create_services.assert_called_once()
         _patch_pod_labels.assert_called_once()
+        _update_replicas_readiness.assert_called_with(own_pod_only=True)
         self.assertFalse(isinstance(self.charm.unit.status, BlockedStatus))
 
     @patch("charm.Client")
@@ -521,7 +623,44 @@ class TestCharm(unittest.TestCase):
         _client.return_value.get.assert_called_once_with(
             res=Pod, name="postgresql-k8s-0", namespace=self.charm.model.name
         )
-        self.assertEqual(_client.return_value.apply.call_count, 2)
+        self.assertEqual(_client.return_value.apply.call_count, 3)
+        primary_service, replicas_service, sync_standbys_service = [
+            apply_call.kwargs["obj"] for apply_call in _client.return_value.apply.call_args_list
+        ]
+        self.assertEqual(primary_service.spec.selector["role"], "master")
+        self.assertNotIn("replica-ready", primary_service.spec.selector)
+        self.assertEqual(
+            replicas_service.spec.selector,
+            {
+                "app.kubernetes.io/name": "postgresql-k8s",
+                "cluster-name": "patroni-postgresql-k8s",
+                "role": "replica",
+            },
+        )
+        self.assertEqual(sync_standbys_service.spec.selector["role"], "replica")
+        self.assertEqual(sync_standbys_service.spec.selector["sync-standby"], "true")
+        self.assertEqual([port.name for port in primary_service.spec.ports], ["api", "database"])
+
+        # Test that the replicas are selected by their readiness only when a maximum lag is set.
+        _client.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"replicas_max_lag": 100})
+        self.charm._create_services()
+        replicas_service = _client.return_value.apply.call_args_list[1].kwargs["obj"]
+        self.assertEqual(replicas_service.spec.selector["role"], "replica")
+        self.assertEqual(replicas_service.spec.selector["replica-ready"], "true")
+        self.assertNotIn("sync-standby", replicas_service.spec.selector)
+
+        # Test that the PgBouncer port is exposed only when the connection pooler is enabled.
+        _client.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"connection_pooler": True})
+        self.charm._create_services()
+        for apply_call in _client.return_value.apply.call_args_list:
+            self.assertEqual(
+                [port.name for port in apply_call.kwargs["obj"].spec.ports],
+                ["api", "database", "pgbouncer"],
+            )
 
         # Test when the charm fails to get first pod info.
         _client.reset_mock()
@@ -562,6 +701,138 @@ class TestCharm(unittest.TestCase):
             obj=expected_patch,
         )
 
+    @patch("charm.Client")
+    @patch("charm.Patroni.get_sync_standby_names", return_value=["postgresql-k8s/2"])
+    @patch("charm.Patroni.get_replicas_lag")
+    def test_update_replicas_readiness(self, _get_replicas_lag, _get_sync_standby_names, _client):
+        with self.harness.hooks_disabled():
+            for unit_id in [1, 2, 3]:
+                self.harness.add_relation_unit(self.rel_id, f"{self.charm.app.name}/{unit_id}")
+
+        def labels(ready: bool, sync_standby: bool = False) -> Dict:
+            return {
+                "metadata": {
+                    "labels": {
+                        "replica-ready": str(ready).lower(),
+                        "sync-standby": str(sync_standby).lower(),
+                    }
+                }
+            }
+
+        # Test when the unit is not the leader.
+        self.charm._update_replicas_readiness()
+        _get_replicas_lag.assert_not_called()
+        _client.return_value.patch.assert_not_called()
+
+        # Test that any unit can label its own pod.
+        _get_replicas_lag.return_value = {"postgresql-k8s/1": 0}
+        self.charm._update_replicas_readiness(own_pod_only=True)
+        _client.return_value.patch.assert_called_once_with(
+            Pod, name="postgresql-k8s-0", namespace=self.charm._namespace, obj=labels(False)
+        )
+        _client.reset_mock()
+
+        # Test when the replicas lag couldn't be retrieved.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        _get_replicas_lag.side_effect = RetryError("fake error")
+        self.charm._update_replicas_readiness()
+        _client.return_value.patch.assert_not_called()
+
+        # Test when there is no maximum lag (only the not running replica is taken out).
+        _get_replicas_lag.side_effect = None
+        _get_replicas_lag.return_value = {
+            "postgresql-k8s/1": 0,
+            "postgresql-k8s/2": 200 * 10**6,
+        }
+        self.charm._update_replicas_readiness()
+        _client.return_value.patch.assert_has_calls(
+            [
+                call(
+                    Pod,
+                    name="postgresql-k8s-0",
+                    namespace=self.charm._namespace,
+                    obj=labels(False),
+                ),
+                call(
+                    Pod, name="postgresql-k8s-1", namespace=self.charm._namespace, obj=labels(True)
+                ),
+                call(
+                    Pod,
+                    name="postgresql-k8s-2",
+                    namespace=self.charm._namespace,
+                    obj=labels(True, sync_standby=True),
+                ),
+                call(
+                    Pod,
+                    name="postgresql-k8s-3",
+                    namespace=self.charm._namespace,
+                    obj=labels(False),
+                ),
+            ],
+            any_order=True,
+        )
+
+        # Test when the lagging replica is taken out.
+        _client.reset_mock()
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"replicas_max_lag": 100})
+        self.charm._update_replicas_readiness()
+        _client.return_value.patch.assert_any_call(
+            Pod, name="postgresql-k8s-1", namespace=self.charm._namespace, obj=labels(True)
+        )
+        _client.return_value.patch.assert_any_call(
+            Pod,
+            name="postgresql-k8s-2",
+            namespace=self.charm._namespace,
+            obj=labels(False, sync_standby=True),
+        )
+
+        # Test that a failure to patch a pod doesn't stop the other pods from being patched.
+        _client.reset_mock()
+        _client.return_value.patch.side_effect = [_FakeApiError, None, None, None]
+        self.charm._update_replicas_readiness()
+        self.assertEqual(_client.return_value.patch.call_count, 4)
+
+        # Test that only the pods whose labels changed are patched.
+        _client.reset_mock()
+        _client.return_value.patch.side_effect = None
+        _client.return_value.list.return_value = [
+            Pod(
+                metadata=ObjectMeta(
+                    name=f"postgresql-k8s-{unit_id}",
+                    labels={
+                        "app.kubernetes.io/name": "postgresql-k8s",
+                        **pod_labels["metadata"]["labels"],
+                    },
+                )
+            )
+            for unit_id, pod_labels in enumerate([
+                labels(False),
+                labels(True),
+                labels(True, sync_standby=True),
+                labels(False),
+            ])
+        ]
+        self.charm._update_replicas_readiness()
+        _client.return_value.list.assert_called_once_with(
+            Pod,
+            namespace=self.charm._namespace,
+            labels={"app.kubernetes.io/name": "postgresql-k8s"},
+        )
+        _client.return_value.patch.assert_called_once_with(
+            Pod,
+            name="postgresql-k8s-2",
+            namespace=self.charm._namespace,
+            obj=labels(False, sync_standby=True),
+        )
+
+        # Test when the current labels can't be retrieved.
+        _client.reset_mock()
+        _client.return_value.list.side_effect = _FakeApiError
+        self.charm._update_replicas_readiness()
+        _client.return_value.patch.assert_not_called()
+
     @patch("charm.Patroni.reload_patroni_configuration")
     @patch("charm.PostgresqlOperatorCharm._patch_pod_labels")
     @patch("charm.PostgresqlOperatorCharm._create_services")
@@ -614,6 +885,15 @@ class TestCharm(unittest.TestCase):
                     "user": "postgres",
                     "group": "postgres",
                 },
+                "pgbouncer": {
+                    "override": "replace",
+                    "summary": "pgbouncer connection pooler",
+                    "command": "/usr/sbin/pgbouncer /var/lib/postgresql/data/pgbouncer/pgbouncer.ini",
+                    "startup": "disabled",
+                    "after": [self._postgresql_service],
+                    "user": "postgres",
+                    "group": "postgres",
+                },
             },
             "checks": {
                 self._postgresql_service: {
@@ -722,6 +1002,150 @@ class TestCharm(unittest.TestCase):
             self.charm.client_relations, [database_relation, db_relation, db_admin_relation]
         )
 
+    @patch("charm.PostgresqlOperatorCharm.get_secret", return_value="test-password")
+    def test_postgresql(self, _get_secret):
+        # Test that the same object is used while the operator password doesn't change.
+        postgresql = self.charm.postgresql
+        self.assertEqual(postgresql.password, "test-password")
+        self.assertIs(self.charm.postgresql, postgresql)
+
+        # Test when the operator password changes.
+        _get_secret.return_value = "new-password"
+        self.assertIsNot(self.charm.postgresql, postgresql)
+        self.assertEqual(self.charm.postgresql.password, "new-password")
+
+    def test_get_relation_user_limits(self):
+        with self.harness.hooks_disabled():
+            rel_id = self.harness.add_relation("database", "application")
+        relation = self.harness.model.get_relation("database", rel_id)
+
+        # Test when no limits are set.
+        self.assertEqual(
+            self.charm.get_relation_user_limits(relation),
+            (
+                -1,
+                {
+                    "idle_in_transaction_session_timeout": None,
+                    "statement_timeout": None,
+                    "synchronous_commit": None,
+                    "temp_file_limit": None,
+                    "work_mem": None,
+                },
+            ),
+        )
+
+        # Test that only the stricter of the requested and configured limits is used
+        # (and that invalid requested limits are ignored).
+        with self.harness.hooks_disabled():
+            self.harness.update_config({
+                "relation_connection_limit": 20,
+                "relation_statement_timeout": 60000,
+                "relation_temp_file_limit": 1048576,
+            })
+            self.harness.update_relation_data(
+                rel_id,
+                "application",
+                {
+                    "connection-limit": "10",
+                    "statement-timeout": "120000",
+                    "synchronous-commit": "local",
+                    "work-mem": "8192",
+                    "temp-file-limit": "invalid",
+                },
+            )
+        self.assertEqual(
+            self.charm.get_relation_user_limits(relation),
+            (
+                10,
+                {
+                    "idle_in_transaction_session_timeout": None,
+                    "statement_timeout": "60000",
+                    "synchronous_commit": "on",
+                    "temp_file_limit": "1048576",
+                    "work_mem": "8192",
+                },
+            ),
+        )
+
+        # Test that requested limits out of the PostgreSQL ranges are ignored.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                rel_id,
+                "application",
+                {
+                    "connection-limit": "-5",
+                    "idle-in-transaction-session-timeout": "2147483648",
+                    "work-mem": "32",
+                },
+            )
+        self.assertEqual(
+            self.charm.get_relation_user_limits(relation),
+            (
+                20,
+                {
+                    "idle_in_transaction_session_timeout": None,
+                    "statement_timeout": "60000",
+                    "synchronous_commit": "on",
+                    "temp_file_limit": "1048576",
+                    "work_mem": None,
+                },
+            ),
+        )
+
+    def test_get_relation_synchronous_commit(self):
+        with self.harness.hooks_disabled():
+            rel_id = self.harness.add_relation("database", "application")
+        relation = self.harness.model.get_relation("database", rel_id)
+
+        # Test when no level (or an invalid one) is requested.
+        self.assertIsNone(self.charm._get_relation_synchronous_commit(relation, None))
+        self.assertIsNone(self.charm._get_relation_synchronous_commit(relation, "invalid"))
+
+        # Test that, by default, a level lower than the durability one is raised.
+        self.assertEqual(self.charm._get_relation_synchronous_commit(relation, "off"), "on")
+        self.assertEqual(
+            self.charm._get_relation_synchronous_commit(relation, "remote_write"), "on"
+        )
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"durability_synchronous_commit": "remote_apply"})
+        self.assertEqual(
+            self.charm._get_relation_synchronous_commit(relation, "on"), "remote_apply"
+        )
+
+        # Test when the operator allows relaxing the durability.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"relation_min_synchronous_commit": "local"})
+        self.assertEqual(self.charm._get_relation_synchronous_commit(relation, "off"), "local")
+        self.assertEqual(self.charm._get_relation_synchronous_commit(relation, "local"), "local")
+        self.assertEqual(
+            self.charm._get_relation_synchronous_commit(relation, "remote_apply"), "remote_apply"
+        )
+
+    @patch("charm.PostgresqlOperatorCharm.get_relation_user_limits", return_value=(10, {}))
+    @patch("charm.PostgresqlOperatorCharm.postgresql", new_callable=PropertyMock)
+    def test_update_client_relations_user_limits(self, _postgresql, _get_relation_user_limits):
+        with self.harness.hooks_disabled():
+            rel_id = self.harness.add_relation("database", "application")
+            self.harness.add_relation("db", "legacy-application")
+        _postgresql.return_value.list_users.return_value = {f"relation_id_{rel_id}", "operator"}
+
+        # Test that only the users that were already created are updated.
+        self.charm._update_client_relations_user_limits()
+        _postgresql.return_value.update_user_limits.assert_called_once_with(
+            f"relation_id_{rel_id}", 10, {}
+        )
+        _get_relation_user_limits.assert_called_once_with(
+            self.harness.model.get_relation("database", rel_id)
+        )
+
+        # Test when the limits can't be updated.
+        _postgresql.return_value.update_user_limits.side_effect = PostgreSQLUpdateUserLimitsError
+        with self.assertLogs("charm", "ERROR") as logs:
+            self.charm._update_client_relations_user_limits()
+            self.assertIn(
+                "Failed to update the client relations users limits", "".join(logs.output)
+            )
+
     @patch("charm.PostgresqlOperatorCharm.postgresql", new_callable=PropertyMock)
     def test_validate_config_options(self, _charm_lib):
         self.harness.set_can_connect(self._postgresql_container, True)
@@ -766,6 +1190,14 @@ class TestCharm(unittest.TestCase):
         _charm_lib.return_value.get_postgresql_timezones.assert_called_once_with()
         _charm_lib.return_value.get_postgresql_timezones.return_value = ["TEST_ZONE"]
 
+        # Test connection_pooler exception (the workload image doesn't have PgBouncer).
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"connection_pooler": True})
+
+        with self.assertRaises(ValueError) as e:
+            self.charm._validate_config_options()
+        self.assertIn("/usr/sbin/pgbouncer", str(e.exception))
+
     #
     # Secrets
     #
@@ -1335,6 +1767,9 @@ class TestCharm(unittest.TestCase):
                 enable_tls=False,
                 is_no_sync_member=False,
                 backup_id=None,
+                restore_delta=False,
+                restore_repository=None,
+                local_repository=False,
                 stanza=None,
                 restore_stanza=None,
                 parameters={"test": "test"},
@@ -1358,6 +1793,9 @@ class TestCharm(unittest.TestCase):
                 enable_tls=True,
                 is_no_sync_member=False,
                 backup_id=None,
+                restore_delta=False,
+                restore_repository=None,
+                local_repository=False,
                 stanza=None,
                 restore_stanza=None,
                 parameters={"test": "test"},
@@ -1391,6 +1829,120 @@ class TestCharm(unittest.TestCase):
                 "tls", self.harness.get_relation_data(self.rel_id, self.charm.unit.name)
             )
 
+    def test_build_pgbouncer_pool_sizes(self):
+        self.assertEqual(
+            self.charm._build_pgbouncer_pool_sizes(100),
+            {
+                "max_client_conn": 10000,
+                "max_db_connections": 85,
+                "default_pool_size": 21,
+                "reserve_pool_size": 5,
+            },
+        )
+        self.assertEqual(
+            self.charm._build_pgbouncer_pool_sizes(16),
+            {
+                "max_client_conn": 1600,
+                "max_db_connections": 10,
+                "default_pool_size": 2,
+                "reserve_pool_size": 1,
+            },
+        )
+
+    @patch("ops.model.Container.send_signal")
+    @patch("charm.PostgresqlOperatorCharm.is_tls_enabled", new_callable=PropertyMock)
+    @patch("charm.PostgresqlOperatorCharm.get_secret")
+    def test_update_connection_pooler(self, _get_secret, _is_tls_enabled, _send_signal):
+        _get_secret.return_value = "test-password"
+        _is_tls_enabled.return_value = False
+        self.harness.set_can_connect(self._postgresql_container, True)
+        container = self.charm.unit.get_container(self._postgresql_container)
+        config_file = "/var/lib/postgresql/data/pgbouncer/pgbouncer.ini"
+        auth_file = "/var/lib/postgresql/data/pgbouncer/userlist.txt"
+
+        # Test when the service isn't in the plan yet.
+        self.harness.update_config({"connection_pooler": True})
+        self.charm._update_connection_pooler(100)
+        self.assertFalse(container.exists(config_file))
+
+        # Test when the workload image doesn't have PgBouncer.
+        container.add_layer(self._postgresql_service, self.charm._postgresql_layer())
+        self.charm._update_connection_pooler(100)
+        self.assertFalse(container.get_service("pgbouncer").is_running())
+        self.assertFalse(container.exists(config_file))
+
+        # Test when the connection pooler is enabled.
+        container.push("/usr/sbin/pgbouncer", "", make_dirs=True)
+        self.charm._update_connection_pooler(100)
+        self.assertTrue(container.get_service("pgbouncer").is_running())
+        with open("templates/pgbouncer.ini.j2") as file:
+            expected_config = Template(file.read()).render(
+                database_port="5432",
+                listen_port="6432",
+                auth_file=auth_file,
+                auth_user="pgbouncer",
+                pool_mode="transaction",
+                enable_tls=False,
+                storage_path="/var/lib/postgresql/data",
+                max_client_conn=10000,
+                max_db_connections=85,
+                default_pool_size=21,
+                reserve_pool_size=5,
+            )
+        self.assertEqual(container.pull(config_file).read(), expected_config)
+        self.assertEqual(container.pull(auth_file).read(), '"pgbouncer" "test-password"\n')
+        _send_signal.assert_not_called()
+
+        # Test that PgBouncer isn't reloaded when the configuration didn't change.
+        self.charm._update_connection_pooler(100)
+        _send_signal.assert_not_called()
+
+        # Test that PgBouncer is reloaded when the configuration changed.
+        self.harness.update_config({"connection_pooler_mode": "session"})
+        self.charm._update_connection_pooler(100)
+        _send_signal.assert_called_once_with("SIGHUP", "pgbouncer")
+        self.assertIn("pool_mode = session", container.pull(config_file).read())
+
+        # Test that PgBouncer is stopped while the connectivity to the database is disabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id, self.charm.unit.name, {"connectivity": "off"}
+            )
+        self.charm._update_connection_pooler(100)
+        self.assertFalse(container.get_service("pgbouncer").is_running())
+
+        # Test when the connection pooler is disabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id, self.charm.unit.name, {"connectivity": "on"}
+            )
+        self.charm._update_connection_pooler(100)
+        self.assertTrue(container.get_service("pgbouncer").is_running())
+        self.harness.update_config({"connection_pooler": False})
+        self.charm._update_connection_pooler(100)
+        self.assertFalse(container.get_service("pgbouncer").is_running())
+
+    @patch("charm.PostgresqlOperatorCharm.set_secret")
+    @patch("charm.PostgresqlOperatorCharm.get_secret")
+    def test_set_up_connection_pooler_auth(self, _get_secret, _set_secret):
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()) as postgresql_mock:
+            # Test when the user doesn't exist yet.
+            _get_secret.return_value = "test-password"
+            postgresql_mock.list_users.return_value = {"operator", "monitoring"}
+            self.charm._set_up_connection_pooler_auth()
+            _set_secret.assert_not_called()
+            postgresql_mock.create_user.assert_called_once_with("pgbouncer", "test-password")
+            postgresql_mock.set_up_auth_query.assert_called_once_with("pgbouncer")
+
+            # Test when the user already exists (and the password wasn't generated yet).
+            postgresql_mock.reset_mock()
+            _get_secret.return_value = None
+            self.charm._set_up_connection_pooler_auth({"operator", "pgbouncer"})
+            _set_secret.assert_called_once_with("app", "pgbouncer-password", ANY)
+            postgresql_mock.list_users.assert_not_called()
+            postgresql_mock.create_user.assert_not_called()
+            postgresql_mock.set_up_auth_query.assert_called_once_with("pgbouncer")
+
     @patch("charms.rolling_ops.v0.rollingops.RollingOpsManager._on_acquire_lock")
     @patch("charm.PostgresqlOperatorCharm._generate_metrics_jobs")
     @patch("charm.wait_fixed", return_value=wait_fixed(0))
@@ -23,7 +23,7 @@ POSTGRESQL_VERSION = "14"
 
 
 class TestDbProvides(unittest.TestCase):
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     def setUp(self):
         self.harness = Harness(PostgresqlOperatorCharm)
         self.addCleanup(self.harness.cleanup)
@@ -55,6 +55,7 @@ class TestDbProvides(unittest.TestCase):
             "port": "",
             "master": "",
             "standbys": "",
+            "sync-standbys": "",
             "version": "",
             "user": "",
             "password": "",
@@ -63,6 +64,9 @@ class TestDbProvides(unittest.TestCase):
         }
         self.harness.update_relation_data(self.rel_id, self.app, data)
         self.harness.update_relation_data(self.rel_id, self.unit, data)
+        self.harness.update_relation_data(
+            self.peer_rel_id, self.app, {f"db-{self.rel_id}-fingerprint": ""}
+        )
 
     def request_database(self):
         # Reset the charm status.
@@ -129,7 +133,7 @@ class TestDbProvides(unittest.TestCase):
         _defer.assert_not_called()
         _set_up_relation.assert_called_once()
 
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     def test_get_extensions(self):
         # Test when there are no extensions in the relation databags.
         relation = self.harness.model.get_relation(RELATION_NAME, self.rel_id)
@@ -203,12 +207,14 @@ class TestDbProvides(unittest.TestCase):
                 (extensions, set()),
                 (extensions, set()),
                 (extensions, set()),
+                (extensions, set()),
+                (extensions, set()),
             ]
             postgresql_mock.create_user = PropertyMock(
-                side_effect=[None, None, PostgreSQLCreateUserError, None, None]
+                side_effect=[None, None, None, PostgreSQLCreateUserError, None, None]
             )
             postgresql_mock.create_database = PropertyMock(
-                side_effect=[None, None, PostgreSQLCreateDatabaseError, None]
+                side_effect=[None, None, None, PostgreSQLCreateDatabaseError, None]
             )
             postgresql_mock.get_postgresql_version = PropertyMock(
                 side_effect=[
@@ -217,6 +223,8 @@ class TestDbProvides(unittest.TestCase):
                     POSTGRESQL_VERSION,
                     POSTGRESQL_VERSION,
                     POSTGRESQL_VERSION,
+                    POSTGRESQL_VERSION,
+                    POSTGRESQL_VERSION,
                     PostgreSQLGetPostgreSQLVersionError,
                 ]
             )
@@ -241,6 +249,17 @@ class TestDbProvides(unittest.TestCase):
             self.assertTrue(self.harness.charm.legacy_db_relation.set_up_relation(relation))
             user = f"relation_id_{self.rel_id}"
             postgresql_mock.create_user.assert_called_once_with(user, "test-password", False)
+            postgresql_mock.update_user_limits.assert_called_once_with(
+                user,
+                -1,
+                {
+                    "idle_in_transaction_session_timeout": None,
+                    "statement_timeout": None,
+                    "synchronous_commit": None,
+                    "temp_file_limit": None,
+                    "work_mem": None,
+                },
+            )
             postgresql_mock.create_database.assert_called_once_with(
                 DATABASE, user, plugins=[], client_relations=[relation]
             )
@@ -259,6 +278,9 @@ class TestDbProvides(unittest.TestCase):
                 "standbys": f"dbname={DATABASE} fallback_application_name=application "
                 f"host=postgresql-k8s-replicas.{self.harness.model.name}.svc.cluster.local "
                 f"password=test-password port=5432 user=relation_id_{self.rel_id}",
+                "sync-standbys": f"dbname={DATABASE} fallback_application_name=application "
+                f"host=postgresql-k8s-sync-standbys.{self.harness.model.name}.svc.cluster.local "
+                f"password=test-password port=5432 user=relation_id_{self.rel_id}",
                 "user": f"relation_id_{self.rel_id}",
                 "version": POSTGRESQL_VERSION,
             }
@@ -266,6 +288,34 @@ class TestDbProvides(unittest.TestCase):
             self.assertEqual(self.harness.get_relation_data(self.rel_id, self.unit), expected_data)
             self.assertNotIsInstance(self.harness.model.unit.status, BlockedStatus)
 
+            # Assert that the setup is skipped when nothing changed.
+            postgresql_mock.create_user.reset_mock()
+            postgresql_mock.create_database.reset_mock()
+            postgresql_mock.get_postgresql_version.reset_mock()
+            _update_unit_status.reset_mock()
+            self.assertTrue(self.harness.charm.legacy_db_relation.set_up_relation(relation))
+            postgresql_mock.create_user.assert_not_called()
+            postgresql_mock.create_database.assert_not_called()
+            postgresql_mock.get_postgresql_version.assert_not_called()
+            _update_unit_status.assert_called_once()
+            self.assertEqual(self.harness.get_relation_data(self.rel_id, self.app), expected_data)
+
+            # Assert that the setup is done again when one of its inputs changed.
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(
+                    self.rel_id, "application/0", {"egress-subnets": "10.0.0.0/24"}
+                )
+            self.assertTrue(self.harness.charm.legacy_db_relation.set_up_relation(relation))
+            postgresql_mock.create_user.assert_called_once_with(user, "test-password", False)
+            self.assertEqual(
+                self.harness.get_relation_data(self.rel_id, self.app)["allowed-subnets"],
+                "10.0.0.0/24",
+            )
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(
+                    self.rel_id, "application/0", {"egress-subnets": ""}
+                )
+
             # Assert that the correct calls were made when the database name is
             # provided only in the unit databag.
             postgresql_mock.create_user.reset_mock()
@@ -349,6 +399,44 @@ class TestDbProvides(unittest.TestCase):
             _update_unit_status.assert_not_called()
             self.assertIsInstance(self.harness.model.unit.status, BlockedStatus)
 
+    @patch("relations.db.new_password", return_value="test-password")
+    @patch("charm.Patroni.member_started", new_callable=PropertyMock(return_value=True))
+    def test_relation_data_kept_across_relation_changed_events(self, _, __):
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()) as postgresql_mock:
+            postgresql_mock.get_postgresql_version.return_value = POSTGRESQL_VERSION
+            self.request_database()
+            expected_data = self.harness.get_relation_data(self.rel_id, self.app)
+            self.assertEqual(expected_data["allowed-units"], "application/0")
+            self.assertEqual(expected_data["database"], DATABASE)
+            self.assertEqual(self.harness.get_relation_data(self.rel_id, self.unit), expected_data)
+
+            # Assert that the data the ops-lib-pgsql client reads stays in the databags
+            # when the relation changes without changing the setup inputs.
+            postgresql_mock.create_user.reset_mock()
+            for value in ["1", "2"]:
+                self.harness.update_relation_data(
+                    self.rel_id, "application/0", {"private-address": f"10.0.0.{value}"}
+                )
+                self.assertEqual(
+                    self.harness.get_relation_data(self.rel_id, self.app), expected_data
+                )
+                self.assertEqual(
+                    self.harness.get_relation_data(self.rel_id, self.unit), expected_data
+                )
+            postgresql_mock.create_user.assert_not_called()
+
+            # Assert that the data is published again when it's missing (like in the
+            # unit databag of a new leader).
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(
+                    self.rel_id, self.unit, {key: "" for key in expected_data}
+                )
+            self.harness.update_relation_data(
+                self.rel_id, "application/0", {"private-address": "10.0.0.3"}
+            )
+            postgresql_mock.create_user.assert_called_once()
+            self.assertEqual(self.harness.get_relation_data(self.rel_id, self.unit), expected_data)
+
     @patch("relations.db.DbProvides._check_for_blocking_relations")
     @patch("charm.PostgresqlOperatorCharm._has_blocked_status", new_callable=PropertyMock)
     def test_update_unit_status(self, _has_blocked_status, _check_for_blocking_relations):
@@ -415,9 +503,17 @@ class TestDbProvides(unittest.TestCase):
             # Test when this unit is departing the relation (due to the relation being broken between the apps).
             event = Mock()
             event.relation.id = self.rel_id
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(
+                    self.peer_rel_id, self.app, {f"db-{self.rel_id}-fingerprint": "fingerprint"}
+                )
             self.harness.charm.legacy_db_relation._on_relation_broken(event)
             user = f"relation_id_{self.rel_id}"
             postgresql_mock.delete_user.assert_called_once_with(user)
+            self.assertNotIn(
+                f"db-{self.rel_id}-fingerprint",
+                self.harness.get_relation_data(self.peer_rel_id, self.app),
+            )
 
             # Test when this unit is departing the relation (due to a scale down event).
             postgresql_mock.reset_mock()
@@ -0,0 +1,231 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import Mock, PropertyMock, patch
+
+from charms.postgresql_k8s.v0.postgresql import (
+    PostgreSQLGetReplicationSlotsLagError,
+    PostgreSQLLogicalReplicationRemoveError,
+    PostgreSQLLogicalReplicationSetupError,
+)
+from ops.framework import EventBase
+from ops.model import ActiveStatus, BlockedStatus
+from ops.testing import Harness
+from requests import ConnectionError
+
+from charm import PostgresqlOperatorCharm
+from constants import PEER
+
+DATABASE = "test_database"
+RELATION_NAME = "logical-replication"
+POSTGRESQL_VERSION = "14"
+
+
+class TestPostgreSQLLogicalReplication(unittest.TestCase):
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
+    def setUp(self):
+        self.harness = Harness(PostgresqlOperatorCharm)
+        self.addCleanup(self.harness.cleanup)
+
+        # Set up the initial relation and hooks.
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.app = self.harness.charm.app.name
+        self.unit = self.harness.charm.unit.name
+
+        # Define some relations.
+        self.rel_id = self.harness.add_relation(RELATION_NAME, "application")
+        self.harness.add_relation_unit(self.rel_id, "application/0")
+        self.peer_rel_id = self.harness.add_relation(PEER, self.app)
+        self.harness.add_relation_unit(self.peer_rel_id, self.unit)
+        self.harness.update_relation_data(
+            self.peer_rel_id,
+            self.app,
+            {"cluster_initialised": "True"},
+        )
+        self.logical_replication = self.harness.charm.logical_replication
+        self.user = f"relation_id_{self.rel_id}"
+
+    def request_tables(self, tables: str = "public.orders,customers") -> None:
+        with self.harness.hooks_disabled():
+            self.harness.update_relation_data(
+                self.rel_id, "application", {"database": DATABASE, "tables": tables}
+            )
+
+    def test_get_tables(self):
+        relation = self.harness.model.get_relation(RELATION_NAME, self.rel_id)
+
+        # Test when no tables are requested.
+        self.assertEqual(self.logical_replication._get_tables(relation), [])
+
+        # Test when valid tables are requested.
+        self.request_tables(" public.orders , customers,")
+        self.assertEqual(
+            self.logical_replication._get_tables(relation), ["public.orders", "customers"]
+        )
+
+        # Test when an invalid table is requested.
+        self.request_tables("orders,customers; DROP TABLE orders")
+        self.assertIsNone(self.logical_replication._get_tables(relation))
+
+    @patch("relations.logical_replication.PostgreSQLLogicalReplication.set_up_relation")
+    @patch.object(EventBase, "defer")
+    @patch("charm.Patroni.member_started", new_callable=PropertyMock)
+    def test_on_relation_changed(self, _member_started, _defer, _set_up_relation):
+        # Test when the cluster is not ready yet.
+        _member_started.return_value = False
+        self.harness.update_relation_data(self.rel_id, "application", {"database": DATABASE})
+        _defer.assert_called_once()
+        _set_up_relation.assert_not_called()
+
+        # Test when the unit is not the leader.
+        _defer.reset_mock()
+        _member_started.return_value = True
+        with self.harness.hooks_disabled():
+            self.harness.set_leader(False)
+        self.harness.update_relation_data(self.rel_id, "application", {"tables": "orders"})
+        _defer.assert_not_called()
+        _set_up_relation.assert_not_called()
+
+        # Test when the unit is the leader.
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        self.harness.update_relation_data(self.rel_id, "application", {"tables": "customers"})
+        _set_up_relation.assert_called_once()
+
+    @patch("relations.logical_replication.new_password", return_value="test-password")
+    @patch("charm.Patroni.update_permanent_slots")
+    def test_set_up_relation(self, _update_permanent_slots, _new_password):
+        relation = self.harness.model.get_relation(RELATION_NAME, self.rel_id)
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()) as postgresql_mock:
+            postgresql_mock.get_postgresql_version.return_value = POSTGRESQL_VERSION
+
+            # Test when no database or tables are requested.
+            self.assertFalse(self.logical_replication.set_up_relation(relation))
+            postgresql_mock.set_up_logical_replication.assert_not_called()
+            _update_permanent_slots.assert_not_called()
+
+            # Test a successful setup.
+            self.request_tables()
+            self.assertTrue(self.logical_replication.set_up_relation(relation))
+            postgresql_mock.set_up_logical_replication.assert_called_once_with(
+                self.user, "test-password", DATABASE, self.user, ["public.orders", "customers"]
+            )
+            _update_permanent_slots.assert_called_once_with({
+                self.user: {"type": "logical", "database": DATABASE, "plugin": "pgoutput"}
+            })
+            self.assertEqual(
+                self.harness.get_relation_data(self.rel_id, self.app),
+                {
+                    "endpoints": "postgresql-k8s-primary.None.svc.cluster.local:5432",
+                    "database": DATABASE,
+                    "username": self.user,
+                    "password": "test-password",
+                    "publication": self.user,
+                    "replication-slot": self.user,
+                    "plugin": "pgoutput",
+                    "version": POSTGRESQL_VERSION,
+                },
+            )
+
+            # Test that the same password is kept when the tables change.
+            _new_password.return_value = "other-password"
+            postgresql_mock.set_up_logical_replication.reset_mock()
+            self.request_tables("orders")
+            self.assertTrue(self.logical_replication.set_up_relation(relation))
+            postgresql_mock.set_up_logical_replication.assert_called_once_with(
+                self.user, "test-password", DATABASE, self.user, ["orders"]
+            )
+
+            # Test when the publication can't be set up.
+            postgresql_mock.set_up_logical_replication.side_effect = (
+                PostgreSQLLogicalReplicationSetupError
+            )
+            self.assertFalse(self.logical_replication.set_up_relation(relation))
+            self.assertIsInstance(self.harness.model.unit.status, BlockedStatus)
+
+            # Test when Patroni can't create the replication slot.
+            self.harness.model.unit.status = ActiveStatus()
+            postgresql_mock.set_up_logical_replication.side_effect = None
+            _update_permanent_slots.side_effect = ConnectionError
+            self.assertFalse(self.logical_replication.set_up_relation(relation))
+            self.assertIsInstance(self.harness.model.unit.status, BlockedStatus)
+
+    @patch("charm.Patroni.update_permanent_slots")
+    @patch("charm.Patroni.member_started", new_callable=PropertyMock(return_value=True))
+    def test_on_relation_broken(self, _member_started, _update_permanent_slots):
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()) as postgresql_mock:
+            event = Mock()
+            event.relation = self.harness.model.get_relation(RELATION_NAME, self.rel_id)
+
+            # Test when the relation was not set up.
+            self.logical_replication._on_relation_broken(event)
+            _update_permanent_slots.assert_not_called()
+            postgresql_mock.remove_logical_replication.assert_not_called()
+
+            # Test a successful removal.
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(self.rel_id, self.app, {"database": DATABASE})
+            self.logical_replication._on_relation_broken(event)
+            _update_permanent_slots.assert_called_once_with({self.user: None})
+            postgresql_mock.remove_logical_replication.assert_called_once_with(
+                DATABASE, self.user, self.user
+            )
+            postgresql_mock.delete_user.assert_called_once_with(self.user)
+
+            # Test when the replication slot is still active (the removal is retried later).
+            postgresql_mock.delete_user.reset_mock()
+            postgresql_mock.remove_logical_replication.side_effect = (
+                PostgreSQLLogicalReplicationRemoveError
+            )
+            self.logical_replication._on_relation_broken(event)
+            event.defer.assert_called_once()
+            postgresql_mock.delete_user.assert_not_called()
+            self.assertNotIsInstance(self.harness.model.unit.status, BlockedStatus)
+            postgresql_mock.remove_logical_replication.side_effect = None
+
+            # Test when Patroni can't remove the replication slot.
+            _update_permanent_slots.side_effect = ConnectionError
+            self.logical_replication._on_relation_broken(event)
+            self.assertIsInstance(self.harness.model.unit.status, BlockedStatus)
+
+            # Test when this unit is departing the relation (due to a scale down event).
+            _update_permanent_slots.reset_mock()
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(
+                    self.peer_rel_id, self.unit, {"departing": "True"}
+                )
+            self.logical_replication._on_relation_broken(event)
+            _update_permanent_slots.assert_not_called()
+
+    def test_update_replication_slots_lag(self):
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()) as postgresql_mock:
+            # Test when the unit is not the leader.
+            with self.harness.hooks_disabled():
+                self.harness.set_leader(False)
+            self.logical_replication.update_replication_slots_lag()
+            postgresql_mock.get_replication_slots_lag.assert_not_called()
+
+            # Test when the lag can't be retrieved.
+            with self.harness.hooks_disabled():
+                self.harness.set_leader()
+            postgresql_mock.get_replication_slots_lag.side_effect = (
+                PostgreSQLGetReplicationSlotsLagError
+            )
+            self.logical_replication.update_replication_slots_lag()
+            self.assertNotIn(
+                "replication-slot-lag-mib", self.harness.get_relation_data(self.rel_id, self.app)
+            )
+
+            # Test that the lag is shared in MiB.
+            postgresql_mock.get_replication_slots_lag.side_effect = None
+            postgresql_mock.get_replication_slots_lag.return_value = {
+                self.user: 3 * 1024**2 + 512,
+                "relation_id_999": 1024,
+            }
+            self.logical_replication.update_replication_slots_lag()
+            self.assertEqual(
+                self.harness.get_relation_data(self.rel_id, self.app)["replication-slot-lag-mib"],
+                "3",
+            )
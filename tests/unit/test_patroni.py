@@ -5,6 +5,7 @@
 import unittest
 from unittest.mock import MagicMock, PropertyMock, mock_open, patch
 
+import requests
 import tenacity
 from jinja2 import Template
 from ops.testing import Harness
@@ -17,7 +18,7 @@ from tests.helpers import STORAGE_PATH, patch_network_get
 
 
 class TestPatroni(unittest.TestCase):
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     @patch_network_get(private_address="1.1.1.1")
     def setUp(self):
         self.harness = Harness(PostgresqlOperatorCharm)
@@ -61,6 +62,51 @@ class TestPatroni(unittest.TestCase):
         self.assertEqual(primary, "postgresql-k8s/1")
         _get.assert_called_once_with("http://postgresql-k8s-0:8008/cluster", verify=True)
 
+    @patch("requests.get")
+    def test_get_replicas_lag(self, _get):
+        # Mock Patroni cluster API.
+        _get.return_value.json.return_value = {
+            "members": [
+                {"name": "postgresql-k8s-0", "role": "replica", "state": "streaming", "lag": 16},
+                {"name": "postgresql-k8s-1", "role": "leader", "state": "running"},
+                {"name": "postgresql-k8s-2", "role": "replica", "state": "streaming", "lag": 0},
+                {"name": "postgresql-k8s-3", "role": "replica", "state": "stopped"},
+                {
+                    "name": "postgresql-k8s-4",
+                    "role": "replica",
+                    "state": "running",
+                    "lag": "unknown",
+                },
+            ]
+        }
+        self.assertEqual(
+            self.patroni.get_replicas_lag(), {"postgresql-k8s/0": 16, "postgresql-k8s/2": 0}
+        )
+        _get.assert_called_once_with("http://postgresql-k8s-0:8008/cluster", verify=True)
+
+    @patch("requests.get")
+    def test_are_all_members_ready(self, _get):
+        # Test when all members are running.
+        _get.return_value.json.return_value = {
+            "members": [
+                {"name": "postgresql-k8s-0", "state": "running"},
+                {"name": "postgresql-k8s-1", "state": "streaming"},
+            ]
+        }
+        self.assertTrue(self.patroni.are_all_members_ready())
+
+        # Test when one of the members is still creating its replica.
+        _get.return_value.json.return_value["members"].append({
+            "name": "postgresql-k8s-2",
+            "state": "creating replica",
+        })
+        self.assertFalse(self.patroni.are_all_members_ready())
+        self.assertTrue(self.patroni.are_all_members_ready(creating_replicas_allowed=True))
+
+        # Test when one of the members is stopped.
+        _get.return_value.json.return_value["members"][0]["state"] = "stopped"
+        self.assertFalse(self.patroni.are_all_members_ready(creating_replicas_allowed=True))
+
     @patch("requests.get")
     def test_is_creating_backup(self, _get):
         # Test when one member is creating a backup.
@@ -113,6 +159,46 @@ class TestPatroni(unittest.TestCase):
         _get.side_effect = RetryError
         self.assertFalse(self.patroni.member_streaming)
 
+    @patch("requests.get")
+    def test_member_wal_replay_status(self, _get):
+        # Test when the member is replaying WAL.
+        xlog = {
+            "received_location": 50331648,
+            "replayed_location": 50331648,
+            "replayed_timestamp": "2023-01-01 10:00:00.000000+00:00",
+            "paused": False,
+        }
+        _get.return_value.json.return_value = {"state": "running", "xlog": xlog}
+        self.assertEqual(self.patroni.member_wal_replay_status, xlog)
+
+        # Test when the member has no WAL position yet.
+        _get.return_value.json.return_value = {"state": "starting"}
+        self.assertEqual(self.patroni.member_wal_replay_status, {})
+
+        # Test when the Patroni API isn't reachable.
+        _get.side_effect = requests.exceptions.ConnectionError
+        self.assertEqual(self.patroni.member_wal_replay_status, {})
+
+    @patch("requests.patch")
+    def test_update_permanent_slots(self, _patch):
+        # Test adding a slot and removing another one.
+        slots = {
+            "relation_id_3": {"type": "logical", "database": "test", "plugin": "pgoutput"},
+            "relation_id_2": None,
+        }
+        self.patroni.update_permanent_slots(slots)
+        _patch.assert_called_once_with(
+            "http://postgresql-k8s-0:8008/config",
+            verify=True,
+            json={"slots": slots},
+            timeout=5,
+        )
+
+        # Test when Patroni rejects the change.
+        _patch.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.patroni.update_permanent_slots(slots)
+
     @patch("os.chmod")
     @patch("os.chown")
     @patch("pwd.getpwnam")
@@ -216,6 +302,43 @@ class TestPatroni(unittest.TestCase):
             "ssl_cert_file: /var/lib/postgresql/data/cert.pem", expected_content_with_tls
         )
         self.assertIn("ssl_key_file: /var/lib/postgresql/data/key.pem", expected_content_with_tls)
+        self.assertNotIn("create_replica_methods", expected_content_with_tls)
+
+        # Test that new replicas are created from the backup repository when there is a stanza.
+        _render_file.reset_mock()
+        with patch("builtins.open", mock, create=True):
+            self.patroni.render_patroni_yml_file(enable_tls=True, stanza="test-stanza")
+        self.assertIn(
+            "  create_replica_methods:\n  - pgbackrest\n  - basebackup\n  pgbackrest:\n"
+            "    command: pgbackrest --stanza=test-stanza --pg1-path=/var/lib/postgresql/data/pgdata"
+            " --delta --type=standby --target-timeline=latest restore\n",
+            _render_file.call_args[0][1],
+        )
+        self.assertNotIn("on_role_change", _render_file.call_args[0][1])
+
+        # Test that the stanza is created in the local repository when the member is promoted.
+        _render_file.reset_mock()
+        with patch("builtins.open", mock, create=True):
+            self.patroni.render_patroni_yml_file(stanza="test-stanza", local_repository=True)
+        self.assertIn(
+            "  callbacks:\n    # The WAL files are also pushed to the local repository of the"
+            " new primary.\n    on_role_change: '/bin/bash -c \"case $2 in master|primary)"
+            " pgbackrest --stanza=test-stanza --repo=2 stanza-create;; esac\" on_role_change'\n",
+            _render_file.call_args[0][1],
+        )
+
+        # Test that a backup from the local repository is restored from it.
+        _render_file.reset_mock()
+        with patch("builtins.open", mock, create=True):
+            self.patroni.render_patroni_yml_file(
+                restore_stanza="test-stanza", backup_id="20230101-090000F", restore_repository="2"
+            )
+        self.assertIn(
+            "    command: pgbackrest --stanza=test-stanza --pg1-path=/var/lib/postgresql/data/pgdata"
+            " --set=20230101-090000F --repo=2 --type=immediate --target-action=promote"
+            " --log-level-file=detail restore\n",
+            _render_file.call_args[0][1],
+        )
 
     @patch("patroni.stop_after_delay", return_value=stop_after_delay(0))
     @patch("patroni.wait_fixed", return_value=wait_fixed(0))
@@ -4,16 +4,23 @@ import unittest
 from unittest.mock import call, patch
 
 import psycopg2
-from charms.postgresql_k8s.v0.postgresql import PostgreSQLCreateDatabaseError
+from charms.postgresql_k8s.v0.postgresql import (
+    PostgreSQLAuthQuerySetupError,
+    PostgreSQLCreateDatabaseError,
+    PostgreSQLGetReplicationSlotsLagError,
+    PostgreSQLLogicalReplicationRemoveError,
+    PostgreSQLLogicalReplicationSetupError,
+    PostgreSQLUpdateUserLimitsError,
+)
 from ops.testing import Harness
-from psycopg2.sql import SQL, Composed, Identifier
+from psycopg2.sql import SQL, Composed, Identifier, Literal
 
 from charm import PostgresqlOperatorCharm
 from constants import PEER
 
 
 class TestPostgreSQL(unittest.TestCase):
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     def setUp(self):
         self.harness = Harness(PostgresqlOperatorCharm)
         self.addCleanup(self.harness.cleanup)
@@ -297,3 +304,302 @@ class TestPostgreSQL(unittest.TestCase):
         parameters = self.charm.postgresql.build_postgresql_parameters(config_options, 1000000000)
         self.assertEqual(parameters["shared_buffers"], "128MB")
         self.assertNotIn("effective_cache_size", parameters)
+        self.assertNotIn("huge_pages", parameters)
+
+        # Test when there are no huge pages available.
+        config_options["profile"] = "production"
+        parameters = self.charm.postgresql.build_postgresql_parameters(
+            config_options, 1000000000, available_hugepages=0
+        )
+        self.assertEqual(parameters["shared_buffers"], "250MB")
+        self.assertEqual(parameters["huge_pages"], "off")
+
+        # Test when the shared buffers are sized to fit in the huge pages.
+        parameters = self.charm.postgresql.build_postgresql_parameters(
+            config_options, 1000000000, available_hugepages=200000000
+        )
+        self.assertEqual(parameters["shared_buffers"], "180MB")
+        self.assertEqual(parameters["effective_cache_size"], "820MB")
+        self.assertEqual(parameters["huge_pages"], "on")
+
+        # Test when the requested shared buffers don't fit in the huge pages.
+        config_options["memory_shared_buffers"] = 50000
+        parameters = self.charm.postgresql.build_postgresql_parameters(
+            config_options, 1000000000, available_hugepages=200000000
+        )
+        self.assertEqual(parameters["shared_buffers"], 50000)
+        self.assertEqual(parameters["huge_pages"], "try")
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_set_up_auth_query(self, _connect_to_database):
+        # Test a successful setup.
+        self.charm.postgresql.set_up_auth_query("pgbouncer")
+        execute = _connect_to_database.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value.execute
+        self.assertEqual(
+            execute.call_args_list[0],
+            call(
+                Composed([
+                    SQL("CREATE SCHEMA IF NOT EXISTS "),
+                    Identifier("pgbouncer"),
+                    SQL(";"),
+                ])
+            ),
+        )
+        self.assertIn("SECURITY DEFINER", execute.call_args_list[1][0][0].seq[-1].string)
+        execute.assert_has_calls([
+            call(
+                Composed([
+                    SQL("REVOKE ALL ON FUNCTION "),
+                    Identifier("pgbouncer"),
+                    SQL(".get_auth(TEXT) FROM PUBLIC;"),
+                ])
+            ),
+            call(
+                Composed([
+                    SQL("GRANT USAGE ON SCHEMA "),
+                    Identifier("pgbouncer"),
+                    SQL(" TO "),
+                    Identifier("pgbouncer"),
+                    SQL(";"),
+                ])
+            ),
+            call(
+                Composed([
+                    SQL("GRANT EXECUTE ON FUNCTION "),
+                    Identifier("pgbouncer"),
+                    SQL(".get_auth(TEXT) TO "),
+                    Identifier("pgbouncer"),
+                    SQL(";"),
+                ])
+            ),
+        ])
+
+        # Test when the function can't be created.
+        execute.side_effect = psycopg2.Error
+        with self.assertRaises(PostgreSQLAuthQuerySetupError):
+            self.charm.postgresql.set_up_auth_query("pgbouncer")
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_update_user_limits(self, _connect_to_database):
+        # Test setting a connection limit and a setting and resetting another one.
+        self.charm.postgresql.update_user_limits(
+            "relation_id_2", 10, {"statement_timeout": "30000", "work_mem": None}
+        )
+        execute = _connect_to_database.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value.execute
+        self.assertEqual(
+            execute.call_args_list,
+            [
+                call(
+                    Composed([
+                        SQL("ALTER ROLE "),
+                        Identifier("relation_id_2"),
+                        SQL(" CONNECTION LIMIT "),
+                        Literal(10),
+                        SQL(";"),
+                    ])
+                ),
+                call(
+                    Composed([
+                        SQL("ALTER ROLE "),
+                        Identifier("relation_id_2"),
+                        SQL(" SET "),
+                        Identifier("statement_timeout"),
+                        SQL(" = "),
+                        Literal("30000"),
+                        SQL(";"),
+                    ])
+                ),
+                call(
+                    Composed([
+                        SQL("ALTER ROLE "),
+                        Identifier("relation_id_2"),
+                        SQL(" RESET "),
+                        Identifier("work_mem"),
+                        SQL(";"),
+                    ])
+                ),
+            ],
+        )
+
+        # Test when the limits can't be updated.
+        execute.side_effect = psycopg2.Error
+        with self.assertRaises(PostgreSQLUpdateUserLimitsError):
+            self.charm.postgresql.update_user_limits("relation_id_2")
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_list_valid_privileges_and_roles(self, _connect_to_database):
+        cursor = _connect_to_database.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [("postgres",), ("relation_id_1",)]
+
+        # Test that the roles are only queried once.
+        expected = ({"createdb", "createrole", "superuser"}, {"postgres", "relation_id_1"})
+        self.assertEqual(self.charm.postgresql.list_valid_privileges_and_roles(), expected)
+        self.assertEqual(self.charm.postgresql.list_valid_privileges_and_roles(), expected)
+        cursor.execute.assert_called_once_with("SELECT rolname FROM pg_roles;")
+
+        # Test that the roles catalog is updated when users are created and deleted.
+        self.charm.postgresql.create_user("relation_id_2", "test-password")
+        self.assertIn("relation_id_2", self.charm.postgresql.list_valid_privileges_and_roles()[1])
+        with patch(
+            "charms.postgresql_k8s.v0.postgresql.PostgreSQL.list_users",
+            return_value={"relation_id_1"},
+        ):
+            self.charm.postgresql.delete_user("relation_id_1")
+        self.assertEqual(
+            self.charm.postgresql.list_valid_privileges_and_roles()[1],
+            {"postgres", "relation_id_2"},
+        )
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_set_up_logical_replication(self, _connect_to_database):
+        cursor = _connect_to_database.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        tables = SQL(", ").join([Identifier("public", "orders"), Identifier("customers")])
+
+        # Test when the user and the publication don't exist yet.
+        cursor.fetchone.return_value = None
+        self.charm.postgresql.set_up_logical_replication(
+            "relation_id_2",
+            "test-password",
+            "test",
+            "relation_id_2",
+            ["public.orders", "customers"],
+        )
+        _connect_to_database.assert_has_calls([call(), call("test")], any_order=True)
+        self.assertEqual(
+            cursor.execute.call_args_list[1],
+            call(
+                Composed([
+                    SQL("CREATE ROLE "),
+                    Identifier("relation_id_2"),
+                    SQL(" WITH LOGIN REPLICATION ENCRYPTED PASSWORD "),
+                    Literal("test-password"),
+                    SQL(";"),
+                ])
+            ),
+        )
+        cursor.execute.assert_has_calls([
+            call(
+                Composed([
+                    SQL("GRANT USAGE ON SCHEMA "),
+                    Identifier("public"),
+                    SQL(" TO "),
+                    Identifier("relation_id_2"),
+                    SQL(";"),
+                ])
+            ),
+            call(
+                Composed([
+                    SQL("GRANT SELECT ON TABLE "),
+                    tables,
+                    SQL(" TO "),
+                    Identifier("relation_id_2"),
+                    SQL(";"),
+                ])
+            ),
+        ])
+        self.assertEqual(
+            cursor.execute.call_args_list[-1],
+            call(
+                Composed([
+                    SQL("CREATE PUBLICATION "),
+                    Identifier("relation_id_2"),
+                    SQL(" FOR TABLE "),
+                    tables,
+                    SQL(";"),
+                ])
+            ),
+        )
+
+        # Test when the publication already exists.
+        cursor.reset_mock()
+        cursor.fetchone.return_value = (True,)
+        self.charm.postgresql.set_up_logical_replication(
+            "relation_id_2",
+            "test-password",
+            "test",
+            "relation_id_2",
+            ["public.orders", "customers"],
+        )
+        self.assertEqual(cursor.execute.call_args_list[1][0][0].seq[0], SQL("ALTER ROLE "))
+        self.assertEqual(
+            cursor.execute.call_args_list[-1],
+            call(
+                Composed([
+                    SQL("ALTER PUBLICATION "),
+                    Identifier("relation_id_2"),
+                    SQL(" SET TABLE "),
+                    tables,
+                    SQL(";"),
+                ])
+            ),
+        )
+
+        # Test when the publication can't be set up.
+        cursor.execute.side_effect = psycopg2.Error
+        with self.assertRaises(PostgreSQLLogicalReplicationSetupError):
+            self.charm.postgresql.set_up_logical_replication(
+                "relation_id_2", "test-password", "test", "relation_id_2", ["orders"]
+            )
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_remove_logical_replication(self, _connect_to_database):
+        cursor = _connect_to_database.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+
+        # Test a successful removal.
+        self.charm.postgresql.remove_logical_replication("test", "relation_id_2", "relation_id_2")
+        _connect_to_database.assert_called_once_with("test")
+        self.assertEqual(
+            cursor.execute.call_args_list,
+            [
+                call(
+                    Composed([
+                        SQL("DROP PUBLICATION IF EXISTS "),
+                        Identifier("relation_id_2"),
+                        SQL(";"),
+                    ])
+                ),
+                call(
+                    "SELECT pg_terminate_backend(active_pid, 10000) FROM pg_replication_slots"
+                    " WHERE slot_name = %s AND active_pid IS NOT NULL;",
+                    ("relation_id_2",),
+                ),
+                call(
+                    "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots"
+                    " WHERE slot_name = %s;",
+                    ("relation_id_2",),
+                ),
+            ],
+        )
+
+        # Test when the slot is still active after its walsender was terminated.
+        cursor.execute.side_effect = [
+            None,
+            None,
+            psycopg2.errors.ObjectInUse("replication slot is active for PID 123"),
+        ]
+        with self.assertRaises(PostgreSQLLogicalReplicationRemoveError):
+            self.charm.postgresql.remove_logical_replication(
+                "test", "relation_id_2", "relation_id_2"
+            )
+
+        # Test when the publication can't be removed.
+        cursor.execute.side_effect = psycopg2.Error
+        with self.assertRaises(PostgreSQLLogicalReplicationRemoveError):
+            self.charm.postgresql.remove_logical_replication(
+                "test", "relation_id_2", "relation_id_2"
+            )
+
+    @patch("charms.postgresql_k8s.v0.postgresql.PostgreSQL._connect_to_database")
+    def test_get_replication_slots_lag(self, _connect_to_database):
+        cursor = _connect_to_database.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+
+        # Test that the slots without a known position are skipped.
+        cursor.fetchall.return_value = [("relation_id_2", 1024), ("relation_id_3", None)]
+        self.assertEqual(
+            self.charm.postgresql.get_replication_slots_lag(), {"relation_id_2": 1024}
+        )
+
+        # Test when the lag can't be retrieved.
+        cursor.execute.side_effect = psycopg2.Error
+        with self.assertRaises(PostgreSQLGetReplicationSlotsLagError):
+            self.charm.postgresql.get_replication_slots_lag()
@@ -8,6 +8,7 @@ from charms.postgresql_k8s.v0.postgresql import (
     PostgreSQLCreateDatabaseError,
     PostgreSQLCreateUserError,
     PostgreSQLGetPostgreSQLVersionError,
+    PostgreSQLUpdateUserLimitsError,
 )
 from ops import Unit
 from ops.framework import EventBase
@@ -26,7 +27,7 @@ POSTGRESQL_VERSION = "14"
 
 @patch_network_get(private_address="1.1.1.1")
 class TestPostgreSQLProvider(unittest.TestCase):
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     def setUp(self):
         self.harness = Harness(PostgresqlOperatorCharm)
         self.addCleanup(self.harness.cleanup)
@@ -106,6 +107,17 @@ class TestPostgreSQLProvider(unittest.TestCase):
             postgresql_mock.create_user.assert_called_once_with(
                 user, "test-password", extra_user_roles=EXTRA_USER_ROLES
             )
+            postgresql_mock.update_user_limits.assert_called_once_with(
+                user,
+                -1,
+                {
+                    "idle_in_transaction_session_timeout": None,
+                    "statement_timeout": None,
+                    "synchronous_commit": None,
+                    "temp_file_limit": None,
+                    "work_mem": None,
+                },
+            )
             database_relation = self.harness.model.get_relation(RELATION_NAME)
             client_relations = [database_relation]
             postgresql_mock.create_database.assert_called_once_with(
@@ -122,6 +134,7 @@ class TestPostgreSQLProvider(unittest.TestCase):
                     "username": user,
                     "password": "test-password",
                     "read-only-endpoints": "postgresql-k8s-replicas.None.svc.cluster.local:5432",
+                    "sync-standby-endpoints": "postgresql-k8s-sync-standbys.None.svc.cluster.local:5432",
                     "version": POSTGRESQL_VERSION,
                     "database": f"{DATABASE}",
                 },
@@ -140,6 +153,7 @@ class TestPostgreSQLProvider(unittest.TestCase):
                     "data": f'{{"database": "{DATABASE}", "extra-user-roles": "{EXTRA_USER_ROLES}"}}',
                     "endpoints": "postgresql-k8s-primary.None.svc.cluster.local:5432",
                     "read-only-endpoints": "postgresql-k8s-replicas.None.svc.cluster.local:5432",
+                    "sync-standby-endpoints": "postgresql-k8s-sync-standbys.None.svc.cluster.local:5432",
                 },
             )
 
@@ -153,6 +167,7 @@ class TestPostgreSQLProvider(unittest.TestCase):
                     "data": f'{{"database": "{DATABASE}", "extra-user-roles": "{EXTRA_USER_ROLES}"}}',
                     "endpoints": "postgresql-k8s-primary.None.svc.cluster.local:5432",
                     "read-only-endpoints": "postgresql-k8s-replicas.None.svc.cluster.local:5432",
+                    "sync-standby-endpoints": "postgresql-k8s-sync-standbys.None.svc.cluster.local:5432",
                 },
             )
 
@@ -160,6 +175,53 @@ class TestPostgreSQLProvider(unittest.TestCase):
             self.request_database()
             self.assertTrue(isinstance(self.harness.model.unit.status, BlockedStatus))
 
+    @patch.object(EventBase, "defer")
+    @patch("charm.Patroni.member_started", new_callable=PropertyMock)
+    def test_on_relation_changed(self, _member_started, _defer):
+        with patch.object(PostgresqlOperatorCharm, "postgresql", Mock()) as postgresql_mock:
+            # Test when the database wasn't created yet.
+            _member_started.return_value = True
+            self.harness.update_relation_data(self.rel_id, "application", {"work-mem": "8192"})
+            postgresql_mock.update_user_limits.assert_not_called()
+
+            # Test when the cluster is not ready.
+            with self.harness.hooks_disabled():
+                self.harness.update_relation_data(self.rel_id, self.app, {"database": DATABASE})
+            _member_started.return_value = False
+            self.harness.update_relation_data(self.rel_id, "application", {"work-mem": "4096"})
+            _defer.assert_called_once()
+            postgresql_mock.update_user_limits.assert_not_called()
+
+            # Test that the newly requested limits are applied.
+            _member_started.return_value = True
+            self.harness.update_relation_data(self.rel_id, "application", {"work-mem": "2048"})
+            postgresql_mock.update_user_limits.assert_called_once_with(
+                f"relation_id_{self.rel_id}",
+                -1,
+                {
+                    "idle_in_transaction_session_timeout": None,
+                    "statement_timeout": None,
+                    "synchronous_commit": None,
+                    "temp_file_limit": None,
+                    "work_mem": "2048",
+                },
+            )
+
+            # Test when the limits can't be updated (the event is retried later).
+            _defer.reset_mock()
+            self.harness.model.unit.status = ActiveStatus()
+            postgresql_mock.update_user_limits.side_effect = PostgreSQLUpdateUserLimitsError
+            self.harness.update_relation_data(self.rel_id, "application", {"work-mem": "1024"})
+            _defer.assert_called_once()
+            self.assertIsInstance(self.harness.model.unit.status, ActiveStatus)
+
+            # Test when the unit is not the leader.
+            postgresql_mock.update_user_limits.reset_mock()
+            with self.harness.hooks_disabled():
+                self.harness.set_leader(False)
+            self.harness.update_relation_data(self.rel_id, "application", {"work-mem": "512"})
+            postgresql_mock.update_user_limits.assert_not_called()
+
     @patch("charm.Patroni.member_started", new_callable=PropertyMock(return_value=True))
     def test_on_relation_departed(self, _):
         # Test when this unit is departing the relation (due to a scale down event).
@@ -207,3 +269,39 @@ class TestPostgreSQLProvider(unittest.TestCase):
                 )
             self.harness.charm.postgresql_client_relation._on_relation_broken(event)
             postgresql_mock.delete_user.assert_not_called()
+
+    def test_update_pooler_endpoints(self):
+        # Test when the connection pooler is disabled.
+        self.provider.update_pooler_endpoints()
+        relation_data = self.harness.get_relation_data(self.rel_id, self.app)
+        self.assertNotIn("pooler-endpoints", relation_data)
+        self.assertNotIn("pooler-read-only-endpoints", relation_data)
+
+        # Test when the connection pooler is enabled.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"connection_pooler": True})
+        self.provider.update_pooler_endpoints()
+        relation_data = self.harness.get_relation_data(self.rel_id, self.app)
+        self.assertEqual(
+            relation_data["pooler-endpoints"],
+            "postgresql-k8s-primary.None.svc.cluster.local:6432",
+        )
+        self.assertEqual(
+            relation_data["pooler-read-only-endpoints"],
+            "postgresql-k8s-replicas.None.svc.cluster.local:6432",
+        )
+
+        # Test when the connection pooler is disabled again.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"connection_pooler": False})
+        self.provider.update_pooler_endpoints()
+        relation_data = self.harness.get_relation_data(self.rel_id, self.app)
+        self.assertNotIn("pooler-endpoints", relation_data)
+        self.assertNotIn("pooler-read-only-endpoints", relation_data)
+
+        # Test that only the leader updates the endpoints.
+        with self.harness.hooks_disabled():
+            self.harness.update_config({"connection_pooler": True})
+            self.harness.set_leader(False)
+        self.provider.update_pooler_endpoints()
+        self.assertNotIn("pooler-endpoints", self.harness.get_relation_data(self.rel_id, self.app))
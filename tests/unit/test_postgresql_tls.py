@@ -59,7 +59,7 @@ class TestPostgreSQLTLS(unittest.TestCase):
         self.charm.set_secret(SCOPE, "cert", "test-cert")
         self.charm.set_secret(SCOPE, "chain", "test-chain")
 
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     def setUp(self):
         self.harness = Harness(PostgresqlOperatorCharm)
         self.addCleanup(self.harness.cleanup)
@@ -114,6 +114,7 @@ class TestPostgreSQLTLS(unittest.TestCase):
                 "1.1.1.1",
                 f"postgresql-k8s-primary.{self.charm.model.name}.svc.cluster.local",
                 f"postgresql-k8s-replicas.{self.charm.model.name}.svc.cluster.local",
+                f"postgresql-k8s-sync-standbys.{self.charm.model.name}.svc.cluster.local",
             ],
         )
         _generate_csr.assert_has_calls([generate_csr_call])
@@ -147,6 +148,7 @@ class TestPostgreSQLTLS(unittest.TestCase):
                 "1.1.1.1",
                 f"postgresql-k8s-primary.{self.charm.model.name}.svc.cluster.local",
                 f"postgresql-k8s-replicas.{self.charm.model.name}.svc.cluster.local",
+                f"postgresql-k8s-sync-standbys.{self.charm.model.name}.svc.cluster.local",
             ],
         )
         _generate_csr.assert_has_calls([custom_key_generate_csr_call])
@@ -238,6 +240,7 @@ class TestPostgreSQLTLS(unittest.TestCase):
                     "1.1.1.1",
                     "postgresql-k8s-primary.None.svc.cluster.local",
                     "postgresql-k8s-replicas.None.svc.cluster.local",
+                    "postgresql-k8s-sync-standbys.None.svc.cluster.local",
                 ],
             },
         )
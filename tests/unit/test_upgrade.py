@@ -19,7 +19,7 @@ from tests.unit.helpers import _FakeApiError
 class TestUpgrade(unittest.TestCase):
     """Test the upgrade class."""
 
-    @patch("charm.KubernetesServicePatch", lambda x, y: None)
+    @patch("charm.KubernetesServicePatch", lambda *args, **kwargs: None)
     def setUp(self):
         """Set up the test."""
         self.patcher = patch("lightkube.core.client.GenericSyncClient")
@@ -3,8 +3,9 @@
 
 import re
 import unittest
+from datetime import datetime
 
-from utils import new_password
+from utils import new_password, next_cron_run, parse_cron_expression
 
 
 class TestUtils(unittest.TestCase):
@@ -18,3 +19,32 @@ class TestUtils(unittest.TestCase):
         second_password = new_password()
         self.assertIsNotNone(re.fullmatch("[a-zA-Z0-9\b]{16}$", second_password))
         self.assertNotEqual(second_password, first_password)
+
+    def test_parse_cron_expression(self):
+        # Test with wildcards, lists, ranges and steps.
+        minutes, hours, days, months, weekdays = parse_cron_expression("0,30 8-18/5 * */6 5-7")
+        self.assertEqual(minutes, {0, 30})
+        self.assertEqual(hours, {8, 13, 18})
+        self.assertEqual(days, set(range(1, 32)))
+        self.assertEqual(months, {1, 7})
+        self.assertEqual(weekdays, {0, 5, 6})
+
+        # Test with invalid expressions.
+        for expression in ["* * * *", "60 * * * *", "* * 0 * *", "5-1 * * * *", "*/0 * * * *"]:
+            with self.assertRaises(ValueError):
+                parse_cron_expression(expression)
+
+    def test_next_cron_run(self):
+        after = datetime(2024, 1, 31, 23, 59, 30)
+        self.assertEqual(next_cron_run("* * * * *", after), datetime(2024, 2, 1, 0, 0))
+        # Sunday.
+        self.assertEqual(next_cron_run("0 2 * * 0", after), datetime(2024, 2, 4, 2, 0))
+        self.assertEqual(next_cron_run("*/30 8-18 * * 1-5", after), datetime(2024, 2, 1, 8, 0))
+        self.assertEqual(next_cron_run("0 0 29 2 *", after), datetime(2024, 2, 29, 0, 0))
+        self.assertEqual(next_cron_run("0 0 1 */3 *", after), datetime(2024, 4, 1, 0, 0))
+        # Day of month or day of week (Thursday, 1st of February).
+        self.assertEqual(next_cron_run("5 4 1 * 1", after), datetime(2024, 2, 1, 4, 5))
+
+        # Test with an expression that never matches.
+        with self.assertRaises(ValueError):
+            next_cron_run("0 0 30 2 *", after)